@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+
+log = logging.getLogger("admission")
+
+# Leverantörer som begränsas per worker
+PROVIDER_ELEVENLABS = "elevenlabs"
+PROVIDER_REALTIME = "openai_realtime"
+PROVIDER_LLM = "openai_llm"
+PROVIDER_TRANSCRIBE = "openai_transcribe"
+
+
+class AdmissionRejected(Exception):
+    """Kastas när en uppströmsleverantör är fullbelagd och kön är full eller tog för lång tid."""
+
+    def __init__(self, provider: str, reason: str, retry_after_ms: int):
+        super().__init__(f"{provider} busy ({reason})")
+        self.provider = provider
+        self.reason = reason
+        self.retry_after_ms = retry_after_ms
+
+    def to_message(self) -> dict:
+        """Strukturerat `busy`-fel till frontend."""
+        return {
+            "type": "error",
+            "reason": "busy",
+            "provider": self.provider,
+            "detail": self.reason,
+            "retry_after_ms": self.retry_after_ms,
+        }
+
+
+class ProviderLimiter:
+    """Semafor med begränsad FIFO-kö och deadline för en leverantör.
+
+    Upp till `max_concurrent` sessioner får köra samtidigt. Därefter får upp
+    till `max_queue` vänta i högst `max_wait_ms`; allt utöver det avvisas direkt.
+    `max_concurrent <= 0` betyder obegränsat.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, max_wait_ms: int, max_samples: int = 500):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait_ms = max_wait_ms
+        self._active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._wait_samples: Deque[float] = deque(maxlen=max_samples)
+
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def _reject(self, reason: str) -> AdmissionRejected:
+        log.warning("Admission rejected for %s: %s (active=%d waiting=%d)",
+                    self.name, reason, self._active, len(self._waiters))
+        return AdmissionRejected(self.name, reason, self.max_wait_ms)
+
+    def _admit(self, started: float) -> float:
+        waited = time.monotonic() - started
+        self._wait_samples.append(waited)
+        self.admitted += 1
+        return waited
+
+    async def acquire(self) -> float:
+        """Vänta på en plats. Returnerar väntetiden i sekunder."""
+        started = time.monotonic()
+        if self.max_concurrent <= 0 or (self._active < self.max_concurrent and not self._waiters):
+            self._active += 1
+            return self._admit(started)
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise self._reject("queue_full")
+
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            done, _ = await asyncio.wait({fut}, timeout=self.max_wait_ms / 1000)
+        except asyncio.CancelledError:
+            self._abandon(fut)
+            raise
+
+        if not done:
+            self._abandon(fut)
+            self.rejected_timeout += 1
+            raise self._reject("queue_timeout")
+        return self._admit(started)
+
+    def _abandon(self, fut: asyncio.Future) -> None:
+        """Ta bort en väntande; om den redan fått en plats lämnas platsen tillbaka."""
+        if fut.done() and not fut.cancelled():
+            self.release()
+            return
+        fut.cancel()
+        try:
+            self._waiters.remove(fut)
+        except ValueError:
+            pass
+
+    def release(self) -> None:
+        # Lämna över platsen direkt till nästa i kön (active oförändrat)
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self._active = max(0, self._active - 1)
+
+    def stats(self) -> dict:
+        samples = sorted(self._wait_samples)
+
+        def _pct(p: float) -> Optional[float]:
+            if not samples:
+                return None
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 1)
+
+        return {
+            "active": self._active,
+            "waiting": len(self._waiters),
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "max_wait_ms": self.max_wait_ms,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "queue_wait_ms": {"p50": _pct(0.5), "p95": _pct(0.95), "max": _pct(1.0)},
+        }
+
+
+class Slot:
+    """En tilldelad plats; `release()` är idempotent."""
+
+    def __init__(self, limiter: ProviderLimiter, waited_sec: float):
+        self._limiter = limiter
+        self.waited_sec = waited_sec
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._limiter.release()
+
+
+class AdmissionController:
+    """Delad admission control för alla uppströmsleverantörer i en worker."""
+
+    def __init__(self):
+        self._limiters: Dict[str, ProviderLimiter] = {}
+
+    def configure(self, provider: str, max_concurrent: int, max_queue: int, max_wait_ms: int) -> ProviderLimiter:
+        limiter = ProviderLimiter(provider, max_concurrent, max_queue, max_wait_ms)
+        self._limiters[provider] = limiter
+        return limiter
+
+    def limiter(self, provider: str) -> ProviderLimiter:
+        if provider not in self._limiters:
+            # Okänd leverantör → obegränsad
+            self.configure(provider, 0, 0, 0)
+        return self._limiters[provider]
+
+    async def acquire(self, provider: str) -> Slot:
+        limiter = self.limiter(provider)
+        waited = await limiter.acquire()
+        return Slot(limiter, waited)
+
+    @asynccontextmanager
+    async def slot(self, provider: str):
+        slot = await self.acquire(provider)
+        try:
+            yield slot
+        finally:
+            slot.release()
+
+    def stats(self) -> dict:
+        return {name: limiter.stats() for name, limiter in self._limiters.items()}
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+def _configure_from_env(controller: AdmissionController) -> None:
+    defaults = {
+        PROVIDER_ELEVENLABS: (10, 20, 2000),
+        PROVIDER_REALTIME: (20, 10, 2000),
+        PROVIDER_LLM: (20, 40, 5000),
+        PROVIDER_TRANSCRIBE: (10, 20, 5000),
+    }
+    for provider, (max_concurrent, max_queue, max_wait_ms) in defaults.items():
+        prefix = f"ADMISSION_{provider.upper()}"
+        controller.configure(
+            provider,
+            max_concurrent=_env_int(f"{prefix}_MAX_CONCURRENT", max_concurrent),
+            max_queue=_env_int(f"{prefix}_MAX_QUEUE", max_queue),
+            max_wait_ms=_env_int(f"{prefix}_MAX_WAIT_MS", max_wait_ms),
+        )
+
+
+admission = AdmissionController()
+_configure_from_env(admission)
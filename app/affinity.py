@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import socket
+from typing import Optional, Tuple
+
+log = logging.getLogger("affinity")
+
+# Identifierar denna process (Render sätter RENDER_INSTANCE_ID per instans)
+INSTANCE_ID = os.getenv("RENDER_INSTANCE_ID") or f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _load_secret() -> bytes:
+    """Delad hemlighet så att alla instanser kan verifiera varandras tokens.
+
+    Utan AFFINITY_SECRET används en slumpad nyckel per process: tokens kan då
+    inte förfalskas (en tom nyckel skulle låta vem som helst ta över en
+    session), men gäller bara på den instans som skapade dem.
+    """
+    secret = os.getenv("AFFINITY_SECRET", "")
+    if secret:
+        return secret.encode()
+    log.warning("AFFINITY_SECRET is not set; affinity tokens are only valid on this process")
+    return secrets.token_bytes(32)
+
+
+_SECRET = _load_secret()
+
+_VERSION = "v1"
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _unb64(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(payload: bytes) -> str:
+    return _b64(hmac.new(_SECRET, payload, hashlib.sha256).digest()[:12])
+
+
+def make_token(session_id: str, instance_id: str = INSTANCE_ID) -> str:
+    """Skapa ett session-affinity-token: session + instans som äger sessionen.
+
+    Klienten skickar tillbaka det (`?affinity=`) vid återanslutning så att
+    sessionen (konversation, debug-data) återupptas, och en lastbalanserare
+    kan routa på instansdelen.
+    """
+    payload = f"{session_id}|{instance_id}".encode()
+    return f"{_VERSION}.{_b64(payload)}.{_sign(payload)}"
+
+
+def parse_token(token: Optional[str]) -> Optional[Tuple[str, str]]:
+    """Returnerar (session_id, instance_id) eller None om token är ogiltigt."""
+    if not token:
+        return None
+    try:
+        version, payload_b64, signature = token.split(".")
+        if version != _VERSION:
+            return None
+        payload = _unb64(payload_b64)
+        if not hmac.compare_digest(signature, _sign(payload)):
+            return None
+        session_id, instance_id = payload.decode().split("|", 1)
+        return session_id, instance_id
+    except Exception:
+        return None
+
+
+def resume_session_id(token: Optional[str]) -> Optional[str]:
+    """Session-ID att återuppta från ett `?affinity=`-token, annars None."""
+    parsed = parse_token(token)
+    if parsed is None:
+        return None
+    session_id, instance_id = parsed
+    if instance_id != INSTANCE_ID:
+        # Sessionen startade på en annan instans; state hämtas från delad backend
+        log.info("Resuming session %s from instance %s on %s", session_id, instance_id, INSTANCE_ID)
+    return session_id
@@ -0,0 +1,16 @@
+# Audio package: strömmande PCM/WAV-läsning och skrivning, frames, nivåer och nivåanalys per session
+from .analytics import LevelMeter
+from .levels import dbfs, min_max_peaks, peak, rms, window_levels
+from .pcm import (
+    PCM16_MONO_16K, PCM_CHANNELS, PCM_SAMPLE_RATE, PCM_SAMPLE_WIDTH,
+    FrameSplitter, PcmFormat, as_samples, iter_frames,
+)
+from .wav import WAV_HEADER_SIZE, AudioFile, WavWriter, open_audio, pcm_to_wav, read_layout, wav_bytes, wav_header
+
+__all__ = [
+    "LevelMeter",
+    "dbfs", "min_max_peaks", "peak", "rms", "window_levels",
+    "PCM16_MONO_16K", "PCM_CHANNELS", "PCM_SAMPLE_RATE", "PCM_SAMPLE_WIDTH",
+    "FrameSplitter", "PcmFormat", "as_samples", "iter_frames",
+    "WAV_HEADER_SIZE", "AudioFile", "WavWriter", "open_audio", "pcm_to_wav", "read_layout", "wav_bytes", "wav_header",
+]
@@ -0,0 +1,127 @@
+# app/audio/analytics.py
+import math
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+import numpy as np
+
+from .levels import FULL_SCALE, dbfs
+from .pcm import PCM_SAMPLE_RATE, BytesLike, as_samples
+
+# Fönsterlängd för nivåer/tystnad och gränser för klippning och tystnad
+LEVEL_WINDOW_MS = 20
+CLIP_LEVEL = 32767
+SILENCE_DBFS = -50.0
+RECENT_WINDOWS = 25
+
+
+class LevelMeter:
+    """Inkrementell nivåanalys av en PCM16-ström (mono) på fasta fönster.
+
+    Varje `push()` analyserar alla hela fönster i chunken vektoriserat direkt
+    på chunkens buffert (ingen kopia); bara en ofullständig rest (< ett
+    fönster) och ev. en udda byte sparas till nästa chunk. Endast
+    räknare behålls, så minnet är konstant oavsett sessionens längd.
+    """
+
+    __slots__ = (
+        "sample_rate", "window", "clip_level", "silence_dbfs", "_silence_rms",
+        "_carry", "_carry_len", "_odd", "samples", "sum_sq", "total", "peak",
+        "clipped", "windows", "silent_windows", "recent",
+    )
+
+    def __init__(self, sample_rate: int = PCM_SAMPLE_RATE, window_ms: int = LEVEL_WINDOW_MS,
+                 clip_level: int = CLIP_LEVEL, silence_dbfs: float = SILENCE_DBFS,
+                 recent: int = RECENT_WINDOWS):
+        self.sample_rate = sample_rate
+        self.window = max(1, sample_rate * window_ms // 1000)
+        self.clip_level = clip_level
+        self.silence_dbfs = silence_dbfs
+        self._silence_rms = FULL_SCALE * 10 ** (silence_dbfs / 20)
+        self._carry = np.zeros(self.window, dtype="<i2")
+        self._carry_len = 0
+        self._odd = b""
+        self.samples = 0
+        self.sum_sq = 0.0
+        self.total = 0
+        self.peak = 0
+        self.clipped = 0
+        self.windows = 0
+        self.silent_windows = 0
+        self.recent: Deque[float] = deque(maxlen=recent)
+
+    def push(self, data: BytesLike) -> None:
+        """Analysera en chunk PCM16 (godtycklig längd)."""
+        if self._odd:
+            data = self._odd + bytes(data)  # sällsynt: föregående chunk slutade mitt i ett sample
+            self._odd = b""
+        view = memoryview(data).cast("B")
+        if len(view) % 2:
+            self._odd = bytes(view[-1:])
+        samples = as_samples(view)
+
+        if self._carry_len:
+            take = samples[:self.window - self._carry_len]
+            self._carry[self._carry_len:self._carry_len + take.size] = take
+            self._carry_len += take.size
+            samples = samples[take.size:]
+            if self._carry_len < self.window:
+                return
+            self._add(self._carry.reshape(1, self.window))
+            self._carry_len = 0
+
+        count = samples.size // self.window
+        if count:
+            self._add(samples[:count * self.window].reshape(count, self.window))
+        rest = samples[count * self.window:]
+        self._carry[:rest.size] = rest
+        self._carry_len = rest.size
+
+    def _add(self, frames: np.ndarray) -> None:
+        energy = np.einsum("ij,ij->i", frames, frames, dtype=np.float64)
+        window_rms = np.sqrt(energy / self.window)
+        self.samples += frames.size
+        self.sum_sq += float(energy.sum())
+        self.total += int(frames.sum(dtype=np.int64))
+        self.peak = max(self.peak, -int(frames.min()), int(frames.max()))
+        self.clipped += int(np.count_nonzero(frames >= self.clip_level) + np.count_nonzero(frames <= -self.clip_level))
+        self.windows += len(frames)
+        self.silent_windows += int(np.count_nonzero(window_rms < self._silence_rms))
+        self.recent.extend(window_rms[-self.recent.maxlen:].tolist())
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Nivåer hittills (hela fönster; en ofullständig rest räknas inte in)."""
+        n = self.samples
+        return {
+            "duration_sec": round(n / self.sample_rate, 3),
+            "windows": self.windows,
+            "rms_dbfs": dbfs(math.sqrt(self.sum_sq / n)) if n else None,
+            "peak_dbfs": dbfs(self.peak),
+            "clipping_ratio": round(self.clipped / n, 5) if n else 0.0,
+            "silence_ratio": round(self.silent_windows / self.windows, 3) if self.windows else 0.0,
+            "dc_offset": round(self.total / n / FULL_SCALE, 5) if n else 0.0,
+            "recent_rms_dbfs": [dbfs(v) for v in self.recent],
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Kompakta räknare för delad backend (se `DebugStore.publish`)."""
+        return {
+            "sample_rate": self.sample_rate,
+            "samples": self.samples,
+            "sum_sq": self.sum_sq,
+            "total": self.total,
+            "peak": self.peak,
+            "clipped": self.clipped,
+            "windows": self.windows,
+            "silent_windows": self.silent_windows,
+            "recent": list(self.recent),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> "LevelMeter":
+        data = data or {}
+        meter = cls(sample_rate=data.get("sample_rate", PCM_SAMPLE_RATE))
+        for name in ("samples", "sum_sq", "total", "peak", "clipped", "windows", "silent_windows"):
+            setattr(meter, name, data.get(name, getattr(meter, name)))
+        meter.recent.extend(data.get("recent", []))
+        return meter
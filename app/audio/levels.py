@@ -0,0 +1,49 @@
+# app/audio/levels.py
+import math
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Fullskala för PCM16 (|−32768| räknas som 32768)
+FULL_SCALE = 32768.0
+
+
+def rms(samples: np.ndarray) -> float:
+    """RMS i sample-enheter (0–32768)."""
+    if samples.size == 0:
+        return 0.0
+    x = samples.astype(np.float32)
+    return math.sqrt(float(np.dot(x, x)) / samples.size)
+
+
+def peak(samples: np.ndarray) -> int:
+    """Största absolutvärde (utan overflow för −32768)."""
+    if samples.size == 0:
+        return 0
+    return max(-int(samples.min()), int(samples.max()))
+
+
+def dbfs(value: float) -> Optional[float]:
+    """Nivå i dBFS (None för tystnad)."""
+    return round(20 * math.log10(value / FULL_SCALE), 1) if value > 0 else None
+
+
+def window_levels(samples: np.ndarray, window: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(RMS, peak) per hela fönster om `window` samples; en ofullständig rest ignoreras."""
+    count = samples.size // window
+    if count == 0:
+        return np.zeros(0), np.zeros(0, dtype=np.int32)
+    frames = samples[:count * window].reshape(count, window)
+    rms_values = np.sqrt(np.einsum("ij,ij->i", frames, frames, dtype=np.float64) / window)
+    peaks = np.maximum(frames.max(axis=1).astype(np.int32), -frames.min(axis=1).astype(np.int32))
+    return rms_values, peaks
+
+
+def min_max_peaks(samples: np.ndarray, points: int) -> Tuple[np.ndarray, np.ndarray, int]:
+    """Min/max per bucket (normaliserat till ±1) för vågformsvisning: (min, max, samples per punkt)."""
+    points = max(1, min(points, samples.size))
+    bucket = samples.size // points
+    usable = samples[:bucket * points].reshape(points, bucket)
+    mins = (usable.min(axis=1) / FULL_SCALE).round(4)
+    maxs = (usable.max(axis=1) / FULL_SCALE).round(4)
+    return mins, maxs, bucket
@@ -0,0 +1,96 @@
+# app/audio/pcm.py
+from typing import Iterator, List, NamedTuple, Union
+
+import numpy as np
+
+# PCM i hela kedjan (frontend, Realtime, ElevenLabs pcm_16000): 16 kHz, 16-bit, mono
+PCM_SAMPLE_RATE = 16000
+PCM_CHANNELS = 1
+PCM_SAMPLE_WIDTH = 2
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+
+class PcmFormat(NamedTuple):
+    """Layout för rå PCM (little-endian, heltal)."""
+
+    sample_rate: int = PCM_SAMPLE_RATE
+    channels: int = PCM_CHANNELS
+    sample_width: int = PCM_SAMPLE_WIDTH
+
+    @property
+    def bytes_per_frame(self) -> int:
+        return self.channels * self.sample_width
+
+    @property
+    def bytes_per_second(self) -> int:
+        return self.sample_rate * self.bytes_per_frame
+
+    def bytes_for_ms(self, ms: float) -> int:
+        """Antal bytes för `ms` millisekunder, avrundat till hela frames."""
+        return int(self.sample_rate * ms / 1000) * self.bytes_per_frame
+
+    def duration_sec(self, byte_count: int) -> float:
+        return byte_count / self.bytes_per_second
+
+
+PCM16_MONO_16K = PcmFormat()
+
+
+def as_samples(data: BytesLike) -> np.ndarray:
+    """PCM16-bytes som int16-array utan kopiering (en udda sista byte ignoreras)."""
+    view = memoryview(data).cast("B")
+    return np.frombuffer(view[:len(view) - len(view) % 2], dtype="<i2")
+
+
+def iter_frames(data: BytesLike, frame_bytes: int, partial: bool = True) -> Iterator[memoryview]:
+    """Dela `data` i frames om `frame_bytes` som memoryview-utsnitt (ingen kopiering).
+
+    Med `partial=False` hoppas en ofullständig sista frame över.
+    """
+    if frame_bytes <= 0:
+        raise ValueError("frame_bytes måste vara > 0")
+    view = memoryview(data).cast("B")
+    end = len(view) if partial else len(view) - len(view) % frame_bytes
+    for offset in range(0, end, frame_bytes):
+        yield view[offset:offset + frame_bytes]
+
+
+class FrameSplitter:
+    """Gör om en ström av godtyckligt stora chunkar till frames med fast storlek.
+
+    Hela frames i en ny chunk ges som memoryview-utsnitt av chunken (ingen
+    kopiering); bara det som blir över mellan chunkar buffras.
+    """
+
+    def __init__(self, frame_bytes: int):
+        if frame_bytes <= 0:
+            raise ValueError("frame_bytes måste vara > 0")
+        self.frame_bytes = frame_bytes
+        self._pending = bytearray()
+
+    @property
+    def pending_bytes(self) -> int:
+        return len(self._pending)
+
+    def push(self, chunk: BytesLike) -> List[BytesLike]:
+        view = memoryview(chunk).cast("B")
+        frames: List[BytesLike] = []
+        if self._pending:
+            need = self.frame_bytes - len(self._pending)
+            self._pending += view[:need]
+            view = view[need:]
+            if len(self._pending) < self.frame_bytes:
+                return frames
+            frames.append(bytes(self._pending))
+            self._pending.clear()
+        whole = len(view) - len(view) % self.frame_bytes
+        frames.extend(iter_frames(view[:whole], self.frame_bytes))
+        self._pending += view[whole:]
+        return frames
+
+    def flush(self) -> bytes:
+        """Det som blivit över (kortare än en frame)."""
+        rest = bytes(self._pending)
+        self._pending.clear()
+        return rest
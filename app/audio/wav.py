@@ -0,0 +1,201 @@
+# app/audio/wav.py
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional, Tuple, Union
+
+import numpy as np
+
+from .pcm import PCM16_MONO_16K, PcmFormat
+
+WAV_HEADER_SIZE = 44
+COPY_CHUNK_BYTES = 1024 * 1024
+
+PathLike = Union[str, Path]
+
+
+def wav_header(data_size: int, sample_rate: int = PCM16_MONO_16K.sample_rate,
+               channels: int = PCM16_MONO_16K.channels,
+               sample_width: int = PCM16_MONO_16K.sample_width) -> bytes:
+    """44-byte WAV-header för `data_size` bytes PCM (utan att läsa filen)."""
+    byte_rate = sample_rate * channels * sample_width
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_size, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate, byte_rate, channels * sample_width, sample_width * 8,
+        b"data", data_size,
+    )
+
+
+def wav_bytes(pcm: bytes, fmt: PcmFormat = PCM16_MONO_16K) -> bytes:
+    """PCM i minnet som komplett WAV."""
+    return wav_header(len(pcm), fmt.sample_rate, fmt.channels, fmt.sample_width) + pcm
+
+
+def read_layout(path: PathLike) -> Tuple[int, int, PcmFormat]:
+    """(offset till ljuddata, antal bytes ljud, format) för .pcm eller .wav.
+
+    WAV-chunks gås igenom så att extra chunks (LIST m.fl.) hoppas över. En
+    data-storlek som saknas eller är för stor (fil som fortfarande skrivs)
+    ersätts med resten av filen.
+    """
+    path = Path(path)
+    file_size = path.stat().st_size
+    if path.suffix.lower() != ".wav":
+        return 0, file_size, PCM16_MONO_16K
+    fmt = PCM16_MONO_16K
+    with path.open("rb") as f:
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:12] != b"WAVE":
+            # Inte RIFF – anta standardheader
+            return WAV_HEADER_SIZE, max(0, file_size - WAV_HEADER_SIZE), fmt
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                break
+            chunk_id, size = struct.unpack("<4sI", header)
+            if chunk_id == b"fmt ":
+                body = f.read(size)
+                channels, sample_rate = struct.unpack_from("<HI", body, 2)
+                bits = struct.unpack_from("<H", body, 14)[0]
+                fmt = PcmFormat(sample_rate, channels, bits // 8)
+                f.seek(size % 2, os.SEEK_CUR)
+            elif chunk_id == b"data":
+                offset = f.tell()
+                available = file_size - offset
+                data_size = available if size == 0 or size > available else size
+                return offset, data_size, fmt
+            else:
+                f.seek(size + size % 2, os.SEEK_CUR)
+    return WAV_HEADER_SIZE, max(0, file_size - WAV_HEADER_SIZE), fmt
+
+
+class AudioFile:
+    """PCM- eller WAV-fil läst via mmap (ingen full inläsning, även för timslånga filer)."""
+
+    def __init__(self, path: PathLike):
+        self.path = Path(path)
+        self.offset, self.data_size, self.format = read_layout(self.path)
+        self._file: Optional[BinaryIO] = None
+        self._map: Optional[mmap.mmap] = None
+
+    def __enter__(self) -> "AudioFile":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    @property
+    def frame_count(self) -> int:
+        return self.data_size // self.format.bytes_per_frame
+
+    @property
+    def duration_sec(self) -> float:
+        return self.frame_count / self.format.sample_rate
+
+    def _mapped(self) -> Optional[mmap.mmap]:
+        if self._map is None and self.data_size > 0:
+            self._file = self.path.open("rb")
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def samples(self, channel: Optional[int] = None) -> np.ndarray:
+        """int16-samples mappade från filen (en kanal om `channel` anges)."""
+        if self.frame_count == 0:
+            return np.zeros(0, dtype="<i2")
+        count = self.frame_count * self.format.channels
+        data = np.frombuffer(self._mapped(), dtype="<i2", count=count, offset=self.offset)
+        if channel is not None and self.format.channels > 1:
+            return data.reshape(-1, self.format.channels)[:, channel]
+        return data
+
+    def read(self, offset: int, length: int) -> bytes:
+        """`length` bytes ljud från `offset` (relativt ljuddatans början)."""
+        mapped = self._mapped()
+        if mapped is None:
+            return b""
+        start = self.offset + max(0, offset)
+        return mapped[start:min(start + length, self.offset + self.data_size)]
+
+    def iter_chunks(self, chunk_bytes: int = COPY_CHUNK_BYTES) -> Iterator[memoryview]:
+        """Ljuddata i chunkar om hela frames som memoryview-utsnitt av mappningen."""
+        mapped = self._mapped()
+        if mapped is None:
+            return
+        chunk_bytes -= chunk_bytes % self.format.bytes_per_frame
+        view = memoryview(mapped)[self.offset:self.offset + self.data_size]
+        try:
+            for start in range(0, len(view), chunk_bytes):
+                yield view[start:start + chunk_bytes]
+        finally:
+            view.release()
+
+    def close(self) -> None:
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # En numpy-vy lever kvar; mappningen frigörs när den försvinner
+                pass
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def open_audio(path: PathLike) -> AudioFile:
+    return AudioFile(path)
+
+
+class WavWriter:
+    """Strömmande WAV-skrivare: headern skrivs först och storlekarna fylls i vid `close()`.
+
+    Kan skriva godtyckligt långa inspelningar utan att hålla ljudet i minnet.
+    """
+
+    def __init__(self, path: PathLike, fmt: PcmFormat = PCM16_MONO_16K):
+        self.path = Path(path)
+        self.format = fmt
+        self.bytes_written = 0
+        self._file = self.path.open("wb")
+        self._file.write(wav_header(0, fmt.sample_rate, fmt.channels, fmt.sample_width))
+
+    def __enter__(self) -> "WavWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def write(self, data) -> None:
+        self._file.write(data)
+        self.bytes_written += len(memoryview(data).cast("B"))
+
+    def close(self) -> None:
+        if self._file is None:
+            return
+        pad = self.bytes_written % 2
+        if pad:
+            self._file.write(b"\x00")  # RIFF-chunks har jämn längd
+        self._file.seek(0)
+        fmt = self.format
+        self._file.write(wav_header(self.bytes_written, fmt.sample_rate, fmt.channels, fmt.sample_width))
+        if pad:
+            # Utfyllnaden räknas in i RIFF-storleken men inte i data-chunkens storlek
+            self._file.seek(4)
+            self._file.write(struct.pack("<I", 36 + self.bytes_written + pad))
+        self._file.close()
+        self._file = None
+
+
+def pcm_to_wav(pcm_path: PathLike, wav_path: Optional[PathLike] = None, fmt: PcmFormat = PCM16_MONO_16K,
+               chunk_bytes: int = COPY_CHUNK_BYTES) -> Path:
+    """Konvertera en rå PCM-fil till WAV i chunkar (filen läses aldrig in i minnet)."""
+    pcm_path = Path(pcm_path)
+    if not pcm_path.exists():
+        raise FileNotFoundError(f"PCM-fil hittades inte: {pcm_path}")
+    wav_path = Path(wav_path) if wav_path is not None else pcm_path.with_suffix(".wav")
+    with pcm_path.open("rb") as src, WavWriter(wav_path, fmt) as writer:
+        while chunk := src.read(chunk_bytes):
+            writer.write(chunk)
+    return wav_path
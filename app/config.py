@@ -1,17 +1,43 @@
 # app/config.py
 from __future__ import annotations
 
+import asyncio
+import logging
 import os
-from dotenv import load_dotenv
-from pydantic import BaseModel
+import signal
+import time
+from typing import Dict, Mapping, Optional
+
+from dotenv import dotenv_values, load_dotenv
+from pydantic import BaseModel, ValidationError
+
+log = logging.getLogger("config")
+
+# .env läses lokalt om den finns (Render använder sina egna env vars).
+# Processens egna miljövariabler vinner alltid över .env, även vid omläsning.
+ENV_FILE = os.getenv("SETTINGS_ENV_FILE", ".env")
+_PROCESS_ENV = dict(os.environ)
+load_dotenv(ENV_FILE)
+
+# Fält som maskeras i loggar
+SECRET_FIELDS = {"openai_api_key", "elevenlabs_api_key"}
 
-# Ladda .env lokalt om den finns (Render använder sina egna env vars)
-load_dotenv()
 
 class Settings(BaseModel):
+    """Typade runtime-inställningar, lästa en gång från miljön.
+
+    Varje fält motsvarar miljövariabeln med samma namn i versaler
+    (`commit_interval_ms` ← `COMMIT_INTERVAL_MS`). Det finns en enda
+    instans (`settings`) som sessioner håller en referens till;
+    `reload_settings()` (SIGHUP) uppdaterar den på plats så att pågående
+    sessioner ser nya värden utan omstart.
+    """
+
     # --- Server-inställningar ---
     host: str = "0.0.0.0"
     port: int = 8000
+    drain_timeout_sec: float = 25.0
+    ws_batch_ms: float = 0.0
 
     # --- CORS-inställningar (används av flera moduler) ---
     cors_origins: str = (
@@ -21,4 +47,138 @@ class Settings(BaseModel):
         "http://localhost:5173"
     )
 
-settings = Settings()
+    # --- STT (OpenAI/Azure Realtime) ---
+    realtime_url: str = "wss://api.openai.com/v1/realtime?model=gpt-4o-mini-realtime-preview-2024-12-17"
+    openai_api_key: str = ""
+    transcribe_model: str = "gpt-4o-mini-transcribe"
+    input_language: str = "sv"
+    add_beta_header: bool = True
+    commit_interval_ms: int = 150
+    ws_default_mode: str = "json"
+    stt_connect_timeout_ms: float = 3000.0
+    stt_partial_mode: str = "full"
+    stt_partial_window_ms: float = 50.0
+    stt_partial_snapshot_every: int = 20
+
+    # --- LLM ---
+    conversation_ttl_sec: float = 3600.0
+
+    # --- TTS (ElevenLabs) ---
+    elevenlabs_api_key: str = ""
+    # Automatisk justering av chunk_length_schedule mot TTFB-målet (se app/tts/schedule_tuner.py)
+    tts_schedule_tuning: bool = True
+    tts_target_ttfb_ms: float = 500.0
+    tts_gap_limit_ms: float = 250.0
+    tts_schedule_file: str = ""  # tomt = inlärda scheman bara i minnet
+    # Pacing av utgående ljud i realtidstakt (se app/tts/paced_sender.py)
+    tts_pacing: bool = False
+    tts_pacing_lead_ms: int = 300
+    tts_pacing_jitter_ms: int = 100
+    tts_pacing_max_buffer_ms: int = 10000
+    tts_pacing_frame_ms: int = 40
+    # Hedging mellan TTS-engines (se app/tts/engine_router.py)
+    tts_hedging: bool = False
+    tts_hedge_after_ms: float = 800.0
+    tts_hedge_min_ms: float = 300.0
+    tts_hedge_max_ms: float = 4000.0
+
+    # --- Inspelning och ljudfiler ---
+    audio_output_dir: str = "test_output"
+    record_sessions: bool = False
+    recording_dir: str = ""  # tomt = audio_output_dir
+    recording_segment_bytes: int = 8 * 1024 * 1024
+
+    # --- Readiness (/readyz) ---
+    readyz_probes: bool = True
+    readyz_probe_interval_sec: float = 15.0
+    readyz_probe_timeout_sec: float = 3.0
+    readyz_max_loop_lag_ms: float = 250.0
+    max_sessions: int = 0  # 0 = ingen gräns
+    probe_realtime_url: str = ""  # tomt = realtime_url
+    probe_elevenlabs_url: str = "https://api.elevenlabs.io/v1/models"
+    probe_openai_url: str = "https://api.openai.com/v1/models"
+
+    # --- Debug och övervakning ---
+    debug_publish_interval_sec: float = 2.0
+    debug_ttl_sec: float = 3600.0
+    loop_monitor: bool = True
+    loop_lag_interval_sec: float = 0.25
+    slow_callback_ms: float = 100.0
+
+    @classmethod
+    def from_env(cls, env: Optional[Mapping[str, str]] = None) -> "Settings":
+        """Bygg inställningar från miljön (.env + processens variabler om `env` saknas)."""
+        env = _current_env() if env is None else env
+        values = {name: env[name.upper()] for name in cls.model_fields if name.upper() in env}
+        return cls.model_validate(values)
+
+    def update_from(self, other: "Settings") -> Dict[str, tuple]:
+        """Kopiera in värden från `other` på plats. Returnerar ändrade fält (gammalt, nytt)."""
+        changed = {}
+        for name in type(self).model_fields:
+            old, new = getattr(self, name), getattr(other, name)
+            if old != new:
+                setattr(self, name, new)
+                changed[name] = (old, new)
+        return changed
+
+
+def _current_env() -> Dict[str, str]:
+    values = {k: v for k, v in dotenv_values(ENV_FILE).items() if v is not None} if os.path.exists(ENV_FILE) else {}
+    values.update(_PROCESS_ENV)
+    return values
+
+
+def _masked(name: str, value) -> object:
+    return ("***" if value else "") if name in SECRET_FIELDS else value
+
+
+def public_settings() -> Dict[str, object]:
+    """Alla inställningar utom hemligheter (för /config)."""
+    return {name: value for name, value in settings.model_dump().items() if name not in SECRET_FIELDS}
+
+
+settings = Settings.from_env()
+settings_version = 1
+settings_loaded_at = time.time()
+
+
+def reload_settings(env: Optional[Mapping[str, str]] = None) -> Dict[str, tuple]:
+    """Läs om inställningarna och uppdatera `settings` på plats.
+
+    Ogiltiga värden loggas och ignoreras (de gamla inställningarna gäller).
+    Returnerar ändrade fält.
+    """
+    global settings_version, settings_loaded_at
+    try:
+        fresh = Settings.from_env(env)
+    except ValidationError as e:
+        log.error("Settings reload rejected, keeping current settings: %s", e)
+        return {}
+    changed = settings.update_from(fresh)
+    settings_loaded_at = time.time()
+    if changed:
+        settings_version += 1
+        log.info("Settings reloaded (v%d): %s", settings_version,
+                 {name: (_masked(name, old), _masked(name, new)) for name, (old, new) in changed.items()})
+    else:
+        log.info("Settings reloaded, no changes")
+    return changed
+
+
+def install_reload_handler() -> bool:
+    """Läs om inställningarna vid SIGHUP (ingen omstart, sessioner behålls)."""
+    if not hasattr(signal, "SIGHUP"):
+        return False
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, reload_settings)
+    except (NotImplementedError, RuntimeError, ValueError):
+        # Inte i huvudtråden (t.ex. TestClient) → ingen signalhantering
+        log.debug("SIGHUP handler not installed")
+        return False
+    return True
+
+
+def settings_status() -> dict:
+    """Version och tidpunkt för senaste inläsning (för /config)."""
+    return {"version": settings_version, "loaded_at": settings_loaded_at}
@@ -1,9 +1,22 @@
 from __future__ import annotations
 
+import asyncio
+import logging
 import time
 import uuid
 from collections import deque
-from typing import Dict, Deque, List, Any
+from typing import Dict, Deque, List, Any, Optional
+
+import orjson
+
+from .audio import LevelMeter
+from .config import settings
+from .state_backend import StateBackend, state
+
+log = logging.getLogger("debug_store")
+
+# Hur ofta aktiva sessioner publiceras till delad backend, och hur länge de sparas:
+# settings.debug_publish_interval_sec och settings.debug_ttl_sec
 
 class SessionBuffers:
     def __init__(self, max_items: int = 500):
@@ -13,10 +26,54 @@ class SessionBuffers:
         self.openai_text: Deque[str] = deque(maxlen=max_items)
         self.frontend_text: Deque[str] = deque(maxlen=max_items)
         self.rt_events: Deque[str] = deque(maxlen=max_items)
+        # Nivåanalys av inkommande (till STT) och utgående (TTS) ljud, bara räknare
+        self.audio_in = LevelMeter()
+        self.audio_out = LevelMeter()
+
+    def output_meter(self, sample_rate: Optional[int]) -> Optional[LevelMeter]:
+        """Meter för utgående ljud i given samplingsfrekvens (None = komprimerat ljud, ingen analys)."""
+        if sample_rate is None:
+            return None
+        if self.audio_out.sample_rate != sample_rate:
+            self.audio_out = LevelMeter(sample_rate)
+        return self.audio_out
+
+    def audio_levels(self) -> Dict[str, Any]:
+        return {"in": self.audio_in.snapshot(), "out": self.audio_out.snapshot()}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "started_at": self.started_at,
+            "frontend_chunks": list(self.frontend_chunks),
+            "openai_chunks": list(self.openai_chunks),
+            "openai_text": list(self.openai_text),
+            "frontend_text": list(self.frontend_text),
+            "rt_events": list(self.rt_events),
+            "audio_levels": {"in": self.audio_in.to_dict(), "out": self.audio_out.to_dict()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], max_items: int = 500) -> "SessionBuffers":
+        buffers = cls(max_items)
+        buffers.started_at = data.get("started_at", buffers.started_at)
+        for name in ("frontend_chunks", "openai_chunks", "openai_text", "frontend_text", "rt_events"):
+            getattr(buffers, name).extend(data.get(name, []))
+        levels = data.get("audio_levels") or {}
+        buffers.audio_in = LevelMeter.from_dict(levels.get("in"))
+        buffers.audio_out = LevelMeter.from_dict(levels.get("out"))
+        return buffers
 
 class DebugStore:
-    def __init__(self):
+    """Debug-buffertar per session.
+
+    Hot path skriver alltid till processens minne. Med en delad backend
+    (shm/redis) publiceras aktiva sessioner periodiskt så att `/debug/*`
+    fungerar oavsett vilken worker som svarar.
+    """
+
+    def __init__(self, backend: Optional[StateBackend] = None):
         self._sessions: Dict[str, SessionBuffers] = {}
+        self._backend = backend if backend is not None else state
 
     def get_or_create(self, session_id: str) -> SessionBuffers:
         if session_id not in self._sessions:
@@ -28,6 +85,14 @@ class DebugStore:
         self._sessions[sid] = SessionBuffers()
         return sid
 
+    async def open_session(self, session_id: Optional[str] = None) -> str:
+        """Ny session, eller återuppta en befintlig (lokalt eller från delad backend)."""
+        if not session_id:
+            return self.new_session()
+        if session_id not in self._sessions:
+            self._sessions[session_id] = await self.load(session_id)
+        return session_id
+
     def list_sessions(self) -> List[str]:
         return list(self._sessions.keys())
 
@@ -37,4 +102,43 @@ class DebugStore:
         else:
             self._sessions.clear()
 
+    async def publish(self, session_id: str) -> None:
+        """Spara en ögonblicksbild av sessionen i den delade backenden."""
+        if not self._backend.shared or session_id not in self._sessions:
+            return
+        try:
+            data = orjson.dumps(self._sessions[session_id].to_dict())
+            await self._backend.set(f"debug:{session_id}", data, ttl_sec=settings.debug_ttl_sec)
+        except Exception as e:
+            log.warning("Kunde inte publicera debug-data för %s: %s", session_id, e)
+
+    def start_publisher(self, session_id: str) -> Optional[asyncio.Task]:
+        """Publicera sessionen periodiskt (bara med delad backend)."""
+        if not self._backend.shared:
+            return None
+
+        async def _loop():
+            try:
+                while True:
+                    await asyncio.sleep(settings.debug_publish_interval_sec)
+                    await self.publish(session_id)
+            except asyncio.CancelledError:
+                await self.publish(session_id)
+                raise
+
+        return asyncio.create_task(_loop())
+
+    async def load(self, session_id: str) -> SessionBuffers:
+        """Hämta sessionen lokalt, annars från delad backend (t.ex. annan worker)."""
+        if session_id in self._sessions or not self._backend.shared:
+            return self.get_or_create(session_id)
+        try:
+            raw = await self._backend.get(f"debug:{session_id}")
+        except Exception as e:
+            log.warning("Kunde inte läsa debug-data för %s: %s", session_id, e)
+            raw = None
+        if raw is None:
+            return self.get_or_create(session_id)
+        return SessionBuffers.from_dict(orjson.loads(raw))
+
 store = DebugStore()
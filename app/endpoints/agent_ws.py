@@ -0,0 +1,306 @@
+import asyncio
+import logging
+import time
+from contextlib import aclosing
+from typing import Optional
+
+import orjson
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from starlette.websockets import WebSocketState
+
+from ..admission import AdmissionRejected, PROVIDER_REALTIME
+from ..affinity import make_token, resume_session_id
+from ..debug_store import store
+from ..lifecycle import lifecycle
+from ..messaging import FrontendChannel, STT_FINAL
+from ..profiles import activate_profile, current_profile
+from ..llm.receive_text_from_stt import process_final_transcription
+from ..stt.decoders import DecodeStage, UnsupportedCodec, available_codecs, create_decoder
+from ..stt.engine_router import stt_router
+from ..stt.event_to_text import TranscriptState
+from ..stt.partial_emitter import PartialEmitter
+from ..stt.receive_audio_from_frontend import process_frontend_message
+from ..tts.engine_router import tts_router
+from ..tts.paced_sender import PacedAudioSender, pacing_enabled_by_default
+from ..tts.send_audio_to_frontend import send_audio_to_frontend
+
+log = logging.getLogger("agent")
+
+router = APIRouter()
+
+
+def _ms(start: Optional[float], end: Optional[float]) -> Optional[float]:
+    if start is None or end is None:
+        return None
+    return round((end - start) * 1000, 1)
+
+
+class _Turn:
+    """Tidsstämplar för en tur: tal slut → transkript → LLM-svar → ljud."""
+
+    def __init__(self, number: int, text: str, speech_stopped_at: Optional[float]):
+        self.number = number
+        self.text = text
+        self.speech_stopped_at = speech_stopped_at
+        self.final_at = time.time()
+        self.llm_done_at: Optional[float] = None
+        self.first_audio_at: Optional[float] = None
+        self.audio_done_at: Optional[float] = None
+
+    def latency(self) -> dict:
+        start = self.speech_stopped_at or self.final_at
+        return {
+            "stt_ms": _ms(self.speech_stopped_at, self.final_at),
+            "llm_ms": _ms(self.final_at, self.llm_done_at),
+            "tts_ttfb_ms": _ms(self.llm_done_at, self.first_audio_at),
+            "tts_ms": _ms(self.llm_done_at, self.audio_done_at),
+            "first_audio_ms": _ms(start, self.first_audio_at),
+            "total_ms": _ms(start, self.audio_done_at),
+        }
+
+
+@router.websocket("/ws/agent")
+async def ws_agent(ws: WebSocket):
+    """STT → LLM → TTS på en och samma anslutning.
+
+    Frontend skickar ljud (binärt; PCM16 eller `?codec=`, ev. `audio.format`)
+    och får tillbaka JSON-meddelanden (`stt.partial`, `stt.final`,
+    `llm.text`, `turn.done`) samt TTS-ljud som binära frames. STT-engine
+    väljs av stt_router (`?stt_engine=`) som i `/ws/transcribe`; failover
+    sker bara vid anslutning. Tur-detektering sköts av Realtime server-VAD
+    (övriga engines delar upp yttranden vid `commit()`).
+    """
+    await ws.accept()
+    if await lifecycle.reject_if_draining(ws):
+        return
+    # Binära frames är TTS-ljud → JSON-framing (batchning av debug kan förhandlas)
+    channel = FrontendChannel.from_websocket(ws, allow_binary=False)
+
+    pacing_param = ws.query_params.get("pacing")
+    paced = pacing_param.lower() == "true" if pacing_param else pacing_enabled_by_default()
+    # Röst-/modellprofil (?profile=) gäller STT, LLM och TTS för hela anslutningen
+    activate_profile(ws.query_params.get("profile"))
+
+    # Komprimerat ljud (?codec=) avkodas och annan samplerate resamplas som i /ws/transcribe
+    try:
+        decode = DecodeStage(create_decoder(ws.query_params.get("codec")))
+    except UnsupportedCodec as e:
+        log.warning("Rejecting agent session: %s", e)
+        await channel.send(e.to_message())
+        await channel.close(code=1003)  # Unsupported data
+        return
+
+    # Återuppta sessionen om klienten skickar sitt affinity-token
+    session_id = await store.open_session(resume_session_id(ws.query_params.get("affinity")))
+    buffers = store.get_or_create(session_id)
+    # Nivåanalys av utgående TTS-ljud (bara för rå PCM, se Profile.pcm_sample_rate)
+    out_rate = current_profile().pcm_sample_rate
+    out_meter = buffers.output_meter(out_rate)
+    if paced and not out_rate:
+        # Pacing kräver känd byte-takt; komprimerat ljud skickas som det kommer
+        log.info("Pacing disabled for non-PCM output format %s", current_profile().output_format)
+        paced = False
+
+    async def send_json(obj: dict):
+        if ws.client_state == WebSocketState.CONNECTED:
+            await channel.send(obj)
+
+    await send_json({
+        "type": "ready",
+        "audio_in": {**decode.decoder.describe(), "codecs_available": available_codecs()},
+        "audio_out": current_profile().audio_out,
+        **channel.negotiated(),
+    })
+    await send_json({"type": "session.started", "session_id": session_id, "affinity_token": make_token(session_id)})
+
+    session = lifecycle.register_websocket(channel, "agent", session_id)
+    try:
+        stt = await stt_router.connect(ws.query_params.get("stt_engine"))
+    except AdmissionRejected as e:
+        lifecycle.unregister(session)
+        await send_json(e.to_message())
+        await channel.close(code=1013)
+        return
+    except Exception as e:
+        lifecycle.unregister(session)
+        await send_json({"type": "error", "reason": "realtime_connect_failed", "detail": str(e)})
+        await channel.close()
+        return
+    rt = stt.client
+    session.upstream_opened(stt.provider)
+    await send_json({"type": "info", "msg": "realtime_connected", "engine": stt.engine_name})
+    # Realtime delar upp yttranden med server-VAD; övriga engines gör det vid commit()
+    commit_per_chunk = stt.provider != PROVIDER_REALTIME
+
+    partials = PartialEmitter.from_websocket(channel)
+    transcripts = TranscriptState()
+    speech_stopped_at: Optional[float] = None
+    turn_count = 0
+    turn_task: Optional[asyncio.Task] = None
+
+    async def run_turn(turn: _Turn):
+        """LLM-svar och TTS för en final transkription."""
+        try:
+            response = await process_final_transcription(session_id, turn.text)
+        except AdmissionRejected as e:
+            await send_json({**e.to_message(), "turn": turn.number})
+            return
+        turn.llm_done_at = time.time()
+        if not response:
+            await send_json({"type": "error", "message": "Failed to get response from AI", "turn": turn.number})
+            return
+        await send_json({"type": "llm.text", "text": response, "turn": turn.number})
+
+        sink = PacedAudioSender(channel, bytes_per_sec=out_rate * 2, started_at=turn.llm_done_at) if paced else channel
+        stream_stats = {}
+        audio_bytes_total = 0
+        last_chunk_ts = None
+        try:
+            async with aclosing(tts_router.stream(channel, response, turn.llm_done_at, stream_stats)) as stream:
+                async for server_msg, current_audio_bytes in stream:
+                    audio_bytes_total, last_chunk_ts, should_break = await send_audio_to_frontend(
+                        sink, server_msg, current_audio_bytes, last_chunk_ts, meter=out_meter
+                    )
+                    if turn.first_audio_at is None and last_chunk_ts is not None:
+                        turn.first_audio_at = last_chunk_ts
+                    if should_break:
+                        break
+            pacing = await sink.finish() if paced else None
+        except asyncio.CancelledError:
+            if paced:
+                await sink.cancel()
+            raise
+        except AdmissionRejected as e:
+            await send_json({**e.to_message(), "turn": turn.number})
+            return
+        except Exception as e:
+            # Alla engines misslyckades (eller oväntat fel) → frigör pacing och meddela klienten
+            if paced:
+                await sink.cancel()
+            log.error("TTS failed for turn %d in session %s: %s", turn.number, session_id, e)
+            await send_json({"type": "error", "reason": "tts_failed", "turn": turn.number})
+            return
+        turn.audio_done_at = time.time()
+
+        done = {
+            "type": "turn.done",
+            "turn": turn.number,
+            "latency_ms": turn.latency(),
+            "audio_bytes_total": audio_bytes_total,
+            "engine": stream_stats.get("engine"),
+        }
+        if pacing is not None:
+            done["pacing"] = pacing
+        await send_json(done)
+        log.info("Agent turn %d done for session %s: %s", turn.number, session_id, done["latency_ms"])
+
+    async def on_rt_event(evt: dict):
+        nonlocal speech_stopped_at, turn_count, turn_task
+
+        evt_type = evt.get("type")
+        if evt_type == "input_audio_buffer.speech_stopped":
+            speech_stopped_at = time.time()
+        elif evt_type == "input_audio_buffer.speech_started" and turn_task and not turn_task.done():
+            # Användaren pratar igen → avbryt pågående svar (barge-in)
+            turn_task.cancel()
+            await send_json({"type": "turn.interrupted", "turn": turn_count})
+
+        result = transcripts.process(evt, buffers)
+        if not result:
+            return
+        if result["type"] == "error":
+            await send_json({"type": "error", "reason": "realtime_error", "detail": result["detail"]})
+            return
+        if result["type"] == "info":
+            await send_json({"type": "info", "msg": result["msg"]})
+            return
+        if result["type"] != "transcript" or not (result["delta"] or result["is_final"]):
+            return
+
+        buffers.openai_text.append(result["text"])
+        buffers.frontend_text.append(result["delta"])
+
+        if not result["is_final"]:
+            if ws.client_state == WebSocketState.CONNECTED:
+                partials.push(result["text"])
+            return
+
+        await partials.end_utterance()
+
+        if ws.client_state == WebSocketState.CONNECTED:
+            await channel.send_schema(STT_FINAL, result["text"])
+        if not result["text"].strip():
+            return
+        if turn_task and not turn_task.done():
+            turn_task.cancel()
+        turn_count += 1
+        turn_task = asyncio.create_task(run_turn(_Turn(turn_count, result["text"], speech_stopped_at)))
+        speech_stopped_at = None
+
+    # Kontrollmeddelande före första ljudet: {"type": "audio.format", "sample_rate_hz": 48000, "channels": 2}
+    async def handle_control(text: str):
+        try:
+            data = orjson.loads(text)
+        except Exception:
+            return
+        if not isinstance(data, dict) or data.get("type") != "audio.format":
+            return
+        try:
+            accepted = decode.set_input_format(data)
+        except ValueError as e:
+            await send_json({"type": "error", "reason": "unsupported_audio_format", "detail": str(e)})
+            return
+        log.info("Input format for %s: %d Hz, %d ch", session_id, accepted["sample_rate_hz"], accepted["channels"])
+        await send_json(accepted)
+
+    rt_recv_task = asyncio.create_task(rt.recv_loop(on_rt_event))
+    publisher = store.start_publisher(session_id)
+
+    try:
+        while ws.client_state == WebSocketState.CONNECTED:
+            try:
+                msg = await ws.receive()
+            except (WebSocketDisconnect, RuntimeError):
+                break
+            if msg.get("type") == "websocket.disconnect":
+                break
+
+            result = process_frontend_message(msg, buffers)
+            if result["type"] == "audio":
+                pcm = await decode.decode(result["chunk"])
+                if not pcm:
+                    continue
+                try:
+                    await rt.send_audio_chunk(pcm)
+                    if commit_per_chunk:
+                        await rt.commit()
+                    buffers.openai_chunks.append(len(pcm))
+                    buffers.audio_in.push(pcm)
+                except Exception as e:
+                    log.error("Fel när chunk skickades till %s: %s", stt.engine_name, e)
+                    break
+            elif result["type"] == "ping":
+                await channel.send_text("pong")
+            elif result["type"] == "text":
+                await handle_control(result["text"])
+    finally:
+        tasks = [rt_recv_task] + ([turn_task] if turn_task else []) + ([publisher] if publisher else [])
+        for task in tasks:
+            task.cancel()
+        try:
+            await rt.close()
+        except Exception:
+            pass
+        stt.release()
+        session.upstream_closed(stt.provider)
+        await asyncio.gather(*tasks, return_exceptions=True)
+        lifecycle.unregister(session)
+        await partials.close()
+        if not decode.passthrough:
+            log.info("Audio ingest for %s: %s", session_id, decode.stats())
+        if ws.client_state != WebSocketState.DISCONNECTED:
+            try:
+                await channel.close()
+            except Exception:
+                pass
+        log.info("Agent WebSocket closed: %s", session_id)
@@ -1,56 +1,210 @@
+import asyncio
 import os
-import base64
-from pathlib import Path
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import HTMLResponse, FileResponse
-from typing import Dict, Any, List, Optional
-import wave
+import re
 import time
+from pathlib import Path
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import Dict, Any, List, Optional, Tuple
+
+from ..config import settings
+from ..audio import PCM_SAMPLE_RATE, PCM_SAMPLE_WIDTH, WAV_HEADER_SIZE, min_max_peaks, open_audio, wav_header
 
 router = APIRouter()
 
+# Katalog med genererade audio-filer (AUDIO_OUTPUT_DIR)
+AUDIO_DIR = Path(settings.audio_output_dir)
+
+STREAM_CHUNK_BYTES = 64 * 1024
+# Listan byggs om när katalogen ändras, men minst så här ofta (filer som växer)
+LISTING_MAX_AGE_SEC = 2.0
+
+_RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+def _resolve(filename: str) -> Path:
+    """Säker sökväg inom AUDIO_DIR (inga kataloger eller '..')."""
+    if not filename or Path(filename).name != filename or filename.startswith("."):
+        raise HTTPException(status_code=400, detail="Ogiltigt filnamn")
+    file_path = AUDIO_DIR / filename
+    if not file_path.is_file():
+        raise HTTPException(status_code=404, detail="Filen hittades inte")
+    return file_path
+
+
+class _ListingCache:
+    """Cachad fil-lista; byggs om när katalogens mtime ändras eller listan är gammal."""
+
+    def __init__(self, max_age_sec: float = LISTING_MAX_AGE_SEC):
+        self.max_age_sec = max_age_sec
+        self._key: Optional[Tuple[str, int]] = None
+        self._built_at = 0.0
+        self._files: List[Dict[str, Any]] = []
+
+    def get(self, directory: Path) -> List[Dict[str, Any]]:
+        key = (str(directory), directory.stat().st_mtime_ns)
+        if key != self._key or time.monotonic() - self._built_at > self.max_age_sec:
+            self._files = self._scan(directory)
+            self._key = key
+            self._built_at = time.monotonic()
+        return self._files
+
+    @staticmethod
+    def _scan(directory: Path) -> List[Dict[str, Any]]:
+        audio_files = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                suffix = Path(entry.name).suffix.lower()
+                if not entry.is_file() or suffix not in (".pcm", ".wav"):
+                    continue
+                stat = entry.stat()
+                data_size = stat.st_size - (WAV_HEADER_SIZE if suffix == ".wav" else 0)
+                audio_files.append({
+                    'name': entry.name,
+                    'path': str(directory / entry.name),
+                    'size': stat.st_size,
+                    'modified': stat.st_mtime,
+                    'type': suffix,
+                    'duration_sec': round(max(0, data_size) / (PCM_SAMPLE_RATE * PCM_SAMPLE_WIDTH), 2),
+                })
+        # Sortera efter senaste modifiering (nyaste först)
+        audio_files.sort(key=lambda x: x['modified'], reverse=True)
+        return audio_files
+
+
+_listing = _ListingCache()
+
+# Vågformsdata per (fil, storlek, mtime, punkter) – beräknas en gång
+_peaks_cache: Dict[Tuple[str, int, int, int], Dict[str, Any]] = {}
+_PEAKS_CACHE_MAX = 64
+
+
 @router.get("/audio-files")
 async def list_audio_files() -> Dict[str, Any]:
     """Returnerar lista över audio-filer för dropdown."""
-    output_dir = Path("test_output")
-    
-    if not output_dir.exists():
+    if not AUDIO_DIR.exists():
         return {
             "files": [],
             "message": "Inga audio-filer hittades. Kör ett test först."
         }
-    
-    # Hitta alla audio-filer
-    audio_files = []
-    for file_path in output_dir.glob("*"):
-        if file_path.is_file() and file_path.suffix.lower() in ['.pcm', '.wav']:
-            stat = file_path.stat()
-            audio_files.append({
-                'name': file_path.name,
-                'path': str(file_path),
-                'size': stat.st_size,
-                'modified': stat.st_mtime,
-                'type': file_path.suffix.lower()
-            })
-    
-    # Sortera efter senaste modifiering (nyaste först)
-    audio_files.sort(key=lambda x: x['modified'], reverse=True)
-    
+
+    audio_files = await asyncio.to_thread(_listing.get, AUDIO_DIR)
     return {
         "files": audio_files,
         "message": f"Hittade {len(audio_files)} audio-filer"
     }
 
+
+def _parse_range(header: Optional[str], total: int) -> Optional[Tuple[int, int]]:
+    """Tolka `Range: bytes=a-b` → (start, end inklusive). None = hela filen."""
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match or (not match.group(1) and not match.group(2)):
+        raise HTTPException(status_code=416, detail="Ogiltigt Range-huvud",
+                            headers={"Content-Range": f"bytes */{total}"})
+    if match.group(1):
+        start = int(match.group(1))
+        end = int(match.group(2)) if match.group(2) else total - 1
+    else:
+        # Suffix-range: sista N bytes
+        start = max(0, total - int(match.group(2)))
+        end = total - 1
+    end = min(end, total - 1)
+    if start > end or start >= total:
+        raise HTTPException(status_code=416, detail="Range utanför filen",
+                            headers={"Content-Range": f"bytes */{total}"})
+    return start, end
+
+
+async def _stream_virtual(prefix: bytes, file_path: Path, start: int, end: int):
+    """Strömma bytes [start, end] av den virtuella filen `prefix + fil`."""
+    position = start
+    if position < len(prefix):
+        piece = prefix[position:end + 1]
+        yield piece
+        position += len(piece)
+    if position > end:
+        return
+    with file_path.open("rb") as f:
+        f.seek(position - len(prefix))
+        remaining = end - position + 1
+        while remaining > 0:
+            chunk = await asyncio.to_thread(f.read, min(STREAM_CHUNK_BYTES, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
 @router.get("/download-audio/{filename}")
-async def download_audio(filename: str):
-    """Laddar ner en audio-fil."""
-    file_path = Path("test_output") / filename
-    
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail="Filen hittades inte")
-    
-    return FileResponse(
-        path=str(file_path),
-        filename=filename,
-        media_type='application/octet-stream'
+async def download_audio(request: Request, filename: str, raw: bool = Query(False, description="Rå PCM utan WAV-header")):
+    """Strömmar en audio-fil med stöd för Range (spolning).
+
+    PCM-filer serveras som WAV med en genererad header (filen läses aldrig
+    in i minnet); `?raw=true` ger rå PCM.
+    """
+    file_path = _resolve(filename)
+    file_size = file_path.stat().st_size
+
+    if file_path.suffix.lower() == ".pcm" and not raw:
+        prefix = wav_header(file_size)
+        media_type = "audio/wav"
+        download_name = file_path.with_suffix(".wav").name
+    else:
+        prefix = b""
+        media_type = "audio/wav" if file_path.suffix.lower() == ".wav" else "application/octet-stream"
+        download_name = filename
+
+    total = len(prefix) + file_size
+    byte_range = _parse_range(request.headers.get("range"), total)
+    start, end = byte_range if byte_range else (0, total - 1)
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Length": str(max(0, end - start + 1)),
+        "Content-Disposition": f'inline; filename="{download_name}"',
+    }
+    status_code = 200
+    if byte_range:
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{total}"
+
+    return StreamingResponse(
+        _stream_virtual(prefix, file_path, start, end),
+        status_code=status_code,
+        media_type=media_type,
+        headers=headers,
     )
+
+
+def compute_peaks(file_path: Path, points: int) -> Dict[str, Any]:
+    """Min/max per bucket för vågformsvisning (memory-mappad, ingen full inläsning)."""
+    with open_audio(file_path) as audio:
+        sample_rate = audio.format.sample_rate
+        if audio.frame_count == 0:
+            return {"sample_rate": sample_rate, "duration_sec": 0.0, "points": 0, "min": [], "max": []}
+        mins, maxs, bucket = min_max_peaks(audio.samples(channel=0), points)
+        return {
+            "sample_rate": sample_rate,
+            "duration_sec": round(audio.duration_sec, 3),
+            "points": len(mins),
+            "samples_per_point": bucket,
+            "min": mins.tolist(),
+            "max": maxs.tolist(),
+        }
+
+
+@router.get("/audio-peaks/{filename}")
+async def audio_peaks(filename: str, points: int = Query(800, ge=1, le=10000)) -> Dict[str, Any]:
+    """Förberäknad vågformsdata (min/max per punkt) för audio-visaren."""
+    file_path = _resolve(filename)
+    stat = file_path.stat()
+    key = (filename, stat.st_size, stat.st_mtime_ns, points)
+    peaks = _peaks_cache.get(key)
+    if peaks is None:
+        peaks = await asyncio.to_thread(compute_peaks, file_path, points)
+        if len(_peaks_cache) >= _PEAKS_CACHE_MAX:
+            _peaks_cache.pop(next(iter(_peaks_cache)))
+        _peaks_cache[key] = peaks
+    return {"name": filename, **peaks}
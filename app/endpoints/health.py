@@ -1,8 +1,22 @@
 import time
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from ..lifecycle import lifecycle
+from ..readiness import readiness
 
 router = APIRouter()
 
 @router.get("/healthz")
 async def healthz():
-    return {"ok": True, "ts": time.time()}
+    status = lifecycle.status()
+    if status["draining"]:
+        # 503 → lastbalanseraren slutar skicka nya anslutningar hit
+        return JSONResponse({"ok": False, "ts": time.time(), **status}, status_code=503)
+    return {"ok": True, "ts": time.time(), **status}
+
+@router.get("/readyz")
+async def readyz():
+    """Redo för nya sessioner? 503 om workern är mättad, dränerar eller har nere-leverantörer."""
+    snapshot = readiness.snapshot()
+    return JSONResponse(snapshot, status_code=200 if snapshot["ready"] else 503)
@@ -1,57 +1,120 @@
 import asyncio
 import logging
-import os
 import time
+import orjson
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
 from starlette.websockets import WebSocketState
 
+from ..admission import AdmissionRejected, PROVIDER_REALTIME
+from ..affinity import make_token, resume_session_id
+from ..lifecycle import lifecycle
+from ..messaging import FrontendChannel
+from ..recording import recorder, recording_enabled, TRACK_IN
 from ..config import settings
 from ..debug_store import store
-from ..stt.audio_to_event import AudioToEventClient
+from ..profiles import activate_profile
+from ..stt.engine_router import stt_router
+from ..stt.decoders import DecodeStage, UnsupportedCodec, available_codecs, create_decoder
+from ..stt.resample import TARGET_SAMPLE_RATE
 from ..stt.receive_audio_from_frontend import process_frontend_message
-from ..stt.event_to_text import process_realtime_event
+from ..stt.event_to_text import TranscriptState
+from ..stt.partial_emitter import PartialEmitter
 from ..stt.send_transcription_to_frontend import send_transcription_to_frontend
 
 log = logging.getLogger("stt")
 
 router = APIRouter()
 
+# STT-engine väljs per session via stt_router (?stt_engine=). En satt factory
+# ersätter urvalet med en lokal ersättare (t.ex. vid replay).
+realtime_client_factory = None
+
+
+async def _connect_stt(preferred):
+    if realtime_client_factory is not None:
+        return await stt_router.connect_client(realtime_client_factory, PROVIDER_REALTIME)
+    return await stt_router.connect(preferred)
+
 @router.websocket("/ws/transcribe")
 async def ws_transcribe(ws: WebSocket):
     await ws.accept()
     
     # A är default: JSON, B som fallback: ren text
-    mode = (ws.query_params.get("mode") or os.getenv("WS_DEFAULT_MODE", "json")).lower()
+    # Sessionen håller en referens till inställningarna (omläsning via SIGHUP slår igenom direkt)
+    cfg = settings
+    mode = (ws.query_params.get("mode") or cfg.ws_default_mode).lower()
     send_json = (mode == "json")
+    # Meddelanden till frontend: orjson/förkompilerade scheman, ev. MessagePack (?framing=msgpack)
+    channel = FrontendChannel.from_websocket(ws)
     
-    session_id = store.new_session()
+    # Under drain (omstart/deploy) tas inga nya sessioner emot
+    if await lifecycle.reject_if_draining(channel, notify=send_json):
+        return
+    
+    # Röst-/modellprofil (?profile=): språk för STT samt system-prompt och modell för LLM
+    activate_profile(ws.query_params.get("profile"))
+
+    # Komprimerat ljud (?codec=mulaw|opus|webm-opus) avkodas till PCM16 på servern
+    try:
+        decode = DecodeStage(create_decoder(ws.query_params.get("codec")))
+    except UnsupportedCodec as e:
+        log.warning("Rejecting session: %s", e)
+        if send_json:
+            await channel.send(e.to_message())
+        await channel.close(code=1003)  # Unsupported data
+        return
+
+    # Återuppta sessionen om klienten skickar sitt affinity-token
+    session_id = await store.open_session(resume_session_id(ws.query_params.get("affinity")))
     
     # Skicka "ready" meddelande för kompatibilitet med frontend
     if send_json:
-        await ws.send_json({
+        await channel.send({
             "type": "ready",
-            "audio_in": {"encoding": "pcm16", "sample_rate_hz": 16000, "channels": 1},
+            "audio_in": {**decode.decoder.describe(), "codecs_available": available_codecs()},
             "audio_out": {"mimetype": "audio/mpeg"},
+            **channel.negotiated(),
         })
-        await ws.send_json({"type": "session.started", "session_id": session_id})
+        await channel.send({"type": "session.started", "session_id": session_id, "affinity_token": make_token(session_id)})
 
-    # Setup klient mot OpenAI/Azure Realtime
-    rt = AudioToEventClient()  # Använder nu sina egna defaults/miljövariabler
-    
+    # Registrera sessionen så att drain kan varna och till sist stänga den
+    session = lifecycle.register_websocket(channel, "transcribe", session_id, notify=send_json)
+
+    # Anslut STT-engine (Realtime som standard); admission control begränsar
+    # samtidiga sessioner per leverantör och routern byter leverantör vid fel
     try:
-        await rt.connect()
-    except Exception as e:
+        stt = await _connect_stt(ws.query_params.get("stt_engine"))
+    except AdmissionRejected as e:
+        lifecycle.unregister(session)
         if send_json and ws.client_state == WebSocketState.CONNECTED:
-            await ws.send_json({"type": "error", "reason": "realtime_connect_failed", "detail": str(e)})
+            await channel.send(e.to_message())
+        await channel.close(code=1013)  # Try again later
         return
-    else:
+    except Exception as e:
+        lifecycle.unregister(session)
         if send_json and ws.client_state == WebSocketState.CONNECTED:
-            await ws.send_json({"type": "info", "msg": "realtime_connected"})
+            await channel.send({"type": "error", "reason": "realtime_connect_failed", "detail": str(e)})
+        return
+    rt = stt.client
+    session.upstream_opened(stt.provider)
+    if send_json and ws.client_state == WebSocketState.CONNECTED:
+        await channel.send({"type": "info", "msg": "realtime_connected", "engine": stt.engine_name})
 
     buffers = store.get_or_create(session_id)
+    # Opt-in inspelning av inkommande ljud och transkript (?record=true eller RECORD_SESSIONS)
+    rec = None
+    if recording_enabled(ws.query_params.get("record")):
+        rec = recorder.start_session("transcribe", meta={"session_id": session_id, "mode": mode})
+        # Spåret spelar in ljudet efter avkodning/resampling, dvs. det som går till STT
+        rec.set_format(TRACK_IN, "pcm16", TARGET_SAMPLE_RATE, 1)
+    # Publicera debug-data till delad backend (no-op för in-process)
+    publisher = store.start_publisher(session_id)
+
+    # Partials slås ihop och skickas i klientens takt (?partials=delta för inkrementella)
+    partials = PartialEmitter.from_websocket(channel) if send_json else None
 
-    # Hålla senaste text för enkel diff
-    last_text = ""
+    # Transkript per item_id (överlappande yttranden skriver inte över varandra)
+    transcripts = TranscriptState()
     
     # Flagga för att veta om vi har skickat ljud
     has_audio = False
@@ -59,10 +122,11 @@ async def ws_transcribe(ws: WebSocket):
 
     # Task: läs events från Realtime och skicka deltas till frontend
     async def on_rt_event(evt: dict):
-        nonlocal last_text
+        if rec is not None:
+            rec.event("realtime", event=evt)
         
-        # Använd den nya modulen för att hantera events
-        result = process_realtime_event(evt, last_text, buffers)
+        # Dispatch-tabell per eventtyp (app/stt/event_to_text.py)
+        result = transcripts.process(evt, buffers)
         
         if not result:
             return
@@ -70,30 +134,31 @@ async def ws_transcribe(ws: WebSocket):
         # Hantera error/info events
         if result["type"] == "error":
             if send_json and ws.client_state == WebSocketState.CONNECTED:
-                await ws.send_json({"type": "error", "reason": "realtime_error", "detail": result["detail"]})
+                await channel.send({"type": "error", "reason": "realtime_error", "detail": result["detail"]})
             return
             
         if result["type"] == "info":
             if send_json and ws.client_state == WebSocketState.CONNECTED:
-                await ws.send_json({"type": "info", "msg": result["msg"]})
+                await channel.send({"type": "info", "msg": result["msg"]})
             return
             
         # Hantera transcript events
+        if result["type"] == "transcript" and rec is not None and (result["delta"] or result["is_final"]):
+            rec.event("transcript", text=result["text"], is_final=result["is_final"])
         if result["type"] == "transcript" and ws.client_state == WebSocketState.CONNECTED:
-            last_text = await send_transcription_to_frontend(ws, result, send_json, buffers, session_id) or last_text
+            await send_transcription_to_frontend(channel, result, send_json, buffers, session_id, partials=partials)
 
     rt_recv_task = asyncio.create_task(rt.recv_loop(on_rt_event))
 
     # Periodisk commit för att få löpande partials
     async def commit_loop():
+        nonlocal has_audio
         try:
             while True:
-                commit_interval = int(os.getenv("COMMIT_INTERVAL_MS", "150"))
-                await asyncio.sleep(max(0.001, commit_interval / 1000))
+                await asyncio.sleep(max(0.001, cfg.commit_interval_ms / 1000))
                 # Bara committa om vi har skickat ljud
                 if has_audio:
                     # Kontrollera om det har gått för lång tid sedan senaste ljudet
-                    import time
                     if time.time() - last_audio_time > 2.0:  # 2 sekunder timeout
                         has_audio = False
                         log.debug("Timeout - återställer has_audio flaggan")
@@ -113,10 +178,28 @@ async def ws_transcribe(ws: WebSocket):
                             log.warning("Commit fel: %s", e)
                             break
         except asyncio.CancelledError:
-            pass
+            raise
 
     commit_task = asyncio.create_task(commit_loop())
 
+    # Kontrollmeddelande före första ljudet: {"type": "audio.format", "sample_rate_hz": 48000, "channels": 2}
+    async def handle_control(text: str):
+        try:
+            data = orjson.loads(text)
+        except Exception:
+            return
+        if not isinstance(data, dict) or data.get("type") != "audio.format":
+            return
+        try:
+            accepted = decode.set_input_format(data)
+        except ValueError as e:
+            if send_json:
+                await channel.send({"type": "error", "reason": "unsupported_audio_format", "detail": str(e)})
+            return
+        log.info("Input format for %s: %d Hz, %d ch", session_id, accepted["sample_rate_hz"], accepted["channels"])
+        if send_json:
+            await channel.send(accepted)
+
     try:
         while ws.client_state == WebSocketState.CONNECTED:
             try:
@@ -127,11 +210,17 @@ async def ws_transcribe(ws: WebSocket):
 
                 # Hantera ljudmeddelande
                 if result["type"] == "audio":
+                    # Avkodning körs i trådpoolen; väntas in per chunk så ordningen behålls
+                    pcm = await decode.decode(result["chunk"])
+                    if not pcm:
+                        continue
+                    if rec is not None:
+                        rec.audio(TRACK_IN, pcm)
                     try:
-                        await rt.send_audio_chunk(result["chunk"])
-                        buffers.openai_chunks.append(result["size"])
+                        await rt.send_audio_chunk(pcm)
+                        buffers.openai_chunks.append(len(pcm))
+                        buffers.audio_in.push(pcm)  # nivåer/klippning/tystnad efter avkodning
                         has_audio = True  # Markera att vi har skickat ljud
-                        import time
                         last_audio_time = time.time()  # Uppdatera timestamp
                     except Exception as e:
                         log.error("Fel när chunk skickades till Realtime: %s", e)
@@ -139,7 +228,11 @@ async def ws_transcribe(ws: WebSocket):
 
                 # Hantera ping-meddelande
                 elif result["type"] == "ping":
-                    await ws.send_text("pong")
+                    await channel.send_text("pong")
+
+                # Hantera kontrollmeddelanden (format för inkommande ljud)
+                elif result["type"] == "text":
+                    await handle_control(result["text"])
 
             except WebSocketDisconnect:
                 log.info("WebSocket stängd: %s", session_id)
@@ -153,18 +246,32 @@ async def ws_transcribe(ws: WebSocket):
     finally:
         commit_task.cancel()
         rt_recv_task.cancel()
+        if publisher is not None:
+            publisher.cancel()
+            await asyncio.gather(publisher, return_exceptions=True)
         try:
             await rt.close()
         except Exception:
             pass
+        stt.release()
+        session.upstream_closed(stt.provider)
         try:
             await asyncio.gather(commit_task, rt_recv_task, return_exceptions=True)
         except Exception:
             pass
+        lifecycle.unregister(session)
+        if partials is not None:
+            await partials.close()
+            log.debug("Partials for %s: %s", session_id, partials.stats())
+        log.debug("Realtime events for %s: %s", session_id, transcripts.stats())
+        if not decode.passthrough:
+            log.info("Audio ingest for %s: %s", session_id, decode.stats())
+        if rec is not None:
+            rec.close()
         # Stäng WebSocket bara om den inte redan är stängd
         if ws.client_state != WebSocketState.DISCONNECTED:
             try:
-                await ws.close()
+                await channel.close()
             except Exception:
                 pass
 
@@ -1,114 +1,295 @@
 import asyncio
-import json
-import base64
+import hashlib
+import itertools
+import os
 import time
-import subprocess
 import sys
+from collections import OrderedDict
 from pathlib import Path
 from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 from typing import Dict, Any, List, Optional
 
 router = APIRouter()
 
-class TestRunner:
-    """Kör tester och samlar resultat."""
-    
-    def __init__(self):
-        self.test_results = {}
-        self.audio_data = {}
-    
-    async def run_specific_test(self, test_type: str) -> Dict[str, Any]:
-        """Kör ett specifikt test baserat på typ."""
-        test_configs = {
-            "unit": {
-                "name": "Enhetstester",
-                "path": "tests/test_receive_text.py",
-                "description": "Testar individuella moduler"
-            },
-            "api-mock": {
-                "name": "API Mock-tester",
-                "path": "tests/test_text_to_audio.py tests/test_send_audio.py",
-                "description": "Testar API med mock-data"
-            },
-            "full-mock": {
-                "name": "Fullständig Pipeline Mock",
-                "path": "tests/test_full_tts_pipeline.py",
-                "description": "Testar hela kedjan med mock-data"
-            },
-            "elevenlabs": {
-                "name": "ElevenLabs API Test",
-                "path": "tests/test_real_elevenlabs.py",
-                "description": "Testar mot riktig ElevenLabs API"
-            },
-            "pipeline": {
-                "name": "Fullständig Pipeline Test",
-                "path": "tests/test_full_chain.py",
-                "description": "Testar hela kedjan från frontend till audio"
-            }
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+
+# Hur många testsviter som får köra samtidigt, och hur många jobb som får vänta
+TEST_MAX_PARALLEL = int(os.getenv("TEST_MAX_PARALLEL", "2"))
+TEST_MAX_PENDING = int(os.getenv("TEST_MAX_PENDING", "10"))
+TEST_JOB_TIMEOUT_SEC = float(os.getenv("TEST_JOB_TIMEOUT_SEC", "300"))
+
+TEST_CONFIGS = {
+    "unit": {
+        "name": "Enhetstester",
+        "path": "tests/test_receive_text.py",
+        "description": "Testar individuella moduler"
+    },
+    "api-mock": {
+        "name": "API Mock-tester",
+        "path": "tests/test_text_to_audio.py tests/test_send_audio.py",
+        "description": "Testar API med mock-data"
+    },
+    "full-mock": {
+        "name": "Fullständig Pipeline Mock",
+        "path": "tests/test_full_tts_pipeline.py",
+        "description": "Testar hela kedjan med mock-data"
+    },
+    "elevenlabs": {
+        "name": "ElevenLabs API Test",
+        "path": "tests/test_real_elevenlabs.py",
+        "description": "Testar mot riktig ElevenLabs API",
+        "external": True,  # Beror på extern tjänst → cachas inte
+    },
+    "pipeline": {
+        "name": "Fullständig Pipeline Test",
+        "path": "tests/test_full_chain.py",
+        "description": "Testar hela kedjan från frontend till audio",
+        "external": True,
+    }
+}
+
+
+def code_fingerprint(root: Path = PROJECT_ROOT) -> str:
+    """Fingeravtryck av koden (sökväg, storlek, mtime för alla .py under app/ och tests/)."""
+    digest = hashlib.sha1()
+    for directory in ("app", "tests"):
+        for path in sorted((root / directory).rglob("*.py")):
+            stat = path.stat()
+            digest.update(f"{path.relative_to(root)}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()
+
+
+class TestJob:
+    """Ett testjobb: status och strömmad output."""
+
+    __test__ = False  # Inte en pytest-testklass
+
+    def __init__(self, job_id: str, test_type: str, config: Dict[str, Any], text: Optional[str]):
+        self.job_id = job_id
+        self.test_type = test_type
+        self.config = config
+        self.text = text
+        self.status = "queued"  # queued | running | passed | failed | error
+        self.output: List[str] = []
+        self.return_code: Optional[int] = None
+        self.error: Optional[str] = None
+        self.cached = False
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.command: List[str] = []
+        self._changed = asyncio.Event()
+        self._done = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("passed", "failed", "error")
+
+    def append(self, line: str) -> None:
+        self.output.append(line)
+        self._changed.set()
+
+    def finish(self, status: str, return_code: Optional[int] = None, error: Optional[str] = None) -> None:
+        self.status = status
+        self.return_code = return_code
+        self.error = error
+        self.finished_at = time.time()
+        self._changed.set()
+        self._done.set()
+
+    async def wait(self) -> "TestJob":
+        await self._done.wait()
+        return self
+
+    async def follow(self):
+        """Ge output-rader allteftersom de kommer, tills jobbet är klart."""
+        offset = 0
+        while True:
+            self._changed.clear()
+            while offset < len(self.output):
+                yield self.output[offset]
+                offset += 1
+            if self.done:
+                return
+            await self._changed.wait()
+
+    def to_dict(self, since: int = 0) -> Dict[str, Any]:
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = round((self.finished_at or time.time()) - self.started_at, 3)
+        return {
+            "job_id": self.job_id,
+            "test_type": self.test_type,
+            "test_name": self.config["name"],
+            "description": self.config["description"],
+            "status": self.status,
+            "success": self.status == "passed",
+            "cached": self.cached,
+            "return_code": self.return_code,
+            "error": self.error,
+            "elapsed_sec": elapsed,
+            "command": " ".join(self.command),
+            "output_offset": since,
+            "output_lines": len(self.output),
+            "output": "".join(self.output[since:]),
         }
-        
-        if test_type not in test_configs:
+
+
+class TestJobQueue:
+    """Kör pytest-jobb som asynkrona subprocesser med begränsad parallellitet.
+
+    Event-loopen blockeras aldrig (output läses rad för rad från en pipe).
+    Resultat cachas per (test-typ, text) tills koden ändras; bara resultat
+    för kodens aktuella fingeravtryck sparas. Sviter mot externa tjänster
+    (`"external": True`) cachas inte eftersom utfallet beror på tjänsten.
+    """
+
+    __test__ = False  # Inte en pytest-testklass
+
+    def __init__(self, configs: Dict[str, Dict[str, Any]] = TEST_CONFIGS, max_parallel: int = TEST_MAX_PARALLEL,
+                 max_pending: int = TEST_MAX_PENDING, timeout_sec: float = TEST_JOB_TIMEOUT_SEC,
+                 root: Path = PROJECT_ROOT, max_jobs: int = 100):
+        self.configs = configs
+        self.max_pending = max_pending
+        self.timeout_sec = timeout_sec
+        self.root = root
+        self.max_jobs = max_jobs
+        self.jobs: "OrderedDict[str, TestJob]" = OrderedDict()
+        self._semaphore = asyncio.Semaphore(max_parallel)
+        self._cache: Dict[tuple, TestJob] = {}
+        self._cache_fingerprint: Optional[str] = None
+        self._ids = itertools.count(1)
+        self._tasks: set = set()
+
+    def build_command(self, test_type: str) -> List[str]:
+        return [sys.executable, "-m", "pytest", "-v", "-s", *self.configs[test_type]["path"].split()]
+
+    @property
+    def pending(self) -> int:
+        return sum(1 for job in self.jobs.values() if not job.done)
+
+    def _remember(self, job: TestJob) -> None:
+        self.jobs[job.job_id] = job
+        # Släng äldsta avslutade jobb när listan blir för lång
+        for old_id in [jid for jid, old in self.jobs.items() if old.done][: max(0, len(self.jobs) - self.max_jobs)]:
+            del self.jobs[old_id]
+
+    async def submit(self, test_type: str, text: Optional[str] = None) -> TestJob:
+        """Lägg ett jobb i kön; returnerar direkt (cachat resultat om koden är oförändrad)."""
+        if test_type not in self.configs:
             raise ValueError(f"Okänd test-typ: {test_type}")
-        
-        config = test_configs[test_type]
-        
+
+        fingerprint = await asyncio.to_thread(code_fingerprint, self.root)
+        if fingerprint != self._cache_fingerprint:
+            # Koden har ändrats → äldre resultat kan aldrig återanvändas
+            self._cache.clear()
+            self._cache_fingerprint = fingerprint
+        key = (test_type, text or "", fingerprint)
+        job = TestJob(f"job-{next(self._ids)}-{test_type}", test_type, self.configs[test_type], text)
+        job.command = self.build_command(test_type)
+
+        cached = self._cache.get(key)
+        if cached is not None:
+            job.cached = True
+            job.output = list(cached.output)
+            job.started_at, job.finished_at = cached.started_at, cached.finished_at
+            job.finish(cached.status, cached.return_code, cached.error)
+            job.finished_at = cached.finished_at
+            self._remember(job)
+            return job
+
+        if self.pending >= self.max_pending:
+            raise OverflowError("För många testjobb i kö")
+
+        self._remember(job)
+        task = asyncio.create_task(self._run(job, key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def _run(self, job: TestJob, cache_key: tuple) -> None:
         try:
-            print(f"🚀 Startar {config['name']}...")
-            
-            # Kör testet med pytest
-            cmd = [sys.executable, "-m", "pytest", "-v", "-s"]
-            if " " in config["path"]:
-                # För tester som kör flera filer
-                cmd.extend(config["path"].split())
-            else:
-                cmd.append(config["path"])
-            
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                cwd=Path(__file__).parent.parent.parent
+            async with self._semaphore:
+                await self._execute(job, cache_key)
+        except asyncio.CancelledError:
+            # Avbrutet i kön (innan semaforen) eller under körning → jobbet får ett slutläge
+            if not job.done:
+                job.finish("error", -1, "Avbrutet")
+            raise
+
+    async def _execute(self, job: TestJob, cache_key: tuple) -> None:
+        job.status = "running"
+        job.started_at = time.time()
+        env = dict(os.environ)
+        if job.text:
+            # Text skickas bara till just denna subprocess (inte global os.environ)
+            env["TEXT"] = job.text
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *job.command,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+                cwd=self.root,
+                env=env,
             )
-            
-            # Analysera resultat
-            success = result.returncode == 0
-            output = result.stdout
-            error = result.stderr
-            
-            return {
-                "test_type": test_type,
-                "test_name": config["name"],
-                "description": config["description"],
-                "success": success,
-                "output": output,
-                "error": error,
-                "return_code": result.returncode,
-                "command": " ".join(cmd)
-            }
-            
         except Exception as e:
-            return {
-                "test_type": test_type,
-                "test_name": config["name"],
-                "description": config["description"],
-                "success": False,
-                "output": "",
-                "error": str(e),
-                "return_code": -1,
-                "command": " ".join(cmd) if 'cmd' in locals() else "unknown"
-            }
+            job.finish("error", -1, str(e))
+            return
+
+        try:
+            await asyncio.wait_for(self._pipe_output(process, job), self.timeout_sec)
+            return_code = await process.wait()
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            job.finish("error", -1, f"Timeout efter {self.timeout_sec:.0f}s")
+            return
+        except asyncio.CancelledError:
+            process.kill()
+            await process.wait()
+            job.finish("error", -1, "Avbrutet")
+            raise
+
+        job.finish("passed" if return_code == 0 else "failed", return_code)
+        # Inte om koden ändrats under körningen eller om sviten beror på en extern tjänst
+        if cache_key[2] == self._cache_fingerprint and not job.config.get("external"):
+            self._cache[cache_key] = job
+
+    @staticmethod
+    async def _pipe_output(process, job: TestJob) -> None:
+        async for line in process.stdout:
+            job.append(line.decode(errors="replace"))
+
+
+# Global kö (delas av alla förfrågningar i workern)
+job_queue = TestJobQueue()
+
+
+class TestRunner:
+    """Kör tester och samlar resultat (via den asynkrona jobbkön)."""
+
+    __test__ = False  # Inte en pytest-testklass
+    
+    def __init__(self, queue: Optional[TestJobQueue] = None):
+        self.queue = queue or job_queue
+    
+    async def run_specific_test(self, test_type: str, text: Optional[str] = None) -> Dict[str, Any]:
+        """Kör ett specifikt test och väntar på resultatet utan att blockera loopen."""
+        job = await self.queue.submit(test_type, text)
+        await job.wait()
+        result = job.to_dict()
+        result["error"] = job.error or ""
+        return result
     
-    async def run_all_tests(self) -> Dict[str, Any]:
-        """Kör alla tester och returnerar sammanfattning."""
-        test_types = ["unit", "api-mock", "full-mock", "elevenlabs", "pipeline"]
+    async def run_all_tests(self, text: Optional[str] = None) -> Dict[str, Any]:
+        """Kör alla tester (oberoende sviter parallellt) och returnerar sammanfattning."""
+        test_types = list(self.queue.configs)
         
         start_time = time.time()
-        results = {}
-        
-        for test_type in test_types:
-            result = await self.run_specific_test(test_type)
-            results[test_type] = result
+        results = dict(zip(test_types, await asyncio.gather(
+            *(self.run_specific_test(test_type, text) for test_type in test_types)
+        )))
         
         total_time = time.time() - start_time
         
@@ -218,12 +399,7 @@ async def test_endpoint(
                     detail=f"Okänd test-typ: {test_type}. Tillgängliga: {', '.join(test_info.keys())}"
                 )
             
-            # Sätt TEXT-miljövariabel om text angavs
-            if text:
-                import os
-                os.environ["TEXT"] = text
-            
-            result = await runner.run_specific_test(test_type)
+            result = await runner.run_specific_test(test_type, text)
             return {
                 "status": "completed",
                 "test": result,
@@ -233,12 +409,7 @@ async def test_endpoint(
             }
         else:
             # Kör alla tester
-            # Sätt TEXT-miljövariabel om text angavs
-            if text:
-                import os
-                os.environ["TEXT"] = text
-            
-            results = await runner.run_all_tests()
+            results = await runner.run_all_tests(text)
             results["available_tests"] = test_info  # Inkludera info för enkelhet
             results["test_text"] = text or "standardtext"
             return results
@@ -246,6 +417,48 @@ async def test_endpoint(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Test execution failed: {str(e)}")
 
+@router.post("/test/jobs", status_code=202)
+async def submit_test_jobs(
+    test_type: str = Query("all", description="Typ av test, eller 'all' för alla sviter"),
+    text: Optional[str] = Query(None, description="Text att testa med")
+) -> Dict[str, Any]:
+    """Starta testjobb i bakgrunden. Returnerar jobb-ID:n att polla."""
+    test_types = list(job_queue.configs) if test_type == "all" else [test_type]
+    if any(t not in job_queue.configs for t in test_types):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Okänd test-typ: {test_type}. Tillgängliga: all, {', '.join(job_queue.configs)}"
+        )
+    try:
+        jobs = [await job_queue.submit(t, text) for t in test_types]
+    except OverflowError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return {"status": "accepted", "jobs": [job.to_dict() for job in jobs]}
+
+@router.get("/test/jobs")
+async def list_test_jobs() -> Dict[str, Any]:
+    """Lista senaste testjobb (utan output)."""
+    return {
+        "pending": job_queue.pending,
+        "jobs": [{k: v for k, v in job.to_dict().items() if k != "output"} for job in job_queue.jobs.values()],
+    }
+
+def _get_job(job_id: str) -> TestJob:
+    job = job_queue.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Okänt jobb: {job_id}")
+    return job
+
+@router.get("/test/jobs/{job_id}")
+async def get_test_job(job_id: str, since: int = Query(0, ge=0, description="Output från denna rad")) -> Dict[str, Any]:
+    """Status och output för ett jobb; `since` ger bara nya rader vid polling."""
+    return _get_job(job_id).to_dict(since)
+
+@router.get("/test/jobs/{job_id}/stream")
+async def stream_test_job(job_id: str) -> StreamingResponse:
+    """Strömma jobbets output (text/plain) medan testet kör."""
+    return StreamingResponse(_get_job(job_id).follow(), media_type="text/plain; charset=utf-8")
+
 @router.get("/")
 async def test_home() -> HTMLResponse:
     """Enkel startsida för tester."""
@@ -473,13 +686,10 @@ async def test_home() -> HTMLResponse:
                         <div class="file-item">
                             <div>
                                 <strong>📁 ${file.name}</strong><br>
-                                <small>${fileSizeKB} KB • ${file.type.toUpperCase()} • ${modifiedTime}</small>
+                                <small>${fileSizeKB} KB • ${file.type.toUpperCase()} • ${file.duration_sec}s • ${modifiedTime}</small>
                             </div>
                             <div>
-                                ${file.type === '.wav' ? 
-                                    `<button class="play-button" onclick="playAudio('${file.name}')">▶️ Spela</button>` : 
-                                    `<span style="color: #6c757d;">PCM (ladda ner)</span>`
-                                }
+                                <button class="play-button" onclick="playAudio('${file.name}')">▶️ Spela</button>
                                 <button class="play-button" onclick="downloadFile('${file.name}')">📥 Ladda ner</button>
                             </div>
                         </div>
@@ -2,30 +2,53 @@ import asyncio
 import json
 import logging
 import time
+from contextlib import aclosing
+from typing import Optional
 import orjson
 from fastapi import WebSocket, WebSocketDisconnect
 from websockets.exceptions import ConnectionClosedOK, ConnectionClosedError
 
-from ..tts.receive_text_from_frontend import receive_and_validate_text
-from ..tts.text_to_audio import process_text_to_audio
+from ..admission import AdmissionRejected
+from ..audio import LevelMeter
+from ..lifecycle import lifecycle
+from ..messaging import FrontendChannel, send_message, send_schema, PONG, TTS_STATUS
+from ..profiles import activate_profile, current_profile
+from ..recording import recorder, recording_enabled, RecordingSink, SessionRecorder, TRACK_OUT
+from ..tts.engine_router import tts_router, hedging_enabled_by_default
+from ..tts.receive_text_from_frontend import MAX_TEXT_CHARS
 from ..tts.send_audio_to_frontend import send_audio_to_frontend
+from ..tts.paced_sender import PacedAudioSender, pacing_enabled_by_default
 
 logger = logging.getLogger("stefan-api-test-16")
 
 async def _send_json(ws, obj: dict):
-    """Skicka JSON (utf-8) till frontend."""
-    try:
-        await ws.send_text(orjson.dumps(obj).decode())
-    except Exception:
-        # Faller tillbaka till standardjson om orjson av någon anledning felar
-        await ws.send_text(json.dumps(obj))
+    """Skicka JSON (orjson) till frontend via messaging-lagret."""
+    await send_message(ws, obj)
 
 async def ws_tts(ws: WebSocket):
     await ws.accept()
+    if await lifecycle.reject_if_draining(ws):
+        return
+    # Allt till frontend går via kanalen; binära frames är ljud → alltid JSON-framing
+    channel = FrontendChannel.from_websocket(ws, allow_binary=False)
+    session = lifecycle.register_websocket(channel, "tts")
     session_started_at = time.time()
     
+    # Pacing av audio kan slås på per anslutning (?pacing=true) eller per förfrågan
+    pacing_param = ws.query_params.get("pacing")
+    paced_default = pacing_param.lower() == "true" if pacing_param else pacing_enabled_by_default()
+    
+    # Röst-/modellprofil för anslutningen (?profile=, annars "default")
+    activate_profile(ws.query_params.get("profile"))
+    
+    # Opt-in inspelning av utgående TTS-ljud (?record=true eller RECORD_SESSIONS)
+    rec = None
+    if recording_enabled(ws.query_params.get("record")):
+        rec = recorder.start_session("tts", meta={"profile": current_profile().name})
+        rec.set_format(TRACK_OUT, **current_profile().audio_out)
+    
     try:
-        await _send_json(ws, {"type": "status", "stage": "ready"})
+        await _send_json(channel, {"type": "status", "stage": "ready", **channel.negotiated()})
         logger.info("TTS WebSocket connection established")
 
         # Huvudloop för att hantera flera TTS-förfrågningar per anslutning
@@ -44,23 +67,35 @@ async def ws_tts(ws: WebSocket):
                                 data = json.loads(message["text"])
                             except Exception as e:
                                 logger.error("Failed to parse JSON message: %s", e)
-                                await _send_json(ws, {"type": "error", "message": "Invalid JSON format"})
+                                await _send_json(channel, {"type": "error", "message": "Invalid JSON format"})
                                 continue
                         
                         # Hantera ping-meddelande för att hålla anslutningen vid liv
                         if data.get("type") == "ping":
-                            await _send_json(ws, {"type": "pong"})
+                            await send_schema(channel, PONG)
                             continue
                         
                         # Hantera TTS-förfrågan
                         if data.get("type") == "tts_request":
                             text = data.get("text", "").strip()
                             if not text:
-                                await _send_json(ws, {"type": "error", "message": "No text provided"})
+                                await _send_json(channel, {"type": "error", "message": "No text provided"})
+                                continue
+                            if len(text) > MAX_TEXT_CHARS:
+                                # Samma gräns som receive_and_validate_text; anslutningen hålls öppen
+                                await _send_json(channel, {"type": "error", "message": f"Max {MAX_TEXT_CHARS} tecken"})
                                 continue
                             
                             # Processa TTS-förfrågan
-                            await _process_tts_request(ws, text, session_started_at)
+                            paced = data.get("paced", paced_default) is True
+                            hedge = data.get("hedge", hedging_enabled_by_default()) is True
+                            session.upstream_opened("tts")
+                            try:
+                                await _process_tts_request(
+                                    channel, text, session_started_at, paced=paced, hedge=hedge, rec=rec
+                                )
+                            finally:
+                                session.upstream_closed("tts")
                         
                         # Hantera disconnect-förfrågan
                         elif data.get("type") == "disconnect":
@@ -68,7 +103,7 @@ async def ws_tts(ws: WebSocket):
                             break
                         
                         else:
-                            await _send_json(ws, {"type": "error", "message": f"Unknown message type: {data.get('type')}"})
+                            await _send_json(channel, {"type": "error", "message": f"Unknown message type: {data.get('type')}"})
                 
                 elif message["type"] == "websocket.disconnect":
                     logger.info("Client disconnected")
@@ -79,7 +114,7 @@ async def ws_tts(ws: WebSocket):
                 break
             except Exception as e:
                 logger.error("Error processing message: %s", e)
-                await _send_json(ws, {"type": "error", "message": str(e)})
+                await _send_json(channel, {"type": "error", "message": str(e)})
                 continue
 
     except WebSocketDisconnect:
@@ -89,20 +124,36 @@ async def ws_tts(ws: WebSocket):
     except Exception as e:
         logger.exception("WS error: %s", e)
         try:
-            await _send_json(ws, {"type": "error", "message": str(e)})
+            await _send_json(channel, {"type": "error", "message": str(e)})
         except Exception:
             pass
     finally:
+        lifecycle.unregister(session)
+        if rec is not None:
+            rec.close()
         try:
-            await ws.close()
+            await channel.close()
         except Exception:
             pass
         logger.info("TTS WebSocket connection closed")
 
 
-async def _process_tts_request(ws: WebSocket, text: str, session_started_at: float):
-    """Processa en enskild TTS-förfrågan."""
+async def _process_tts_request(
+    ws: WebSocket, text: str, session_started_at: float, paced: bool = False, hedge: bool = False,
+    rec: Optional[SessionRecorder] = None,
+):
+    """Processa en enskild TTS-förfrågan via TTS-routern (snabbaste friska engine)."""
     request_started_at = time.time()
+    sample_rate = current_profile().pcm_sample_rate
+    if paced and not sample_rate:
+        # Pacing kräver känd byte-takt; komprimerat ljud skickas som det kommer
+        logger.info("Pacing disabled for non-PCM output format %s", current_profile().output_format)
+        paced = False
+    # Med pacing går audio via en jitter-buffert som släpper ljudet i realtidstakt (PCM16 → 2 bytes/sample)
+    sink = PacedAudioSender(ws, bytes_per_sec=sample_rate * 2, started_at=request_started_at) if paced else ws
+    if rec is not None:
+        rec.event("tts_request", text=text, request_id=int(request_started_at * 1000))
+        sink = RecordingSink(sink, rec)
     
     try:
         await _send_json(ws, {
@@ -112,36 +163,59 @@ async def _process_tts_request(ws: WebSocket, text: str, session_started_at: flo
             "request_id": int(request_started_at * 1000)  # Unik ID för denna förfrågan
         })
 
-        await _send_json(ws, {"type": "status", "stage": "connecting-elevenlabs"})
-        logger.debug("Connecting to ElevenLabs for text: %s", text[:50] + "..." if len(text) > 50 else text)
+        await send_schema(ws, TTS_STATUS, "connecting-elevenlabs")
+        logger.debug("Connecting to TTS engine for text: %s", text[:50] + "..." if len(text) > 50 else text)
 
-        # Hantera ElevenLabs API-kommunikation och audio-streaming
-        await _send_json(ws, {"type": "status", "stage": "streaming"})
+        # Hantera TTS-kommunikation och audio-streaming
+        await send_schema(ws, TTS_STATUS, "streaming")
         
         audio_bytes_total = 0
         last_chunk_ts = None
+        stream_stats = {}
+        # Nivåanalys av förfrågans ljud (bara rå PCM; mp3 m.fl. analyseras inte)
+        meter = LevelMeter(sample_rate) if sample_rate else None
         
-        async for server_msg, current_audio_bytes in process_text_to_audio(ws, text, request_started_at):
-            # Hantera audio-streaming till frontend
-            audio_bytes_total, last_chunk_ts, should_break = await send_audio_to_frontend(
-                ws, server_msg, current_audio_bytes, last_chunk_ts
-            )
-            
-            if should_break:
-                break
+        # aclosing → engine-strömmen (och dess admission-plats) stängs direkt vid break
+        async with aclosing(tts_router.stream(ws, text, request_started_at, stream_stats, hedge=hedge)) as stream:
+            async for server_msg, current_audio_bytes in stream:
+                # Hantera audio-streaming till frontend
+                audio_bytes_total, last_chunk_ts, should_break = await send_audio_to_frontend(
+                    sink, server_msg, current_audio_bytes, last_chunk_ts, meter=meter
+                )
+                
+                if should_break:
+                    break
         
-        await _send_json(ws, {
+        done_msg = {
             "type": "status",
             "stage": "done",
             "audio_bytes_total": audio_bytes_total,
             "elapsed_sec": round(time.time() - request_started_at, 3),
-            "request_id": int(request_started_at * 1000)
-        })
+            "request_id": int(request_started_at * 1000),
+            "profile": current_profile().name,
+            "engine": stream_stats.get("engine"),
+            "hedged": stream_stats.get("hedged", False),
+            "queue_wait_ms": stream_stats.get("queue_wait_ms"),
+            "segments": stream_stats.get("segments"),
+            "segment_ttfb_ms": stream_stats.get("segment_ttfb_ms"),
+            "chunk_length_schedule": stream_stats.get("chunk_length_schedule"),
+            "audio_levels": meter.snapshot() if meter is not None else None,
+        }
+        if paced:
+            # Vänta tills allt ljud släppts innan "done" skickas
+            done_msg["pacing"] = await sink.finish()
+            done_msg["elapsed_sec"] = round(time.time() - request_started_at, 3)
+        await _send_json(ws, done_msg)
         
         logger.info("TTS request completed: %d bytes, %.3fs", audio_bytes_total, time.time() - request_started_at)
 
+    except AdmissionRejected as e:
+        await _send_json(ws, {**e.to_message(), "request_id": int(request_started_at * 1000)})
+
     except Exception as e:
         logger.error("Error processing TTS request: %s", e)
+        if paced:
+            await sink.cancel()
         await _send_json(ws, {
             "type": "error", 
             "message": str(e),
@@ -0,0 +1,64 @@
+# app/engine_stats.py
+import time
+from collections import deque
+from typing import Deque, Optional
+
+DEFAULT_LATENCY_PRIOR_MS = 1000.0  # Antagen latens för engine utan mätdata
+
+
+class EngineStats:
+    """Rullande latens och felfrekvens för en engine (TTS- och STT-routern).
+
+    `metric` namnger vad latensen mäter i snapshot (`ttfb` för TTS:s första
+    ljud, `connect` för STT-anslutning), t.ex. `ttfb_p50_ms`.
+    """
+
+    def __init__(self, metric: str = "ttfb", window: int = 50, outcome_window: int = 20,
+                 cooldown_sec: float = 30.0):
+        self.metric = metric
+        self.latency_ms: Deque[float] = deque(maxlen=window)
+        self.outcomes: Deque[bool] = deque(maxlen=outcome_window)  # True = lyckad
+        self.cooldown_sec = cooldown_sec
+        self.unhealthy_until = 0.0
+        self.requests = 0
+        self.errors = 0
+
+    def record_latency(self, ms: float) -> None:
+        self.latency_ms.append(ms)
+
+    def record_outcome(self, ok: bool) -> None:
+        self.requests += 1
+        self.outcomes.append(ok)
+        if not ok:
+            self.errors += 1
+            # Två fel i rad → vila engine en stund
+            if len(self.outcomes) >= 2 and not any(list(self.outcomes)[-2:]):
+                self.unhealthy_until = time.monotonic() + self.cooldown_sec
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return 1.0 - sum(self.outcomes) / len(self.outcomes)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.latency_ms:
+            return None
+        samples = sorted(self.latency_ms)
+        return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.unhealthy_until and self.error_rate < 0.5
+
+    def snapshot(self) -> dict:
+        p50 = self.percentile(0.5)
+        p95 = self.percentile(0.95)
+        return {
+            "healthy": self.healthy(),
+            "requests": self.requests,
+            "errors": self.errors,
+            "error_rate": round(self.error_rate, 3),
+            f"{self.metric}_p50_ms": round(p50, 1) if p50 is not None else None,
+            f"{self.metric}_p95_ms": round(p95, 1) if p95 is not None else None,
+            "samples": len(self.latency_ms),
+        }
@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+import signal
+import time
+from collections import Counter
+from typing import Awaitable, Callable, Dict, Optional
+
+from starlette.websockets import WebSocketState
+
+from .config import settings
+
+log = logging.getLogger("lifecycle")
+
+# Hur länge pågående sessioner får fortsätta efter SIGTERM läses från settings
+# (DRAIN_TIMEOUT_SEC, 25 s; Render ger 30 s)
+
+# WebSocket-stängningskod "Service Restart"
+CLOSE_SERVICE_RESTART = 1012
+
+DrainCallback = Callable[[int], Awaitable[None]]
+CloseCallback = Callable[[], Awaitable[None]]
+
+
+def draining_message(deadline_ms: int) -> dict:
+    """Meddelande till frontend: servern startar om, återanslut inom deadline."""
+    return {"type": "server.draining", "deadline_ms": deadline_ms, "reconnect": True}
+
+
+class SessionHandle:
+    """En registrerad långlivad session (WebSocket)."""
+
+    def __init__(self, handle_id: int, kind: str, session_id: Optional[str],
+                 on_drain: Optional[DrainCallback], on_close: Optional[CloseCallback]):
+        self.handle_id = handle_id
+        self.kind = kind
+        self.session_id = session_id
+        self.started_at = time.time()
+        self.on_drain = on_drain
+        self.on_close = on_close
+        self.upstreams: Counter = Counter()
+
+    def upstream_opened(self, provider: str) -> None:
+        self.upstreams[provider] += 1
+
+    def upstream_closed(self, provider: str) -> None:
+        self.upstreams[provider] -= 1
+        if self.upstreams[provider] <= 0:
+            del self.upstreams[provider]
+
+
+class LifecycleManager:
+    """Håller reda på aktiva sessioner och styr graceful drain vid omstart.
+
+    Vid drain tas inga nya sessioner emot, befintliga får `server.draining`
+    med en deadline och stängs med kod 1012 om de inte avslutats innan dess.
+    """
+
+    def __init__(self, drain_timeout_sec: Optional[float] = None):
+        # None → DRAIN_TIMEOUT_SEC från settings (läses när drain startar)
+        self._drain_timeout_sec = drain_timeout_sec
+        self.draining = False
+        self.drain_started_at: Optional[float] = None
+        self.drain_deadline: Optional[float] = None
+        self._sessions: Dict[int, SessionHandle] = {}
+        self._ids = itertools.count(1)
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._drain_task: Optional[asyncio.Task] = None
+
+    @property
+    def drain_timeout_sec(self) -> float:
+        return self._drain_timeout_sec if self._drain_timeout_sec is not None else settings.drain_timeout_sec
+
+    @property
+    def accepting(self) -> bool:
+        return not self.draining
+
+    @property
+    def active_sessions(self) -> int:
+        return len(self._sessions)
+
+    def register(self, kind: str, session_id: Optional[str] = None,
+                 on_drain: Optional[DrainCallback] = None,
+                 on_close: Optional[CloseCallback] = None) -> SessionHandle:
+        handle = SessionHandle(next(self._ids), kind, session_id, on_drain, on_close)
+        self._sessions[handle.handle_id] = handle
+        self._idle.clear()
+        return handle
+
+    def unregister(self, handle: SessionHandle) -> None:
+        self._sessions.pop(handle.handle_id, None)
+        if not self._sessions:
+            self._idle.set()
+
+    def register_websocket(self, ws, kind: str, session_id: Optional[str] = None,
+                           notify: bool = True) -> SessionHandle:
+        """Registrera en WebSocket: får `server.draining` vid drain och stängs vid deadline."""
+
+        async def _on_drain(deadline_ms: int):
+            if notify and ws.client_state == WebSocketState.CONNECTED:
+                await ws.send_json(draining_message(deadline_ms))
+
+        async def _on_close():
+            if ws.client_state == WebSocketState.CONNECTED:
+                await ws.close(code=CLOSE_SERVICE_RESTART)
+
+        return self.register(kind, session_id, _on_drain, _on_close)
+
+    async def reject_if_draining(self, ws, notify: bool = True) -> bool:
+        """Avvisa en ny anslutning under drain. Returnerar True om den avvisades."""
+        if self.accepting:
+            return False
+        if notify:
+            await ws.send_json({**draining_message(self.deadline_ms()), "type": "error", "reason": "draining"})
+        await ws.close(code=CLOSE_SERVICE_RESTART)
+        return True
+
+    def deadline_ms(self) -> int:
+        if self.drain_deadline is None:
+            return 0
+        return max(0, int((self.drain_deadline - time.monotonic()) * 1000))
+
+    def start_draining(self, timeout_sec: Optional[float] = None) -> asyncio.Task:
+        """Starta drain (idempotent). Returnerar tasken som väntar ut sessionerna."""
+        if self._drain_task is None:
+            self._drain_task = asyncio.create_task(self.drain(timeout_sec))
+        return self._drain_task
+
+    async def drain(self, timeout_sec: Optional[float] = None) -> bool:
+        """Sluta ta emot nya sessioner och vänta ut befintliga.
+
+        Returnerar True om alla sessioner avslutades före deadline.
+        """
+        timeout_sec = self.drain_timeout_sec if timeout_sec is None else timeout_sec
+        self.draining = True
+        self.drain_started_at = time.time()
+        self.drain_deadline = time.monotonic() + timeout_sec
+        log.info("Draining: %d active sessions, deadline %.1fs", len(self._sessions), timeout_sec)
+
+        for handle in list(self._sessions.values()):
+            if handle.on_drain is not None:
+                try:
+                    await handle.on_drain(self.deadline_ms())
+                except Exception as e:
+                    log.debug("Could not notify session %s about drain: %s", handle.session_id, e)
+
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout_sec)
+            log.info("Drain complete, all sessions finished")
+            return True
+        except asyncio.TimeoutError:
+            pass
+
+        remaining = list(self._sessions.values())
+        log.warning("Drain deadline reached, closing %d sessions", len(remaining))
+        for handle in remaining:
+            if handle.on_close is not None:
+                try:
+                    await handle.on_close()
+                except Exception as e:
+                    log.debug("Could not close session %s: %s", handle.session_id, e)
+        # Ge sessionerna en kort stund att köra sina finally-block
+        try:
+            await asyncio.wait_for(self._idle.wait(), 2.0)
+        except asyncio.TimeoutError:
+            pass
+        return False
+
+    def status(self) -> dict:
+        upstreams: Counter = Counter()
+        kinds: Counter = Counter()
+        for handle in self._sessions.values():
+            upstreams.update(handle.upstreams)
+            kinds[handle.kind] += 1
+        return {
+            "draining": self.draining,
+            "drain_deadline_ms": self.deadline_ms() if self.draining else None,
+            "active_sessions": len(self._sessions),
+            "sessions_by_kind": dict(kinds),
+            "upstream_connections": dict(upstreams),
+        }
+
+    def install_signal_handlers(self) -> None:
+        """Kör drain vid SIGTERM innan uvicorns egen hanterare stänger servern.
+
+        Uvicorn stänger WebSockets direkt vid SIGTERM; vi lägger oss före
+        och anropar uvicorns hanterare först när sessionerna är klara.
+        En andra SIGTERM stänger direkt.
+        """
+        loop = asyncio.get_running_loop()
+        previous = signal.getsignal(signal.SIGTERM)
+
+        def _handler(signum, frame):
+            if self.draining or not callable(previous):
+                if callable(previous):
+                    previous(signum, frame)
+                return
+
+            def _start():
+                task = self.start_draining()
+                task.add_done_callback(lambda _: previous(signum, frame))
+
+            loop.call_soon_threadsafe(_start)
+
+        try:
+            signal.signal(signal.SIGTERM, _handler)
+        except ValueError:
+            # Inte i huvudtråden (t.ex. TestClient) → ingen signalhantering
+            log.debug("Signal handlers not installed (not main thread)")
+
+
+# Global instans
+lifecycle = LifecycleManager()
@@ -1,6 +1,6 @@
 # app/llm/conversation_manager.py
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from dataclasses import dataclass
 from datetime import datetime
 
@@ -18,16 +18,16 @@ class ConversationMessage:
 class ConversationManager:
     """Hanterar konversationshistorik per session."""
     
-    def __init__(self, session_id: str):
+    def __init__(self, session_id: str, system_prompt: Optional[str] = None):
         self.session_id = session_id
         self.messages: List[ConversationMessage] = []
-        self._add_system_message()
+        self._add_system_message(system_prompt or llm_config.system_prompt)
     
-    def _add_system_message(self):
-        """Lägg till system-prompt som första meddelande."""
+    def _add_system_message(self, system_prompt: str):
+        """Lägg till system-prompt (profilens eller LLMConfig:s) som första meddelande."""
         system_msg = ConversationMessage(
             role="system",
-            content=llm_config.system_prompt,
+            content=system_prompt,
             timestamp=datetime.now()
         )
         self.messages.append(system_msg)
@@ -80,3 +80,27 @@ class ConversationManager:
     def get_message_count(self) -> int:
         """Antal meddelanden (exklusive system)."""
         return len(self.messages) - 1  # Exkludera system-meddelandet
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialisera för delad state-backend."""
+        return {
+            "session_id": self.session_id,
+            "messages": [
+                {"role": m.role, "content": m.content, "timestamp": m.timestamp.isoformat()}
+                for m in self.messages
+            ],
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ConversationManager":
+        """Återskapa från delad state-backend."""
+        manager = cls(data["session_id"])
+        manager.messages = [
+            ConversationMessage(
+                role=m["role"],
+                content=m["content"],
+                timestamp=datetime.fromisoformat(m["timestamp"]),
+            )
+            for m in data["messages"]
+        ] or manager.messages
+        return manager
@@ -1,7 +1,14 @@
 # app/llm/receive_text_from_stt.py
 import logging
+import time
 from typing import Optional
 
+import orjson
+
+from ..admission import AdmissionRejected
+from ..config import settings
+from ..profiles import current_profile
+from ..state_backend import state
 from .conversation_manager import ConversationManager
 from .text_to_response import llm_processor
 
@@ -10,14 +17,43 @@ logger = logging.getLogger("llm")
 # Global session manager - håller koll på alla aktiva konversationer
 _conversation_sessions: dict[str, ConversationManager] = {}
 
+# Hur länge en konversation sparas i delad state-backend efter senaste tur: settings.conversation_ttl_sec
+
 def get_or_create_conversation(session_id: str) -> ConversationManager:
-    """Hämta eller skapa konversationshanterare för session."""
+    """Hämta eller skapa konversationshanterare för session (med profilens system-prompt)."""
     if session_id not in _conversation_sessions:
-        _conversation_sessions[session_id] = ConversationManager(session_id)
+        _conversation_sessions[session_id] = ConversationManager(session_id, current_profile().system_prompt)
         logger.info("Created new conversation manager for session %s", session_id)
     
     return _conversation_sessions[session_id]
 
+async def load_conversation(session_id: str) -> ConversationManager:
+    """Hämta konversation; med delad backend läses senaste versionen därifrån.
+
+    Då kan en återansluten session fortsätta på en annan worker/nod.
+    """
+    if state.shared:
+        try:
+            raw = await state.get(f"conversation:{session_id}")
+            if raw is not None:
+                _conversation_sessions[session_id] = ConversationManager.from_dict(orjson.loads(raw))
+        except Exception as e:
+            logger.warning("Could not load conversation %s from %s backend: %s", session_id, state.name, e)
+    return get_or_create_conversation(session_id)
+
+async def save_conversation(manager: ConversationManager) -> None:
+    """Spara konversationen i delad backend (no-op för in-process)."""
+    if not state.shared:
+        return
+    try:
+        await state.set(
+            f"conversation:{manager.session_id}",
+            orjson.dumps(manager.to_dict()),
+            ttl_sec=settings.conversation_ttl_sec,
+        )
+    except Exception as e:
+        logger.warning("Could not save conversation %s to %s backend: %s", manager.session_id, state.name, e)
+
 async def process_final_transcription(session_id: str, transcription_text: str) -> Optional[str]:
     """
     Processa final transkription genom LLM-pipeline.
@@ -28,6 +64,9 @@ async def process_final_transcription(session_id: str, transcription_text: str)
         
     Returns:
         LLM-svar eller None vid fel
+        
+    Raises:
+        AdmissionRejected: om LLM-leverantören är fullbelagd
     """
     if not transcription_text or not transcription_text.strip():
         logger.warning("Empty transcription text for session %s", session_id)
@@ -35,15 +74,19 @@ async def process_final_transcription(session_id: str, transcription_text: str)
     
     try:
         # Hämta konversationshanterare
-        conversation_manager = get_or_create_conversation(session_id)
+        conversation_manager = await load_conversation(session_id)
         
-        # Processa genom LLM
+        # Processa genom LLM (latens mäts per profil)
+        started = time.monotonic()
         llm_response = await llm_processor.process_user_input(
             conversation_manager, 
             transcription_text
         )
+        if llm_response:
+            current_profile().metrics.record("llm_ms", (time.monotonic() - started) * 1000)
         
         if llm_response:
+            await save_conversation(conversation_manager)
             logger.info("Successfully processed transcription for session %s: %s -> %s", 
                        session_id, transcription_text[:30], llm_response[:30])
             return llm_response
@@ -51,6 +94,8 @@ async def process_final_transcription(session_id: str, transcription_text: str)
             logger.error("Failed to get LLM response for session %s", session_id)
             return None
             
+    except AdmissionRejected:
+        raise
     except Exception as e:
         logger.error("Error processing final transcription for session %s: %s", 
                     session_id, str(e))
@@ -3,6 +3,8 @@ import asyncio
 import logging
 from typing import Optional
 
+from ..messaging import send_message
+
 logger = logging.getLogger("llm")
 
 async def send_llm_response_to_tts(ws, llm_response: str) -> bool:
@@ -24,7 +26,7 @@ async def send_llm_response_to_tts(ws, llm_response: str) -> bool:
         logger.info("Sending LLM response to frontend for TTS: %s", llm_response[:50])
         
         # Skicka signal till frontend att LLM-svar är redo
-        await ws.send_json({
+        await send_message(ws, {
             "type": "llm_response_ready",
             "text": llm_response,
             "instruction": "send_to_tts"
@@ -38,7 +40,7 @@ async def send_llm_response_to_tts(ws, llm_response: str) -> bool:
         
         # Skicka felmeddelande till frontend
         try:
-            await ws.send_json({
+            await send_message(ws, {
                 "type": "error",
                 "message": f"Failed to send LLM response: {str(e)}"
             })
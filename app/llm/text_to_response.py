@@ -1,12 +1,14 @@
 # app/llm/text_to_response.py
 import asyncio
 import logging
-import os
 from typing import Optional
 
 import openai
 from openai import AsyncOpenAI
 
+from ..admission import admission, PROVIDER_LLM
+from ..config import settings
+from ..profiles import current_profile
 from .config import llm_config
 from .conversation_manager import ConversationManager
 
@@ -16,9 +18,16 @@ class LLMProcessor:
     """Hanterar LLM-anrop till OpenAI."""
     
     def __init__(self):
-        self.client = AsyncOpenAI(
-            api_key=os.getenv("OPENAI_API_KEY")
-        )
+        self._client: Optional[AsyncOpenAI] = None
+    
+    @property
+    def client(self) -> AsyncOpenAI:
+        # Skapas vid första anropet så att appen kan importeras utan API-nyckel
+        if self._client is None:
+            self._client = AsyncOpenAI(
+                api_key=settings.openai_api_key or None
+            )
+        return self._client
     
     async def process_user_input(self, conversation_manager: ConversationManager, user_text: str) -> Optional[str]:
         """
@@ -30,7 +39,13 @@ class LLMProcessor:
             
         Returns:
             LLM-svar eller None vid fel
+            
+        Raises:
+            AdmissionRejected: om OpenAI-kvoten för workern är full
         """
+        # Vänta på plats innan meddelandet läggs i historiken så att ett
+        # avvisat anrop inte lämnar en obesvarad fråga kvar
+        slot = await admission.acquire(PROVIDER_LLM)
         try:
             # Lägg till användarmeddelande
             conversation_manager.add_user_message(user_text)
@@ -44,7 +59,7 @@ class LLMProcessor:
             # Gör OpenAI-anrop
             response = await asyncio.wait_for(
                 self.client.chat.completions.create(
-                    model=llm_config.model,
+                    model=current_profile().llm_model,
                     messages=messages,
                     temperature=llm_config.temperature,
                     max_tokens=llm_config.max_tokens
@@ -70,6 +85,8 @@ class LLMProcessor:
             logger.error("Error processing LLM request for session %s: %s", 
                         conversation_manager.session_id, str(e))
             return None
+        finally:
+            slot.release()
 
 # Global instans
 llm_processor = LLMProcessor()
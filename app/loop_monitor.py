@@ -0,0 +1,314 @@
+from __future__ import annotations
+
+import asyncio
+import collections.abc
+import contextvars
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from .config import settings
+
+log = logging.getLogger("loop_monitor")
+
+# Mätintervall för loop-lag (LOOP_LAG_INTERVAL_SEC) och gräns för när ett enskilt
+# steg räknas som långsamt (SLOW_CALLBACK_MS) läses från settings när mätarna skapas
+
+# Antal stack-rader som sparas per långsamt anrop
+STALL_STACK_DEPTH = 12
+
+# Vilken endpoint (route) den aktuella tasken tillhör; ärvs av barn-tasks
+endpoint_label: contextvars.ContextVar[str] = contextvars.ContextVar("endpoint_label", default="other")
+
+# (etikett, coroutine, start) för steget som just nu kör på loopen – läses av watchdog-tråden
+_current_step: Optional[tuple] = None
+
+
+def monitor_enabled() -> bool:
+    return settings.loop_monitor
+
+
+class LoopLagSampler:
+    """Mäter event-loop-lag: hur mycket senare än planerat en sleep vaknar.
+
+    Billigt (en timer per intervall) och ger en bra bild av om workern är
+    mättad – hög lag betyder att audio och WebSocket-meddelanden försenas.
+    """
+
+    def __init__(self, interval_sec: Optional[float] = None, window: int = 240):
+        self.interval_sec = settings.loop_lag_interval_sec if interval_sec is None else interval_sec
+        self.samples_ms: Deque[float] = deque(maxlen=window)
+        self.max_lag_ms = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            expected = time.perf_counter() + self.interval_sec
+            await asyncio.sleep(self.interval_sec)
+            self.record(max(0.0, (time.perf_counter() - expected) * 1000))
+
+    def record(self, lag_ms: float) -> None:
+        self.samples_ms.append(lag_ms)
+        self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+
+    @property
+    def last_ms(self) -> Optional[float]:
+        return self.samples_ms[-1] if self.samples_ms else None
+
+    def percentile_ms(self, p: float) -> Optional[float]:
+        if not self.samples_ms:
+            return None
+        samples = sorted(self.samples_ms)
+        return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+    def snapshot(self) -> dict:
+        def _round(value):
+            return round(value, 1) if value is not None else None
+
+        return {
+            "last_ms": _round(self.last_ms),
+            "p50_ms": _round(self.percentile_ms(0.5)),
+            "p99_ms": _round(self.percentile_ms(0.99)),
+            "max_ms": round(self.max_lag_ms, 1),
+            "samples": len(self.samples_ms),
+        }
+
+
+class CpuAccounting:
+    """CPU-tid per endpoint, mätt per task-steg (`time.thread_time`)."""
+
+    def __init__(self):
+        self.cpu_sec: Dict[str, float] = {}
+        self.steps: Dict[str, int] = {}
+        self.max_step_ms: Dict[str, float] = {}
+
+    def add(self, label: str, cpu_sec: float, wall_sec: float) -> None:
+        self.cpu_sec[label] = self.cpu_sec.get(label, 0.0) + cpu_sec
+        self.steps[label] = self.steps.get(label, 0) + 1
+        wall_ms = wall_sec * 1000
+        if wall_ms > self.max_step_ms.get(label, 0.0):
+            self.max_step_ms[label] = wall_ms
+
+    def snapshot(self) -> dict:
+        total = sum(self.cpu_sec.values()) or 1.0
+        return {
+            label: {
+                "cpu_ms": round(cpu * 1000, 1),
+                "share": round(cpu / total, 3),
+                "steps": self.steps[label],
+                "max_step_ms": round(self.max_step_ms[label], 1),
+            }
+            for label, cpu in sorted(self.cpu_sec.items(), key=lambda item: -item[1])
+        }
+
+
+class _MeteredCoroutine(collections.abc.Coroutine):
+    """Omsluter en tasks coroutine och mäter varje steg (send/throw)."""
+
+    __slots__ = ("_coro", "_accounting")
+
+    def __init__(self, coro, accounting: CpuAccounting):
+        self._coro = coro
+        self._accounting = accounting
+
+    def _step(self, method, *args):
+        global _current_step
+        label = endpoint_label.get()
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        _current_step = (label, self._coro, wall_start)
+        try:
+            return method(*args)
+        finally:
+            _current_step = None
+            self._accounting.add(label, time.thread_time() - cpu_start, time.perf_counter() - wall_start)
+
+    def send(self, value):
+        return self._step(self._coro.send, value)
+
+    def throw(self, *args):
+        return self._step(self._coro.throw, *args)
+
+    def close(self):
+        return self._coro.close()
+
+    def __await__(self):
+        return self._coro.__await__()
+
+    def __getattr__(self, name):
+        # cr_frame, __qualname__ m.m. används av asyncio för repr/debug
+        return getattr(self._coro, name)
+
+
+def _coro_name(coro) -> str:
+    return getattr(coro, "__qualname__", None) or type(coro).__name__
+
+
+class SlowCallbackWatchdog:
+    """Upptäcker steg som blockerar loopen och sparar vad som körde.
+
+    Loopen slår ett hjärtslag med `call_later`; en daemon-tråd kontrollerar
+    att det kommer i tid och fångar annars loop-trådens stack via
+    `sys._current_frames()` medan blockeringen pågår.
+    """
+
+    def __init__(self, threshold_ms: Optional[float] = None, max_records: int = 50):
+        self.threshold_sec = (settings.slow_callback_ms if threshold_ms is None else threshold_ms) / 1000
+        self.beat_interval_sec = self.threshold_sec / 2
+        self.stalls: Deque[dict] = deque(maxlen=max_records)
+        self.total_stalls = 0
+        self._last_beat = time.monotonic()
+        self._pending: Optional[dict] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        if self._thread is not None:
+            return
+        self._loop = loop
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._handle = loop.call_later(self.beat_interval_sec, self._beat)
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def _beat(self) -> None:
+        now = time.monotonic()
+        gap = now - self._last_beat
+        self._last_beat = now
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            # Blockeringen är över: nu vet vi hur länge den varade
+            pending["duration_ms"] = round((gap - self.beat_interval_sec) * 1000, 1)
+            self.stalls.append(pending)
+            self.total_stalls += 1
+            log.warning(
+                "Event loop blocked %.0f ms in %s (endpoint=%s)\n%s",
+                pending["duration_ms"], pending["coroutine"], pending["endpoint"], "".join(pending["stack"]),
+            )
+        if not self._stop.is_set():
+            self._handle = self._loop.call_later(self.beat_interval_sec, self._beat)
+
+    def _watch(self) -> None:
+        check_sec = self.threshold_sec / 4
+        while not self._stop.wait(check_sec):
+            overdue = time.monotonic() - self._last_beat - self.beat_interval_sec
+            if overdue >= self.threshold_sec and self._pending is None:
+                self._pending = self.capture()
+
+    def capture(self) -> dict:
+        """Fånga stack och aktuell coroutine för loop-tråden."""
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = traceback.format_stack(frame)[-STALL_STACK_DEPTH:] if frame is not None else []
+        step = _current_step
+        return {
+            "at": time.time(),
+            "duration_ms": None,
+            "endpoint": step[0] if step else None,
+            "coroutine": _coro_name(step[1]) if step else None,
+            "stack": stack,
+        }
+
+    def snapshot(self, limit: int = 20) -> dict:
+        recent: List[dict] = list(self.stalls)[-limit:]
+        return {
+            "threshold_ms": round(self.threshold_sec * 1000, 1),
+            "total": self.total_stalls,
+            "recent": recent,
+        }
+
+
+class LoopMonitor:
+    """Samlar lag-sampler, watchdog och CPU-accounting för workerns loop."""
+
+    def __init__(self, lag: "LoopLagSampler", watchdog: SlowCallbackWatchdog, accounting: CpuAccounting):
+        self.lag = lag
+        self.watchdog = watchdog
+        self.accounting = accounting
+        self._previous_factory = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._loop = loop
+        self.lag.start()
+        self.watchdog.start(loop)
+        self._previous_factory = loop.get_task_factory()
+        accounting = self.accounting
+        previous = self._previous_factory
+
+        def _factory(loop, coro, **kwargs):
+            metered = _MeteredCoroutine(coro, accounting)
+            if previous is not None:
+                return previous(loop, metered, **kwargs)
+            return asyncio.Task(metered, loop=loop, **kwargs)
+
+        loop.set_task_factory(_factory)
+
+    async def stop(self) -> None:
+        if self._loop is not None:
+            self._loop.set_task_factory(self._previous_factory)
+            self._loop = None
+        self.watchdog.stop()
+        await self.lag.stop()
+
+    def snapshot(self) -> dict:
+        return {
+            "lag": self.lag.snapshot(),
+            "slow_callbacks": self.watchdog.snapshot(),
+            "cpu_by_endpoint": self.accounting.snapshot(),
+        }
+
+
+class EndpointLabelMiddleware:
+    """ASGI-middleware som sätter `endpoint_label` till matchad route (t.ex. `/ws/tts`)."""
+
+    def __init__(self, app, router):
+        self.app = app
+        self.router = router
+
+    def _label(self, scope) -> str:
+        from starlette.routing import Match
+
+        for route in self.router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return f"{scope['type']}:{getattr(route, 'path', scope['path'])}"
+        return f"{scope['type']}:unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] in ("http", "websocket"):
+            endpoint_label.set(self._label(scope))
+        await self.app(scope, receive, send)
+
+
+# Globala instanser
+loop_lag = LoopLagSampler()
+loop_monitor = LoopMonitor(loop_lag, SlowCallbackWatchdog(), CpuAccounting())
@@ -6,21 +6,53 @@ import logging
 import os
 import re
 import time
+from contextlib import asynccontextmanager
 from typing import Optional
 
 from fastapi import FastAPI, Query
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
-from .config import settings
+from .admission import admission
+from .affinity import INSTANCE_ID
+from .config import install_reload_handler, public_settings, settings, settings_status
 from .debug_store import store
-from .endpoints import stt_ws, health, test, audio_viewer
+from .lifecycle import lifecycle
+from .loop_monitor import loop_lag, loop_monitor, monitor_enabled, EndpointLabelMiddleware
+from .profiles import profiles
+from .readiness import readiness, probes_enabled
+from .recording import recorder
+from .state_backend import state
+from .endpoints import stt_ws, agent_ws, health, test, audio_viewer
 from .endpoints.tts_ws import ws_tts
+from .tts.engine_router import tts_router
+from .tts.schedule_tuner import schedule_tuner
+from .stt.engine_router import stt_router
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger("stt")
 
-app = FastAPI(title="stefan-api-test-16 – STT+TTS-backend (FastAPI + Realtime)")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # SIGTERM (deploy/omstart) → drain pågående sessioner innan uvicorn stänger
+    lifecycle.install_signal_handlers()
+    # SIGHUP → läs om inställningarna utan omstart (pågående sessioner behålls)
+    install_reload_handler()
+    if monitor_enabled():
+        # Lag, långsamma anrop och CPU per endpoint (se /debug/loop)
+        loop_monitor.start()
+    else:
+        loop_lag.start()
+    if probes_enabled():
+        readiness.start()
+    yield
+    await readiness.stop()
+    await loop_monitor.stop()
+    # Skriv klart pågående inspelningar
+    await asyncio.to_thread(recorder.flush)
+
+
+app = FastAPI(lifespan=lifespan, title="stefan-api-test-16 – STT+TTS-backend (FastAPI + Realtime)")
 
 
 # ----------------------- CORS -----------------------
@@ -43,8 +75,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Märk varje anslutning med sin route för CPU-accounting per endpoint
+app.add_middleware(EndpointLabelMiddleware, router=app.router)
+
 # Inkludera routers
 app.include_router(stt_ws.router, tags=["stt"])
+app.include_router(agent_ws.router, tags=["agent"])
 app.include_router(health.router, tags=["health"])
 app.include_router(test.router, prefix="/api", tags=["test"])
 app.include_router(audio_viewer.router, prefix="/api", tags=["audio"])
@@ -56,8 +92,13 @@ class ConfigOut(BaseModel):
     transcribe_model: str
     input_language: str
     commit_interval_ms: int
+    ws_default_mode: str
     cors_origins: list[str]
     cors_regex: Optional[str]
+    settings_version: int
+    settings_loaded_at: float
+    # Alla övriga inställningar (utom API-nycklar), se app/config.py
+    runtime: dict
 
 class DebugListOut(BaseModel):
     session_id: str
@@ -67,45 +108,96 @@ class DebugListOut(BaseModel):
 
 @app.get("/config", response_model=ConfigOut)
 async def get_config():
+    status = settings_status()
     return ConfigOut(
         realtime_url=settings.realtime_url,
         transcribe_model=settings.transcribe_model,
         input_language=settings.input_language,
         commit_interval_ms=settings.commit_interval_ms,
+        ws_default_mode=settings.ws_default_mode,
         cors_origins=origins,
         cors_regex=regex,
+        settings_version=status["version"],
+        settings_loaded_at=status["loaded_at"],
+        runtime=public_settings(),
     )
 
 @app.get("/debug/frontend-chunks", response_model=DebugListOut)
 async def debug_frontend_chunks(session_id: str = Query(...), limit: int = Query(200, ge=1, le=1000)):
-    buf = store.get_or_create(session_id)
+    buf = await store.load(session_id)
     data = list(buf.frontend_chunks)[-limit:]
     return DebugListOut(session_id=session_id, data=data)
 
 @app.get("/debug/openai-chunks", response_model=DebugListOut)
 async def debug_openai_chunks(session_id: str = Query(...), limit: int = Query(200, ge=1, le=1000)):
-    buf = store.get_or_create(session_id)
+    buf = await store.load(session_id)
     data = list(buf.openai_chunks)[-limit:]
     return DebugListOut(session_id=session_id, data=data)
 
 @app.get("/debug/openai-text", response_model=DebugListOut)
 async def debug_openai_text(session_id: str = Query(...), limit: int = Query(200, ge=1, le=2000)):
-    buf = store.get_or_create(session_id)
+    buf = await store.load(session_id)
     data = list(buf.openai_text)[-limit:]
     return DebugListOut(session_id=session_id, data=data)
 
 @app.get("/debug/frontend-text", response_model=DebugListOut)
 async def debug_frontend_text(session_id: str = Query(...), limit: int = Query(200, ge=1, le=2000)):
-    buf = store.get_or_create(session_id)
+    buf = await store.load(session_id)
     data = list(buf.frontend_text)[-limit:]
     return DebugListOut(session_id=session_id, data=data)
 
 @app.get("/debug/rt-events", response_model=DebugListOut)
 async def debug_rt_events(session_id: str = Query(...), limit: int = Query(200, ge=1, le=2000)):
-    buf = store.get_or_create(session_id)
+    buf = await store.load(session_id)
     data = list(buf.rt_events)[-limit:]
     return DebugListOut(session_id=session_id, data=data)
 
+@app.get("/debug/audio-levels")
+async def debug_audio_levels(session_id: str = Query(...)):
+    """Nivå (RMS/peak i dBFS), klippning, tystnad och DC-offset för in- och utgående ljud."""
+    buf = await store.load(session_id)
+    return {"session_id": session_id, **buf.audio_levels()}
+
+@app.get("/debug/admission")
+async def debug_admission():
+    """Aktiva sessioner, köer och köväntetider per uppströmsleverantör."""
+    return admission.stats()
+
+@app.get("/debug/tts-engines")
+async def debug_tts_engines():
+    """TTFB, felfrekvens och aktuell routing-ordning per TTS-engine."""
+    return tts_router.snapshot()
+
+@app.get("/debug/tts-schedules")
+async def debug_tts_schedules():
+    """Inlärda chunk_length_schedule per röst, modell och textlängd med TTFB och glapp."""
+    return schedule_tuner.snapshot()
+
+@app.get("/debug/stt-engines")
+async def debug_stt_engines():
+    """Anslutningstid, felfrekvens, failovers och aktuell routing-ordning per STT-engine."""
+    return stt_router.snapshot()
+
+@app.get("/debug/profiles")
+async def debug_profiles():
+    """Röst-/modellprofiler med sessioner och latens (TTS-TTFB, LLM, STT-anslutning) per profil."""
+    return profiles.snapshot()
+
+@app.get("/debug/loop")
+async def debug_loop():
+    """Event-loop-lag, senaste blockerande anrop (med stack) och CPU-tid per endpoint."""
+    return loop_monitor.snapshot()
+
+@app.get("/debug/state")
+async def debug_state():
+    """Vilken state-backend som används och vilken instans som svarar."""
+    return {
+        "backend": state.name,
+        "shared": state.shared,
+        "instance_id": INSTANCE_ID,
+        "local_sessions": len(store.list_sessions()),
+    }
+
 @app.post("/debug/reset")
 async def debug_reset(session_id: str | None = Query(None)):
     store.reset(session_id)
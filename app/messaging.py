@@ -0,0 +1,292 @@
+"""Gemensamt lager för alla meddelanden från servern till frontend.
+
+- All JSON kodas med orjson direkt till bytes.
+- Heta meddelanden (`stt.partial`, `stt.final`, …) har förkompilerade
+  scheman: den fasta delen (`{"type":"stt.partial","text":`) byggs en gång
+  och bara fältvärdena kodas per meddelande.
+- Binär framing (MessagePack) kan väljas vid anslutning med
+  `?framing=msgpack` på endpoints som inte skickar ljud som binära frames.
+- Små kontrollmeddelanden (debug) kan batchas med `?batch_ms=N`: de samlas
+  i högst N ms och skickas som ett `{"type": "batch", "messages": [...]}`.
+  Batchade meddelanden behåller ordningen sinsemellan och mot övrig JSON,
+  men kan komma efter ljud-frames som skickats under tiden.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import struct
+from typing import Any, List, Optional
+
+import orjson
+
+from .config import settings
+
+log = logging.getLogger("messaging")
+
+FRAMING_JSON = "json"
+FRAMING_MSGPACK = "msgpack"
+FRAMINGS = (FRAMING_JSON, FRAMING_MSGPACK)
+
+# Standardbatchning läses från settings (WS_BATCH_MS, 0 = ingen); högst så här många meddelanden per batch
+MAX_BATCH_MESSAGES = 64
+
+
+def encode_json(obj: Any) -> bytes:
+    """orjson till bytes; okända typer (t.ex. undantag i feldetaljer) blir strängar."""
+    return orjson.dumps(obj, default=str)
+
+
+# ---- MessagePack (delmängd: det som JSON kan uttrycka + bytes) ----
+
+def _pack_header(n: int, fix: int, fix_max: int, small: Optional[int], mid: int, large: int) -> bytes:
+    if n <= fix_max:
+        return bytes((fix | n,))
+    if small is not None and n < 0x100:
+        return bytes((small, n))
+    if n < 0x10000:
+        return struct.pack(">BH", mid, n)
+    return struct.pack(">BI", large, n)
+
+
+def _pack_int(n: int) -> bytes:
+    if 0 <= n < 0x80:
+        return bytes((n,))
+    if -32 <= n < 0:
+        return struct.pack(">b", n)
+    if n >= 0:
+        for code, fmt, limit in ((0xCC, ">BB", 0x100), (0xCD, ">BH", 0x10000), (0xCE, ">BI", 0x100000000)):
+            if n < limit:
+                return struct.pack(fmt, code, n)
+        return struct.pack(">BQ", 0xCF, n)
+    for code, fmt, limit in ((0xD0, ">Bb", 0x80), (0xD1, ">Bh", 0x8000), (0xD2, ">Bi", 0x80000000)):
+        if n >= -limit:
+            return struct.pack(fmt, code, n)
+    return struct.pack(">Bq", 0xD3, n)
+
+
+def packb(obj: Any) -> bytes:
+    """Koda ett värde som MessagePack."""
+    if obj is None:
+        return b"\xc0"
+    if obj is True:
+        return b"\xc3"
+    if obj is False:
+        return b"\xc2"
+    if isinstance(obj, int):
+        return _pack_int(obj)
+    if isinstance(obj, float):
+        return struct.pack(">Bd", 0xCB, obj)
+    if isinstance(obj, str):
+        data = obj.encode("utf-8")
+        return _pack_header(len(data), 0xA0, 31, 0xD9, 0xDA, 0xDB) + data
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        data = bytes(obj)
+        return _pack_header(len(data), 0xC4, -1, 0xC4, 0xC5, 0xC6) + data
+    if isinstance(obj, dict):
+        parts = [_pack_header(len(obj), 0x80, 15, None, 0xDE, 0xDF)]
+        for key, value in obj.items():
+            parts.append(packb(str(key)))
+            parts.append(packb(value))
+        return b"".join(parts)
+    if isinstance(obj, (list, tuple)):
+        return _pack_header(len(obj), 0x90, 15, None, 0xDC, 0xDD) + b"".join(packb(v) for v in obj)
+    return packb(str(obj))
+
+
+def _pack_array_header(n: int) -> bytes:
+    return _pack_header(n, 0x90, 15, None, 0xDC, 0xDD)
+
+
+class MessageSchema:
+    """Förkompilerat meddelande med fast `type` och fasta fältnamn.
+
+    `encode(*values)` kodar bara värdena; resten är färdiga bytes.
+    """
+
+    def __init__(self, message_type: str, *fields: str):
+        self.type = message_type
+        self.fields = fields
+
+        head = b'{"type":' + orjson.dumps(message_type)
+        self._json_keys = [b"," + orjson.dumps(f) + b":" for f in fields]
+        if self._json_keys:
+            self._json_keys[0] = head + self._json_keys[0]
+        self._json_empty = head + b"}"
+
+        self._msgpack_head = bytes((0x80 | (len(fields) + 1),)) + packb("type") + packb(message_type)
+        self._msgpack_keys = [packb(f) for f in fields]
+
+    def encode(self, *values: Any) -> bytes:
+        if not self._json_keys:
+            return self._json_empty
+        parts = []
+        for key, value in zip(self._json_keys, values):
+            parts.append(key)
+            parts.append(orjson.dumps(value, default=str))
+        parts.append(b"}")
+        return b"".join(parts)
+
+    def encode_msgpack(self, *values: Any) -> bytes:
+        parts = [self._msgpack_head]
+        for key, value in zip(self._msgpack_keys, values):
+            parts.append(key)
+            parts.append(packb(value))
+        return b"".join(parts)
+
+    def to_dict(self, *values: Any) -> dict:
+        return {"type": self.type, **dict(zip(self.fields, values))}
+
+
+# Scheman för de heta meddelandena
+STT_PARTIAL = MessageSchema("stt.partial", "text")
+STT_FINAL = MessageSchema("stt.final", "text")
+STT_PROCESSING = MessageSchema("stt.processing", "text")
+STT_PARTIAL_SNAPSHOT = MessageSchema("stt.partial", "text", "seq")
+STT_PARTIAL_DELTA = MessageSchema("stt.partial.delta", "delta", "seq")
+TTS_STATUS = MessageSchema("status", "stage")
+PONG = MessageSchema("pong")
+
+_BATCH_JSON_HEAD = b'{"type":"batch","messages":['
+_BATCH_MSGPACK_HEAD = b"\x82" + packb("type") + packb("batch") + packb("messages")
+
+
+class FrontendChannel:
+    """Kodar och skickar meddelanden till en frontend-WebSocket.
+
+    Fungerar som en ersättning för WebSocket:en (samma `send_json`,
+    `send_text`, `send_bytes`, `close`; övriga attribut skickas vidare).
+    """
+
+    def __init__(self, ws, framing: str = FRAMING_JSON, batch_ms: Optional[float] = None):
+        if framing not in FRAMINGS:
+            raise ValueError(f"Okänd framing: {framing}")
+        self._ws = ws
+        self.framing = framing
+        self.batch_ms = max(0.0, settings.ws_batch_ms if batch_ms is None else batch_ms)
+        self._pending: List[bytes] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self.messages_sent = 0
+        self.frames_sent = 0
+
+    @classmethod
+    def from_websocket(cls, ws, allow_binary: bool = True) -> "FrontendChannel":
+        """Förhandla framing och batchning från query-parametrar (`framing`, `batch_ms`).
+
+        `allow_binary=False` för endpoints där binära frames är ljud; då
+        används alltid JSON-framing.
+        """
+        framing = (ws.query_params.get("framing") or FRAMING_JSON).lower()
+        if framing not in FRAMINGS or not allow_binary:
+            framing = FRAMING_JSON
+        try:
+            batch_ms = float(ws.query_params.get("batch_ms") or settings.ws_batch_ms)
+        except ValueError:
+            batch_ms = settings.ws_batch_ms
+        return cls(ws, framing, batch_ms)
+
+    @property
+    def binary(self) -> bool:
+        return self.framing == FRAMING_MSGPACK
+
+    def negotiated(self) -> dict:
+        """Beskrivning av förhandlad framing (skickas i ready-meddelandet)."""
+        return {"framing": self.framing, "batch_ms": self.batch_ms}
+
+    # ---- Sändning ----
+
+    async def send(self, obj: dict, batchable: bool = False) -> None:
+        await self._send_encoded(packb(obj) if self.binary else encode_json(obj), batchable)
+
+    async def send_schema(self, schema: MessageSchema, *values: Any, batchable: bool = False) -> None:
+        payload = schema.encode_msgpack(*values) if self.binary else schema.encode(*values)
+        await self._send_encoded(payload, batchable)
+
+    async def send_json(self, obj: dict) -> None:
+        await self.send(obj)
+
+    async def send_message(self, obj: dict, batchable: bool = False) -> None:
+        await self.send(obj, batchable)
+
+    async def send_text(self, data: str) -> None:
+        """Rå text (t.ex. "pong" eller ren transkripttext) – efter eventuella batchade meddelanden."""
+        await self.flush()
+        await self._ws.send_text(data)
+
+    async def send_bytes(self, data) -> None:
+        """Ljud skickas direkt (väntar inte på batchen)."""
+        await self._ws.send_bytes(data)
+
+    async def _send_encoded(self, payload: bytes, batchable: bool) -> None:
+        if batchable and self.batch_ms > 0:
+            self._pending.append(payload)
+            self.messages_sent += 1
+            if len(self._pending) >= MAX_BATCH_MESSAGES:
+                await self.flush()
+            elif self._flush_task is None:
+                self._flush_task = asyncio.create_task(self._flush_later())
+            return
+        if self._pending:
+            await self.flush()
+        self.messages_sent += 1
+        await self._write(payload)
+
+    async def _write(self, payload: bytes) -> None:
+        self.frames_sent += 1
+        if self.binary:
+            await self._ws.send_bytes(payload)
+        else:
+            await self._ws.send_text(payload.decode("utf-8"))
+
+    async def _flush_later(self) -> None:
+        try:
+            await asyncio.sleep(self.batch_ms / 1000)
+            self._flush_task = None
+            await self.flush()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.debug("Batch flush failed: %s", e)
+
+    async def flush(self) -> None:
+        """Skicka batchade meddelanden som en frame."""
+        task, self._flush_task = self._flush_task, None
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        if len(pending) == 1:
+            await self._write(pending[0])
+        elif self.binary:
+            await self._write(_BATCH_MSGPACK_HEAD + _pack_array_header(len(pending)) + b"".join(pending))
+        else:
+            await self._write(_BATCH_JSON_HEAD + b",".join(pending) + b"]}")
+
+    async def close(self, code: int = 1000, reason: Optional[str] = None) -> None:
+        try:
+            await self.flush()
+        except Exception:
+            pass
+        await self._ws.close(code=code, reason=reason)
+
+    def __getattr__(self, name):
+        return getattr(self._ws, name)
+
+
+async def send_message(ws, obj: dict, batchable: bool = False) -> None:
+    """Skicka ett meddelande via FrontendChannel om `ws` är (eller omsluter) en, annars som orjson-text."""
+    if hasattr(type(ws), "send_message"):
+        await ws.send_message(obj, batchable)
+    else:
+        await ws.send_text(encode_json(obj).decode("utf-8"))
+
+
+async def send_schema(ws, schema: MessageSchema, *values: Any) -> None:
+    """Som `send_message` men med ett förkompilerat schema."""
+    if isinstance(ws, FrontendChannel):
+        await ws.send_schema(schema, *values)
+    elif hasattr(type(ws), "send_message"):
+        await ws.send_message(schema.to_dict(*values))
+    else:
+        await ws.send_text(schema.encode(*values).decode("utf-8"))
@@ -0,0 +1,302 @@
+# app/profiles.py
+from __future__ import annotations
+
+import contextvars
+import json
+import logging
+import os
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional
+
+import orjson
+from pydantic import BaseModel, Field, PrivateAttr
+
+from .llm.config import llm_config
+
+log = logging.getLogger("profiles")
+
+# Standardvärden för TTS (ElevenLabs); en profil utan egna värden använder dessa
+DEFAULT_VOICE_ID = "Vo4adEN1y46b0ufuysRe"  # Sätt ditt voice-ID här
+DEFAULT_MODEL_ID = "eleven_flash_v2_5"
+DEFAULT_OUTPUT_FORMAT = "pcm_16000"
+DEFAULT_VOICE_SETTINGS = {
+    "stability": 0.5,
+    "similarity_boost": 0.8,
+    "use_speaker_boost": False,
+    "speed": 1.0,
+}
+# Lägre trösklar → snabbare start på kort text
+DEFAULT_CHUNK_LENGTH_SCHEDULE = [50, 90, 140]
+
+ELEVENLABS_WS_BASE_URL = "wss://api.elevenlabs.io/v1/text-to-speech"
+
+# Profiler läses från en JSON-fil ({"namn": {...}, ...}) eller direkt från PROFILES_JSON
+PROFILES_FILE = os.getenv("PROFILES_FILE", "")
+DEFAULT_PROFILE = "default"
+
+# Mätvärden som sparas per profil
+METRICS = ("tts_ttfb_ms", "llm_ms", "stt_connect_ms")
+
+
+class LatencyWindow:
+    """Rullande fönster med latensmätningar (p50/p95)."""
+
+    def __init__(self, window: int = 200):
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.count = 0
+
+    def record(self, ms: float) -> None:
+        self.samples.append(ms)
+        self.count += 1
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        samples = sorted(self.samples)
+        return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+    def snapshot(self) -> dict:
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        return {
+            "count": self.count,
+            "p50_ms": round(p50, 1) if p50 is not None else None,
+            "p95_ms": round(p95, 1) if p95 is not None else None,
+        }
+
+
+class ProfileMetrics:
+    """Sessioner och latens (TTS-TTFB, LLM, STT-anslutning) för en profil."""
+
+    def __init__(self):
+        self.sessions = 0
+        self.latency: Dict[str, LatencyWindow] = {name: LatencyWindow() for name in METRICS}
+
+    def record(self, metric: str, ms: float) -> None:
+        self.latency[metric].record(ms)
+
+    def snapshot(self) -> dict:
+        return {"sessions": self.sessions, **{name: w.snapshot() for name, w in self.latency.items()}}
+
+
+class Profile(BaseModel):
+    """Namngiven röst- och modellprofil (en per kund/tenant).
+
+    Väljs per anslutning med `?profile=`. Det som skickas till
+    leverantörerna vid varje förfrågan – ElevenLabs URL och init-meddelande
+    samt Realtime `session.update` – serialiseras en gång när profilen
+    skapas i stället för per förfrågan. API-nyckeln ingår inte i det
+    förberäknade init-meddelandet utan läggs till per förfrågan (den kan
+    laddas om, se app/config.py).
+    """
+
+    name: str = DEFAULT_PROFILE
+
+    # --- TTS (ElevenLabs) ---
+    voice_id: str = DEFAULT_VOICE_ID
+    tts_model_id: str = DEFAULT_MODEL_ID
+    output_format: str = DEFAULT_OUTPUT_FORMAT
+    voice_settings: Dict[str, Any] = Field(default_factory=lambda: dict(DEFAULT_VOICE_SETTINGS))
+    chunk_length_schedule: List[int] = Field(default_factory=lambda: list(DEFAULT_CHUNK_LENGTH_SCHEDULE))
+
+    # --- LLM ---
+    system_prompt: str = Field(default_factory=lambda: llm_config.system_prompt)
+    llm_model: str = Field(default_factory=lambda: llm_config.model)
+
+    # --- STT --- (None = INPUT_LANGUAGE från inställningarna)
+    input_language: Optional[str] = None
+
+    _tts_url: str = PrivateAttr("")
+    _tts_init_prefixes: Dict[tuple, bytes] = PrivateAttr(default_factory=dict)
+    _tts_init_debug: dict = PrivateAttr(default_factory=dict)
+    _session_updates: Dict[str, str] = PrivateAttr(default_factory=dict)
+    _variants: Dict[tuple, "Profile"] = PrivateAttr(default_factory=dict)
+    _metrics: ProfileMetrics = PrivateAttr(default_factory=ProfileMetrics)
+
+    def model_post_init(self, __context) -> None:
+        query = f"?model_id={self.tts_model_id}&output_format={self.output_format}"
+        self._tts_url = f"{ELEVENLABS_WS_BASE_URL}/{self.voice_id}/stream-input{query}"
+        self._tts_init_debug = self._init_msg(self.chunk_length_schedule)
+        self._init_prefix(self.chunk_length_schedule)
+
+    @property
+    def pcm_sample_rate(self) -> Optional[int]:
+        """Samplingsfrekvens för rå PCM-utdata ("pcm_16000" → 16000), None för komprimerat format."""
+        codec, _, rate = self.output_format.partition("_")
+        return int(rate) if codec == "pcm" and rate.isdigit() else None
+
+    @property
+    def audio_out(self) -> dict:
+        """Utgående ljudformat som det annonseras till klienten ("pcm_24000" → pcm16 i 24 kHz)."""
+        codec, _, rest = self.output_format.partition("_")
+        rate = rest.partition("_")[0]
+        return {
+            "encoding": "pcm16" if codec == "pcm" else codec,
+            "sample_rate_hz": int(rate) if rate.isdigit() else None,
+            "channels": 1,
+        }
+
+    def _init_msg(self, schedule: List[int]) -> dict:
+        return {
+            "text": " ",  # kickstart
+            "voice_settings": self.voice_settings,
+            "generation_config": {"chunk_length_schedule": schedule},
+        }
+
+    def _init_prefix(self, schedule: List[int]) -> bytes:
+        # Allt utom avslutande "}" → nyckeln skarvas in per förfrågan utan ny serialisering
+        key = tuple(schedule)
+        prefix = self._tts_init_prefixes.get(key)
+        if prefix is None:
+            prefix = orjson.dumps(self._init_msg(list(schedule)))[:-1] + b',"xi_api_key":'
+            self._tts_init_prefixes[key] = prefix
+        return prefix
+
+    @property
+    def metrics(self) -> ProfileMetrics:
+        return self._metrics
+
+    @property
+    def tts_url(self) -> str:
+        """ElevenLabs stream-input-URL för profilens röst, modell och format."""
+        return self._tts_url
+
+    @property
+    def tts_init_debug(self) -> dict:
+        """Init-meddelandet utan API-nyckel (för debug till frontend)."""
+        return self._tts_init_debug
+
+    def tts_init_message(self, api_key: str, schedule: Optional[List[int]] = None) -> str:
+        """Förserialiserat ElevenLabs init-meddelande med API-nyckeln inskarvad.
+
+        `schedule` ersätter profilens chunk-schema (t.ex. inlärt av
+        app/tts/schedule_tuner.py); varje schema serialiseras en gång.
+        """
+        prefix = self._init_prefix(schedule or self.chunk_length_schedule)
+        return (prefix + orjson.dumps(api_key) + b"}").decode()
+
+    def session_update(self, language: str) -> str:
+        """Serialiserat Realtime `session.update` (cachat per språk)."""
+        cached = self._session_updates.get(language)
+        if cached is None:
+            cached = json.dumps({
+                "type": "session.update",
+                "session": {
+                    "modalities": ["text"],  # räcker för STT
+                    "input_audio_format": "pcm16",
+                    "input_audio_transcription": {
+                        "model": "whisper-1",  # samma som repo 2 för kompatibilitet
+                        "language": language,
+                    },
+                    "turn_detection": {
+                        "type": "server_vad",
+                        "threshold": 0.5,
+                        "prefix_padding_ms": 300,
+                        "silence_duration_ms": 500,
+                        "create_response": False,  # vi vill bara STT
+                        "interrupt_response": True
+                    },
+                },
+            })
+            self._session_updates[language] = cached
+        return cached
+
+    def with_voice(self, voice_id: Optional[str] = None, tts_model_id: Optional[str] = None) -> "Profile":
+        """Samma profil med annan röst/modell (t.ex. en engine med fast röst). Cachas."""
+        voice_id = voice_id or self.voice_id
+        tts_model_id = tts_model_id or self.tts_model_id
+        if (voice_id, tts_model_id) == (self.voice_id, self.tts_model_id):
+            return self
+        key = (voice_id, tts_model_id)
+        variant = self._variants.get(key)
+        if variant is None:
+            variant = Profile(**{**self.model_dump(), "voice_id": voice_id, "tts_model_id": tts_model_id})
+            variant._metrics = self._metrics  # mäts som samma profil
+            self._variants[key] = variant
+        return variant
+
+    def describe(self) -> dict:
+        return {
+            "voice_id": self.voice_id,
+            "tts_model_id": self.tts_model_id,
+            "output_format": self.output_format,
+            "chunk_length_schedule": self.chunk_length_schedule,
+            "llm_model": self.llm_model,
+            "input_language": self.input_language,
+        }
+
+
+class ProfileRegistry:
+    """Profiler per namn. `default` finns alltid (standardvärdena ovan).
+
+    Okända namn ger standardprofilen (loggas och räknas) i stället för att
+    anslutningen nekas.
+    """
+
+    def __init__(self, profiles: Iterable[Profile] = ()):
+        self._profiles: Dict[str, Profile] = {DEFAULT_PROFILE: Profile()}
+        for profile in profiles:
+            self._profiles[profile.name] = profile
+        self.unknown_requests = 0
+
+    @classmethod
+    def from_mapping(cls, data: Dict[str, dict]) -> "ProfileRegistry":
+        return cls(Profile(**{**values, "name": name}) for name, values in data.items())
+
+    @classmethod
+    def from_env(cls) -> "ProfileRegistry":
+        """Läs profiler från PROFILES_JSON eller filen i PROFILES_FILE (annars bara default)."""
+        raw = os.getenv("PROFILES_JSON", "")
+        if not raw and PROFILES_FILE:
+            with open(PROFILES_FILE, "rb") as f:
+                raw = f.read()
+        if not raw:
+            return cls()
+        registry = cls.from_mapping(orjson.loads(raw))
+        log.info("Loaded voice/model profiles: %s", ", ".join(registry.names()))
+        return registry
+
+    @property
+    def default(self) -> Profile:
+        return self._profiles[DEFAULT_PROFILE]
+
+    def names(self) -> List[str]:
+        return list(self._profiles)
+
+    def get(self, name: Optional[str]) -> Profile:
+        if not name:
+            return self.default
+        profile = self._profiles.get(name)
+        if profile is None:
+            self.unknown_requests += 1
+            log.warning("Unknown profile requested: %s (using %s)", name, DEFAULT_PROFILE)
+            return self.default
+        return profile
+
+    def snapshot(self) -> dict:
+        return {
+            "profiles": {
+                name: {**profile.describe(), "metrics": profile.metrics.snapshot()}
+                for name, profile in self._profiles.items()
+            },
+            "unknown_requests": self.unknown_requests,
+        }
+
+
+# Global instans
+profiles = ProfileRegistry.from_env()
+
+# Profilen för den aktuella anslutningen; ärvs av barn-tasks (LLM-tur, TTS-engine, STT-klient)
+_active_profile: contextvars.ContextVar[Optional[Profile]] = contextvars.ContextVar("active_profile", default=None)
+
+
+def activate_profile(name: Optional[str]) -> Profile:
+    """Välj profil för den aktuella anslutningen (`?profile=`) och räkna sessionen."""
+    profile = profiles.get(name)
+    profile.metrics.sessions += 1
+    _active_profile.set(profile)
+    return profile
+
+
+def current_profile() -> Profile:
+    """Profilen för den aktuella anslutningen, annars standardprofilen."""
+    return _active_profile.get() or profiles.default
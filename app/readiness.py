@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional, Union
+from urllib.parse import urlparse
+
+import httpx
+
+from .admission import admission, PROVIDER_ELEVENLABS, PROVIDER_REALTIME, PROVIDER_LLM
+from .config import settings
+from .lifecycle import lifecycle
+from .loop_monitor import loop_lag
+
+log = logging.getLogger("readiness")
+
+# Probintervall/timeout och gränser för när workern inte längre ska få nya
+# anslutningar läses från settings (READYZ_*, MAX_SESSIONS) och följer med vid omläsning
+
+
+class ProbeResult:
+    def __init__(self, status: str, latency_ms: Optional[float] = None, detail: Optional[str] = None):
+        self.status = status  # "ok" | "degraded" | "down" | "unknown"
+        self.latency_ms = latency_ms
+        self.detail = detail
+        self.checked_at = time.time()
+
+    def to_dict(self) -> dict:
+        return {
+            "status": self.status,
+            "latency_ms": self.latency_ms,
+            "detail": self.detail,
+            "age_sec": round(time.time() - self.checked_at, 1),
+        }
+
+
+class Probe(ABC):
+    """En uppströmskontroll; `check()` returnerar ett ProbeResult."""
+
+    name = "base"
+
+    @abstractmethod
+    async def check(self) -> ProbeResult:
+        ...
+
+
+class HttpProbe(Probe):
+    """GET mot en lättviktig endpoint. 2xx = ok, 401/403/4xx = degraded, 5xx/fel = down."""
+
+    def __init__(self, name: str, url: str, headers: Union[dict, Callable[[], dict], None] = None,
+                 client: Optional[httpx.AsyncClient] = None):
+        self.name = name
+        self.url = url
+        # Headers kan vara en funktion → API-nyckeln slås upp vid varje kontroll (omläsning slår igenom)
+        self.headers = headers or {}
+        self._client = client
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient()
+        return self._client
+
+    async def check(self) -> ProbeResult:
+        headers = self.headers() if callable(self.headers) else self.headers
+        started = time.perf_counter()
+        try:
+            response = await self._get_client().get(
+                self.url, headers=headers, timeout=settings.readyz_probe_timeout_sec
+            )
+        except Exception as e:
+            return ProbeResult("down", detail=f"{type(e).__name__}: {e}"[:200])
+        latency_ms = round((time.perf_counter() - started) * 1000, 1)
+        if response.status_code < 300:
+            return ProbeResult("ok", latency_ms)
+        status = "down" if response.status_code >= 500 else "degraded"
+        return ProbeResult(status, latency_ms, f"HTTP {response.status_code}")
+
+
+class TcpProbe(Probe):
+    """TCP-(+TLS-)anslutning mot en WebSocket-värd, t.ex. Realtime."""
+
+    def __init__(self, name: str, host: str, port: int, tls: bool = True):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.tls = tls
+
+    @classmethod
+    def from_url(cls, name: str, url: str) -> "TcpProbe":
+        parsed = urlparse(url)
+        tls = parsed.scheme in ("wss", "https")
+        return cls(name, parsed.hostname or "localhost", parsed.port or (443 if tls else 80), tls)
+
+    async def check(self) -> ProbeResult:
+        started = time.perf_counter()
+        try:
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port, ssl=self.tls or None),
+                settings.readyz_probe_timeout_sec,
+            )
+        except Exception as e:
+            return ProbeResult("down", detail=f"{type(e).__name__}: {e}"[:200])
+        latency_ms = round((time.perf_counter() - started) * 1000, 1)
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except Exception:
+            pass
+        return ProbeResult("ok", latency_ms)
+
+
+class Readiness:
+    """Samlar readiness-signaler för `/readyz`.
+
+    Proberna körs periodiskt i en bakgrunds-task och resultatet cachas, så
+    `/readyz` kostar bara en ögonblicksbild av befintliga räknare.
+    """
+
+    def __init__(self, probes: List[Probe], interval_sec: Optional[float] = None,
+                 max_loop_lag_ms: Optional[float] = None, max_sessions: Optional[int] = None):
+        self.probes = probes
+        # None → värdet från settings
+        self._interval_sec = interval_sec
+        self._max_loop_lag_ms = max_loop_lag_ms
+        self._max_sessions = max_sessions
+        self.results: Dict[str, ProbeResult] = {probe.name: ProbeResult("unknown") for probe in probes}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def interval_sec(self) -> float:
+        return self._interval_sec if self._interval_sec is not None else settings.readyz_probe_interval_sec
+
+    @property
+    def max_loop_lag_ms(self) -> float:
+        return self._max_loop_lag_ms if self._max_loop_lag_ms is not None else settings.readyz_max_loop_lag_ms
+
+    @property
+    def max_sessions(self) -> int:
+        return self._max_sessions if self._max_sessions is not None else settings.max_sessions
+
+    async def run_probes(self) -> None:
+        results = await asyncio.gather(*(probe.check() for probe in self.probes), return_exceptions=True)
+        for probe, result in zip(self.probes, results):
+            if isinstance(result, Exception):
+                result = ProbeResult("down", detail=str(result)[:200])
+            if result.status != self.results[probe.name].status:
+                log.info("Probe %s: %s -> %s", probe.name, self.results[probe.name].status, result.status)
+            self.results[probe.name] = result
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.run_probes()
+            except Exception as e:
+                log.warning("Probe run failed: %s", e)
+            await asyncio.sleep(self.interval_sec)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    @staticmethod
+    def _pools() -> dict:
+        pools = {}
+        for provider, stats in admission.stats().items():
+            capacity = stats["max_concurrent"]
+            pools[provider] = {
+                "active": stats["active"],
+                "capacity": capacity if capacity > 0 else None,
+                "fill": round(stats["active"] / capacity, 3) if capacity > 0 else None,
+                "waiting": stats["waiting"],
+                "max_queue": stats["max_queue"],
+            }
+        return pools
+
+    def snapshot(self) -> dict:
+        reasons = []
+        if lifecycle.draining:
+            reasons.append("draining")
+
+        lag_ms = loop_lag.percentile_ms(0.5)
+        if lag_ms is not None and lag_ms > self.max_loop_lag_ms:
+            reasons.append("event_loop_lag")
+
+        active = lifecycle.active_sessions
+        if self.max_sessions > 0 and active >= self.max_sessions:
+            reasons.append("at_capacity")
+
+        pools = self._pools()
+        for provider, pool in pools.items():
+            # Kön full → nya sessioner skulle avvisas direkt
+            if pool["capacity"] and pool["active"] >= pool["capacity"] and pool["waiting"] >= pool["max_queue"]:
+                reasons.append(f"{provider}_saturated")
+
+        for name, result in self.results.items():
+            if result.status == "down":
+                reasons.append(f"{name}_down")
+
+        return {
+            "ready": not reasons,
+            "reasons": reasons,
+            "event_loop_lag": loop_lag.snapshot(),
+            "sessions": {"active": active, "capacity": self.max_sessions or None},
+            "pools": pools,
+            "probes": {name: result.to_dict() for name, result in self.results.items()},
+        }
+
+
+def _probes_from_settings() -> List[Probe]:
+    # Nycklarna läses vid varje kontroll så att en omläsning (SIGHUP) når proberna
+    return [
+        TcpProbe.from_url(PROVIDER_REALTIME, settings.probe_realtime_url or settings.realtime_url),
+        HttpProbe(
+            PROVIDER_ELEVENLABS,
+            settings.probe_elevenlabs_url,
+            lambda: {"xi-api-key": settings.elevenlabs_api_key},
+        ),
+        HttpProbe(
+            PROVIDER_LLM,
+            settings.probe_openai_url,
+            lambda: {"Authorization": f"Bearer {settings.openai_api_key}"},
+        ),
+    ]
+
+
+def probes_enabled() -> bool:
+    return settings.readyz_probes
+
+
+# Global instans
+readiness = Readiness(_probes_from_settings())
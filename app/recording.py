@@ -0,0 +1,342 @@
+from __future__ import annotations
+
+import logging
+import mmap
+import queue
+import struct
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import orjson
+
+from .audio import AudioFile, PcmFormat, WavWriter, open_audio
+from .config import settings
+from .messaging import send_message
+
+log = logging.getLogger("recording")
+
+
+def recording_dir() -> Path:
+    """Katalog för inspelningar (RECORDING_DIR, annars AUDIO_OUTPUT_DIR)."""
+    return Path(settings.recording_dir or settings.audio_output_dir)
+
+
+TRACK_IN = "in"    # PCM från frontend (mikrofon)
+TRACK_OUT = "out"  # TTS-audio till frontend
+TRACKS = (TRACK_IN, TRACK_OUT)
+# Spårets format tills sessionen anger sitt faktiska (se SessionRecorder.set_format)
+DEFAULT_TRACK_FORMAT = {"encoding": "pcm16", "sample_rate_hz": 16000, "channels": 1}
+
+# Indexpost (16 bytes): t_ms, spår, typ, segment, offset, längd
+INDEX_RECORD = struct.Struct("<IBBHII")
+KIND_AUDIO = 0
+KIND_EVENT = 1
+
+
+def recording_enabled(query_value: Optional[str] = None) -> bool:
+    """Inspelning är opt-in: RECORD_SESSIONS=true för alla, annars ?record=true per anslutning."""
+    if query_value is not None:
+        return query_value.lower() == "true"
+    return settings.record_sessions
+
+
+class _Segment:
+    """En förallokerad, memory-mappad segmentfil för ett spår."""
+
+    def __init__(self, path: Path, size: int):
+        self.path = path
+        self.size = size
+        self.used = 0
+        self._file = open(path, "w+b")
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+
+    def free(self) -> int:
+        return self.size - self.used
+
+    def write(self, data: memoryview) -> int:
+        n = min(len(data), self.free())
+        self._map[self.used:self.used + n] = data[:n]
+        self.used += n
+        return n
+
+    def close(self) -> None:
+        # Korta filen till faktiskt använd längd så att den går att spela upp direkt
+        self._map.flush()
+        self._map.close()
+        self._file.truncate(self.used)
+        self._file.close()
+
+
+class SessionRecorder:
+    """Spelar in en sessions ljud (in/ut) och händelser.
+
+    Alla metoder anropas från event-loopen och lägger bara ett kommando i
+    writer-trådens kö; kopiering till mmap och fil-I/O sker i tråden.
+    """
+
+    def __init__(self, writer: "RecordingWriter", recording_id: str, kind: str, directory: Path,
+                 segment_bytes: int, meta: Optional[dict] = None):
+        self._writer = writer
+        self.recording_id = recording_id
+        self.kind = kind
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.started_at = time.time()
+        self._t0 = time.monotonic()
+        self.meta = meta or {}
+        self.formats: Dict[str, dict] = {track: dict(DEFAULT_TRACK_FORMAT) for track in TRACKS}
+        self.closed = False
+
+        # Tillstånd som bara används i writer-tråden
+        self._segments: Dict[str, List[Path]] = {track: [] for track in TRACKS}
+        self._current: Dict[str, Optional[_Segment]] = {track: None for track in TRACKS}
+        self._bytes: Dict[str, int] = {track: 0 for track in TRACKS}
+        self._index_file = None
+        self._events_file = None
+        self._event_offset = 0
+        self._event_count = 0
+
+    @property
+    def prefix(self) -> str:
+        return f"rec-{self.recording_id}"
+
+    def _t_ms(self) -> int:
+        return int((time.monotonic() - self._t0) * 1000)
+
+    # ---- Anropas från event-loopen (icke-blockerande) ----
+
+    def set_format(self, track: str, encoding: str = "pcm16", sample_rate_hz: Optional[int] = None,
+                   channels: int = 1) -> None:
+        """Ange spårets faktiska ljudformat (sparas per spår i manifestet)."""
+        self.formats[track] = {"encoding": encoding, "sample_rate_hz": sample_rate_hz, "channels": channels}
+
+    def audio(self, track: str, data: bytes) -> None:
+        if not self.closed and data:
+            self._writer.submit(self, "audio", self._t_ms(), track, bytes(data))
+
+    def event(self, event_type: str, **payload: Any) -> None:
+        if not self.closed:
+            self._writer.submit(self, "event", self._t_ms(), None, {"type": event_type, **payload})
+
+    def close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            self._writer.submit(self, "close", self._t_ms(), None, None)
+
+    # ---- Körs i writer-tråden ----
+
+    def _open(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._index_file = open(self.directory / f"{self.prefix}.idx", "wb")
+        self._events_file = open(self.directory / f"{self.prefix}.events.jsonl", "wb")
+
+    def _segment_for(self, track: str) -> _Segment:
+        segment = self._current[track]
+        if segment is None or segment.free() == 0:
+            if segment is not None:
+                segment.close()
+            number = len(self._segments[track])
+            path = self.directory / f"{self.prefix}-{track}-{number:03d}.pcm"
+            segment = _Segment(path, self.segment_bytes)
+            self._segments[track].append(path)
+            self._current[track] = segment
+        return segment
+
+    def _write_audio(self, t_ms: int, track: str, data: bytes) -> None:
+        view = memoryview(data)
+        while view:
+            segment = self._segment_for(track)
+            offset = segment.used
+            written = segment.write(view)
+            self._index_file.write(INDEX_RECORD.pack(
+                t_ms, TRACKS.index(track), KIND_AUDIO, len(self._segments[track]) - 1, offset, written
+            ))
+            self._bytes[track] += written
+            view = view[written:]
+
+    def _write_event(self, t_ms: int, payload: dict) -> None:
+        line = orjson.dumps({"t_ms": t_ms, **payload}) + b"\n"
+        self._events_file.write(line)
+        self._index_file.write(INDEX_RECORD.pack(t_ms, 0, KIND_EVENT, 0, self._event_offset, len(line)))
+        self._event_offset += len(line)
+        self._event_count += 1
+
+    def _finish(self, t_ms: int) -> None:
+        for track in TRACKS:
+            if self._current[track] is not None:
+                self._current[track].close()
+                self._current[track] = None
+        self._index_file.close()
+        self._events_file.close()
+        manifest = {
+            "recording_id": self.recording_id,
+            "kind": self.kind,
+            "started_at": self.started_at,
+            "duration_ms": t_ms,
+            "tracks": {
+                track: {
+                    **self.formats[track],
+                    "segments": [p.name for p in self._segments[track]],
+                    "bytes": self._bytes[track],
+                }
+                for track in TRACKS
+            },
+            "events": self._event_count,
+            "index": f"{self.prefix}.idx",
+            "events_file": f"{self.prefix}.events.jsonl",
+            "meta": self.meta,
+        }
+        (self.directory / f"{self.prefix}.json").write_bytes(orjson.dumps(manifest, option=orjson.OPT_INDENT_2))
+        log.info("Recording %s saved: in=%d bytes out=%d bytes events=%d",
+                 self.recording_id, self._bytes[TRACK_IN], self._bytes[TRACK_OUT], self._event_count)
+
+
+class RecordingWriter:
+    """En bakgrundstråd som skriver alla sessioners inspelningar."""
+
+    def __init__(self, directory: Optional[Path] = None, segment_bytes: Optional[int] = None):
+        # None → katalog och segmentstorlek från settings, lästa per ny session
+        self._directory = Path(directory) if directory is not None else None
+        self._segment_bytes = segment_bytes
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.errors = 0
+
+    @property
+    def directory(self) -> Path:
+        return self._directory if self._directory is not None else recording_dir()
+
+    @property
+    def segment_bytes(self) -> int:
+        return self._segment_bytes if self._segment_bytes is not None else settings.recording_segment_bytes
+
+    def start_session(self, kind: str, recording_id: Optional[str] = None,
+                      meta: Optional[dict] = None) -> SessionRecorder:
+        recording_id = recording_id or uuid.uuid4().hex
+        recorder = SessionRecorder(self, recording_id, kind, self.directory, self.segment_bytes, meta)
+        self.submit(recorder, "open", 0, None, None)
+        return recorder
+
+    def submit(self, recorder: Optional[SessionRecorder], op: str, t_ms: int, track: Optional[str], data: Any) -> None:
+        self._ensure_thread()
+        self._queue.put((recorder, op, t_ms, track, data))
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="recording-writer", daemon=True)
+                    self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            recorder, op, t_ms, track, data = item
+            if op == "flush":
+                data.set()
+                continue
+            try:
+                if op == "audio":
+                    recorder._write_audio(t_ms, track, data)
+                elif op == "event":
+                    recorder._write_event(t_ms, data)
+                elif op == "open":
+                    recorder._open()
+                elif op == "close":
+                    recorder._finish(t_ms)
+            except Exception as e:
+                self.errors += 1
+                log.error("Recording %s: %s failed: %s", recorder.recording_id, op, e)
+
+    def flush(self, timeout_sec: float = 5.0) -> bool:
+        """Vänta tills allt som köats hittills är skrivet (för tester och shutdown)."""
+        done = threading.Event()
+        self.submit(None, "flush", 0, None, done)
+        return done.wait(timeout_sec)
+
+
+class RecordingSink:
+    """Omsluter en audio-sink (WebSocket eller PacedAudioSender) och spelar in utgående ljud."""
+
+    def __init__(self, sink, recorder: SessionRecorder):
+        self._sink = sink
+        self._recorder = recorder
+
+    async def send_bytes(self, data) -> None:
+        self._recorder.audio(TRACK_OUT, data)
+        await self._sink.send_bytes(data)
+
+    async def send_message(self, obj: dict, batchable: bool = False) -> None:
+        await send_message(self._sink, obj, batchable)
+
+    def __getattr__(self, name):
+        return getattr(self._sink, name)
+
+
+class Recording:
+    """Läser en sparad inspelning (manifest, index, händelser och ljud)."""
+
+    def __init__(self, manifest_path: Path):
+        self.path = Path(manifest_path)
+        self.directory = self.path.parent
+        self.manifest = orjson.loads(self.path.read_bytes())
+
+    @classmethod
+    def find(cls, recording_id: str, directory: Optional[Path] = None) -> "Recording":
+        directory = Path(directory) if directory is not None else recording_dir()
+        return cls(directory / f"rec-{recording_id}.json")
+
+    def track_format(self, track: str = TRACK_IN) -> dict:
+        """Spårets ljudformat; äldre manifest har ett gemensamt format på toppnivå."""
+        info = self.manifest["tracks"][track]
+        return {key: info.get(key, self.manifest.get(key, default)) for key, default in DEFAULT_TRACK_FORMAT.items()}
+
+    def index(self) -> Iterator[Tuple[int, int, int, int, int, int]]:
+        data = (self.directory / self.manifest["index"]).read_bytes()
+        return INDEX_RECORD.iter_unpack(data)
+
+    def events(self) -> List[dict]:
+        path = self.directory / self.manifest["events_file"]
+        return [orjson.loads(line) for line in path.read_bytes().splitlines() if line]
+
+    def chunks(self, track: str = TRACK_IN) -> Iterator[Tuple[int, bytes]]:
+        """(t_ms, bytes) i inspelningsordning (chunkar som delats över två segment ger två poster)."""
+        track_number = TRACKS.index(track)
+        segments = self.manifest["tracks"][track]["segments"]
+        # Segmenten mappas i stället för att läsas in (kan vara många MB var)
+        files: Dict[int, AudioFile] = {}
+        try:
+            for t_ms, rec_track, kind, segment, offset, length in self.index():
+                if kind != KIND_AUDIO or rec_track != track_number:
+                    continue
+                if segment not in files:
+                    files[segment] = open_audio(self.directory / segments[segment])
+                yield t_ms, files[segment].read(offset, length)
+        finally:
+            for audio_file in files.values():
+                audio_file.close()
+
+    def audio(self, track: str = TRACK_IN) -> bytes:
+        return b"".join(chunk for _, chunk in self.chunks(track))
+
+    def export_wav(self, track: str = TRACK_IN, path: Optional[Path] = None) -> Path:
+        """Skriv ett spår som WAV utan att hålla hela ljudet i minnet."""
+        fmt = self.track_format(track)
+        if fmt["encoding"] != "pcm16" or not fmt["sample_rate_hz"]:
+            raise ValueError(f"Spåret {track} är {fmt['encoding']}, inte PCM16 – kan inte skrivas som WAV")
+        path = Path(path) if path is not None else self.directory / f"rec-{self.manifest['recording_id']}-{track}.wav"
+        with WavWriter(path, PcmFormat(fmt["sample_rate_hz"], fmt["channels"])) as writer:
+            for _, chunk in self.chunks(track):
+                writer.write(chunk)
+        return path
+
+
+# Global writer (en tråd per worker, startas vid första inspelningen)
+recorder = RecordingWriter()
@@ -0,0 +1,355 @@
+"""Deterministisk replay av inspelade sessioner mot lokala ersättare.
+
+Exempel:
+    python -m app.replay <recording_id> --speed 4
+    python -m app.replay test_output/rec-<id>.json --max-delta-ms 150
+
+Inkommande ljud skickas till `/ws/transcribe` med inspelad timing, och
+Realtime-/TTS-leverantörerna ersätts av strömmar som spelar upp de
+inspelade händelserna med originalets tidsavstånd (delat med `speed`).
+Rapporten jämför transkript och latens mot inspelningen.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+
+from .recording import Recording, TRACK_IN, TRACK_OUT, recording_dir
+from .stt.resample import TARGET_SAMPLE_RATE
+from .tts.engines import FINAL_MESSAGE, TTSEngine
+
+# Hur länge replay väntar på sena svar efter sista inspelade händelsen
+REPLAY_GRACE_SEC = 0.5
+REPLAY_LLM_RESPONSE = "(replay)"
+
+
+@contextmanager
+def _swap(target, name: str, value):
+    """Byt ut ett modulattribut under replay och återställ efteråt."""
+    original = getattr(target, name)
+    setattr(target, name, value)
+    try:
+        yield
+    finally:
+        setattr(target, name, original)
+
+
+async def _sleep_until(t0: float, t_ms: float, speed: float) -> None:
+    delay = t0 + t_ms / 1000 / speed - time.monotonic()
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+
+class RecordedRealtimeClient:
+    """Ersätter AudioToEventClient: spelar upp inspelade Realtime-events med originalets timing."""
+
+    def __init__(self, events: List[Tuple[int, dict]], speed: float = 1.0):
+        self.events = events
+        self.speed = speed
+        self.chunks_received = 0
+        self.bytes_received = 0
+        self._t0: Optional[float] = None
+
+    async def connect(self) -> None:
+        self._t0 = time.monotonic()
+
+    async def send_audio_chunk(self, pcm_bytes: bytes) -> None:
+        self.chunks_received += 1
+        self.bytes_received += len(pcm_bytes)
+
+    async def commit(self) -> None:
+        pass
+
+    async def recv_loop(self, on_event) -> None:
+        for t_ms, evt in self.events:
+            await _sleep_until(self._t0, t_ms, self.speed)
+            await on_event(evt)
+        # Som en riktig anslutning: vänta tills den stängs
+        await asyncio.Event().wait()
+
+    async def close(self) -> None:
+        pass
+
+
+class RecordedTTSEngine(TTSEngine):
+    """TTS-ersättare som spelar upp inspelat utgående ljud, en inspelad förfrågan i taget."""
+
+    name = "recorded"
+    provider = "local"
+
+    def __init__(self, responses: List[List[Tuple[int, bytes]]], speed: float = 1.0):
+        self.responses = responses
+        self.speed = speed
+        self._next = 0
+
+    async def stream(self, ws, text, started_at, stats=None):
+        chunks = self.responses[self._next] if self._next < len(self.responses) else []
+        self._next += 1
+        t0 = time.monotonic()
+        audio_bytes_total = 0
+        for offset_ms, chunk in chunks:
+            await _sleep_until(t0, offset_ms, self.speed)
+            yield orjson.dumps({"audio": base64.b64encode(chunk).decode("ascii")}).decode(), audio_bytes_total
+            audio_bytes_total += len(chunk)
+        yield FINAL_MESSAGE, audio_bytes_total
+
+
+class AsgiWebSocketClient:
+    """Minimal WebSocket-klient som pratar ASGI direkt med appen (ingen server/nätverk)."""
+
+    def __init__(self, app, path: str, query: str = ""):
+        self.app = app
+        self.scope = {
+            "type": "websocket",
+            "asgi": {"version": "3.0"},
+            "scheme": "ws",
+            "path": path,
+            "raw_path": path.encode(),
+            "root_path": "",
+            "query_string": query.encode(),
+            "headers": [],
+            "client": ("replay", 0),
+            "server": ("replay", 0),
+            "subprotocols": [],
+        }
+        self._to_app: asyncio.Queue = asyncio.Queue()
+        self._from_app: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    async def connect(self) -> None:
+        self._task = asyncio.create_task(self.app(self.scope, self._to_app.get, self._from_app.put))
+        await self._to_app.put({"type": "websocket.connect"})
+        message = await self._from_app.get()
+        if message["type"] != "websocket.accept":
+            raise RuntimeError(f"Anslutningen nekades: {message}")
+
+    async def send_bytes(self, data: bytes) -> None:
+        await self._to_app.put({"type": "websocket.receive", "bytes": data})
+
+    async def send_json(self, obj: dict) -> None:
+        await self._to_app.put({"type": "websocket.receive", "text": orjson.dumps(obj).decode()})
+
+    async def receive(self) -> Optional[dict]:
+        """Nästa meddelande från appen; None när appen stängt anslutningen."""
+        message = await self._from_app.get()
+        if message["type"] == "websocket.close":
+            return None
+        return message
+
+    async def close(self) -> None:
+        await self._to_app.put({"type": "websocket.disconnect", "code": 1000})
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._task, 5.0)
+            except (asyncio.TimeoutError, Exception):
+                self._task.cancel()
+
+
+def _json(message: dict) -> Optional[dict]:
+    text = message.get("text")
+    if not text:
+        return None
+    try:
+        return orjson.loads(text)
+    except Exception:
+        return None
+
+
+def _delta_summary(deltas: List[float]) -> Dict[str, Optional[float]]:
+    if not deltas:
+        return {"p50_delta_ms": None, "max_delta_ms": None}
+    return {
+        "p50_delta_ms": round(statistics.median(deltas), 1),
+        "max_delta_ms": round(max(deltas, key=abs), 1),
+    }
+
+
+async def replay_transcribe(recording: Recording, app=None, speed: float = 1.0) -> Dict[str, Any]:
+    """Spela upp en `/ws/transcribe`-inspelning och jämför slutliga transkript och latens."""
+    from .endpoints import stt_ws
+    from .llm import receive_text_from_stt
+
+    app = app or _default_app()
+    events = recording.events()
+    realtime_events = [(e["t_ms"], e["event"]) for e in events if e["type"] == "realtime"]
+    expected = [(e["t_ms"], e["text"]) for e in events if e["type"] == "transcript" and e["is_final"]]
+    chunks = list(recording.chunks(TRACK_IN))
+    end_ms = max([t for t, _ in realtime_events] + [t for t, _ in chunks] + [0])
+
+    async def _llm_stand_in(session_id, text):
+        return REPLAY_LLM_RESPONSE
+
+    stand_in = RecordedRealtimeClient(realtime_events, speed)
+    received: List[Tuple[float, str]] = []
+
+    with _swap(stt_ws, "realtime_client_factory", lambda: stand_in), \
+            _swap(receive_text_from_stt, "process_final_transcription", _llm_stand_in):
+        client = AsgiWebSocketClient(app, "/ws/transcribe", "mode=json")
+        await client.connect()
+        fmt = recording.track_format(TRACK_IN)
+        if (fmt["sample_rate_hz"], fmt["channels"]) != (TARGET_SAMPLE_RATE, 1):
+            # Spela upp i inspelat format; endpointen resamplar som i originalsessionen
+            await client.send_json({"type": "audio.format", "sample_rate_hz": fmt["sample_rate_hz"],
+                                    "channels": fmt["channels"]})
+        t0 = time.monotonic()
+
+        async def _reader():
+            while True:
+                message = await client.receive()
+                if message is None:
+                    return
+                data = _json(message)
+                if data and data.get("type") == "stt.final":
+                    received.append(((time.monotonic() - t0) * 1000 * speed, data["text"]))
+
+        reader = asyncio.create_task(_reader())
+        for t_ms, chunk in chunks:
+            await _sleep_until(t0, t_ms, speed)
+            await client.send_bytes(chunk)
+        await _sleep_until(t0, end_ms, speed)
+        await asyncio.sleep(REPLAY_GRACE_SEC)
+        await client.close()
+        reader.cancel()
+        await asyncio.gather(reader, return_exceptions=True)
+
+    deltas = [round(actual_ms - expected_ms, 1)
+              for (expected_ms, _), (actual_ms, _) in zip(expected, received)]
+    return {
+        "recording_id": recording.manifest["recording_id"],
+        "kind": "transcribe",
+        "speed": speed,
+        "transcripts": {
+            "expected": [text for _, text in expected],
+            "actual": [text for _, text in received],
+            "match": [text for _, text in expected] == [text for _, text in received],
+        },
+        "audio_bytes_sent": stand_in.bytes_received,
+        "audio_bytes_recorded": recording.manifest["tracks"][TRACK_IN]["bytes"],
+        "latency_deltas_ms": deltas,
+        **_delta_summary(deltas),
+    }
+
+
+def _tts_responses(recording: Recording) -> Tuple[List[dict], List[List[Tuple[int, bytes]]]]:
+    """Dela upp utgående ljud per inspelad tts_request (offset relativt förfrågan)."""
+    requests = [e for e in recording.events() if e["type"] == "tts_request"]
+    starts = [r["t_ms"] for r in requests] + [float("inf")]
+    responses: List[List[Tuple[int, bytes]]] = [[] for _ in requests]
+    for t_ms, chunk in recording.chunks(TRACK_OUT):
+        for i in range(len(requests)):
+            if starts[i] <= t_ms < starts[i + 1]:
+                responses[i].append((t_ms - starts[i], chunk))
+                break
+    return requests, responses
+
+
+async def replay_tts(recording: Recording, app=None, speed: float = 1.0) -> Dict[str, Any]:
+    """Spela upp en `/ws/tts`-inspelning och jämför ljudmängd och första-ljud-latens."""
+    from .endpoints import tts_ws
+    from .tts.engine_router import TTSRouter
+
+    app = app or _default_app()
+    requests, responses = _tts_responses(recording)
+    router = TTSRouter([RecordedTTSEngine(responses, speed)])
+    results = []
+
+    with _swap(tts_ws, "tts_router", router):
+        # Samma profil (och därmed utdataformat) som den inspelade sessionen
+        profile = recording.manifest["meta"].get("profile")
+        client = AsgiWebSocketClient(app, "/ws/tts", f"profile={profile}" if profile else "")
+        await client.connect()
+        await client.receive()  # status: ready
+        t0 = time.monotonic()
+
+        for request, response in zip(requests, responses):
+            await _sleep_until(t0, request["t_ms"], speed)
+            sent_at = time.monotonic()
+            await client.send_json({"type": "tts_request", "text": request["text"]})
+            first_audio_ms = None
+            audio_bytes = 0
+            while True:
+                message = await client.receive()
+                if message is None:
+                    break
+                if message.get("bytes"):
+                    if first_audio_ms is None:
+                        first_audio_ms = (time.monotonic() - sent_at) * 1000 * speed
+                    audio_bytes += len(message["bytes"])
+                    continue
+                data = _json(message) or {}
+                if data.get("stage") == "done" or data.get("type") == "error":
+                    break
+            expected_first = response[0][0] if response else None
+            results.append({
+                "text": request["text"],
+                "audio_bytes_expected": sum(len(c) for _, c in response),
+                "audio_bytes_actual": audio_bytes,
+                "first_audio_expected_ms": expected_first,
+                "first_audio_actual_ms": round(first_audio_ms, 1) if first_audio_ms is not None else None,
+            })
+        await client.close()
+
+    deltas = [round(r["first_audio_actual_ms"] - r["first_audio_expected_ms"], 1)
+              for r in results
+              if r["first_audio_actual_ms"] is not None and r["first_audio_expected_ms"] is not None]
+    return {
+        "recording_id": recording.manifest["recording_id"],
+        "kind": "tts",
+        "speed": speed,
+        "audio_format": recording.track_format(TRACK_OUT),
+        "requests": results,
+        "audio_match": all(r["audio_bytes_expected"] == r["audio_bytes_actual"] for r in results),
+        "latency_deltas_ms": deltas,
+        **_delta_summary(deltas),
+    }
+
+
+async def replay(recording: Recording, app=None, speed: float = 1.0) -> Dict[str, Any]:
+    if recording.manifest["kind"] == "tts":
+        return await replay_tts(recording, app, speed)
+    return await replay_transcribe(recording, app, speed)
+
+
+def replay_passed(report: Dict[str, Any], max_delta_ms: Optional[float] = None) -> bool:
+    ok = report["transcripts"]["match"] if report["kind"] == "transcribe" else report["audio_match"]
+    if max_delta_ms is not None and report["max_delta_ms"] is not None:
+        ok = ok and abs(report["max_delta_ms"]) <= max_delta_ms
+    return ok
+
+
+def _default_app():
+    from .main import app
+    return app
+
+
+def _load(target: str, directory: Path) -> Recording:
+    path = Path(target)
+    if path.suffix == ".json" and path.exists():
+        return Recording(path)
+    return Recording.find(target, directory)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Spela upp en inspelad session mot lokala ersättare")
+    parser.add_argument("recording", help="Inspelnings-ID eller sökväg till rec-<id>.json")
+    parser.add_argument("--dir", default=str(recording_dir()), help="Katalog med inspelningar")
+    parser.add_argument("--speed", type=float, default=1.0, help="Uppspelningshastighet (1 = realtid)")
+    parser.add_argument("--max-delta-ms", type=float, default=None, help="Max tillåten latensavvikelse")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(replay(_load(args.recording, Path(args.dir)), speed=args.speed))
+    print(orjson.dumps(report, option=orjson.OPT_INDENT_2).decode())
+    return 0 if replay_passed(report, args.max_delta_ms) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
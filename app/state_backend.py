@@ -0,0 +1,279 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import logging
+import os
+import struct
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+log = logging.getLogger("state")
+
+
+class StateBackend(ABC):
+    """Gränssnitt för delat tillstånd (konversationer, debug-buffertar, cache).
+
+    Värden är bytes; anroparen serialiserar (orjson). `ttl_sec=None` betyder
+    att nyckeln lever tills den tas bort.
+    """
+
+    name = "base"
+    # True om alla workers ser samma data (annars behövs ingen publicering)
+    shared = False
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl_sec: Optional[float] = None) -> None:
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    async def keys(self, prefix: str = "") -> List[str]:
+        ...
+
+    async def close(self) -> None:
+        pass
+
+
+class InProcessBackend(StateBackend):
+    """Allt i processens minne (standard, en worker)."""
+
+    name = "memory"
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[bytes, Optional[float]]] = {}
+
+    def _alive(self, key: str) -> Optional[bytes]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and time.monotonic() >= expires_at:
+            del self._data[key]
+            return None
+        return value
+
+    async def get(self, key):
+        return self._alive(key)
+
+    async def set(self, key, value, ttl_sec=None):
+        expires_at = time.monotonic() + ttl_sec if ttl_sec else None
+        self._data[key] = (bytes(value), expires_at)
+
+    async def delete(self, key):
+        self._data.pop(key, None)
+
+    async def keys(self, prefix=""):
+        return [k for k in list(self._data) if k.startswith(prefix) and self._alive(k) is not None]
+
+
+class SharedMemoryBackend(StateBackend):
+    """Delat mellan workers på samma maskin via filer på tmpfs (/dev/shm).
+
+    Varje nyckel är en fil: 8 bytes utgångstid (unix-tid, 0 = ingen) + värdet.
+    Skrivningar är atomära (temporär fil + os.replace) så läsare ser aldrig
+    halvskrivna värden. tmpfs ligger i RAM, så I/O:n är mikrosekunder.
+    """
+
+    name = "shm"
+    shared = True
+    _HEADER = struct.Struct("<d")
+
+    def __init__(self, directory: Optional[str] = None):
+        default_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+        self.directory = Path(directory or os.path.join(default_dir, "stt-tts-state"))
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.directory / base64.urlsafe_b64encode(key.encode()).decode("ascii")
+
+    @staticmethod
+    def _key(filename: str) -> Optional[str]:
+        try:
+            return base64.urlsafe_b64decode(filename.encode("ascii")).decode()
+        except Exception:
+            return None
+
+    def _read(self, path: Path) -> Optional[bytes]:
+        try:
+            raw = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        (expires_at,) = self._HEADER.unpack_from(raw)
+        if expires_at and time.time() >= expires_at:
+            path.unlink(missing_ok=True)
+            return None
+        return raw[self._HEADER.size:]
+
+    async def get(self, key):
+        return self._read(self._path(key))
+
+    async def set(self, key, value, ttl_sec=None):
+        expires_at = time.time() + ttl_sec if ttl_sec else 0.0
+        path = self._path(key)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(self._HEADER.pack(expires_at))
+            f.write(value)
+        os.replace(tmp, path)
+
+    async def delete(self, key):
+        self._path(key).unlink(missing_ok=True)
+
+    async def keys(self, prefix=""):
+        result = []
+        for path in self.directory.iterdir():
+            if path.name.startswith(".tmp-"):
+                continue
+            key = self._key(path.name)
+            if key is not None and key.startswith(prefix) and self._read(path) is not None:
+                result.append(key)
+        return result
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisBackend(StateBackend):
+    """Minimal Redis-klient (RESP2) över asyncio-strömmar.
+
+    Räcker för GET/SET/DEL/SCAN och fungerar mot Redis, Valkey, KeyDB och
+    lokala ersättare i tester. En anslutning, serialiserad med lås.
+    """
+
+    name = "redis"
+    shared = True
+
+    def __init__(self, url: str = "redis://localhost:6379/0", timeout_sec: float = 2.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.use_tls = parsed.scheme == "rediss"
+        self.timeout_sec = timeout_sec
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=self.use_tls or None), self.timeout_sec
+        )
+        if self.password:
+            await self._command_unlocked("AUTH", self.password)
+        if self.db:
+            await self._command_unlocked("SELECT", str(self.db))
+
+    @staticmethod
+    def _encode(*args) -> bytes:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, (bytes, bytearray)) else str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(parts)
+
+    async def _read_reply(self):
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("Redis-anslutningen stängdes")
+        prefix, rest = line[:1], line[1:-2]
+        if prefix == b"+":
+            return rest.decode()
+        if prefix == b"-":
+            raise RedisError(rest.decode())
+        if prefix == b":":
+            return int(rest)
+        if prefix == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2]
+        if prefix == b"*":
+            count = int(rest)
+            if count < 0:
+                return None
+            return [await self._read_reply() for _ in range(count)]
+        raise RedisError(f"Oväntat svar: {line!r}")
+
+    async def _command_unlocked(self, *args):
+        self._writer.write(self._encode(*args))
+        await self._writer.drain()
+        return await asyncio.wait_for(self._read_reply(), self.timeout_sec)
+
+    async def command(self, *args):
+        async with self._lock:
+            for attempt in (1, 2):
+                try:
+                    if self._writer is None:
+                        await self._connect()
+                    return await self._command_unlocked(*args)
+                except (ConnectionError, OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+                    # Återanslut en gång vid tappad anslutning
+                    await self._drop()
+                    if attempt == 2:
+                        raise
+
+    async def _drop(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except Exception:
+                pass
+        self._reader = self._writer = None
+
+    async def get(self, key):
+        return await self.command("GET", key)
+
+    async def set(self, key, value, ttl_sec=None):
+        if ttl_sec:
+            await self.command("SET", key, value, "PX", int(ttl_sec * 1000))
+        else:
+            await self.command("SET", key, value)
+
+    async def delete(self, key):
+        await self.command("DEL", key)
+
+    async def keys(self, prefix=""):
+        cursor = "0"
+        result = []
+        while True:
+            cursor, batch = await self.command("SCAN", cursor, "MATCH", f"{prefix}*", "COUNT", "200")
+            cursor = cursor.decode() if isinstance(cursor, bytes) else str(cursor)
+            result.extend(k.decode() for k in batch)
+            if cursor == "0":
+                return result
+
+    async def close(self):
+        async with self._lock:
+            await self._drop()
+
+
+def create_backend(kind: Optional[str] = None) -> StateBackend:
+    """Skapa backend från STATE_BACKEND (memory | shm | redis)."""
+    kind = (kind or os.getenv("STATE_BACKEND", "memory")).lower()
+    if kind == "memory":
+        return InProcessBackend()
+    if kind == "shm":
+        return SharedMemoryBackend(os.getenv("STATE_SHM_DIR"))
+    if kind == "redis":
+        return RedisBackend(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    raise ValueError(f"Okänd state-backend: {kind}")
+
+
+# Global instans
+state = create_backend()
@@ -4,11 +4,13 @@ import asyncio
 import base64
 import json
 import logging
-import os
 from typing import AsyncIterator, Awaitable, Callable, Optional
 
 import websockets
 
+from ..config import settings
+from ..profiles import Profile, current_profile
+
 logger = logging.getLogger(__name__)
 
 JsonDict = dict[str, object]
@@ -27,13 +29,15 @@ class AudioToEventClient:
         transcribe_model: str = None,
         language: str = None,
         add_beta_header: bool = None,
+        profile: Profile = None,
     ) -> None:
-        # Använd parametrar eller fallback till miljövariabler/defaults
-        self.url = url or os.getenv("REALTIME_URL", "wss://api.openai.com/v1/realtime?model=gpt-4o-mini-realtime-preview-2024-12-17")
-        self.api_key = api_key or os.getenv("OPENAI_API_KEY", "")
-        self.transcribe_model = transcribe_model or os.getenv("TRANSCRIBE_MODEL", "gpt-4o-mini-transcribe")
-        self.language = language or os.getenv("INPUT_LANGUAGE", "sv")
-        self.add_beta_header = add_beta_header if add_beta_header is not None else (os.getenv("ADD_BETA_HEADER", "true").lower() == "true")
+        # Använd parametrar, sedan profilen (anslutningens ?profile=), sist inställningarna (app/config.py)
+        self.profile = profile or current_profile()
+        self.url = url or settings.realtime_url
+        self.api_key = api_key or settings.openai_api_key
+        self.transcribe_model = transcribe_model or settings.transcribe_model
+        self.language = language or self.profile.input_language or settings.input_language
+        self.add_beta_header = add_beta_header if add_beta_header is not None else settings.add_beta_header
         
         self.ws: Optional[websockets.WebSocketClientProtocol] = None
         self._recv_task: Optional[asyncio.Task] = None
@@ -57,27 +61,8 @@ class AudioToEventClient:
         )
         self._connected.set()
 
-        # Konfigurera sessionen (pcm16 + transcribe-modell + språk)
-        session_update = {
-            "type": "session.update",
-            "session": {
-                "modalities": ["text"],  # räcker för STT
-                "input_audio_format": "pcm16",
-                "input_audio_transcription": {
-                    "model": "whisper-1",  # samma som repo 2 för kompatibilitet
-                    "language": self.language,
-                },
-                "turn_detection": {
-                    "type": "server_vad",
-                    "threshold": 0.5,
-                    "prefix_padding_ms": 300,
-                    "silence_duration_ms": 500,
-                    "create_response": False,  # vi vill bara STT
-                    "interrupt_response": True
-                },
-            },
-        }
-        await self.ws.send(json.dumps(session_update))
+        # Konfigurera sessionen (pcm16 + transcribe-modell + språk), förserialiserat per profil
+        await self.ws.send(self.profile.session_update(self.language))
 
     async def close(self) -> None:
         if self.ws:
@@ -0,0 +1,351 @@
+# app/stt/decoders.py
+import asyncio
+import logging
+import os
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Type
+
+import numpy as np
+
+from .resample import TARGET_SAMPLE_RATE, Resampler, create_resampler, parse_audio_format
+
+try:  # Valfritt beroende: kräver libopus på systemet
+    import opuslib
+except Exception:  # ImportError, eller OSError om libopus saknas
+    opuslib = None
+
+log = logging.getLogger("stt")
+
+# Allt som skickas vidare till Realtime är PCM16, 16 kHz, mono
+PCM_SAMPLE_RATE = 16000
+OPUS_MAX_FRAME_SAMPLES = PCM_SAMPLE_RATE * 120 // 1000  # längsta Opus-frame (120 ms)
+
+# Avkodning körs i en delad trådpool så att event-loopen inte blockeras
+DECODE_THREADS = int(os.getenv("STT_DECODE_THREADS", str(min(4, os.cpu_count() or 1))))
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _decode_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=DECODE_THREADS, thread_name_prefix="stt-decode")
+    return _executor
+
+
+class UnsupportedCodec(ValueError):
+    """Begärt codec är okänt eller kan inte avkodas här (t.ex. libopus saknas)."""
+
+    def __init__(self, codec: str):
+        super().__init__(f"Codec {codec} is not available on this server")
+        self.codec = codec
+
+    def to_message(self) -> dict:
+        return {"type": "error", "reason": "unsupported_codec", "codec": self.codec,
+                "codecs_available": available_codecs()}
+
+
+class AudioDecoder(ABC):
+    """Avkodar klientens ljudformat till PCM16 16 kHz mono.
+
+    `decode()` är synkron och tillståndsfull (anropas i ordning för en
+    ström); den körs i trådpoolen via `DecodeStage`.
+    """
+
+    name = "base"
+    # Vad som skickas i ready-meddelandet (audio_in)
+    sample_rate_hz = PCM_SAMPLE_RATE
+    container: Optional[str] = None
+
+    @abstractmethod
+    def decode(self, data: bytes) -> bytes:
+        ...
+
+    def describe(self) -> dict:
+        info = {"encoding": self.name, "sample_rate_hz": self.sample_rate_hz, "channels": 1}
+        if self.container:
+            info["container"] = self.container
+        return info
+
+
+class Pcm16Decoder(AudioDecoder):
+    """Rå PCM16 (standard) – skickas vidare oförändrad."""
+
+    name = "pcm16"
+
+    def decode(self, data: bytes) -> bytes:
+        return data
+
+
+class MulawDecoder(AudioDecoder):
+    """G.711 μ-law 8 kHz → PCM16 16 kHz (lokal fallback utan externa bibliotek).
+
+    64 kbit/s i stället för 256 kbit/s. Uppsamplingen interpolerar linjärt
+    och sparar sista samplet så att chunk-gränser inte ger klick.
+    """
+
+    name = "mulaw"
+    sample_rate_hz = 8000
+
+    # Uppslagstabell byggs en gång: μ-law-byte → int16
+    _TABLE = None
+
+    def __init__(self):
+        if MulawDecoder._TABLE is None:
+            MulawDecoder._TABLE = self._build_table()
+        self._last = 0.0
+
+    @staticmethod
+    def _build_table() -> np.ndarray:
+        u = ~np.arange(256, dtype=np.int32) & 0xFF
+        sign = u & 0x80
+        exponent = (u >> 4) & 0x07
+        mantissa = u & 0x0F
+        magnitude = (((mantissa << 3) + 0x84) << exponent) - 0x84
+        return np.where(sign != 0, -magnitude, magnitude).astype(np.int16)
+
+    def decode(self, data: bytes) -> bytes:
+        if not data:
+            return b""
+        samples = self._TABLE[np.frombuffer(data, dtype=np.uint8)].astype(np.float32)
+        previous = np.empty_like(samples)
+        previous[0] = self._last
+        previous[1:] = samples[:-1]
+        self._last = float(samples[-1])
+        out = np.empty(samples.size * 2, dtype=np.float32)
+        out[0::2] = (previous + samples) * 0.5
+        out[1::2] = samples
+        return out.astype("<i2").tobytes()
+
+    @staticmethod
+    def encode(pcm16: bytes) -> bytes:
+        """PCM16 → μ-law (samma samplerate); för tester och klientexempel."""
+        x = np.frombuffer(pcm16, dtype="<i2").astype(np.int32)
+        sign = np.where(x < 0, 0x80, 0)
+        magnitude = np.minimum(np.abs(x), 32635) + 0x84
+        exponent = np.floor(np.log2(magnitude)).astype(np.int32) - 7
+        mantissa = (magnitude >> (exponent + 3)) & 0x0F
+        return (~(sign | (exponent << 4) | mantissa) & 0xFF).astype(np.uint8).tobytes()
+
+
+class OpusDecoder(AudioDecoder):
+    """Opus-paket (ett paket per binärt WebSocket-meddelande) via opuslib.
+
+    Opus avkodas direkt till 16 kHz; ~24 kbit/s tal ger ~10x mindre
+    uppladdning än rå PCM16.
+    """
+
+    name = "opus"
+
+    def __init__(self):
+        if opuslib is None:
+            raise RuntimeError("opuslib/libopus saknas – Opus-ingest är inte tillgängligt")
+        self._decoder = opuslib.Decoder(PCM_SAMPLE_RATE, 1)
+
+    def decode_packet(self, packet: bytes) -> bytes:
+        return self._decoder.decode(bytes(packet), OPUS_MAX_FRAME_SAMPLES)
+
+    def decode(self, data: bytes) -> bytes:
+        return self.decode_packet(data) if data else b""
+
+
+# EBML-id:n som behövs för att plocka ut ljudblock ur en WebM-ström
+_EBML_SEGMENT = 0x18538067
+_EBML_CLUSTER = 0x1F43B675
+_EBML_BLOCK_GROUP = 0xA0
+_EBML_BLOCK = 0xA1
+_EBML_SIMPLE_BLOCK = 0xA3
+_EBML_CONTAINERS = {_EBML_SEGMENT, _EBML_CLUSTER, _EBML_BLOCK_GROUP}
+_EBML_BLOCKS = {_EBML_BLOCK, _EBML_SIMPLE_BLOCK}
+
+
+def _read_vint(buf, pos: int, keep_marker: bool):
+    """(värde, längd) för en EBML-vint, eller None om bufferten inte räcker."""
+    if pos >= len(buf):
+        return None
+    first = buf[pos]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not first & mask:
+        mask >>= 1
+        length += 1
+    if length > 8:
+        raise ValueError("Ogiltig EBML-vint")
+    if pos + length > len(buf):
+        return None
+    value = first if keep_marker else first & (mask - 1)
+    for b in buf[pos + 1:pos + length]:
+        value = (value << 8) | b
+    return value, length
+
+
+class WebMDemuxer:
+    """Strömmande WebM/Matroska-demuxer som ger Opus-paketen ur (Simple)Block.
+
+    Hanterar element med okänd storlek (som MediaRecorder skriver) genom att
+    gå in i Segment/Cluster/BlockGroup och hoppa över allt annat utan att
+    buffra det.
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._skip = 0
+        self.laced_blocks_skipped = 0
+
+    def feed(self, data: bytes) -> List[bytes]:
+        buf = self._buf
+        buf += data
+        packets: List[bytes] = []
+        pos = 0
+        while True:
+            if self._skip:
+                n = min(self._skip, len(buf) - pos)
+                pos += n
+                self._skip -= n
+                if self._skip:
+                    break
+            element = _read_vint(buf, pos, keep_marker=True)
+            if element is None:
+                break
+            element_id, id_len = element
+            size = _read_vint(buf, pos + id_len, keep_marker=False)
+            if size is None:
+                break
+            size_value, size_len = size
+            header = id_len + size_len
+            unknown_size = size_value == (1 << (7 * size_len)) - 1
+            if element_id in _EBML_CONTAINERS:
+                pos += header
+                continue
+            if element_id in _EBML_BLOCKS and not unknown_size:
+                if pos + header + size_value > len(buf):
+                    break
+                packet = self._block_payload(buf[pos + header:pos + header + size_value])
+                if packet:
+                    packets.append(packet)
+                pos += header + size_value
+                continue
+            pos += header
+            self._skip = 0 if unknown_size else size_value
+        del buf[:pos]
+        return packets
+
+    def _block_payload(self, block: bytearray) -> Optional[bytes]:
+        track = _read_vint(block, 0, keep_marker=False)
+        if track is None:
+            return None
+        offset = track[1] + 3  # spårnummer, tidskod (2 bytes), flaggor
+        if offset > len(block):
+            return None
+        if block[offset - 1] & 0x06:
+            # Lacing används inte av MediaRecorder för Opus
+            self.laced_blocks_skipped += 1
+            return None
+        return bytes(block[offset:])
+
+
+class WebMOpusDecoder(OpusDecoder):
+    """Opus i WebM (MediaRecorder `audio/webm;codecs=opus`), godtyckliga chunkgränser."""
+
+    container = "webm"
+
+    def __init__(self):
+        super().__init__()
+        self._demuxer = WebMDemuxer()
+
+    def decode(self, data: bytes) -> bytes:
+        return b"".join(self.decode_packet(p) for p in self._demuxer.feed(data))
+
+
+DECODERS: Dict[str, Type[AudioDecoder]] = {
+    "pcm16": Pcm16Decoder,
+    "mulaw": MulawDecoder,
+    "opus": OpusDecoder,
+    "webm-opus": WebMOpusDecoder,
+}
+
+
+def available_codecs() -> List[str]:
+    return [name for name in DECODERS if opuslib is not None or "opus" not in name]
+
+
+def create_decoder(codec: Optional[str]) -> AudioDecoder:
+    """Skapa decoder för begärt codec; utan codec används PCM16.
+
+    Ett okänt codec eller ett som inte kan avkodas här (Opus utan libopus)
+    ger `UnsupportedCodec` – komprimerat ljud får aldrig skickas vidare som PCM16.
+    """
+    codec = (codec or "pcm16").lower()
+    if codec not in available_codecs():
+        raise UnsupportedCodec(codec)
+    return DECODERS[codec]()
+
+
+class DecodeStage:
+    """Avkodar en sessions ljud i trådpoolen, en chunk i taget (ordningen behålls).
+
+    Med en `resampler` (PCM16 i annan samplerate/fler kanaler, se
+    `audio.format`) normaliseras ljudet till 16 kHz mono i samma steg.
+    """
+
+    def __init__(self, decoder: AudioDecoder, executor: Optional[ThreadPoolExecutor] = None,
+                 resampler: Optional[Resampler] = None):
+        self.decoder = decoder
+        self.resampler = resampler
+        self._executor = executor
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.errors = 0
+
+    @property
+    def passthrough(self) -> bool:
+        return isinstance(self.decoder, Pcm16Decoder) and self.resampler is None
+
+    def set_input_format(self, msg: dict) -> dict:
+        """Tillämpa ett `audio.format`-meddelande (PCM16 i annan samplerate/fler kanaler).
+
+        Kastar ValueError om formatet inte stöds eller ljud redan tagits emot;
+        returnerar bekräftelsen som skickas till klienten.
+        """
+        if self.bytes_in:
+            raise ValueError("audio.format måste skickas före första ljudet")
+        if not isinstance(self.decoder, Pcm16Decoder):
+            raise ValueError(f"audio.format gäller bara pcm16 (codec={self.decoder.name})")
+        sample_rate, channels = parse_audio_format(msg)
+        self.resampler = create_resampler(sample_rate, channels)
+        return {
+            "type": "audio.format",
+            "accepted": True,
+            "sample_rate_hz": sample_rate,
+            "channels": channels,
+            "resampled_to": {"sample_rate_hz": TARGET_SAMPLE_RATE, "channels": 1},
+        }
+
+    def _convert(self, data: bytes) -> bytes:
+        pcm = self.decoder.decode(data)
+        return self.resampler.process(pcm) if self.resampler is not None else pcm
+
+    async def decode(self, data: bytes) -> bytes:
+        self.bytes_in += len(data)
+        if self.passthrough:
+            pcm = data
+        else:
+            loop = asyncio.get_running_loop()
+            try:
+                pcm = await loop.run_in_executor(self._executor or _decode_executor(), self._convert, data)
+            except Exception as e:
+                self.errors += 1
+                log.warning("Decode failed (%s): %s", self.decoder.name, e)
+                return b""
+        self.bytes_out += len(pcm)
+        return pcm
+
+    def stats(self) -> dict:
+        return {
+            "codec": self.decoder.name,
+            "input_format": self.resampler.describe() if self.resampler is not None else None,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "compression_ratio": round(self.bytes_out / self.bytes_in, 2) if self.bytes_in else None,
+            "errors": self.errors,
+        }
@@ -0,0 +1,145 @@
+# app/stt/engine_router.py
+import asyncio
+import logging
+import os
+import time
+from typing import Callable, Dict, List, Optional
+
+from ..admission import admission, AdmissionRejected, Slot
+from ..config import settings
+from ..engine_stats import DEFAULT_LATENCY_PRIOR_MS, EngineStats
+from ..profiles import current_profile
+from .engines import STTEngine, build_engine
+
+log = logging.getLogger("stt")
+
+
+class STTConnection:
+    """En ansluten STT-session: klienten, vilken engine och admission-platsen."""
+
+    def __init__(self, engine_name: str, provider: str, client, slot: Slot, connect_ms: float, failovers: int = 0):
+        self.engine_name = engine_name
+        self.provider = provider
+        self.client = client
+        self.slot = slot
+        self.connect_ms = connect_ms
+        self.failovers = failovers
+
+    def release(self) -> None:
+        self.slot.release()
+
+
+class STTRouter:
+    """Väljer STT-engine per session och byter leverantör om en är långsam eller nere.
+
+    Urval: klientens önskade engine (`?stt_engine=`) först, därefter friska
+    engines sorterade på median-anslutningstid (som TTS-routern med TTFB).
+    En engine som är fullbelagd, fallerar eller inte ansluter inom
+    `connect_timeout_ms` hoppas över och nästa provas.
+
+    Failover sker bara vid anslutning: en session som redan är ansluten
+    stannar på sin engine även om den slutar svara mitt i sessionen.
+    """
+
+    def __init__(self, engines: List[STTEngine], connect_timeout_ms: Optional[float] = None):
+        if not engines:
+            raise ValueError("Minst en STT-engine krävs")
+        self.engines = engines
+        # None → STT_CONNECT_TIMEOUT_MS från settings (följer med vid omläsning)
+        self._connect_timeout_ms = connect_timeout_ms
+        self.stats: Dict[str, EngineStats] = {engine.name: EngineStats("connect") for engine in engines}
+        self.failovers = 0
+
+    @property
+    def connect_timeout_ms(self) -> float:
+        # En engine som inte hunnit ansluta inom tiden räknas som fel och nästa provas
+        return self._connect_timeout_ms if self._connect_timeout_ms is not None else settings.stt_connect_timeout_ms
+
+    def ranked(self, preferred: Optional[str] = None) -> List[STTEngine]:
+        healthy = [e for e in self.engines if self.stats[e.name].healthy()]
+        if not healthy:
+            ordered = sorted(self.engines, key=lambda e: self.stats[e.name].error_rate)
+        else:
+            def score(engine: STTEngine) -> float:
+                p50 = self.stats[engine.name].percentile(0.5)
+                return p50 if p50 is not None else DEFAULT_LATENCY_PRIOR_MS
+
+            ordered = sorted(healthy, key=score)
+        if preferred:
+            first = [e for e in self.engines if e.name == preferred]
+            if not first:
+                log.warning("Unknown STT engine requested: %s", preferred)
+            ordered = first + [e for e in ordered if e.name != preferred]
+        return ordered
+
+    def names(self) -> List[str]:
+        return [engine.name for engine in self.engines]
+
+    async def connect(self, preferred: Optional[str] = None) -> STTConnection:
+        """Anslut till bästa tillgängliga engine. Kastar AdmissionRejected om alla är fullbelagda."""
+        failure: Optional[Exception] = None
+        attempts = 0
+        for engine in self.ranked(preferred):
+            try:
+                slot = await admission.acquire(engine.provider)
+            except AdmissionRejected as e:
+                failure = failure or e
+                continue
+            attempts += 1
+            client = engine.create_client()
+            started = time.monotonic()
+            try:
+                await asyncio.wait_for(client.connect(), self.connect_timeout_ms / 1000)
+            except Exception as e:
+                slot.release()
+                self.stats[engine.name].record_outcome(False)
+                if isinstance(e, asyncio.TimeoutError):
+                    e = TimeoutError(f"{engine.name}: connect timed out after {self.connect_timeout_ms:.0f} ms")
+                log.warning("STT engine %s failed to connect: %s", engine.name, e)
+                failure = e
+                try:
+                    await client.close()
+                except Exception:
+                    pass
+                continue
+            connect_ms = (time.monotonic() - started) * 1000
+            stats = self.stats[engine.name]
+            stats.record_latency(connect_ms)
+            stats.record_outcome(True)
+            current_profile().metrics.record("stt_connect_ms", connect_ms)
+            if attempts > 1:
+                self.failovers += 1
+                log.info("STT failover to %s after %d failed attempt(s)", engine.name, attempts - 1)
+            return STTConnection(engine.name, engine.provider, client, slot, connect_ms, attempts - 1)
+        raise failure or RuntimeError("Ingen STT-engine tillgänglig")
+
+    async def connect_client(self, factory: Callable[[], object], provider: str) -> STTConnection:
+        """Anslut en given klient (t.ex. lokal ersättare vid replay) utan urval eller failover."""
+        slot = await admission.acquire(provider)
+        client = factory()
+        started = time.monotonic()
+        try:
+            await client.connect()
+        except Exception:
+            slot.release()
+            raise
+        connect_ms = (time.monotonic() - started) * 1000
+        current_profile().metrics.record("stt_connect_ms", connect_ms)
+        return STTConnection("override", provider, client, slot, connect_ms)
+
+    def snapshot(self) -> dict:
+        return {
+            "engines": {name: s.snapshot() for name, s in self.stats.items()},
+            "order": [engine.name for engine in self.ranked()],
+            "connect_timeout_ms": self.connect_timeout_ms,
+            "failovers": self.failovers,
+        }
+
+
+def _engines_from_env() -> List[STTEngine]:
+    names = [n.strip() for n in os.getenv("STT_ENGINES", "realtime").split(",") if n.strip()]
+    return [build_engine(name) for name in names]
+
+
+# Global instans
+stt_router = STTRouter(_engines_from_env())
@@ -0,0 +1,293 @@
+# app/stt/engines.py
+import asyncio
+import itertools
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, List, Optional
+
+import httpx
+
+from ..admission import PROVIDER_REALTIME, PROVIDER_TRANSCRIBE
+from ..audio import PCM_SAMPLE_RATE, as_samples, rms, wav_bytes
+from ..config import settings
+from ..profiles import current_profile
+from .audio_to_event import AudioToEventClient
+
+log = logging.getLogger("stt")
+
+BYTES_PER_MS = PCM_SAMPLE_RATE * 2 // 1000
+
+# Eventtyper som klienterna ger (samma som Realtime, så att TranscriptState fungerar oförändrad)
+EVENT_SESSION_UPDATED = "session.updated"
+EVENT_TRANSCRIPT_DELTA = "conversation.item.input_audio_transcription.delta"
+EVENT_TRANSCRIPT_COMPLETED = "conversation.item.input_audio_transcription.completed"
+
+
+class STTEngine(ABC):
+    """Gränssnitt för en STT-leverantör.
+
+    `create_client()` ger en klient med samma gränssnitt som
+    `AudioToEventClient` (connect, send_audio_chunk, commit, recv_loop,
+    close) som levererar Realtime-liknande events, så att `/ws/transcribe`
+    fungerar oförändrad oavsett leverantör.
+    """
+
+    name = "base"
+    provider = "base"  # Nyckel för admission control
+
+    @abstractmethod
+    def create_client(self):
+        ...
+
+
+class RealtimeSTTEngine(STTEngine):
+    """OpenAI/Azure Realtime över WebSocket (standard)."""
+
+    name = "realtime"
+    provider = PROVIDER_REALTIME
+
+    def create_client(self):
+        return AudioToEventClient()
+
+
+class _QueuedEventClient:
+    """Basklass för klienter som själva producerar events till `recv_loop` via en kö."""
+
+    def __init__(self):
+        self._events: asyncio.Queue = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+
+    def _emit(self, evt: dict) -> None:
+        self._events.put_nowait(evt)
+
+    async def recv_loop(self, on_event: Callable[[dict], Awaitable[None]]) -> None:
+        while True:
+            evt = await self._events.get()
+            try:
+                await on_event(evt)
+            except Exception as e:
+                log.warning("Fel vid hantering av STT-event: %s", e)
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+
+class BatchTranscriptionClient(_QueuedEventClient):
+    """Batch-transkribering över HTTP (`/v1/audio/transcriptions`) som reserv.
+
+    Ljudet buffras och delas upp i yttranden med en enkel energibaserad VAD:
+    när det varit tyst `silence_ms` efter tal (kontrolleras vid `commit()`)
+    skickas yttrandet som WAV och resultatet ges som ett completed-event.
+    Yttranden transkriberas i ordning. Inga partials.
+    """
+
+    def __init__(self, engine: "BatchHTTPSTTEngine"):
+        super().__init__()
+        self.engine = engine
+        self._client: Optional[httpx.AsyncClient] = None
+        self._audio = bytearray()
+        self._voiced = False
+        self._silence_ms = 0.0
+        self._items = itertools.count(1)
+        self._previous: Optional[asyncio.Task] = None
+
+    async def connect(self) -> None:
+        self._client = httpx.AsyncClient(
+            base_url=self.engine.base_url, timeout=self.engine.timeout_sec, transport=self.engine.transport
+        )
+        self._emit({"type": EVENT_SESSION_UPDATED})
+
+    async def send_audio_chunk(self, pcm_bytes: bytes) -> None:
+        if not pcm_bytes:
+            return
+        self._audio += pcm_bytes
+        if rms(as_samples(pcm_bytes)) >= self.engine.vad_rms:
+            self._voiced = True
+            self._silence_ms = 0.0
+        else:
+            self._silence_ms += len(pcm_bytes) / BYTES_PER_MS
+
+    async def commit(self) -> None:
+        audio_ms = len(self._audio) / BYTES_PER_MS
+        if not self._voiced:
+            # Bara tystnad: behåll inte mer än en kort förbuffert
+            keep = int(self.engine.silence_ms * BYTES_PER_MS)
+            if len(self._audio) > keep:
+                del self._audio[:len(self._audio) - keep]
+            return
+        if self._silence_ms < self.engine.silence_ms and audio_ms < self.engine.max_utterance_ms:
+            return
+        audio, self._audio = bytes(self._audio), bytearray()
+        self._voiced, self._silence_ms = False, 0.0
+        item_id = f"batch_{next(self._items)}"
+        task = asyncio.create_task(self._transcribe(item_id, audio, self._previous))
+        self._previous = task
+        self._tasks = [t for t in self._tasks if not t.done()] + [task]
+
+    async def _transcribe(self, item_id: str, pcm: bytes, previous: Optional[asyncio.Task]) -> None:
+        try:
+            text = await self.engine.transcribe(self._client, pcm)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            text, error = None, e
+        else:
+            error = None
+        # Events i yttrandeordning även om HTTP-svaren kommer i annan ordning
+        if previous is not None:
+            await asyncio.gather(previous, return_exceptions=True)
+        if error is not None:
+            self._emit({"type": "error", "error": {"message": str(error), "item_id": item_id}})
+        else:
+            self._emit({"type": EVENT_TRANSCRIPT_COMPLETED, "item_id": item_id, "transcript": text})
+
+    async def close(self) -> None:
+        await super().close()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class BatchHTTPSTTEngine(STTEngine):
+    """Batch-transkribering via OpenAI HTTP som reserv när Realtime är långsamt eller nere."""
+
+    name = "openai_http"
+    provider = PROVIDER_TRANSCRIBE
+
+    def __init__(
+        self,
+        base_url: str = None,
+        api_key: str = None,
+        model: str = None,
+        language: str = None,
+        silence_ms: float = 500.0,
+        max_utterance_ms: float = 15000.0,
+        vad_rms: float = 500.0,
+        timeout_sec: float = 15.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.base_url = base_url or os.getenv("STT_HTTP_BASE_URL", "https://api.openai.com")
+        # None = läs från inställningarna vid varje förfrågan (följer omläsning)
+        self.api_key = api_key
+        self.model = model
+        self.language = language
+        self.silence_ms = silence_ms
+        self.max_utterance_ms = max_utterance_ms
+        self.vad_rms = vad_rms
+        self.timeout_sec = timeout_sec
+        self.transport = transport  # för tester (httpx.MockTransport)
+
+    async def transcribe(self, client: httpx.AsyncClient, pcm: bytes) -> str:
+        started = time.monotonic()
+        response = await client.post(
+            "/v1/audio/transcriptions",
+            headers={"Authorization": f"Bearer {self.api_key or settings.openai_api_key}"},
+            data={
+                "model": self.model or settings.transcribe_model,
+                "language": self.language or current_profile().input_language or settings.input_language,
+            },
+            files={"file": ("audio.wav", wav_bytes(pcm), "audio/wav")},
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"Transcription HTTP {response.status_code}: {response.text[:200]}")
+        log.debug("Batch transcription: %d ms audio in %.3fs", len(pcm) // BYTES_PER_MS, time.monotonic() - started)
+        return response.json().get("text", "")
+
+    def create_client(self):
+        return BatchTranscriptionClient(self)
+
+
+class LocalSTTClient(_QueuedEventClient):
+    """Skriptad STT-session: ett yttrande per `utterance_audio_ms` mottaget ljud."""
+
+    def __init__(self, engine: "LocalSTTEngine"):
+        super().__init__()
+        self.engine = engine
+        self._audio_ms = 0.0
+        self._started = 0
+        self._pending: asyncio.Queue = asyncio.Queue()
+
+    async def connect(self) -> None:
+        if self.engine.connect_delay_ms:
+            await asyncio.sleep(self.engine.connect_delay_ms / 1000)
+        if self.engine.fail:
+            raise RuntimeError(f"{self.engine.name}: simulated failure")
+        self._tasks.append(asyncio.create_task(self._speak()))
+        self._emit({"type": EVENT_SESSION_UPDATED})
+
+    async def send_audio_chunk(self, pcm_bytes: bytes) -> None:
+        self._audio_ms += len(pcm_bytes) / BYTES_PER_MS
+        while self._audio_ms >= (self._started + 1) * self.engine.utterance_audio_ms:
+            self._pending.put_nowait(self._started)
+            self._started += 1
+
+    async def commit(self) -> None:
+        pass
+
+    async def _speak(self) -> None:
+        engine = self.engine
+        while True:
+            index = await self._pending.get()
+            item_id = f"local_{index + 1}"
+            text = engine.script[index % len(engine.script)]
+            await asyncio.sleep(engine.first_partial_ms / 1000)
+            for i, word in enumerate(text.split()):
+                if i and engine.partial_interval_ms:
+                    await asyncio.sleep(engine.partial_interval_ms / 1000)
+                self._emit({"type": EVENT_TRANSCRIPT_DELTA, "item_id": item_id, "delta": word if not i else " " + word})
+            if engine.final_ms:
+                await asyncio.sleep(engine.final_ms / 1000)
+            self._emit({"type": EVENT_TRANSCRIPT_COMPLETED, "item_id": item_id, "transcript": text})
+
+
+class LocalSTTEngine(STTEngine):
+    """Lokal ersättare för tester och benchmark (ingen nätverkstrafik).
+
+    Ger skriptade partials (ett ord i taget) och final per yttrande, med
+    konfigurerbar fördröjning. Ett nytt yttrande startar för varje
+    `utterance_audio_ms` mottaget ljud; skriptet upprepas.
+    """
+
+    name = "local"
+    provider = "local"
+
+    def __init__(
+        self,
+        name: str = "local",
+        script: Optional[List[str]] = None,
+        utterance_audio_ms: float = 1000.0,
+        first_partial_ms: float = 0.0,
+        partial_interval_ms: float = 0.0,
+        final_ms: float = 0.0,
+        connect_delay_ms: float = 0.0,
+        fail: bool = False,
+    ):
+        self.name = name
+        self.script = script or ["hej det här är ett test"]
+        self.utterance_audio_ms = utterance_audio_ms
+        self.first_partial_ms = first_partial_ms
+        self.partial_interval_ms = partial_interval_ms
+        self.final_ms = final_ms
+        self.connect_delay_ms = connect_delay_ms
+        self.fail = fail
+
+    def create_client(self):
+        return LocalSTTClient(self)
+
+
+def build_engine(name: str) -> STTEngine:
+    """Skapa engine från namn (används för STT_ENGINES)."""
+    if name == RealtimeSTTEngine.name:
+        return RealtimeSTTEngine()
+    if name == BatchHTTPSTTEngine.name:
+        return BatchHTTPSTTEngine()
+    if name == LocalSTTEngine.name:
+        script = [s.strip() for s in os.getenv("LOCAL_STT_SCRIPT", "").split("|") if s.strip()]
+        latency_ms = float(os.getenv("LOCAL_STT_LATENCY_MS", "0"))
+        return LocalSTTEngine(script=script or None, first_partial_ms=latency_ms, final_ms=latency_ms)
+    raise ValueError(f"Okänd STT-engine: {name}")
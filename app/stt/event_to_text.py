@@ -1,73 +1,144 @@
-def process_realtime_event(evt: dict, last_text: str, buffers) -> dict:
+from typing import Callable, Dict, Optional
+
+# Handlers per eventtyp: (evt, state) -> resultat-dict eller None
+EventHandler = Callable[[dict, "TranscriptState"], Optional[dict]]
+_HANDLERS: Dict[str, EventHandler] = {}
+
+# Nyckel för events utan item_id (äldre eventvarianter)
+DEFAULT_ITEM = ""
+
+
+def handles(*event_types: str):
+    """Registrera en handler för en eller flera Realtime-eventtyper."""
+    def register(fn: EventHandler) -> EventHandler:
+        for event_type in event_types:
+            _HANDLERS[event_type] = fn
+        return fn
+    return register
+
+
+class TranscriptState:
+    """Transkript-tillstånd för en Realtime-session.
+
+    Texten hålls per `item_id` så att överlappande items (t.ex. ett nytt
+    yttrande som börjar innan förra är klart) inte skriver över varandra.
+    Deltas läggs till direkt (ingen jämförelse mot hela texten), och
+    antal events per typ räknas.
+    """
+
+    def __init__(self):
+        self.items: Dict[str, str] = {}
+        self.counters: Dict[str, int] = {}
+
+    def process(self, evt: dict, buffers=None) -> Optional[dict]:
+        """Slå upp handler för eventtypen och kör den."""
+        t = evt.get("type")
+        counters = self.counters
+        counters[t] = counters.get(t, 0) + 1
+        if buffers is not None:
+            # Logga alltid eventtyp för felsökning
+            try:
+                buffers.rt_events.append(t if t.__class__ is str else str(t))
+            except Exception:
+                pass
+        handler = _HANDLERS.get(t)
+        return handler(evt, self) if handler is not None else None
+
+    def append(self, item_id: str, delta: str, event_type: str) -> Optional[dict]:
+        if not isinstance(delta, str) or not delta:
+            return None
+        text = self.items.get(item_id, "") + delta
+        self.items[item_id] = text
+        return {"type": "transcript", "text": text, "delta": delta, "is_final": False,
+                "event_type": event_type, "item_id": item_id}
+
+    def complete(self, item_id: str, transcript: Optional[str], event_type: str) -> Optional[dict]:
+        previous = self.items.pop(item_id, "")
+        if not isinstance(transcript, str) or not transcript:
+            transcript = previous
+        if not transcript:
+            return None
+        # Final: delta är det som inte redan skickats som partial
+        delta = transcript[len(previous):] if transcript.startswith(previous) else transcript
+        return _transcript(transcript, delta, True, event_type, item_id)
+
+    def stats(self) -> dict:
+        return {"open_items": len(self.items), "events": dict(self.counters)}
+
+
+def _transcript(text: str, delta: str, is_final: bool, event_type: str, item_id: str) -> dict:
+    return {
+        "type": "transcript",
+        "text": text,
+        "delta": delta,
+        "is_final": is_final,
+        "event_type": event_type,
+        "item_id": item_id,
+    }
+
+
+def _item_id(evt: dict) -> str:
+    return evt.get("item_id") or DEFAULT_ITEM
+
+
+@handles("error")
+def _on_error(evt, state):
+    return {"type": "error", "detail": evt.get("error", evt)}
+
+
+@handles("session.updated")
+def _on_session_updated(evt, state):
+    return {"type": "info", "msg": "realtime_connected_and_configured"}
+
+
+@handles("conversation.item.input_audio_transcription.delta", "response.output_text.delta")
+def _on_delta(evt, state):
+    return state.append(_item_id(evt), evt.get("delta"), evt["type"])
+
+
+@handles("response.audio_transcript.delta")
+def _on_audio_transcript_delta(evt, state):
+    # Vissa varianter skickar hela texten i `transcript`/`text` i stället för delta
+    delta = evt.get("delta")
+    if isinstance(delta, str) and delta:
+        return state.append(_item_id(evt), delta, evt["type"])
+    full = evt.get("transcript") or evt.get("text")
+    if not isinstance(full, str) or not full:
+        return None
+    item_id = _item_id(evt)
+    previous = state.items.get(item_id, "")
+    state.items[item_id] = full
+    delta = full[len(previous):] if full.startswith(previous) else full
+    return _transcript(full, delta, False, evt["type"], item_id)
+
+
+@handles("conversation.item.input_audio_transcription.completed")
+def _on_transcription_completed(evt, state):
+    # Klassisk Realtime-transkript (whisper-1 + server VAD)
+    transcript = evt.get("transcript") or evt.get("item", {}).get("content", [{}])[0].get("transcript")
+    return state.complete(_item_id(evt), transcript, evt["type"])
+
+
+@handles("response.audio_transcript.completed")
+def _on_audio_transcript_completed(evt, state):
+    return state.complete(_item_id(evt), evt.get("transcript") or evt.get("text"), evt["type"])
+
+
+def process_realtime_event(evt: dict, last_text: str, buffers, state: Optional[TranscriptState] = None) -> Optional[dict]:
     """
     Hantera Realtime event och konvertera till text.
-    Flyttad från stt_ws.py för att separera concerns.
-    
+
     Args:
         evt: Realtime event från OpenAI
-        last_text: Senaste kända text för delta-beräkning
+        last_text: Senaste kända text (används bara utan `state`, för bakåtkompatibilitet)
         buffers: Debug store buffers för logging
-        
+        state: Transkript-tillstånd för sessionen (per item_id)
+
     Returns:
         Dict med event-resultat eller None om inget text hittades
     """
-    t = evt.get("type")
-
-    # (A) logga alltid eventtyp för felsökning
-    try:
-        buffers.rt_events.append(str(t))
-    except Exception:
-        pass
-
-    # (B) hantera error/info events
-    if t == "error":
-        return {
-            "type": "error",
-            "detail": evt.get("error", evt)
-        }
-    
-    if t == "session.updated":
-        return {
-            "type": "info",
-            "msg": "realtime_connected_and_configured"
-        }
-
-    # (C) försök extrahera transcript från flera varianter
-    transcript = None
-
-    # 1) Klassisk Realtime-transkript (som repo 2 använder) - whisper-1 + server VAD
-    if t == "conversation.item.input_audio_transcription.completed":
-        transcript = (
-            evt.get("transcript")
-            or evt.get("item", {}).get("content", [{}])[0].get("transcript")
-        )
-
-    # 2) Alternativ nomenklatur: response.audio_transcript.delta/completed
-    if not transcript and t in ("response.audio_transcript.delta", "response.audio_transcript.completed"):
-        transcript = evt.get("transcript") or evt.get("text") or evt.get("delta")
-
-    # 3) Sista fallback: response.output_text.delta (text-delning)
-    if not transcript and t == "response.output_text.delta":
-        delta_txt = evt.get("delta")
-        if isinstance(delta_txt, str):
-            transcript = (last_text or "") + delta_txt
-
-    if not isinstance(transcript, str) or not transcript:
-        return None
-
-    # (D) beräkna delta och returnera text-resultat
-    delta = transcript[len(last_text):] if transcript.startswith(last_text) else transcript
-    
-    # Bestäm om detta är final eller partial transcript
-    is_final = t in (
-        "conversation.item.input_audio_transcription.completed",
-        "response.audio_transcript.completed",
-    )
-    
-    return {
-        "type": "transcript",
-        "text": transcript,
-        "delta": delta,
-        "is_final": is_final,
-        "event_type": t
-    }
+    if state is None:
+        state = TranscriptState()
+        if last_text:
+            state.items[_item_id(evt)] = last_text
+    return state.process(evt, buffers)
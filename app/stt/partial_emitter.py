@@ -0,0 +1,154 @@
+# app/stt/partial_emitter.py
+import asyncio
+import logging
+from typing import Optional
+
+from ..config import settings
+from ..messaging import send_schema, STT_PARTIAL_DELTA, STT_PARTIAL_SNAPSHOT
+
+log = logging.getLogger("stt")
+
+MODE_FULL = "full"    # stt.partial med hela texten (som tidigare) + seq
+MODE_DELTA = "delta"  # stt.partial.delta med bara ny text + seq, stt.partial som snapshot
+
+# Standardinställningar läses från settings (STT_PARTIAL_*) och kan överstyras
+# per anslutning med ?partials= och ?partial_window_ms=
+
+
+class PartialEmitter:
+    """Slår ihop partial-transkript och skickar dem i klientens takt.
+
+    `push()` blockerar aldrig Realtime-loopen: den sparar bara senaste
+    texten och ser till att en sändartask kör. Sändaren väntar `window_ms`
+    så att flera deltas slås ihop, skickar senaste texten och – om nya
+    partials kommit medan sändningen pågick (långsam klient) – bara den
+    allra senaste. Mellanliggande partials räknas som `superseded`.
+
+    I delta-läge skickas bara texten som tillkommit sedan förra
+    meddelandet (`stt.partial.delta`), med en full `stt.partial` som
+    snapshot vid start av varje yttrande, när texten skrivits om och var
+    `snapshot_every`:e meddelande. `seq` ökar med ett per meddelande så att
+    klienten kan upptäcka luckor och vänta på nästa snapshot.
+    """
+
+    def __init__(self, ws, mode: Optional[str] = None, window_ms: Optional[float] = None,
+                 snapshot_every: Optional[int] = None):
+        mode = (settings.stt_partial_mode if mode is None else mode).lower()
+        window_ms = settings.stt_partial_window_ms if window_ms is None else window_ms
+        snapshot_every = settings.stt_partial_snapshot_every if snapshot_every is None else snapshot_every
+        self._ws = ws
+        self.mode = mode if mode in (MODE_FULL, MODE_DELTA) else MODE_FULL
+        self.window_sec = max(0.0, window_ms) / 1000
+        self.snapshot_every = max(1, snapshot_every)
+
+        self.seq = 0
+        self._sent_text = ""
+        self._deltas_since_snapshot = 0
+        self._pending: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+        self._sending = False
+
+        # Statistik
+        self.pushed = 0
+        self.sent = 0
+        self.snapshots = 0
+        self.superseded = 0
+        self.chars_sent = 0
+
+    @classmethod
+    def from_websocket(cls, ws) -> "PartialEmitter":
+        """Läs läge och fönster från query-parametrar (`partials`, `partial_window_ms`)."""
+        params = ws.query_params
+        mode = params.get("partials") or None
+        try:
+            window_ms = float(params["partial_window_ms"]) if params.get("partial_window_ms") else None
+        except ValueError:
+            window_ms = None
+        return cls(ws, mode, window_ms)
+
+    def push(self, text: str) -> None:
+        """Ny partial (hela texten hittills). Ersätter en partial som inte hunnit skickas."""
+        self.pushed += 1
+        if self._pending is not None:
+            self.superseded += 1
+        self._pending = text
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        try:
+            while self._pending is not None:
+                if self.window_sec:
+                    await asyncio.sleep(self.window_sec)
+                text, self._pending = self._pending, None
+                if text is None:
+                    break
+                self._sending = True
+                try:
+                    await self._send(text)
+                finally:
+                    self._sending = False
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.debug("Partial emitter stopped: %s", e)
+
+    async def _send(self, text: str) -> None:
+        if text == self._sent_text:
+            return
+        self.seq += 1
+        snapshot = (
+            self.mode == MODE_FULL
+            or not self._sent_text
+            or not text.startswith(self._sent_text)
+            or self._deltas_since_snapshot + 1 >= self.snapshot_every
+        )
+        if snapshot:
+            self._deltas_since_snapshot = 0
+            self.snapshots += 1
+            self.chars_sent += len(text)
+            await send_schema(self._ws, STT_PARTIAL_SNAPSHOT, text, self.seq)
+        else:
+            delta = text[len(self._sent_text):]
+            self._deltas_since_snapshot += 1
+            self.chars_sent += len(delta)
+            await send_schema(self._ws, STT_PARTIAL_DELTA, delta, self.seq)
+        self._sent_text = text
+        self.sent += 1
+
+    async def end_utterance(self) -> None:
+        """Anropas vid final: släng partials som inte skickats och börja om för nästa yttrande.
+
+        En sändning som redan pågår får bli klar så att inga partials kommer
+        efter det som följer (stt.processing/stt.final).
+        """
+        if self._pending is not None:
+            self.superseded += 1
+            self._pending = None
+        task = self._task
+        if task is not None and not task.done():
+            if self._sending:
+                await asyncio.gather(task, return_exceptions=True)
+            else:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self._task = None
+        self._sent_text = ""
+        self._deltas_since_snapshot = 0
+
+    async def close(self) -> None:
+        self._pending = None
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "window_ms": round(self.window_sec * 1000, 1),
+            "pushed": self.pushed,
+            "sent": self.sent,
+            "snapshots": self.snapshots,
+            "superseded": self.superseded,
+            "text_chars_sent": self.chars_sent,
+        }
@@ -0,0 +1,166 @@
+# app/stt/resample.py
+from math import gcd
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Realtime tar emot PCM16, 16 kHz, mono
+TARGET_SAMPLE_RATE = 16000
+MIN_SAMPLE_RATE = 8000
+MAX_SAMPLE_RATE = 96000
+MAX_CHANNELS = 8
+
+# Filterlängd per fas (per utsample vid nedsampling skalas den med kvoten)
+TAPS_PER_PHASE = 16
+
+
+def parse_audio_format(msg: dict) -> Tuple[int, int]:
+    """Validera ett `audio.format`-kontrollmeddelande och returnera (samplerate, kanaler).
+
+    Kastar ValueError med en läsbar orsak om formatet inte stöds.
+    """
+    encoding = str(msg.get("encoding") or "pcm16").lower()
+    if encoding != "pcm16":
+        raise ValueError(f"encoding {encoding} stöds inte (använd ?codec= för komprimerat ljud)")
+    try:
+        sample_rate = int(msg.get("sample_rate_hz", TARGET_SAMPLE_RATE))
+        channels = int(msg.get("channels", 1))
+    except (TypeError, ValueError):
+        raise ValueError("sample_rate_hz och channels måste vara heltal")
+    if not MIN_SAMPLE_RATE <= sample_rate <= MAX_SAMPLE_RATE:
+        raise ValueError(f"sample_rate_hz måste vara {MIN_SAMPLE_RATE}–{MAX_SAMPLE_RATE}")
+    if not 1 <= channels <= MAX_CHANNELS:
+        raise ValueError(f"channels måste vara 1–{MAX_CHANNELS}")
+    return sample_rate, channels
+
+
+def _design_filter(up: int, down: int, taps: int) -> np.ndarray:
+    """Lågpass (fönstrad sinc) för samplerate `in * up`, med förstärkning `up`."""
+    n = taps * up
+    cutoff = 0.5 / max(up, down) * 0.92  # lite marginal för övergångsbandet
+    t = np.arange(n) - (n - 1) / 2
+    h = 2 * cutoff * np.sinc(2 * cutoff * t) * np.kaiser(n, 8.0)
+    return h * (up / h.sum())
+
+
+class Resampler:
+    """Nedmixning till mono och polyfas-resampling av PCM16 till 16 kHz.
+
+    Strömmande: filterhistorik, fasläge och halva frames bärs mellan chunkar
+    så att chunk-gränser inte hörs. Arbetsbuffertarna återanvänds och växer
+    bara när en större chunk än tidigare kommer.
+    """
+
+    def __init__(self, sample_rate: int, channels: int = 1, target_rate: int = TARGET_SAMPLE_RATE,
+                 taps_per_phase: int = TAPS_PER_PHASE):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.target_rate = target_rate
+        g = gcd(sample_rate, target_rate)
+        self.up = target_rate // g
+        self.down = sample_rate // g
+        # Vid nedsampling täcker filtret lika lång tid räknat i utsamples
+        self.taps = taps_per_phase * max(1, -(-self.down // self.up))
+
+        # Polyfasbank: _bank[j, p] är koefficienten för work[i + j] i fas p
+        h = _design_filter(self.up, self.down, self.taps).astype(np.float32)
+        self._bank = np.ascontiguousarray(h.reshape(self.taps, self.up)[::-1])
+
+        self._phase = 0            # nästa utsamples position (uppsamplade steg) relativt chunkens start
+        self._partial = b""        # ofullständig frame (bytes) från förra chunken
+        self._work = np.zeros(0, dtype=np.float32)
+        self._capacity_out = 0
+        self._ensure(4096)
+
+        self.frames_in = 0
+        self.samples_out = 0
+
+    @property
+    def passthrough(self) -> bool:
+        return self.up == self.down and self.channels == 1
+
+    def _ensure(self, frames: int) -> None:
+        history = self.taps - 1
+        if history + frames > self._work.size:
+            work = np.zeros(max(history + frames, 2 * self._work.size), dtype=np.float32)
+            work[:history] = self._work[:history] if self._work.size else 0
+            self._work = work
+        max_out = frames * self.up // self.down + 2
+        if max_out > self._capacity_out:
+            size = max(max_out, 2 * self._capacity_out)
+            self._capacity_out = size
+            self._steps = np.arange(size, dtype=np.int64)
+            self._pos = np.empty(size, dtype=np.int64)
+            self._index = np.empty(size, dtype=np.int64)
+            self._phases = np.empty(size, dtype=np.int64)
+            self._coef = np.empty(size, dtype=np.float32)
+            self._x = np.empty(size, dtype=np.float32)
+            self._acc = np.empty(size, dtype=np.float32)
+            self._out = np.empty(size, dtype="<i2")
+
+    def process(self, data: bytes) -> bytes:
+        """PCM16 (interleaved) i källformat → PCM16 16 kHz mono."""
+        if self.passthrough:
+            return data
+        frame_bytes = 2 * self.channels
+        if self._partial:
+            data = self._partial + data
+        usable = len(data) - len(data) % frame_bytes
+        self._partial = bytes(data[usable:])
+        frames = usable // frame_bytes
+        if not frames:
+            return b""
+        self._ensure(frames)
+        history = self.taps - 1
+        work = self._work
+        chunk = work[history:history + frames]
+
+        # Nedmixning direkt in i arbetsbufferten
+        samples = np.frombuffer(data, dtype="<i2", count=frames * self.channels)
+        if self.channels == 1:
+            np.copyto(chunk, samples, casting="unsafe")
+        else:
+            np.mean(samples.reshape(frames, self.channels), axis=1, out=chunk, dtype=np.float32)
+
+        up, down = self.up, self.down
+        n = (frames * up - self._phase + down - 1) // down
+        if n > 0:
+            pos = self._pos[:n]
+            np.multiply(self._steps[:n], down, out=pos)
+            pos += self._phase
+            index = self._index[:n]
+            np.floor_divide(pos, up, out=index)
+            phases = self._phases[:n]
+            np.remainder(pos, up, out=phases)
+
+            acc, coef, x = self._acc[:n], self._coef[:n], self._x[:n]
+            acc.fill(0)
+            for j in range(self.taps):
+                np.take(self._bank[j], phases, out=coef)
+                np.take(work[j:], index, out=x)
+                np.multiply(coef, x, out=x)
+                acc += x
+            np.rint(acc, out=acc)
+            np.clip(acc, -32768, 32767, out=acc)
+            out = self._out[:n]
+            np.copyto(out, acc, casting="unsafe")
+            result = out.tobytes()
+        else:
+            n, result = 0, b""
+
+        self._phase += n * down - frames * up
+        # Sista taps-1 samples blir historik för nästa chunk
+        work[:history] = work[frames:frames + history]
+        self.frames_in += frames
+        self.samples_out += n
+        return result
+
+    def describe(self) -> dict:
+        return {"encoding": "pcm16", "sample_rate_hz": self.sample_rate, "channels": self.channels}
+
+
+def create_resampler(sample_rate: int, channels: int) -> Optional[Resampler]:
+    """Resampler för formatet, eller None om det redan är 16 kHz mono."""
+    if sample_rate == TARGET_SAMPLE_RATE and channels == 1:
+        return None
+    return Resampler(sample_rate, channels)
@@ -1,4 +1,7 @@
-async def send_transcription_to_frontend(ws, result: dict, send_json: bool, buffers, session_id: str = None):
+from ..messaging import send_message, send_schema, STT_FINAL, STT_PARTIAL, STT_PROCESSING
+
+async def send_transcription_to_frontend(ws, result: dict, send_json: bool, buffers, session_id: str = None,
+                                         partials=None):
     """
     Skicka transkriptionstext till frontend och trigga LLM-pipeline för final transkription.
     Flyttad från stt_ws.py för att separera concerns.
@@ -9,8 +12,10 @@ async def send_transcription_to_frontend(ws, result: dict, send_json: bool, buff
         send_json: Om JSON-format ska användas
         buffers: Debug store buffers för logging
         session_id: Session-ID för LLM-konversation
+        partials: PartialEmitter som slår ihop partials (annars skickas varje partial direkt)
     """
-    if result["type"] == "transcript" and result["delta"]:
+    # Finals skickas även om hela texten redan kommit som partials (tom delta)
+    if result["type"] == "transcript" and (result["delta"] or result["is_final"]):
         # Logga för debug
         buffers.openai_text.append(result["text"])
         
@@ -19,26 +24,25 @@ async def send_transcription_to_frontend(ws, result: dict, send_json: bool, buff
         
         # Om detta är en final transkription, trigga LLM-pipeline istället för att skicka stt.final
         if result["is_final"] and session_id and result["text"].strip():
+            # Partials som inte hunnit skickas är inaktuella nu
+            if partials is not None:
+                await partials.end_utterance()
             # Skicka meddelande att LLM-processning pågår
             if send_json:
-                await ws.send_json({
-                    "type": "stt.processing",
-                    "text": result["text"]
-                })
+                await send_schema(ws, STT_PROCESSING, result["text"])
             
             # Trigga LLM-pipeline
             await _trigger_llm_pipeline(ws, session_id, result["text"])
         else:
             # För partial transkriptioner, skicka som vanligt
-            if send_json:
-                await ws.send_json({
-                    "type": "stt.partial",
-                    "text": result["text"]
-                })
+            if send_json and partials is not None:
+                partials.push(result["text"])
+            elif send_json:
+                await send_schema(ws, STT_PARTIAL, result["text"])
             else:
                 await ws.send_text(result["delta"])  # fallback: ren text
         
-        return result["text"]  # Returnera text för att uppdatera last_text
+        return result["text"]
     return None
 
 async def _trigger_llm_pipeline(ws, session_id: str, transcription_text: str):
@@ -50,30 +54,32 @@ async def _trigger_llm_pipeline(ws, session_id: str, transcription_text: str):
         session_id: Session-ID för konversationen
         transcription_text: Final transkriberad text
     """
+    from ..admission import AdmissionRejected
+
     try:
         # Importera LLM-moduler
         from ..llm.receive_text_from_stt import process_final_transcription
         from ..llm.send_response_to_tts import send_llm_response_to_tts
         
         # Processa genom LLM
-        llm_response = await process_final_transcription(session_id, transcription_text)
+        try:
+            llm_response = await process_final_transcription(session_id, transcription_text)
+        except AdmissionRejected as e:
+            # LLM-leverantören är fullbelagd → skicka stt.final och strukturerat busy-fel
+            await send_schema(ws, STT_FINAL, transcription_text)
+            await send_message(ws, e.to_message())
+            return
         
         if llm_response:
             # Skicka stt.final med transkriptionen
-            await ws.send_json({
-                "type": "stt.final",
-                "text": transcription_text
-            })
+            await send_schema(ws, STT_FINAL, transcription_text)
             
             # Skicka LLM-svar till TTS
             await send_llm_response_to_tts(ws, llm_response)
         else:
             # Om LLM misslyckades, skicka stt.final ändå och felmeddelande
-            await ws.send_json({
-                "type": "stt.final",
-                "text": transcription_text
-            })
-            await ws.send_json({
+            await send_schema(ws, STT_FINAL, transcription_text)
+            await send_message(ws, {
                 "type": "error",
                 "message": "Failed to get response from AI"
             })
@@ -85,7 +91,7 @@ async def _trigger_llm_pipeline(ws, session_id: str, transcription_text: str):
         
         # Skicka felmeddelande till frontend
         try:
-            await ws.send_json({
+            await send_message(ws, {
                 "type": "error",
                 "message": f"AI processing failed: {str(e)}"
             })
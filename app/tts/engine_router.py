@@ -0,0 +1,314 @@
+# app/tts/engine_router.py
+import asyncio
+import logging
+import os
+import time
+from contextlib import aclosing
+from typing import Dict, List, Optional
+
+from ..admission import admission, AdmissionRejected
+from ..config import settings
+from ..engine_stats import DEFAULT_LATENCY_PRIOR_MS, EngineStats
+from ..messaging import send_message
+from ..profiles import current_profile
+from .engines import TTSEngine, build_engine, message_has_audio
+
+logger = logging.getLogger("stefan-api-test-16")
+
+# Router-inställningar
+# Hedge-trösklar läses från settings (TTS_HEDGE_AFTER_MS/_MIN_MS/_MAX_MS)
+HEDGE_MIN_SAMPLES = 10
+
+
+def hedging_enabled_by_default() -> bool:
+    """Om hedging är på när klienten inte själv anger det (opt-in, TTS_HEDGING)."""
+    return settings.tts_hedging
+
+
+class _HeldSink:
+    """Klient-sink för en hedgad session: meddelanden hålls kvar tills sessionen vunnit.
+
+    Engines skickar debug-/init-meddelanden direkt till klienten; med två
+    parallella sessioner skulle klienten annars få båda. Vinnarens hållna
+    meddelanden släpps i ordning, förlorarens kastas. Ljudet går inte hit
+    utan köas av `_pump`.
+    """
+
+    def __init__(self, ws):
+        self._ws = ws
+        self._held: List[tuple] = []
+        self._released = False
+
+    async def send_message(self, obj: dict, batchable: bool = False) -> None:
+        if not self._released:
+            self._held.append((obj, batchable))
+        elif self._ws is not None:
+            await send_message(self._ws, obj, batchable)
+
+    async def release(self) -> None:
+        self._released = True
+        held, self._held = self._held, []
+        if self._ws is not None:
+            for obj, batchable in held:
+                await send_message(self._ws, obj, batchable)
+
+    def discard(self) -> None:
+        self._held.clear()
+
+
+class TTSRouter:
+    """Väljer snabbaste friska TTS-engine och kan hedga mot en reserv.
+
+    Hedging (opt-in): om inget ljud kommit inom primary-engine:ns senaste
+    p95-TTFB startas en andra session för samma text; först med ljud vinner.
+
+    Urval: friska engines sorteras på median-TTFB (engines utan mätdata får
+    `DEFAULT_LATENCY_PRIOR_MS`), konfigurationsordningen avgör vid lika.
+    Om alla är osunda används den med lägst felfrekvens hellre än att vägra.
+    """
+
+    def __init__(self, engines: List[TTSEngine], hedge_after_ms: Optional[float] = None):
+        if not engines:
+            raise ValueError("Minst en TTS-engine krävs")
+        self.engines = engines
+        # None → TTS_HEDGE_AFTER_MS från settings (följer med vid omläsning)
+        self._hedge_after_ms = hedge_after_ms
+        self.stats: Dict[str, EngineStats] = {engine.name: EngineStats() for engine in engines}
+        self.hedges_fired = 0
+        self.hedges_won = 0
+        # Hedgade sessioner som avbröts för att den andra gav ljud först (räknas inte som TTFB)
+        self.hedge_losses: Dict[str, int] = {engine.name: 0 for engine in engines}
+
+    def ranked(self, exclude=()) -> List[TTSEngine]:
+        candidates = [e for e in self.engines if e.name not in exclude]
+        healthy = [e for e in candidates if self.stats[e.name].healthy()]
+        if not healthy:
+            return sorted(candidates, key=lambda e: self.stats[e.name].error_rate)
+
+        def score(engine: TTSEngine) -> float:
+            p50 = self.stats[engine.name].percentile(0.5)
+            return p50 if p50 is not None else DEFAULT_LATENCY_PRIOR_MS
+
+        return sorted(healthy, key=score)
+
+    def select(self, exclude=()) -> Optional[TTSEngine]:
+        ranked = self.ranked(exclude)
+        return ranked[0] if ranked else None
+
+    async def stream(self, ws, text: str, started_at: float, stats: Optional[dict] = None, hedge: bool = False):
+        """Strömma via bästa engine. Ger samma tupler som `process_text_to_audio`."""
+        stats = stats if stats is not None else {}
+        ranked = self.ranked()
+
+        # Hoppa till nästa engine om leverantören är fullbelagd eller fallerar innan något skickats
+        failure: Optional[Exception] = None
+        for index, engine in enumerate(ranked):
+            try:
+                slot = await admission.acquire(engine.provider)
+            except AdmissionRejected as e:
+                failure = failure or e
+                continue
+
+            yielded = False
+            try:
+                stats["queue_wait_ms"] = round(slot.waited_sec * 1000, 1)
+                # Hedge mot nästa engine, eller en andra session mot samma om den är ensam
+                backup = None
+                if hedge:
+                    backup = ranked[index + 1] if index + 1 < len(ranked) else engine
+                if backup is not None:
+                    stream = self._hedged(engine, backup, ws, text, started_at, stats)
+                else:
+                    stream = self._single(engine, ws, text, started_at, stats)
+                async with aclosing(stream):
+                    async for item in stream:
+                        yielded = True
+                        yield item
+                return
+            except Exception as e:
+                if yielded:
+                    raise
+                logger.warning("TTS engine %s failed before first message, trying next: %s", engine.name, e)
+                failure = e
+            finally:
+                slot.release()
+
+        raise failure
+
+    async def _single(self, engine: TTSEngine, ws, text, started_at, stats):
+        engine_stats = self.stats[engine.name]
+        stats["engine"] = engine.name
+        request_start = time.monotonic()
+        got_audio = False
+        try:
+            async for server_msg, audio_bytes in engine.stream(ws, text, started_at, stats):
+                if not got_audio and message_has_audio(server_msg):
+                    got_audio = True
+                    ttfb_ms = (time.monotonic() - request_start) * 1000
+                    engine_stats.record_latency(ttfb_ms)
+                    current_profile().metrics.record("tts_ttfb_ms", ttfb_ms)
+                yield server_msg, audio_bytes
+        except (asyncio.CancelledError, GeneratorExit):
+            raise
+        except Exception:
+            engine_stats.record_outcome(False)
+            raise
+        engine_stats.record_outcome(got_audio)
+
+    async def _pump(self, engine: TTSEngine, ws, text, started_at, stats, queue: asyncio.Queue):
+        try:
+            async for item in self._single(engine, ws, text, started_at, stats):
+                await queue.put(("msg", item))
+            await queue.put(("end", None))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await queue.put(("error", e))
+
+    @property
+    def hedge_after_ms(self) -> float:
+        return self._hedge_after_ms if self._hedge_after_ms is not None else settings.tts_hedge_after_ms
+
+    def hedge_threshold_ms(self, engine: TTSEngine) -> float:
+        """Dynamisk hedge-tröskel: engine:ns senaste p95-TTFB inom [min, max].
+
+        Med för lite mätdata används den statiska `hedge_after_ms`.
+        """
+        engine_stats = self.stats[engine.name]
+        if len(engine_stats.latency_ms) < HEDGE_MIN_SAMPLES:
+            return self.hedge_after_ms
+        p95 = engine_stats.percentile(0.95)
+        return min(settings.tts_hedge_max_ms, max(settings.tts_hedge_min_ms, p95))
+
+    async def _hedged(self, primary: TTSEngine, backup: TTSEngine, ws, text, started_at, stats):
+        """Starta en andra session om primary inte gett ljud inom hedge-tröskeln.
+
+        Backup kan vara samma engine (ny stream-input-session för samma text).
+        Den som först ger ljud vinner; den andra avbryts. Bara verkliga
+        första-ljud-tider blir TTFB-mätningar; förloraren räknas i
+        `hedge_losses`. Engines meddelanden till klienten går via en
+        `_HeldSink` per session så att bara vinnarens når fram.
+        """
+        roles = ("primary", "hedge")
+        engines = {"primary": primary, "hedge": backup}
+        queues = {role: asyncio.Queue() for role in roles}
+        engine_stats = {role: {} for role in roles}
+        pending = {role: [] for role in roles}
+        sinks = {role: _HeldSink(ws) for role in roles}
+        started = {}
+        tasks: Dict[str, asyncio.Task] = {}
+        finished = set()
+        winner: Optional[str] = None
+        backup_slot = None
+
+        def _start(role: str):
+            started[role] = time.monotonic()
+            tasks[role] = asyncio.create_task(
+                self._pump(engines[role], sinks[role], text, started_at, engine_stats[role], queues[role])
+            )
+
+        threshold_ms = self.hedge_threshold_ms(primary)
+        _start("primary")
+        hedge_at = started["primary"] + threshold_ms / 1000
+
+        try:
+            while winner is None:
+                # Starta hedge när tröskeln passerats (eller om primary redan avslutats utan ljud)
+                if "hedge" not in tasks and "hedge" not in finished and (
+                    time.monotonic() >= hedge_at or "primary" in finished
+                ):
+                    try:
+                        backup_slot = await admission.acquire(backup.provider)
+                        self.hedges_fired += 1
+                        logger.info("Hedging TTS request after %.0f ms: %s -> %s",
+                                    threshold_ms, primary.name, backup.name)
+                        _start("hedge")
+                    except AdmissionRejected:
+                        finished.add("hedge")
+
+                getters = {
+                    asyncio.create_task(queues[role].get()): role
+                    for role in tasks if role not in finished
+                }
+                if not getters:
+                    break
+                waiting_for_hedge = "hedge" not in tasks and "hedge" not in finished
+                timeout = max(0.0, hedge_at - time.monotonic()) if waiting_for_hedge else None
+                done, not_done = await asyncio.wait(getters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for getter in not_done:
+                    getter.cancel()
+
+                for getter in done:
+                    role = getters[getter]
+                    kind, payload = getter.result()
+                    if kind == "msg":
+                        pending[role].append(payload)
+                        if winner is None and message_has_audio(payload[0]):
+                            winner = role
+                    else:
+                        finished.add(role)
+                        if kind == "error":
+                            logger.warning("TTS engine %s (%s) failed: %s", engines[role].name, role, payload)
+
+            if winner is None:
+                # Ingen gav ljud; skicka vidare det som finns (t.ex. felmeddelanden från leverantören)
+                winner = next((role for role in roles if pending[role]), None)
+                if winner is None:
+                    raise RuntimeError("Alla TTS-engines misslyckades")
+
+            # Avbryt förloraren; dess väntetid är ingen TTFB och drar inte ner p95
+            for role, task in tasks.items():
+                if role != winner:
+                    task.cancel()
+                    sinks[role].discard()
+                    if not any(message_has_audio(msg) for msg, _ in pending[role]):
+                        self.hedge_losses[engines[role].name] += 1
+            await sinks[winner].release()
+
+            hedged = "hedge" in tasks
+            if hedged and winner == "hedge":
+                self.hedges_won += 1
+            stats.update(engine_stats[winner])
+            stats["engine"] = engines[winner].name
+            stats["hedged"] = hedged
+            stats["hedge_won"] = hedged and winner == "hedge"
+            stats["hedge_threshold_ms"] = round(threshold_ms, 1)
+
+            for item in pending[winner]:
+                yield item
+            if winner in finished:
+                return
+            while True:
+                kind, payload = await queues[winner].get()
+                if kind == "msg":
+                    yield payload
+                elif kind == "error":
+                    raise payload
+                else:
+                    return
+        finally:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            if backup_slot is not None:
+                backup_slot.release()
+
+    def snapshot(self) -> dict:
+        return {
+            "engines": {name: s.snapshot() for name, s in self.stats.items()},
+            "order": [engine.name for engine in self.ranked()],
+            "hedge_after_ms": self.hedge_after_ms,
+            "hedge_threshold_ms": {e.name: round(self.hedge_threshold_ms(e), 1) for e in self.engines},
+            "hedges_fired": self.hedges_fired,
+            "hedges_won": self.hedges_won,
+            "hedge_losses": self.hedge_losses,
+        }
+
+
+def _engines_from_env() -> List[TTSEngine]:
+    names = [n.strip() for n in os.getenv("TTS_ENGINES", "elevenlabs_ws").split(",") if n.strip()]
+    return [build_engine(name) for name in names]
+
+
+# Global instans
+tts_router = TTSRouter(_engines_from_env())
@@ -0,0 +1,188 @@
+# app/tts/engines.py
+import asyncio
+import base64
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Optional, Tuple
+
+import httpx
+import numpy as np
+import orjson
+
+from ..admission import PROVIDER_ELEVENLABS
+from ..audio import PCM16_MONO_16K, iter_frames
+from ..config import settings
+from ..profiles import current_profile
+from . import text_to_audio
+
+logger = logging.getLogger("stefan-api-test-16")
+
+# Ett engine-meddelande har samma form som från process_text_to_audio:
+# (rått server-meddelande, audio_bytes_total hittills)
+EngineMessage = Tuple[object, int]
+
+FINAL_MESSAGE = '{"isFinal": true}'
+
+
+def message_has_audio(server_msg) -> bool:
+    """Avgör om ett engine-meddelande innehåller ljud (för time-to-first-byte)."""
+    if isinstance(server_msg, (bytes, bytearray)):
+        return len(server_msg) > 0
+    if isinstance(server_msg, str) and '"audio"' in server_msg:
+        try:
+            return bool(orjson.loads(server_msg).get("audio"))
+        except Exception:
+            return False
+    return False
+
+
+class TTSEngine(ABC):
+    """Gränssnitt för en TTS-leverantör.
+
+    `stream()` är en async generator som ger samma tupler som
+    `process_text_to_audio` så att `send_audio_to_frontend` kan användas
+    oförändrad oavsett leverantör. Strömmen ska avslutas med ett
+    meddelande som `send_audio_to_frontend` tolkar som final.
+    """
+
+    name = "base"
+    provider = "base"  # Nyckel för admission control
+
+    @abstractmethod
+    def stream(self, ws, text: str, started_at: float, stats: Optional[dict] = None) -> AsyncIterator[EngineMessage]:
+        ...
+
+
+class ElevenLabsStreamInputEngine(TTSEngine):
+    """ElevenLabs WebSocket stream-input (standard).
+
+    Röst och modell kommer från anslutningens profil om de inte anges här.
+    """
+
+    name = "elevenlabs_ws"
+    provider = PROVIDER_ELEVENLABS
+
+    def __init__(self, voice_id: Optional[str] = None, model_id: Optional[str] = None):
+        self.voice_id = voice_id
+        self.model_id = model_id
+
+    async def stream(self, ws, text, started_at, stats=None):
+        async for item in text_to_audio.process_text_to_audio(
+            ws, text, started_at, stats, voice_id=self.voice_id, model_id=self.model_id
+        ):
+            yield item
+
+
+class ElevenLabsHTTPStreamEngine(TTSEngine):
+    """ElevenLabs HTTP-streaming (`/stream`), rå PCM i chunkad respons.
+
+    Klienten återanvänds mellan förfrågningar så att TLS-anslutningen poolas.
+    Röst, modell, format och röstinställningar kommer från anslutningens
+    profil om röst/modell inte anges här.
+    """
+
+    name = "elevenlabs_http"
+    provider = PROVIDER_ELEVENLABS
+
+    def __init__(
+        self,
+        voice_id: Optional[str] = None,
+        model_id: Optional[str] = None,
+        base_url: str = "https://api.elevenlabs.io",
+        timeout_sec: float = 12.0,
+    ):
+        self.voice_id = voice_id
+        self.model_id = model_id
+        self.base_url = base_url
+        self.timeout_sec = timeout_sec
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout_sec)
+        return self._client
+
+    async def stream(self, ws, text, started_at, stats=None):
+        profile = current_profile().with_voice(self.voice_id, self.model_id)
+        url = f"/v1/text-to-speech/{profile.voice_id}/stream"
+        params = {"output_format": profile.output_format}
+        body = {
+            "text": text,
+            "model_id": profile.tts_model_id,
+            "voice_settings": profile.voice_settings,
+        }
+        headers = {"xi-api-key": settings.elevenlabs_api_key}
+
+        audio_bytes_total = 0
+        async with self._get_client().stream("POST", url, params=params, json=body, headers=headers) as response:
+            if response.status_code != 200:
+                detail = (await response.aread()).decode(errors="replace")[:200]
+                raise RuntimeError(f"ElevenLabs HTTP {response.status_code}: {detail}")
+            async for chunk in response.aiter_bytes():
+                if chunk:
+                    yield chunk, audio_bytes_total
+                    audio_bytes_total += len(chunk)
+        yield FINAL_MESSAGE, audio_bytes_total
+        logger.info("HTTP stream done: audio_bytes_total=%d elapsed=%.3fs",
+                    audio_bytes_total, time.time() - started_at)
+
+
+class LocalTTSEngine(TTSEngine):
+    """Lokal ersättare för tester och benchmark (ingen nätverkstrafik).
+
+    Genererar en deterministisk ton (PCM16, 16 kHz) vars längd beror på
+    textens längd och skickar den som ElevenLabs-liknande JSON-meddelanden
+    med konfigurerbar fördröjning före första byte och mellan chunkar.
+    """
+
+    name = "local"
+    provider = "local"
+
+    def __init__(
+        self,
+        name: str = "local",
+        first_byte_delay_ms: float = 0.0,
+        chunk_delay_ms: float = 0.0,
+        chunk_ms: int = 100,
+        ms_per_char: int = 60,
+        fail: bool = False,
+    ):
+        self.name = name
+        self.first_byte_delay_ms = first_byte_delay_ms
+        self.chunk_delay_ms = chunk_delay_ms
+        self.chunk_ms = chunk_ms
+        self.ms_per_char = ms_per_char
+        self.fail = fail
+
+    def synthesize(self, text: str) -> bytes:
+        samples = 16000 * max(1, len(text)) * self.ms_per_char // 1000
+        t = np.arange(samples, dtype=np.float32) / 16000
+        tone = (0.2 * 32767 * np.sin(2 * np.pi * 440.0 * t)).astype("<i2")
+        return tone.tobytes()
+
+    async def stream(self, ws, text, started_at, stats=None):
+        if self.first_byte_delay_ms:
+            await asyncio.sleep(self.first_byte_delay_ms / 1000)
+        if self.fail:
+            raise RuntimeError(f"{self.name}: simulated failure")
+
+        audio = self.synthesize(text)
+        audio_bytes_total = 0
+        for index, chunk in enumerate(iter_frames(audio, PCM16_MONO_16K.bytes_for_ms(self.chunk_ms))):
+            if index and self.chunk_delay_ms:
+                await asyncio.sleep(self.chunk_delay_ms / 1000)
+            yield orjson.dumps({"audio": base64.b64encode(chunk).decode("ascii")}).decode(), audio_bytes_total
+        yield FINAL_MESSAGE, audio_bytes_total
+
+
+def build_engine(name: str) -> TTSEngine:
+    """Skapa engine från namn (används för TTS_ENGINES)."""
+    if name == ElevenLabsStreamInputEngine.name:
+        return ElevenLabsStreamInputEngine()
+    if name == ElevenLabsHTTPStreamEngine.name:
+        return ElevenLabsHTTPStreamEngine()
+    if name == LocalTTSEngine.name:
+        return LocalTTSEngine(first_byte_delay_ms=float(os.getenv("LOCAL_TTS_FIRST_BYTE_MS", "0")))
+    raise ValueError(f"Okänd TTS-engine: {name}")
@@ -0,0 +1,198 @@
+# app/tts/paced_sender.py
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Deque, Optional, Tuple
+
+from ..config import settings
+from ..messaging import send_message
+
+logger = logging.getLogger("stefan-api-test-16")
+
+# Standardformatet pcm_16000 → 16 kHz * 2 bytes * mono (endpoints anger profilens takt)
+PCM16_BYTES_PER_SEC = 16000 * 2
+
+
+def pacing_enabled_by_default() -> bool:
+    """Om pacing är på när klienten inte själv anger det (TTS_PACING)."""
+    return settings.tts_pacing
+
+
+class PacedAudioSender:
+    """Skickar audio till frontend i realtidstakt i stället för i skurar.
+
+    Fungerar som en tunn ersättning för WebSocket:en i `send_audio_to_frontend`:
+    `send_bytes` lägger ljudet i en liten jitter-buffert på servern och en
+    bakgrundstask släpper det i frames så att klienten aldrig ligger mer än
+    `lead_ms` före uppspelningen. Text-meddelanden går igenom direkt.
+
+    Räknare:
+    - underruns: klientens buffert hann ta slut innan nästa frame kom
+    - overruns: server-bufferten blev full och producenten fick vänta
+    """
+
+    def __init__(
+        self,
+        ws,
+        bytes_per_sec: int = PCM16_BYTES_PER_SEC,
+        lead_ms: Optional[int] = None,
+        jitter_ms: Optional[int] = None,
+        max_buffer_ms: Optional[int] = None,
+        frame_ms: Optional[int] = None,
+        started_at: Optional[float] = None,
+    ):
+        # Ej angivna värden tas från settings (TTS_PACING_*), lästa per sändare
+        lead_ms = settings.tts_pacing_lead_ms if lead_ms is None else lead_ms
+        jitter_ms = settings.tts_pacing_jitter_ms if jitter_ms is None else jitter_ms
+        max_buffer_ms = settings.tts_pacing_max_buffer_ms if max_buffer_ms is None else max_buffer_ms
+        frame_ms = settings.tts_pacing_frame_ms if frame_ms is None else frame_ms
+        self._ws = ws
+        self._bytes_per_sec = bytes_per_sec
+        self._lead_sec = lead_ms / 1000
+        # Frames måste vara hela samples (2 bytes) för att inte klyva PCM16
+        self._frame_bytes = max(2, (bytes_per_sec * frame_ms // 1000) & ~1)
+        self._jitter_bytes = bytes_per_sec * jitter_ms // 1000
+        self._max_buffer_bytes = max(self._frame_bytes, bytes_per_sec * max_buffer_ms // 1000)
+        self._started_at = started_at if started_at is not None else time.time()
+
+        self._queue: Deque[Tuple[memoryview, float]] = deque()
+        self._buffered_bytes = 0
+        self._data_ready = asyncio.Event()
+        self._space_free = asyncio.Event()
+        self._space_free.set()
+        self._closed = False
+        self._task: Optional[asyncio.Task] = None
+        self._error: Optional[BaseException] = None
+
+        # Uppspelningsklocka: när klienten (uppskattningsvis) började spela
+        self._playout_start: Optional[float] = None
+        self._sent_sec = 0.0
+
+        # Statistik
+        self.underruns = 0
+        self.overruns = 0
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self._delay_sum = 0.0
+        self._delay_max = 0.0
+        self._first_playout_delay: Optional[float] = None
+
+    async def send_text(self, data: str):
+        """Text (status/debug) skickas direkt utan pacing."""
+        await self._ws.send_text(data)
+
+    async def send_message(self, obj: dict, batchable: bool = False):
+        """Meddelanden skickas direkt utan pacing (via messaging-lagret)."""
+        await send_message(self._ws, obj, batchable)
+
+    async def send_bytes(self, data: bytes):
+        """Lägg audio i jitter-bufferten (väntar om bufferten är full)."""
+        if self._error:
+            raise self._error
+        if not data:
+            return
+        if self._task is None:
+            self._task = asyncio.create_task(self._drain_loop())
+
+        if self._buffered_bytes >= self._max_buffer_bytes:
+            self.overruns += 1
+            while self._buffered_bytes >= self._max_buffer_bytes and not self._error:
+                self._space_free.clear()
+                await self._space_free.wait()
+            if self._error:
+                raise self._error
+
+        enqueued_at = time.monotonic()
+        view = memoryview(data)
+        for offset in range(0, len(view), self._frame_bytes):
+            self._queue.append((view[offset:offset + self._frame_bytes], enqueued_at))
+        self._buffered_bytes += len(view)
+        self._data_ready.set()
+
+    async def finish(self) -> dict:
+        """Markera slut på strömmen, vänta tills allt ljud skickats och returnera statistik."""
+        self._closed = True
+        self._data_ready.set()
+        if self._task is not None:
+            await self._task
+        if self._error:
+            raise self._error
+        return self.stats()
+
+    async def cancel(self):
+        """Avbryt utan att skicka kvarvarande ljud (t.ex. vid fel)."""
+        self._closed = True
+        self._queue.clear()
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "underruns": self.underruns,
+            "overruns": self.overruns,
+            "frames_sent": self.frames_sent,
+            "bytes_sent": self.bytes_sent,
+            "lead_ms": round(self._lead_sec * 1000),
+            "avg_playout_delay_ms": round(self._delay_sum / self.frames_sent * 1000, 1) if self.frames_sent else None,
+            "max_playout_delay_ms": round(self._delay_max * 1000, 1),
+            "first_playout_delay_ms": (
+                round(self._first_playout_delay * 1000, 1) if self._first_playout_delay is not None else None
+            ),
+        }
+
+    async def _wait_for_data(self):
+        self._data_ready.clear()
+        await self._data_ready.wait()
+
+    async def _drain_loop(self):
+        try:
+            # Jitter-buffert: börja inte förrän lite ljud samlats (eller strömmen är slut)
+            while self._buffered_bytes < self._jitter_bytes and not self._closed:
+                await self._wait_for_data()
+
+            while True:
+                if not self._queue:
+                    if self._closed:
+                        break
+                    await self._wait_for_data()
+                    continue
+
+                frame, enqueued_at = self._queue.popleft()
+                now = time.monotonic()
+
+                if self._playout_start is None:
+                    self._playout_start = now
+                    self._first_playout_delay = time.time() - self._started_at
+                elif now > self._playout_start + self._sent_sec:
+                    # Klienten har spelat upp allt den fått → underrun, flytta klockan
+                    self.underruns += 1
+                    self._playout_start = now - self._sent_sec
+
+                # Släpp framen först när den ligger inom lead-fönstret
+                release_at = self._playout_start + self._sent_sec - self._lead_sec
+                if release_at > now:
+                    await asyncio.sleep(release_at - now)
+
+                playout_at = self._playout_start + self._sent_sec
+                await self._ws.send_bytes(frame.tobytes())
+
+                self._buffered_bytes -= len(frame)
+                self._space_free.set()
+                self._sent_sec += len(frame) / self._bytes_per_sec
+                self.frames_sent += 1
+                self.bytes_sent += len(frame)
+
+                delay = playout_at - enqueued_at
+                self._delay_sum += delay
+                self._delay_max = max(self._delay_max, delay)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Paced audio sender failed: %s", e)
+            self._error = e
+            self._space_free.set()
@@ -2,13 +2,15 @@
 import json
 from typing import Optional
 
+from ..messaging import send_message
+
 # Text-validering inställningar
-MAX_TEXT_CHARS = 1000  # Max antal tecken för text-input
+MAX_TEXT_CHARS = 5000  # Max antal tecken för text-input (lång text delas i segment)
 
 async def _send_error_json(ws, message: str):
     """Skicka felmeddelande till frontend."""
     try:
-        await ws.send_text(json.dumps({"type": "error", "message": message}))
+        await send_message(ws, {"type": "error", "message": message})
     except Exception:
         pass  # Ignorera fel vid sändning av felmeddelande
 
@@ -0,0 +1,244 @@
+# app/tts/schedule_tuner.py
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, Tuple
+
+import orjson
+
+from ..config import settings
+
+logger = logging.getLogger("stefan-api-test-16")
+
+# Mål för TTFB och glappgräns läses från settings (TTS_TARGET_TTFB_MS, TTS_GAP_LIMIT_MS);
+# tillåten avvikelse från målet innan schemat ändras
+TTFB_TOLERANCE = 0.2
+# ElevenLabs tillåter 50–500 tecken per steg i chunk_length_schedule
+SCHEDULE_MIN = 50
+SCHEDULE_MAX = 500
+SCHEDULE_STEP = 10
+# Antal förfrågningar per nyckel mellan justeringar
+ADJUST_EVERY = 5
+
+# Textlängd (tecken) → hink; korta svar är känsligast för TTFB
+LENGTH_BUCKETS = ((80, "short"), (250, "medium"))
+LONG_BUCKET = "long"
+
+
+def tuning_enabled() -> bool:
+    return settings.tts_schedule_tuning
+
+
+def length_bucket(text_length: int) -> str:
+    for limit, name in LENGTH_BUCKETS:
+        if text_length <= limit:
+            return name
+    return LONG_BUCKET
+
+
+class ScheduleState:
+    """Inlärt chunk-schema och senaste mätningar för en (röst, modell, längdhink)."""
+
+    def __init__(self, schedule: List[int], window: int = 50):
+        self.schedule = list(schedule)
+        self.ttfb_ms: Deque[float] = deque(maxlen=window)
+        self.gap_ms: Deque[float] = deque(maxlen=window * 4)
+        self.since_adjust = 0
+        self.requests = 0
+        self.adjustments = 0
+        self.updated_at: Optional[float] = None
+
+    @staticmethod
+    def _percentile(samples, p: float) -> Optional[float]:
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+    def snapshot(self) -> dict:
+        ttfb_p50 = self._percentile(self.ttfb_ms, 0.5)
+        gap_p95 = self._percentile(self.gap_ms, 0.95)
+        return {
+            "schedule": self.schedule,
+            "requests": self.requests,
+            "adjustments": self.adjustments,
+            "ttfb_p50_ms": round(ttfb_p50, 1) if ttfb_p50 is not None else None,
+            "gap_p95_ms": round(gap_p95, 1) if gap_p95 is not None else None,
+            "updated_at": self.updated_at,
+        }
+
+
+class ScheduleTuner:
+    """Justerar ElevenLabs `chunk_length_schedule` mot en mål-TTFB.
+
+    Per (röst, modell, textlängdshink) mäts TTFB för första segmentet och
+    glappen mellan audio-chunkar. Var `adjust_every`:e förfrågan:
+
+    - median-TTFB över målet → första steget minskas (snabbare start),
+    - median-TTFB klart under målet och inga stora glapp → första steget
+      ökas (större första chunk, bättre prosodi),
+    - p95-glapp över `gap_limit_ms` → resten av schemat ökas (färre,
+      större genereringar ger jämnare ström).
+
+    Värdena hålls inom ElevenLabs gränser och schemat är icke-minskande.
+    Utgångspunkten är profilens schema. Inlärda scheman sparas i
+    `path` (JSON) och läses in vid start.
+    """
+
+    def __init__(
+        self,
+        target_ttfb_ms: Optional[float] = None,
+        gap_limit_ms: Optional[float] = None,
+        adjust_every: int = ADJUST_EVERY,
+        step: int = SCHEDULE_STEP,
+        path: Optional[str] = None,
+    ):
+        # None → värdet från settings (följer med vid omläsning via SIGHUP)
+        self._target_ttfb_ms = target_ttfb_ms
+        self._gap_limit_ms = gap_limit_ms
+        self.adjust_every = adjust_every
+        self.step = step
+        self.path = Path(path) if path else None
+        self.states: Dict[Tuple[str, str, str], ScheduleState] = {}
+        self.load()
+
+    @property
+    def target_ttfb_ms(self) -> float:
+        return self._target_ttfb_ms if self._target_ttfb_ms is not None else settings.tts_target_ttfb_ms
+
+    @property
+    def gap_limit_ms(self) -> float:
+        return self._gap_limit_ms if self._gap_limit_ms is not None else settings.tts_gap_limit_ms
+
+    @staticmethod
+    def _key_str(key: Tuple[str, str, str]) -> str:
+        return "|".join(key)
+
+    def _state(self, voice_id: str, model_id: str, text_length: int, base: List[int]) -> ScheduleState:
+        key = (voice_id, model_id, length_bucket(text_length))
+        state = self.states.get(key)
+        if state is None:
+            state = self.states[key] = ScheduleState(base)
+        return state
+
+    def schedule_for(self, voice_id: str, model_id: str, text_length: int, base: List[int]) -> List[int]:
+        """Schemat att använda för en förfrågan (`base` tills något lärts in)."""
+        key = (voice_id, model_id, length_bucket(text_length))
+        state = self.states.get(key)
+        return state.schedule if state is not None else base
+
+    def record(
+        self,
+        voice_id: str,
+        model_id: str,
+        text_length: int,
+        base: List[int],
+        ttfb_ms: Optional[float],
+        gaps_ms: List[float],
+    ) -> bool:
+        """Registrera en förfrågan. Returnerar True om schemat justerades."""
+        state = self._state(voice_id, model_id, text_length, base)
+        state.requests += 1
+        if ttfb_ms is not None:
+            state.ttfb_ms.append(ttfb_ms)
+        state.gap_ms.extend(gaps_ms)
+        state.since_adjust += 1
+        if state.since_adjust < self.adjust_every or not state.ttfb_ms:
+            return False
+        state.since_adjust = 0
+        if not self._adjust(state):
+            return False
+        logger.info("TTS chunk schedule for %s/%s (%s) tuned to %s",
+                    voice_id, model_id, length_bucket(text_length), state.schedule)
+        self._save_soon()
+        return True
+
+    def _adjust(self, state: ScheduleState) -> bool:
+        ttfb_p50 = state._percentile(state.ttfb_ms, 0.5)
+        gap_p95 = state._percentile(state.gap_ms, 0.95) or 0.0
+        schedule = list(state.schedule)
+        if ttfb_p50 > self.target_ttfb_ms * (1 + TTFB_TOLERANCE):
+            schedule[0] -= self.step
+        elif ttfb_p50 < self.target_ttfb_ms * (1 - TTFB_TOLERANCE) and gap_p95 <= self.gap_limit_ms:
+            schedule[0] += self.step
+        if gap_p95 > self.gap_limit_ms:
+            schedule[1:] = [value + self.step for value in schedule[1:]]
+
+        # Inom gränserna och icke-minskande
+        clamped = []
+        for value in schedule:
+            value = min(SCHEDULE_MAX, max(SCHEDULE_MIN, value))
+            clamped.append(max(value, clamped[-1]) if clamped else value)
+
+        # Nya mätningar ska spegla det nya schemat
+        state.ttfb_ms.clear()
+        state.gap_ms.clear()
+        if clamped == state.schedule:
+            return False
+        state.schedule = clamped
+        state.adjustments += 1
+        state.updated_at = time.time()
+        return True
+
+    def _save_soon(self) -> None:
+        if self.path is None:
+            return
+        try:
+            asyncio.get_running_loop().run_in_executor(None, self.save)
+        except RuntimeError:
+            self.save()
+
+    def save(self) -> None:
+        """Skriv inlärda scheman till fil (atomiskt)."""
+        if self.path is None:
+            return
+        data = {
+            self._key_str(key): {
+                "schedule": state.schedule,
+                "adjustments": state.adjustments,
+                "updated_at": state.updated_at,
+            }
+            for key, state in list(self.states.items())
+            if state.adjustments
+        }
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+            tmp.write_bytes(orjson.dumps({"schedules": data}, option=orjson.OPT_INDENT_2))
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning("Could not save TTS schedules to %s: %s", self.path, e)
+
+    def load(self) -> None:
+        if self.path is None or not self.path.exists():
+            return
+        try:
+            data = orjson.loads(self.path.read_bytes()).get("schedules", {})
+        except (OSError, ValueError) as e:
+            logger.warning("Could not load TTS schedules from %s: %s", self.path, e)
+            return
+        for key_str, entry in data.items():
+            key = tuple(key_str.split("|"))
+            if len(key) != 3:
+                continue
+            state = ScheduleState(entry["schedule"])
+            state.adjustments = entry.get("adjustments", 0)
+            state.updated_at = entry.get("updated_at")
+            self.states[key] = state
+        logger.info("Loaded %d tuned TTS schedule(s) from %s", len(data), self.path)
+
+    def snapshot(self) -> dict:
+        return {
+            "enabled": tuning_enabled(),
+            "target_ttfb_ms": self.target_ttfb_ms,
+            "gap_limit_ms": self.gap_limit_ms,
+            "path": str(self.path) if self.path else None,
+            "schedules": {self._key_str(key): state.snapshot() for key, state in self.states.items()},
+        }
+
+
+# Global instans; inlärda scheman sparas i TTS_SCHEDULE_FILE (tomt = bara i minnet)
+schedule_tuner = ScheduleTuner(path=settings.tts_schedule_file)
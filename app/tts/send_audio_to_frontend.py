@@ -1,27 +1,35 @@
 import base64
-import json
 import logging
 import time
 
+import orjson
+
+from ..messaging import send_message
+
 logger = logging.getLogger("stefan-api-test-16")
 
 async def _send_debug_json(ws, obj: dict):
-    """Skicka JSON (utf-8) till frontend för debug-meddelanden."""
+    """Skicka debug-meddelande till frontend (kan batchas av FrontendChannel)."""
     try:
-        await ws.send_text(json.dumps(obj))
+        await send_message(ws, obj, batchable=True)
     except Exception as e:
         logger.error("Failed to send debug JSON: %s", e)
 
-async def send_audio_to_frontend(ws, server_msg, audio_bytes_total, last_chunk_ts):
-    """Hanterar audio-streaming till frontend."""
+async def send_audio_to_frontend(ws, server_msg, audio_bytes_total, last_chunk_ts, meter=None):
+    """Hanterar audio-streaming till frontend.
+
+    Med `meter` (LevelMeter) analyseras varje utgående PCM-chunk (nivå, klippning, tystnad).
+    """
     
     # ElevenLabs skickar (vanligen) JSON‐text
     try:
-        payload = json.loads(server_msg)
+        payload = orjson.loads(server_msg)
     except Exception:
         # Om binärt (ovanligt), skicka vidare
         if isinstance(server_msg, (bytes, bytearray)):
             await ws.send_bytes(server_msg)
+            if meter is not None:
+                meter.push(server_msg)
             audio_bytes_total += len(server_msg)
             last_chunk_ts = time.time()
             logger.debug("Forwarded binary frame: %d bytes", len(server_msg))
@@ -48,6 +56,8 @@ async def send_audio_to_frontend(ws, server_msg, audio_bytes_total, last_chunk_t
             b = base64.b64decode(audio_b64)
             if b:
                 await ws.send_bytes(b)
+                if meter is not None:
+                    meter.push(b)
                 audio_bytes_total += len(b)
                 last_chunk_ts = time.time()
                 logger.debug("Forwarded audio chunk: %d bytes (total=%d)", len(b), audio_bytes_total)
@@ -0,0 +1,129 @@
+# app/tts/text_segmenter.py
+import re
+from typing import List
+
+# Segment-inställningar
+FIRST_SEGMENT_MAX_CHARS = 120  # Kort första segment → snabbare första ljud
+MAX_SEGMENT_CHARS = 250        # Senare segment slås ihop upp till denna längd
+
+# Vanliga svenska förkortningar (gemener, utan avslutande punkt)
+ABBREVIATIONS = frozenset({
+    "t.ex", "bl.a", "m.m", "m.fl", "mfl", "osv", "o.s.v", "dvs", "d.v.s", "s.k", "ca", "kl",
+    "nr", "st", "resp", "fr.o.m", "t.o.m", "p.g.a", "pga", "f.d", "etc", "jfr", "obs", "tel",
+    "e.d", "e.kr", "f.kr", "dr", "prof", "kr", "min", "sek", "tim", "mån", "tis", "ons", "tors",
+    "fre", "lör", "sön", "jan", "feb", "mar", "apr", "jun", "jul", "aug", "sep", "sept", "okt",
+    "nov", "dec", "vol", "sid", "ev", "inkl", "exkl", "enl", "avd", "ang", "forts", "ff",
+    "o.d", "i.o.m", "u.a", "mr", "mrs", "ms", "vs",
+})
+
+# Kandidat för meningsslut: skiljetecken (+ ev. citattecken/parentes) följt av blanksteg
+_SENTENCE_END = re.compile(r"[.!?…]+[\"'”»)\]]*\s+")
+# Satsgränser inom en lång mening (komma mellan siffror, t.ex. "3,5", kräver inget blanksteg och matchar ej)
+_CLAUSE_END = re.compile(r"[,;:–—]\s+|\s+[–—]\s+")
+_WORD_BEFORE = re.compile(r"(\S+)$")
+
+
+def _is_sentence_boundary(text: str, match: re.Match) -> bool:
+    """Avgör om en kandidat verkligen är ett meningsslut."""
+    end = match.end()
+    if end >= len(text):
+        return True
+
+    # Nästa mening börjar normalt med versal, siffra, citattecken eller tankstreck
+    next_char = text[end]
+    if next_char.islower():
+        return False
+
+    punct = match.group(0).rstrip()
+    if not punct.startswith("."):
+        return True  # ! ? … är alltid meningsslut
+
+    word_match = _WORD_BEFORE.search(text, 0, match.start())
+    if not word_match:
+        return True
+    word = word_match.group(1).lower()
+
+    if word in ABBREVIATIONS:
+        return False
+    # Initialer ("S. Andersson") och ordningstal ("den 3. maj") är inte meningsslut
+    if len(word) == 1 and word.isalpha():
+        return False
+    if word.isdigit() and next_char.isdigit():
+        return False
+    return True
+
+
+def split_sentences(text: str) -> List[str]:
+    """Dela text i meningar med hänsyn till svenska förkortningar och tal."""
+    sentences = []
+    start = 0
+    for match in _SENTENCE_END.finditer(text):
+        if _is_sentence_boundary(text, match):
+            sentence = text[start:match.end()].strip()
+            if sentence:
+                sentences.append(sentence)
+            start = match.end()
+    rest = text[start:].strip()
+    if rest:
+        sentences.append(rest)
+    return sentences
+
+
+def _split_long(sentence: str, max_chars: int) -> List[str]:
+    """Dela en för lång mening vid satsgränser, i sista hand vid blanksteg."""
+    parts = []
+    while len(sentence) > max_chars:
+        window = sentence[:max_chars + 1]
+        cut = None
+        for match in _CLAUSE_END.finditer(window):
+            cut = match.end()
+        if cut is None:
+            cut = window.rfind(" ") + 1
+        if cut <= 0:
+            cut = max_chars  # Inget blanksteg alls → hård delning
+        parts.append(sentence[:cut].strip())
+        sentence = sentence[cut:].strip()
+    if sentence:
+        parts.append(sentence)
+    return parts
+
+
+def split_text(
+    text: str,
+    max_chars: int = MAX_SEGMENT_CHARS,
+    first_max_chars: int = FIRST_SEGMENT_MAX_CHARS,
+) -> List[str]:
+    """
+    Dela text i segment för pipelining mot ElevenLabs stream-input.
+
+    Första segmentet hålls kort (första meningen eller satsen) så att ljud
+    kan börja genereras direkt. Efterföljande meningar slås ihop upp till
+    `max_chars` för att inte skicka onödigt många meddelanden.
+
+    Args:
+        text: Text att dela upp
+        max_chars: Max längd för segment efter det första
+        first_max_chars: Max längd för första segmentet
+
+    Returns:
+        Lista med segment (tom lista för tom text)
+    """
+    pieces: List[str] = []
+    for sentence in split_sentences(text.strip()):
+        limit = first_max_chars if not pieces else max_chars
+        pieces.extend(_split_long(sentence, limit))
+
+    if not pieces:
+        return []
+
+    segments = [pieces[0]]
+    current = ""
+    for piece in pieces[1:]:
+        if current and len(current) + 1 + len(piece) > max_chars:
+            segments.append(current)
+            current = piece
+        else:
+            current = f"{current} {piece}" if current else piece
+    if current:
+        segments.append(current)
+    return segments
@@ -1,42 +1,78 @@
 import asyncio
 import logging
 import time
-import os
 from websockets.client import connect as ws_connect
 import orjson
 
+from ..config import settings
+from ..messaging import send_message
+from ..profiles import (  # noqa: F401 (standardvärden, används även av engines)
+    DEFAULT_MODEL_ID, DEFAULT_OUTPUT_FORMAT, DEFAULT_VOICE_ID, DEFAULT_VOICE_SETTINGS,
+    Profile, current_profile,
+)
+from .schedule_tuner import schedule_tuner, tuning_enabled
+from .text_segmenter import split_text
+
 logger = logging.getLogger("stefan-api-test-16")
 
-# TTS-specifika inställningar
-DEFAULT_VOICE_ID = "Vo4adEN1y46b0ufuysRe"  # Sätt ditt voice-ID här
-DEFAULT_MODEL_ID = "eleven_flash_v2_5"
-ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY", "")  # Hämtas från .env
+
+def _alignment_char_count(payload: dict) -> int:
+    """Antal tecken som en audio-chunk täcker enligt ElevenLabs alignment."""
+    alignment = payload.get("alignment") or payload.get("normalizedAlignment")
+    if isinstance(alignment, dict) and isinstance(alignment.get("chars"), list):
+        return len(alignment["chars"])
+    return 0
 
 
-async def process_text_to_audio(ws, text, started_at):
-    """Hanterar ElevenLabs API-kommunikation och returnerar rå data."""
+async def process_text_to_audio(
+    ws,
+    text,
+    started_at,
+    stats: dict = None,
+    voice_id: str = None,
+    model_id: str = None,
+    profile: Profile = None,
+):
+    """Hanterar ElevenLabs API-kommunikation och returnerar rå data.
+
+    Texten delas i segment (meningar/satser) som skickas till stream-input
+    var för sig med flush, så att första ljudet kommer efter första meningen.
+    Om `stats` anges fylls den med antal segment och time-to-first-byte per segment.
+    För segment efter det första räknas TTFB från när segmentet skickades
+    eller föregående segments sista ljud kom, det som var senast; annars
+    skulle tiden segmentet köat bakom tidigare ljud räknas som TTFB.
+    Röst, modell och init-meddelande kommer från profilen (anslutningens
+    `?profile=` om ingen anges); `voice_id`/`model_id` åsidosätter den.
+    Chunk-schemat kommer från schedule_tuner (inlärt per röst, modell och
+    textlängd) som också får TTFB och glapp mellan chunkar efteråt.
+    """
+    profile = (profile or current_profile()).with_voice(voice_id, model_id)
+    voice_id, model_id = profile.voice_id, profile.tts_model_id
+    tuning = tuning_enabled()
+    schedule = profile.chunk_length_schedule
+    if tuning:
+        schedule = schedule_tuner.schedule_for(voice_id, model_id, len(text), schedule)
     
-    # 2) Anslut till ElevenLabs
-    query = f"?model_id={DEFAULT_MODEL_ID}&output_format=pcm_16000"
-    eleven_ws_url = f"wss://api.elevenlabs.io/v1/text-to-speech/{DEFAULT_VOICE_ID}/stream-input{query}"
-    headers = [("xi-api-key", ELEVENLABS_API_KEY)]
+    # 2) Anslut till ElevenLabs (URL förberäknad per profil)
+    eleven_ws_url = profile.tts_url
+    api_key = settings.elevenlabs_api_key  # läses per förfrågan (kan laddas om)
+    headers = [("xi-api-key", api_key)]
     
     # Logga API-detaljer i terminalen
-    logger.info("Connecting to ElevenLabs with voice_id=%s, model_id=%s", DEFAULT_VOICE_ID, DEFAULT_MODEL_ID)
+    logger.info("Connecting to ElevenLabs with voice_id=%s, model_id=%s", voice_id, model_id)
     
     # Skicka API-detaljer till frontend för debugging
-    import json
     try:
-        await ws.send_text(json.dumps({
-            "type": "debug", 
+        await send_message(ws, {
+            "type": "debug",
             "provider": "elevenlabs", 
             "api_details": {
-                "voice_id": DEFAULT_VOICE_ID,
-                "model_id": DEFAULT_MODEL_ID,
+                "voice_id": voice_id,
+                "model_id": model_id,
                 "url": eleven_ws_url,
-                "has_api_key": bool(ELEVENLABS_API_KEY)
+                "has_api_key": bool(api_key)
             }
-        }))
+        }, batchable=True)
     except Exception as e:
         logger.warning("Failed to send debug info to frontend: %s", e)
 
@@ -44,71 +80,129 @@ async def process_text_to_audio(ws, text, started_at):
     inactivity_timeout_sec = 12  # intern timeout efter att vi sagt "streaming"
 
     async with ws_connect(eleven_ws_url, extra_headers=headers, open_timeout=30) as eleven:
-        # 3) Initiera session
-        init_msg = {
-            "text": " ",  # kickstart
-            "voice_settings": {
-                "stability": 0.5,
-                "similarity_boost": 0.8,
-                "use_speaker_boost": False,
-                "speed": 1.0,
-            },
-            "generation_config": {
-                # Lägre trösklar → snabbare start på kort text
-                "chunk_length_schedule": [50, 90, 140]
-            },
-            "xi_api_key": ELEVENLABS_API_KEY,
-        }
-        await eleven.send(orjson.dumps(init_msg).decode())
+        # 3) Initiera session (förserialiserat per profil och schema, nyckeln skarvas in)
+        init_msg = profile.tts_init_debug
+        await eleven.send(profile.tts_init_message(api_key, schedule))
         logger.debug("Sent init message to ElevenLabs")
         
         # Skicka init-meddelandet till frontend för debugging
         try:
-            await ws.send_text(json.dumps({
+            await send_message(ws, {
                 "type": "debug",
                 "provider": "elevenlabs", 
                 "init_message": {
                     "text": init_msg["text"],
                     "voice_settings": init_msg["voice_settings"],
-                    "generation_config": init_msg["generation_config"],
-                    "has_api_key": bool(init_msg["xi_api_key"])
+                    "generation_config": {"chunk_length_schedule": schedule},
+                    "has_api_key": bool(api_key)
                 }
-            }))
+            }, batchable=True)
         except Exception as e:
             logger.warning("Failed to send init debug info to frontend: %s", e)
 
-        # 4) Skicka text och trigga generering direkt
-        await eleven.send(orjson.dumps({"text": text, "try_trigger_generation": True}).decode())
-        logger.debug("Sent user text (%d chars) with try_trigger_generation=True", len(text))
+        # 4) Dela texten i segment och skicka dem med flush så att generering
+        #    startar per mening i stället för efter hela texten
+        segments = split_text(text) or [text]
+        segment_sent_at = [0.0] * len(segments)
+        segment_ttfb_ms = [None] * len(segments)
+        # Kumulativ teckengräns per segment (för att koppla alignment → segment)
+        segment_ends = []
+        char_total = 0
+        for segment in segments:
+            char_total += len(segment) + 1
+            segment_ends.append(char_total)
+
+        async def _send_segment(index: int):
+            segment_sent_at[index] = time.time()
+            await eleven.send(orjson.dumps({
+                "text": segments[index] + " ",
+                "try_trigger_generation": True,
+                "flush": True,
+            }).decode())
 
-        # 5) Avsluta inmatning (förhindra deras 20s-timeout)
-        await eleven.send(orjson.dumps({"text": "", "flush": True}).decode())
-        logger.debug("Sent flush message to ElevenLabs")
+        async def _send_remaining_segments():
+            for index in range(1, len(segments)):
+                await _send_segment(index)
+            # 5) Avsluta inmatning (förhindra deras 20s-timeout)
+            await eleven.send(orjson.dumps({"text": "", "flush": True}).decode())
+            logger.debug("Sent flush message to ElevenLabs")
+
+        await _send_segment(0)
+        logger.debug("Sent user text (%d chars) in %d segments", len(text), len(segments))
+        sender_task = asyncio.create_task(_send_remaining_segments())
 
         # 6) Läs streamen och returnera rå data
-        while True:
-            try:
-                server_msg = await asyncio.wait_for(eleven.recv(), timeout=inactivity_timeout_sec)
-            except asyncio.TimeoutError:
-                # Vi har inte fått något på N sekunder → ge upp snyggt
-                logger.warning("No data from ElevenLabs for %ss, aborting stream", inactivity_timeout_sec)
-                break
-
-            # Returnera rå data från ElevenLabs
-            yield server_msg, audio_bytes_total
-
-            # Uppdatera audio_bytes_total för binary frames
-            if isinstance(server_msg, (bytes, bytearray)):
-                audio_bytes_total += len(server_msg)
-
-            # Slut?
-            if isinstance(server_msg, str):
+        chars_received = 0
+        # Glapp mellan audio-chunkar (för schedule_tuner)
+        last_audio_at = None
+        gaps_ms = []
+
+        def _note_audio():
+            nonlocal last_audio_at
+            now = time.time()
+            if last_audio_at is not None:
+                gaps_ms.append((now - last_audio_at) * 1000)
+            last_audio_at = now
+
+        try:
+            while True:
                 try:
-                    payload = orjson.loads(server_msg)
+                    server_msg = await asyncio.wait_for(eleven.recv(), timeout=inactivity_timeout_sec)
+                except asyncio.TimeoutError:
+                    # Vi har inte fått något på N sekunder → ge upp snyggt
+                    logger.warning("No data from ElevenLabs for %ss, aborting stream", inactivity_timeout_sec)
+                    break
+
+                # Returnera rå data från ElevenLabs
+                yield server_msg, audio_bytes_total
+
+                # Uppdatera audio_bytes_total för binary frames
+                if isinstance(server_msg, (bytes, bytearray)):
+                    audio_bytes_total += len(server_msg)
+                    _note_audio()
+                    if segment_ttfb_ms[0] is None:
+                        segment_ttfb_ms[0] = round((time.time() - segment_sent_at[0]) * 1000, 1)
+
+                # Slut?
+                if isinstance(server_msg, str):
+                    try:
+                        payload = orjson.loads(server_msg)
+                    except Exception:
+                        continue
+
+                    if payload.get("audio"):
+                        # Vilket segment tillhör chunken? Första ljudet per segment → TTFB
+                        index = next(
+                            (i for i, end in enumerate(segment_ends) if chars_received < end),
+                            len(segments) - 1,
+                        )
+                        if segment_ttfb_ms[index] is None:
+                            # last_audio_at är här föregående segments sista ljud (ljudet kommer i ordning)
+                            ready_at = segment_sent_at[index]
+                            if index and last_audio_at is not None:
+                                ready_at = max(ready_at, last_audio_at)
+                            segment_ttfb_ms[index] = round((time.time() - ready_at) * 1000, 1)
+                            logger.debug("First audio for segment %d after %.1f ms", index, segment_ttfb_ms[index])
+                        _note_audio()
+                        chars_received += _alignment_char_count(payload)
+
                     if payload.get("isFinal") is True or payload.get("event") == "finalOutput":
                         logger.debug("Final frame from ElevenLabs received")
                         break
-                except:
-                    pass
+        finally:
+            if not sender_task.done():
+                sender_task.cancel()
+            await asyncio.gather(sender_task, return_exceptions=True)
+
+            if stats is not None:
+                stats["segments"] = len(segments)
+                stats["segment_ttfb_ms"] = segment_ttfb_ms
+                stats["chunk_length_schedule"] = schedule
+
+            # Bara strömmar som gav ljud lär tunern något
+            if tuning and segment_ttfb_ms[0] is not None:
+                schedule_tuner.record(voice_id, model_id, len(text), profile.chunk_length_schedule,
+                                      segment_ttfb_ms[0], gaps_ms)
 
-        logger.info("Stream done: audio_bytes_total=%d elapsed=%.3fs", audio_bytes_total, time.time() - started_at)
+        logger.info("Stream done: audio_bytes_total=%d elapsed=%.3fs segments=%d",
+                    audio_bytes_total, time.time() - started_at, len(segments))
@@ -0,0 +1,81 @@
+"""Benchmark: strömmande PCM/WAV-hantering (app/audio) på timslånga filer.
+
+Kör: python -m benchmarks.bench_audio_io [--hours 2] [--dir /tmp]
+
+Skriver en syntetisk PCM16-fil (16 kHz mono) och mäter genomströmning och
+minnestopp för PCM→WAV-konvertering, nivåer per 20 ms-fönster över hela
+filen (mmap) och vågformsdata. Konverteringen ska inte öka minnestoppen
+alls; vid mmap-läsning räknas lästa filsidor (sidcache, inte heap) in i RSS.
+"""
+import argparse
+import os
+import resource
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app.audio import PCM16_MONO_16K, min_max_peaks, open_audio, pcm_to_wav, window_levels
+
+WRITE_CHUNK_SEC = 60
+
+
+def _write_pcm(path: Path, seconds: int) -> None:
+    rng = np.random.default_rng(0)
+    t = np.arange(PCM16_MONO_16K.sample_rate * WRITE_CHUNK_SEC) / PCM16_MONO_16K.sample_rate
+    minute = (6000 * np.sin(2 * np.pi * 180 * t) + rng.normal(0, 800, t.size)).astype("<i2").tobytes()
+    with path.open("wb") as f:
+        for _ in range(max(1, seconds // WRITE_CHUNK_SEC)):
+            f.write(minute)
+
+
+def _max_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _measure(label: str, size_bytes: int, func) -> None:
+    rss_before = _max_rss_mb()
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    grew = _max_rss_mb() - rss_before
+    print(f"{label:<28}{size_bytes / elapsed / 1e6:>10,.0f} MB/s{elapsed:>9.2f} s   max-RSS +{grew:,.0f} MB")
+
+
+def _levels(path: Path) -> None:
+    window = PCM16_MONO_16K.bytes_for_ms(20) // 2
+    with open_audio(path) as audio:
+        # Fönster om en minut i taget: mappningen läses sida för sida
+        samples = audio.samples()
+        step = window * 3000
+        for start in range(0, samples.size, step):
+            window_levels(samples[start:start + step], window)
+
+
+def _peaks(path: Path) -> None:
+    with open_audio(path) as audio:
+        min_max_peaks(audio.samples(), 2000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hours", type=float, default=2.0, help="Filens längd i timmar")
+    parser.add_argument("--dir", default=None, help="Katalog för testfilerna (tmp som standard)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        pcm = Path(directory) / "long.pcm"
+        _write_pcm(pcm, int(args.hours * 3600))
+        size = pcm.stat().st_size
+        print(f"{args.hours:g} h PCM16 16 kHz mono = {size / 1e6:,.0f} MB, start-RSS {_max_rss_mb():,.0f} MB")
+
+        wav = Path(directory) / "long.wav"
+        _measure("pcm_to_wav (strömmande)", size, lambda: pcm_to_wav(pcm, wav))
+        _measure("nivåer per 20 ms (mmap)", size, lambda: _levels(wav))
+        _measure("vågform 2000 punkter (mmap)", size, lambda: _peaks(wav))
+        os.remove(wav)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Benchmark: meddelanden/s per kärna för skurar av `stt.partial`.
+
+Kör: python -m benchmarks.bench_messaging [--messages 200000]
+
+Jämför Starlettes `ws.send_json` (stdlib json) med orjson, förkompilerade
+scheman och MessagePack-framing, både ren kodning och hela vägen genom
+FrontendChannel mot en WebSocket som inte gör något. CPU-tid mäts med
+`time.process_time`, så siffran är per kärna.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import orjson
+
+from app.messaging import FrontendChannel, STT_PARTIAL, packb
+
+
+class _NullWebSocket:
+    async def send_text(self, data):
+        pass
+
+    async def send_bytes(self, data):
+        pass
+
+
+def _partials(count: int):
+    """Växande partial-texter som från Realtime (20–200 tecken, svenska tecken)."""
+    words = "hej det här är ett test av transkribering med åäö och lite längre meningar".split()
+    texts, text = [], ""
+    for i in range(count):
+        text = (text + " " + words[i % len(words)]).strip()
+        if len(text) > 200:
+            text = words[i % len(words)]
+        texts.append(text)
+    return texts
+
+
+def _rate(count: int, fn) -> float:
+    start = time.process_time()
+    fn()
+    elapsed = time.process_time() - start
+    return count / elapsed if elapsed else float("inf")
+
+
+def _encode_benchmarks(texts):
+    return {
+        "stdlib json (starlette send_json)": lambda: [
+            json.dumps({"type": "stt.partial", "text": t}, separators=(",", ":"), ensure_ascii=False) for t in texts
+        ],
+        "orjson dict": lambda: [orjson.dumps({"type": "stt.partial", "text": t}) for t in texts],
+        "schema json": lambda: [STT_PARTIAL.encode(t) for t in texts],
+        "schema msgpack": lambda: [STT_PARTIAL.encode_msgpack(t) for t in texts],
+        "packb dict": lambda: [packb({"type": "stt.partial", "text": t}) for t in texts],
+    }
+
+
+async def _send_starlette_style(ws, texts):
+    for t in texts:
+        await ws.send_text(json.dumps({"type": "stt.partial", "text": t}, separators=(",", ":"), ensure_ascii=False))
+
+
+async def _send_channel(channel, texts, batchable=False):
+    for t in texts:
+        await channel.send_schema(STT_PARTIAL, t, batchable=batchable)
+    await channel.flush()
+
+
+def _send_benchmarks(texts):
+    ws = _NullWebSocket()
+    return {
+        "send: stdlib json": lambda: asyncio.run(_send_starlette_style(ws, texts)),
+        "send: channel json": lambda: asyncio.run(_send_channel(FrontendChannel(ws), texts)),
+        "send: channel msgpack": lambda: asyncio.run(_send_channel(FrontendChannel(ws, "msgpack"), texts)),
+        "send: channel json batched": lambda: asyncio.run(
+            _send_channel(FrontendChannel(ws, batch_ms=5), texts, batchable=True)
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200_000)
+    args = parser.parse_args()
+
+    texts = _partials(args.messages)
+    baseline = None
+    print(f"{'variant':<36}{'msg/s/kärna':>14}{'x':>8}")
+    for name, fn in {**_encode_benchmarks(texts), **_send_benchmarks(texts)}.items():
+        rate = _rate(len(texts), fn)
+        if name.startswith("stdlib") or name == "send: stdlib json":
+            baseline = rate
+        print(f"{name:<36}{rate:>14,.0f}{rate / baseline:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Benchmark: Realtime-event → transkript, dispatch-tabell mot tidigare if-kedja.
+
+Kör: python -m benchmarks.bench_realtime_events [--utterances 500] [--recording <id|rec-<id>.json>]
+
+Utan `--recording` genereras en ström som liknar Realtime: per yttrande
+speech_started/committed, många transkript-deltas, completed och
+ointressanta events (rate_limits, response.*). Med `--recording` används
+Realtime-events från en inspelning (`?record=true`, se app/recording.py).
+"""
+import argparse
+import time
+from pathlib import Path
+
+from app.recording import Recording
+from app.stt.event_to_text import TranscriptState
+
+
+def legacy_process_realtime_event(evt: dict, last_text: str, buffers) -> dict:
+    """Tidigare implementation (if-kedja + startswith mot hela texten), som referens."""
+    t = evt.get("type")
+    try:
+        buffers.rt_events.append(str(t))
+    except Exception:
+        pass
+    if t == "error":
+        return {"type": "error", "detail": evt.get("error", evt)}
+    if t == "session.updated":
+        return {"type": "info", "msg": "realtime_connected_and_configured"}
+    transcript = None
+    if t == "conversation.item.input_audio_transcription.completed":
+        transcript = (
+            evt.get("transcript")
+            or evt.get("item", {}).get("content", [{}])[0].get("transcript")
+        )
+    if not transcript and t in ("response.audio_transcript.delta", "response.audio_transcript.completed"):
+        transcript = evt.get("transcript") or evt.get("text") or evt.get("delta")
+    if not transcript and t == "response.output_text.delta":
+        delta_txt = evt.get("delta")
+        if isinstance(delta_txt, str):
+            transcript = (last_text or "") + delta_txt
+    if not isinstance(transcript, str) or not transcript:
+        return None
+    delta = transcript[len(last_text):] if transcript.startswith(last_text) else transcript
+    is_final = t in (
+        "conversation.item.input_audio_transcription.completed",
+        "response.audio_transcript.completed",
+    )
+    return {"type": "transcript", "text": transcript, "delta": delta, "is_final": is_final, "event_type": t}
+
+
+class _Buffers:
+    def __init__(self):
+        self.rt_events = []
+
+
+def synthetic_stream(utterances: int, deltas_per_utterance: int = 40):
+    words = "hej jag skulle vilja boka en tid hos tandläkaren på tisdag eftermiddag om det går".split()
+    events = []
+    for u in range(utterances):
+        item_id = f"item_{u}"
+        events.append({"type": "input_audio_buffer.speech_started", "item_id": item_id})
+        events.append({"type": "input_audio_buffer.committed", "item_id": item_id})
+        text = ""
+        for i in range(deltas_per_utterance):
+            delta = " " + words[i % len(words)]
+            text += delta
+            events.append({"type": "response.output_text.delta", "item_id": item_id, "delta": delta})
+            if i % 10 == 0:
+                events.append({"type": "rate_limits.updated", "rate_limits": []})
+        events.append({
+            "type": "conversation.item.input_audio_transcription.completed", "item_id": item_id, "transcript": text,
+        })
+    return events
+
+
+def _run_legacy(events):
+    buffers, last_text = _Buffers(), ""
+    for evt in events:
+        result = legacy_process_realtime_event(evt, last_text, buffers)
+        if result and result["type"] == "transcript":
+            last_text = result["text"]
+
+
+def _run_dispatch(events):
+    buffers, state = _Buffers(), TranscriptState()
+    for evt in events:
+        state.process(evt, buffers)
+
+
+def _rate(events, fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.process_time()
+        fn(events)
+        best = min(best, time.process_time() - start)
+    return len(events) / best if best else float("inf")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--utterances", type=int, default=500)
+    parser.add_argument("--deltas", type=int, default=40, help="Deltas per yttrande")
+    parser.add_argument("--recording", help="Inspelnings-ID eller manifest med Realtime-events")
+    args = parser.parse_args()
+
+    if args.recording:
+        path = Path(args.recording)
+        recording = Recording(path) if path.suffix == ".json" else Recording.find(args.recording)
+        events = [e["event"] for e in recording.events() if e["type"] == "realtime"]
+    else:
+        events = synthetic_stream(args.utterances, args.deltas)
+
+    legacy = _rate(events, _run_legacy)
+    dispatch = _rate(events, _run_dispatch)
+    print(f"{len(events)} events")
+    print(f"{'if-kedja (tidigare)':<24}{legacy:>14,.0f} events/s")
+    print(f"{'dispatch-tabell':<24}{dispatch:>14,.0f} events/s  ({dispatch / legacy:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
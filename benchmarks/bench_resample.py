@@ -0,0 +1,52 @@
+"""Benchmark: resampling/nedmixning av inkommande PCM16 till 16 kHz mono.
+
+Kör: python -m benchmarks.bench_resample [--seconds 10] [--chunk-ms 20]
+
+Mäter realtidsfaktor per kärna (sekunder ljud som hinner behandlas per
+sekund CPU-tid) för vanliga klientformat, med samma chunkstorlek som
+frontend skickar.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.stt.resample import Resampler
+
+FORMATS = [(48000, 2), (48000, 1), (44100, 2), (44100, 1), (32000, 1), (22050, 1), (8000, 1)]
+
+
+def _speech_like(sample_rate: int, channels: int, seconds: float) -> bytes:
+    rng = np.random.default_rng(0)
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    mono = 6000 * np.sin(2 * np.pi * 180 * t) * (1 + np.sin(2 * np.pi * 3 * t)) + rng.normal(0, 800, t.size)
+    return np.repeat(mono, channels).astype("<i2").tobytes()
+
+
+def realtime_factor(sample_rate: int, channels: int, seconds: float, chunk_ms: float, repeat: int = 3) -> float:
+    audio = _speech_like(sample_rate, channels, seconds)
+    step = int(sample_rate * chunk_ms / 1000) * 2 * channels
+    best = float("inf")
+    for _ in range(repeat):
+        resampler = Resampler(sample_rate, channels)
+        start = time.process_time()
+        for i in range(0, len(audio), step):
+            resampler.process(audio[i:i + step])
+        best = min(best, time.process_time() - start)
+    return seconds / best if best else float("inf")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=10.0, help="Sekunder ljud per format")
+    parser.add_argument("--chunk-ms", type=float, default=20.0, help="Chunkstorlek (ms)")
+    args = parser.parse_args()
+
+    print(f"{args.seconds:g} s ljud per format, {args.chunk_ms:g} ms chunkar")
+    for sample_rate, channels in FORMATS:
+        rtf = realtime_factor(sample_rate, channels, args.seconds, args.chunk_ms)
+        print(f"{sample_rate:>6} Hz {channels} ch → 16 kHz mono{rtf:>12,.0f}x realtid/kärna")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Benchmark: hela /ws/transcribe-pipelinen offline med lokal STT-engine.
+
+Kör: python -m benchmarks.bench_stt_pipeline [--sessions 20] [--utterances 5] [--latency-ms 0]
+
+Kör appen in-process (ASGI, ingen server/nätverk) med `LocalSTTEngine`
+och en LLM-ersättare. Varje session skickar ljud i 20 ms-chunkar; för
+varje yttrande mäts tiden från sista ljudchunken till `stt.final`.
+`--latency-ms` lägger på engine-latens (partial och final) för att se
+hur pipelinen beter sig med en långsam leverantör.
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+
+from app.main import app
+from app.endpoints import stt_ws
+from app.llm import receive_text_from_stt
+from app.replay import AsgiWebSocketClient, _json, _swap
+from app.stt.engine_router import STTRouter
+from app.stt.engines import LocalSTTEngine
+
+CHUNK_MS = 20
+UTTERANCE_AUDIO_MS = 1000
+
+
+async def _llm_stand_in(session_id, text):
+    return "ok"
+
+
+async def run_session(utterances: int, pace: bool) -> list:
+    client = AsgiWebSocketClient(app, "/ws/transcribe", "stt_engine=local&partial_window_ms=0")
+    await client.connect()
+    finals: asyncio.Queue = asyncio.Queue()
+
+    async def _reader():
+        while True:
+            message = await client.receive()
+            if message is None:
+                return
+            data = _json(message)
+            if data and data.get("type") == "stt.final":
+                finals.put_nowait(time.monotonic())
+
+    reader = asyncio.create_task(_reader())
+    chunk = b"\x00\x01" * (16 * CHUNK_MS)
+    latencies = []
+    try:
+        for _ in range(utterances):
+            for _ in range(UTTERANCE_AUDIO_MS // CHUNK_MS):
+                await client.send_bytes(chunk)
+                await asyncio.sleep(CHUNK_MS / 1000 if pace else 0)
+            sent_at = time.monotonic()
+            latencies.append((await asyncio.wait_for(finals.get(), 30)) - sent_at)
+    finally:
+        await client.close()
+        reader.cancel()
+    return latencies
+
+
+async def run(sessions: int, utterances: int, latency_ms: float, pace: bool) -> None:
+    engine = LocalSTTEngine(utterance_audio_ms=UTTERANCE_AUDIO_MS, first_partial_ms=latency_ms, final_ms=latency_ms)
+    with _swap(stt_ws, "stt_router", STTRouter([engine])), \
+            _swap(receive_text_from_stt, "process_final_transcription", _llm_stand_in):
+        started = time.monotonic()
+        results = await asyncio.gather(*(run_session(utterances, pace) for _ in range(sessions)))
+        elapsed = time.monotonic() - started
+
+    latencies = sorted(ms * 1000 for session in results for ms in session)
+    p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+    print(f"{sessions} sessioner × {utterances} yttranden, engine-latens {latency_ms:g} ms{' (realtid)' if pace else ''}")
+    print(f"ljud → stt.final: p50 {statistics.median(latencies):.1f} ms, p95 {p95:.1f} ms, max {latencies[-1]:.1f} ms")
+    print(f"{len(latencies) / elapsed:,.0f} yttranden/s, {sessions * utterances * UTTERANCE_AUDIO_MS / 1000 / elapsed:,.0f}x realtid")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--utterances", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Lokal engine-latens för partial och final")
+    parser.add_argument("--pace", action="store_true", help="Skicka ljudet i realtid")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)  # loggar per yttrande skulle dominera mätningen
+    asyncio.run(run(args.sessions, args.utterances, args.latency_ms, args.pace))
+
+
+if __name__ == "__main__":
+    main()
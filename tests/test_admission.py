@@ -0,0 +1,101 @@
+import pytest
+import asyncio
+from app.admission import AdmissionController, AdmissionRejected
+
+@pytest.mark.asyncio
+async def test_admits_up_to_limit():
+    """Testar att sessioner släpps in upp till gränsen utan väntan."""
+    controller = AdmissionController()
+    controller.configure("tts", max_concurrent=2, max_queue=0, max_wait_ms=100)
+
+    first = await controller.acquire("tts")
+    second = await controller.acquire("tts")
+
+    assert controller.limiter("tts").active == 2
+    first.release()
+    second.release()
+    assert controller.limiter("tts").active == 0
+
+@pytest.mark.asyncio
+async def test_rejects_fast_when_queue_full():
+    """Testar att nya sessioner avvisas direkt när kön är full."""
+    controller = AdmissionController()
+    controller.configure("tts", max_concurrent=1, max_queue=0, max_wait_ms=1000)
+    slot = await controller.acquire("tts")
+
+    with pytest.raises(AdmissionRejected) as exc:
+        await controller.acquire("tts")
+
+    message = exc.value.to_message()
+    assert message["type"] == "error"
+    assert message["reason"] == "busy"
+    assert message["provider"] == "tts"
+    assert message["detail"] == "queue_full"
+    assert controller.stats()["tts"]["rejected_queue_full"] == 1
+    slot.release()
+
+@pytest.mark.asyncio
+async def test_queued_session_gets_slot_on_release():
+    """Testar att en väntande session får platsen när den släpps."""
+    controller = AdmissionController()
+    controller.configure("tts", max_concurrent=1, max_queue=1, max_wait_ms=1000)
+    slot = await controller.acquire("tts")
+
+    waiter = asyncio.create_task(controller.acquire("tts"))
+    await asyncio.sleep(0.02)
+    assert controller.limiter("tts").waiting == 1
+
+    slot.release()
+    second = await waiter
+
+    assert second.waited_sec >= 0.02
+    assert controller.limiter("tts").active == 1
+    second.release()
+    assert controller.limiter("tts").active == 0
+
+@pytest.mark.asyncio
+async def test_queue_deadline_rejects():
+    """Testar att en session som väntat för länge avvisas med queue_timeout."""
+    controller = AdmissionController()
+    controller.configure("llm", max_concurrent=1, max_queue=5, max_wait_ms=30)
+    slot = await controller.acquire("llm")
+
+    with pytest.raises(AdmissionRejected) as exc:
+        await controller.acquire("llm")
+
+    assert exc.value.reason == "queue_timeout"
+    stats = controller.stats()["llm"]
+    assert stats["waiting"] == 0
+    assert stats["rejected_timeout"] == 1
+    slot.release()
+    assert controller.limiter("llm").active == 0
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_leak_slot():
+    """Testar att en avbruten väntande inte läcker en plats."""
+    controller = AdmissionController()
+    controller.configure("rt", max_concurrent=1, max_queue=1, max_wait_ms=1000)
+    slot = await controller.acquire("rt")
+
+    waiter = asyncio.create_task(controller.acquire("rt"))
+    await asyncio.sleep(0.01)
+    waiter.cancel()
+    await asyncio.gather(waiter, return_exceptions=True)
+    slot.release()
+
+    assert controller.limiter("rt").active == 0
+    assert controller.limiter("rt").waiting == 0
+
+@pytest.mark.asyncio
+async def test_slot_context_manager_records_wait_metrics():
+    """Testar context manager och köväntestatistik."""
+    controller = AdmissionController()
+    controller.configure("tts", max_concurrent=1, max_queue=1, max_wait_ms=100)
+
+    async with controller.slot("tts"):
+        assert controller.limiter("tts").active == 1
+
+    stats = controller.stats()["tts"]
+    assert stats["active"] == 0
+    assert stats["admitted"] == 1
+    assert stats["queue_wait_ms"]["p50"] is not None
@@ -0,0 +1,176 @@
+import asyncio
+import json
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+
+from app.admission import PROVIDER_REALTIME
+from app.main import app
+from app.profiles import ProfileRegistry
+from app.stt.engine_router import STTRouter
+from app.stt.engines import LocalSTTEngine, STTEngine
+from app.tts.engine_router import TTSRouter
+from app.tts.engines import LocalTTSEngine
+from app.tts.paced_sender import PacedAudioSender
+
+class FakeRealtimeClient:
+    """Ersätter AudioToEventClient: ger ett transkript efter första ljudchunken."""
+    
+    def __init__(self, *args, **kwargs):
+        self.events = asyncio.Queue()
+        self.chunks = 0
+    
+    async def connect(self):
+        pass
+    
+    async def send_audio_chunk(self, pcm_bytes):
+        self.chunks += 1
+        if self.chunks == 1:
+            for evt in (
+                {"type": "session.updated"},
+                {"type": "input_audio_buffer.speech_stopped"},
+                {"type": "conversation.item.input_audio_transcription.completed", "transcript": "Hej där"},
+            ):
+                await self.events.put(evt)
+    
+    async def recv_loop(self, on_event):
+        while True:
+            await on_event(await self.events.get())
+    
+    async def close(self):
+        pass
+
+class FakeRealtimeEngine(STTEngine):
+    """Realtime-engine vars klient är FakeRealtimeClient (server-VAD, ingen commit)."""
+
+    name = "realtime"
+    provider = PROVIDER_REALTIME
+
+    def create_client(self):
+        return FakeRealtimeClient()
+
+def _fake_router():
+    return STTRouter([FakeRealtimeEngine()])
+
+async def _fake_llm(session_id, text):
+    return f"Svar på: {text}"
+
+def test_agent_full_turn_on_one_connection():
+    """Testar att STT, LLM och TTS körs på samma anslutning med latens per tur."""
+    local_router = TTSRouter([LocalTTSEngine(ms_per_char=2)])
+    
+    with patch("app.endpoints.agent_ws.stt_router", _fake_router()), \
+         patch("app.endpoints.agent_ws.process_final_transcription", _fake_llm), \
+         patch("app.endpoints.agent_ws.tts_router", local_router):
+        client = TestClient(app)
+        with client.websocket_connect("/ws/agent") as ws:
+            assert ws.receive_json()["type"] == "ready"
+            assert ws.receive_json()["type"] == "session.started"
+            assert ws.receive_json()["msg"] == "realtime_connected"
+            
+            ws.send_bytes(b"\x00" * 3200)
+            
+            messages = []
+            audio = b""
+            while True:
+                frame = ws.receive()
+                if frame.get("bytes"):
+                    audio += frame["bytes"]
+                    continue
+                msg = json.loads(frame["text"])
+                messages.append(msg)
+                if msg["type"] == "turn.done":
+                    break
+    
+    types = [m["type"] for m in messages]
+    assert "stt.final" in types
+    assert {"type": "llm.text", "text": "Svar på: Hej där", "turn": 1} in messages
+    assert len(audio) > 0
+    
+    done = messages[-1]
+    assert done["turn"] == 1
+    assert done["engine"] == "local"
+    for key in ("stt_ms", "llm_ms", "tts_ttfb_ms", "tts_ms", "first_audio_ms", "total_ms"):
+        assert key in done["latency_ms"]
+    assert done["latency_ms"]["first_audio_ms"] is not None
+
+def test_agent_reports_tts_failure_per_turn():
+    """Testar att ett TTS-fel (alla engines misslyckas) ger ett fel för turen och frigör pacingen."""
+    failing_router = TTSRouter([LocalTTSEngine(fail=True)])
+
+    with patch("app.endpoints.agent_ws.stt_router", _fake_router()), \
+         patch("app.endpoints.agent_ws.process_final_transcription", _fake_llm), \
+         patch("app.endpoints.agent_ws.tts_router", failing_router), \
+         patch("app.endpoints.agent_ws.PacedAudioSender.cancel") as cancel:
+        with TestClient(app).websocket_connect("/ws/agent?pacing=true") as ws:
+            for _ in range(3):
+                ws.receive_json()
+            ws.send_bytes(b"\x00" * 3200)
+            while (msg := ws.receive_json())["type"] != "error":
+                assert msg["type"] != "turn.done"
+
+    assert msg == {"type": "error", "reason": "tts_failed", "turn": 1}
+    cancel.assert_awaited_once()
+
+def test_agent_announces_and_paces_profile_output_format():
+    """Testar att `audio_out` och pacingen följer profilens utdataformat (pcm_24000)."""
+    registry = ProfileRegistry.from_mapping({"wide": {"output_format": "pcm_24000"}})
+
+    with patch("app.profiles.profiles", registry), \
+         patch("app.endpoints.agent_ws.stt_router", _fake_router()), \
+         patch("app.endpoints.agent_ws.process_final_transcription", _fake_llm), \
+         patch("app.endpoints.agent_ws.tts_router", TTSRouter([LocalTTSEngine(ms_per_char=2)])), \
+         patch("app.endpoints.agent_ws.PacedAudioSender", wraps=PacedAudioSender) as paced:
+        with TestClient(app).websocket_connect("/ws/agent?profile=wide&pacing=true") as ws:
+            ready = ws.receive_json()
+            for _ in range(2):
+                ws.receive_json()
+            ws.send_bytes(b"\x00" * 3200)
+            while True:
+                frame = ws.receive()
+                if frame.get("text") and (msg := json.loads(frame["text"]))["type"] == "turn.done":
+                    break
+
+    assert ready["audio_out"] == {"encoding": "pcm16", "sample_rate_hz": 24000, "channels": 1}
+    assert paced.call_args.kwargs["bytes_per_sec"] == 24000 * 2
+    assert msg["pacing"]["bytes_sent"] > 0
+
+def test_agent_routes_stt_through_router_and_decoder():
+    """Testar ?stt_engine= (failover bara vid anslutning) och `audio.format`-resampling i /ws/agent."""
+    router = STTRouter([
+        LocalSTTEngine(name="realtime", fail=True),
+        LocalSTTEngine(script=["boka en tid"], utterance_audio_ms=100),
+    ])
+
+    with patch("app.endpoints.agent_ws.stt_router", router), \
+         patch("app.endpoints.agent_ws.process_final_transcription", _fake_llm), \
+         patch("app.endpoints.agent_ws.tts_router", TTSRouter([LocalTTSEngine(ms_per_char=2)])):
+        with TestClient(app).websocket_connect("/ws/agent?stt_engine=local") as ws:
+            ready = ws.receive_json()
+            ws.receive_json()
+            info = ws.receive_json()
+            ws.send_json({"type": "audio.format", "sample_rate_hz": 48000, "channels": 2})
+            while (accepted := ws.receive_json())["type"] != "audio.format":
+                pass
+            ws.send_bytes(b"\x00" * (48000 * 2 * 2 // 5))  # 200 ms stereo i 48 kHz
+            messages = []
+            while True:
+                frame = ws.receive()
+                if frame.get("text"):
+                    messages.append(json.loads(frame["text"]))
+                    if messages[-1]["type"] == "turn.done":
+                        break
+
+    assert ready["audio_in"]["encoding"] == "pcm16"
+    assert info == {"type": "info", "msg": "realtime_connected", "engine": "local"}
+    assert accepted["accepted"] is True and accepted["resampled_to"] == {"sample_rate_hz": 16000, "channels": 1}
+    assert {"type": "llm.text", "text": "Svar på: boka en tid", "turn": 1} in messages
+    assert router.snapshot()["engines"]["local"]["connect_p50_ms"] is not None
+
+def test_agent_rejects_unknown_codec():
+    """Testar att /ws/agent?codec= med okänt codec stängs med 1003 som /ws/transcribe."""
+    with TestClient(app).websocket_connect("/ws/agent?codec=flac") as ws:
+        rejected = ws.receive_json()
+        closed = ws.receive()
+
+    assert rejected["type"] == "error"
+    assert closed["code"] == 1003
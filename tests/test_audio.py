@@ -0,0 +1,103 @@
+import pytest
+import struct
+import wave
+import numpy as np
+
+from app.audio import (
+    FrameSplitter, PcmFormat, WavWriter, as_samples, iter_frames, open_audio, pcm_to_wav,
+    peak, read_layout, rms, wav_header, window_levels,
+)
+from app.recording import Recording, RecordingWriter, TRACK_OUT
+
+def _tone(seconds=0.5, amplitude=10000, rate=16000):
+    t = np.arange(int(rate * seconds)) / rate
+    return (amplitude * np.sin(2 * np.pi * 440 * t)).astype("<i2")
+
+def test_pcm_to_wav_streams_into_valid_wav(tmp_path):
+    """Testar att PCM→WAV i chunkar ger samma resultat som wave-modulen."""
+    pcm = _tone().tobytes()
+    source = tmp_path / "tone.pcm"
+    source.write_bytes(pcm)
+
+    path = pcm_to_wav(source, chunk_bytes=1000)
+
+    assert path == tmp_path / "tone.wav"
+    with wave.open(str(path), "rb") as wav:
+        assert (wav.getframerate(), wav.getnchannels(), wav.getsampwidth()) == (16000, 1, 2)
+        assert wav.readframes(wav.getnframes()) == pcm
+    with pytest.raises(FileNotFoundError):
+        pcm_to_wav(tmp_path / "saknas.pcm")
+
+def test_wav_reader_skips_extra_chunks_and_maps_samples(tmp_path):
+    """Testar att WAV med extra chunk (LIST) och stereo läses via mmap."""
+    stereo = np.stack([_tone(0.1), -_tone(0.1)], axis=1).astype("<i2")
+    fmt_chunk = struct.pack("<4sIHHIIHH", b"fmt ", 16, 1, 2, 48000, 48000 * 4, 4, 16)
+    list_chunk = b"LIST" + struct.pack("<I", 5) + b"INFOx\x00"
+    data = stereo.tobytes()
+    body = b"WAVE" + fmt_chunk + list_chunk + b"data" + struct.pack("<I", len(data)) + data
+    path = tmp_path / "stereo.wav"
+    path.write_bytes(b"RIFF" + struct.pack("<I", len(body)) + body)
+
+    offset, size, fmt = read_layout(path)
+    assert fmt == PcmFormat(48000, 2, 2) and size == len(data)
+    with open_audio(path) as audio:
+        assert audio.frame_count == len(stereo)
+        assert np.array_equal(audio.samples(channel=1), stereo[:, 1])
+        assert b"".join(bytes(c) for c in audio.iter_chunks(1001)) == data
+        assert audio.read(4, 4) == data[4:8]
+
+def test_wav_writer_patches_sizes_on_close(tmp_path):
+    """Testar att strömmande skrivning fyller i headerns storlekar vid close()."""
+    path = tmp_path / "out.wav"
+    with WavWriter(path) as writer:
+        for chunk in iter_frames(_tone().tobytes(), 640):
+            writer.write(chunk)
+    assert path.read_bytes()[:44] == wav_header(len(_tone().tobytes()))
+
+    # Udda längd: utfyllnadsbyte räknas in i RIFF-storleken men inte i data-storleken
+    odd = tmp_path / "odd.wav"
+    with WavWriter(odd) as writer:
+        writer.write(b"\x01\x02\x03")
+    raw = odd.read_bytes()
+    assert struct.unpack_from("<I", raw, 4)[0] == len(raw) - 8
+    assert struct.unpack_from("<I", raw, 40)[0] == 3
+
+def test_frame_splitter_reassembles_arbitrary_chunks():
+    """Testar att godtyckliga chunkar blir frames med fast storlek och rest."""
+    audio = bytes(range(256)) * 10
+    splitter = FrameSplitter(640)
+    frames = []
+    for start in range(0, len(audio), 333):
+        frames.extend(splitter.push(audio[start:start + 333]))
+
+    assert [len(f) for f in frames] == [640] * 4
+    assert b"".join(bytes(f) for f in frames) + splitter.flush() == audio
+    assert isinstance(next(iter_frames(audio, 640)), memoryview)
+    assert [len(f) for f in iter_frames(audio[:1000], 640, partial=False)] == [640]
+
+def test_levels_are_vectorized_and_exact():
+    """Testar RMS, peak (även −32768) och nivåer per fönster."""
+    tone = _tone(amplitude=10000)
+    assert rms(tone) == pytest.approx(10000 / np.sqrt(2), rel=1e-3)
+    assert peak(np.array([-32768, 5], dtype="<i2")) == 32768
+    buffer = bytearray(tone.tobytes())
+    assert np.shares_memory(as_samples(buffer), np.frombuffer(buffer, dtype=np.uint8))  # ingen kopia
+    assert len(as_samples(b"\x00\x01\x02")) == 1
+
+    rms_values, peaks = window_levels(np.concatenate([tone, np.zeros(800, dtype="<i2")]), 800)
+    assert len(rms_values) == 11
+    assert rms_values[-1] == 0 and peaks[0] >= 9990
+
+def test_recording_exports_track_as_wav(tmp_path):
+    """Testar att ett inspelat spår kan skrivas som WAV strömmande."""
+    writer = RecordingWriter(tmp_path, segment_bytes=1000)
+    rec = writer.start_session("tts", recording_id="wav")
+    audio = _tone(0.1).tobytes()
+    for chunk in iter_frames(audio, 640):
+        rec.audio(TRACK_OUT, bytes(chunk))
+    rec.close()
+    assert writer.flush()
+
+    path = Recording.find("wav", tmp_path).export_wav(TRACK_OUT)
+    with wave.open(str(path), "rb") as wav:
+        assert wav.readframes(wav.getnframes()) == audio
@@ -0,0 +1,79 @@
+import pytest
+import json
+import numpy as np
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+
+from app.audio import LevelMeter, window_levels
+from app.debug_store import SessionBuffers, store
+from app.main import app
+from app.profiles import Profile
+from app.tts.engine_router import TTSRouter
+from app.tts.engines import LocalTTSEngine
+
+def _tone(seconds=0.5, amplitude=10000, rate=16000):
+    t = np.arange(int(rate * seconds)) / rate
+    return (amplitude * np.sin(2 * np.pi * 440 * t)).astype("<i2")
+
+def test_chunked_push_matches_whole_signal():
+    """Testar att godtyckliga chunkar (även udda byte-längder) ger samma nivåer som hela signalen."""
+    audio = np.concatenate([_tone(), np.zeros(1600, dtype="<i2")])
+    data = audio.tobytes()
+    whole, chunked = LevelMeter(), LevelMeter()
+    whole.push(data)
+    for start in range(0, len(data), 333):
+        chunked.push(data[start:start + 333])
+
+    assert chunked.snapshot() == whole.snapshot()
+    rms_values, peaks = window_levels(audio, 320)
+    assert whole.windows == len(rms_values) == 30
+    assert whole.peak == peaks.max()
+    assert whole.sum_sq == pytest.approx(float((rms_values ** 2).sum() * 320))
+    assert whole.snapshot()["silence_ratio"] == round(5 / 30, 3)
+
+def test_clipping_dc_offset_and_partial_window():
+    """Testar klippning (båda polariteter), DC-offset och att en ofullständig rest väntar."""
+    meter = LevelMeter()
+    clipped = np.full(320, 1000, dtype="<i2")
+    clipped[:8] = 32767
+    clipped[8:16] = -32768
+    meter.push(clipped.tobytes())
+    meter.push(np.full(100, 1000, dtype="<i2").tobytes())
+
+    levels = meter.snapshot()
+    assert levels["windows"] == 1 and levels["duration_sec"] == 0.02
+    assert levels["clipping_ratio"] == round(16 / 320, 5)
+    assert levels["peak_dbfs"] == 0.0
+    assert levels["dc_offset"] == pytest.approx((304 * 1000 - 8) / 320 / 32768, abs=1e-5)
+    assert LevelMeter().snapshot()["rms_dbfs"] is None
+
+def test_levels_survive_shared_backend_roundtrip():
+    """Testar att räknarna följer med sessionen via to_dict/from_dict (delad backend)."""
+    buffers = SessionBuffers()
+    buffers.audio_in.push(_tone().tobytes())
+    assert buffers.output_meter(Profile(output_format="mp3_44100_128").pcm_sample_rate) is None
+    buffers.output_meter(Profile(output_format="pcm_24000").pcm_sample_rate).push(_tone(rate=24000).tobytes())
+
+    restored = SessionBuffers.from_dict(json.loads(json.dumps(buffers.to_dict())))
+    assert restored.audio_levels() == buffers.audio_levels()
+    assert restored.audio_out.sample_rate == 24000
+
+def test_audio_levels_endpoint_and_tts_done_message():
+    """Testar /debug/audio-levels och att TTS-svarets "done" har nivåer för förfrågans ljud."""
+    sid = store.new_session()
+    store.get_or_create(sid).audio_in.push(_tone().tobytes())
+    body = TestClient(app).get("/debug/audio-levels", params={"session_id": sid}).json()
+    assert body["in"]["rms_dbfs"] == pytest.approx(-13.3, abs=0.1)
+    assert body["out"]["windows"] == 0
+
+    with patch("app.endpoints.tts_ws.tts_router", TTSRouter([LocalTTSEngine()])):
+        with TestClient(app).websocket_connect("/ws/tts") as ws:
+            ws.send_json({"type": "tts_request", "text": "Hej"})
+            while True:
+                frame = ws.receive()
+                if frame.get("text") and (message := json.loads(frame["text"])).get("stage") == "done":
+                    break
+
+    levels = message["audio_levels"]
+    assert levels["windows"] > 0 and levels["duration_sec"] > 0
+    assert levels["clipping_ratio"] == 0.0
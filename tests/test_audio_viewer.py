@@ -0,0 +1,99 @@
+import pytest
+import io
+import wave
+import numpy as np
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+
+from app.endpoints import audio_viewer
+from app.endpoints.audio_viewer import wav_header, compute_peaks
+from app.main import app
+
+@pytest.fixture
+def audio_dir(tmp_path):
+    """Katalog med en PCM-fil (en sekund sinus) och cache-nollställning."""
+    t = np.arange(16000) / 16000
+    pcm = (0.5 * 32767 * np.sin(2 * np.pi * 5 * t)).astype("<i2").tobytes()
+    (tmp_path / "tone.pcm").write_bytes(pcm)
+    with patch.object(audio_viewer, "AUDIO_DIR", tmp_path), \
+         patch.object(audio_viewer, "_listing", audio_viewer._ListingCache()):
+        audio_viewer._peaks_cache.clear()
+        yield tmp_path, pcm
+
+def test_wav_header_matches_wave_module():
+    """Testar att den genererade headern är identisk med wave-modulens."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(16000)
+        wav_file.writeframes(b"\x00\x00" * 100)
+    assert wav_header(200) == buffer.getvalue()[:44]
+
+def test_pcm_served_as_wav(audio_dir):
+    """Testar att PCM strömmas som spelbar WAV."""
+    _, pcm = audio_dir
+    response = TestClient(app).get("/api/download-audio/tone.pcm")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "audio/wav"
+    assert response.headers["accept-ranges"] == "bytes"
+    with wave.open(io.BytesIO(response.content), "rb") as wav_file:
+        assert wav_file.getframerate() == 16000
+        assert wav_file.readframes(wav_file.getnframes()) == pcm
+
+    raw = TestClient(app).get("/api/download-audio/tone.pcm?raw=true")
+    assert raw.content == pcm
+
+def test_range_requests(audio_dir):
+    """Testar Range-förfrågningar över header/data-gränsen och suffix-range."""
+    _, pcm = audio_dir
+    client = TestClient(app)
+    full = wav_header(len(pcm)) + pcm
+
+    response = client.get("/api/download-audio/tone.pcm", headers={"Range": "bytes=40-99"})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes 40-99/{len(full)}"
+    assert response.content == full[40:100]
+
+    response = client.get("/api/download-audio/tone.pcm", headers={"Range": "bytes=-10"})
+    assert response.content == full[-10:]
+
+    response = client.get("/api/download-audio/tone.pcm", headers={"Range": f"bytes={len(full)}-"})
+    assert response.status_code == 416
+
+def test_rejects_path_traversal(audio_dir):
+    """Testar att sökvägar utanför katalogen avvisas."""
+    client = TestClient(app)
+    assert client.get("/api/download-audio/..%2Fsecret.pcm").status_code in (400, 404)
+    assert client.get("/api/download-audio/finns-inte.pcm").status_code == 404
+
+def test_listing_is_cached_until_directory_changes(audio_dir):
+    """Testar att listan cachas och byggs om när en fil läggs till."""
+    directory, _ = audio_dir
+    client = TestClient(app)
+    with patch.object(audio_viewer._ListingCache, "_scan", wraps=audio_viewer._ListingCache._scan) as scan:
+        first = client.get("/api/audio-files").json()
+        client.get("/api/audio-files")
+        assert scan.call_count == 1
+        assert first["files"][0]["duration_sec"] == 1.0
+
+        (directory / "new.pcm").write_bytes(b"\x00\x00" * 10)
+        second = client.get("/api/audio-files").json()
+        assert scan.call_count == 2
+        assert {f["name"] for f in second["files"]} == {"tone.pcm", "new.pcm"}
+
+def test_peaks(audio_dir):
+    """Testar vågformsdata: rätt antal punkter och amplitud, samt cache."""
+    directory, _ = audio_dir
+    peaks = compute_peaks(directory / "tone.pcm", 50)
+    assert peaks["points"] == 50
+    assert peaks["duration_sec"] == 1.0
+    assert max(peaks["max"]) == pytest.approx(0.5, abs=0.01)
+    assert min(peaks["min"]) == pytest.approx(-0.5, abs=0.01)
+
+    client = TestClient(app)
+    response = client.get("/api/audio-peaks/tone.pcm?points=50").json()
+    assert response["max"] == peaks["max"]
+    with patch.object(audio_viewer, "compute_peaks") as compute:
+        client.get("/api/audio-peaks/tone.pcm?points=50")
+        compute.assert_not_called()
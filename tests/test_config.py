@@ -0,0 +1,80 @@
+import pytest
+import asyncio
+import os
+import signal
+from fastapi.testclient import TestClient
+
+from app import config
+from app.config import Settings, install_reload_handler, reload_settings, settings
+from app.recording import recording_enabled
+from app.tts.engine_router import hedging_enabled_by_default
+from app.tts.paced_sender import PacedAudioSender, pacing_enabled_by_default
+from app.stt.audio_to_event import AudioToEventClient
+from app.main import app
+
+@pytest.fixture
+def restore_settings():
+    saved = settings.model_copy()
+    yield
+    settings.update_from(saved)
+
+def test_settings_are_typed_from_env():
+    """Testar att miljövariabler tolkas till typade fält och att okända ignoreras."""
+    s = Settings.from_env({"COMMIT_INTERVAL_MS": "40", "ADD_BETA_HEADER": "false", "OKAND": "x"})
+    assert s.commit_interval_ms == 40
+    assert s.add_beta_header is False
+    assert s.input_language == "sv"
+
+def test_reload_updates_shared_instance_in_place(restore_settings):
+    """Testar att omläsning uppdaterar samma objekt som sessioner redan håller."""
+    session_reference = settings
+    changed = reload_settings({"COMMIT_INTERVAL_MS": "75", "INPUT_LANGUAGE": "en"})
+
+    assert session_reference.commit_interval_ms == 75
+    assert changed["input_language"] == ("sv", "en")
+    assert AudioToEventClient().language == "en"
+
+def test_invalid_reload_keeps_current_settings(restore_settings):
+    """Testar att ogiltiga värden avvisas och att nuvarande inställningar behålls."""
+    before = settings.model_dump()
+    assert reload_settings({"COMMIT_INTERVAL_MS": "snabbt"}) == {}
+    assert settings.model_dump() == before
+
+@pytest.mark.asyncio
+async def test_sighup_reloads_settings(restore_settings, monkeypatch):
+    """Testar att SIGHUP läser om inställningarna utan omstart."""
+    monkeypatch.setitem(config._PROCESS_ENV, "COMMIT_INTERVAL_MS", "33")
+    if not install_reload_handler():
+        pytest.skip("SIGHUP stöds inte här")
+    try:
+        os.kill(os.getpid(), signal.SIGHUP)
+        for _ in range(50):
+            if settings.commit_interval_ms == 33:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        asyncio.get_running_loop().remove_signal_handler(signal.SIGHUP)
+    assert settings.commit_interval_ms == 33
+
+def test_config_endpoint_exposes_settings_without_secrets(restore_settings):
+    """Testar att /config svarar med inställningarna men utan API-nycklar."""
+    reload_settings({"OPENAI_API_KEY": "sk-hemlig", "COMMIT_INTERVAL_MS": "120"})
+    response = TestClient(app).get("/config")
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["commit_interval_ms"] == 120
+    assert body["settings_version"] >= 2
+    assert "sk-hemlig" not in response.text
+
+def test_runtime_knobs_follow_reload(restore_settings):
+    """Testar att pacing, hedging och inspelning läses via settings och slår igenom vid omläsning."""
+    reload_settings({"TTS_PACING": "true", "TTS_PACING_FRAME_MS": "20", "TTS_HEDGING": "true",
+                     "RECORD_SESSIONS": "true", "ELEVENLABS_API_KEY": "xi-hemlig"})
+    assert pacing_enabled_by_default() and hedging_enabled_by_default() and recording_enabled()
+    assert PacedAudioSender(None)._frame_bytes == 640
+
+    response = TestClient(app).get("/config")
+    runtime = response.json()["runtime"]
+    assert runtime["tts_pacing"] is True and runtime["record_sessions"] is True
+    assert "elevenlabs_api_key" not in runtime and "xi-hemlig" not in response.text
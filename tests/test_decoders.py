@@ -0,0 +1,162 @@
+import pytest
+import threading
+import numpy as np
+from types import SimpleNamespace
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+
+from app.stt import decoders
+from app.stt.decoders import (
+    DecodeStage, MulawDecoder, Pcm16Decoder, UnsupportedCodec, WebMDemuxer, available_codecs, create_decoder,
+)
+from app.replay import RecordedRealtimeClient
+from app.main import app
+
+class FakeOpusDecoder:
+    """Ersätter opuslib.Decoder: varje paket blir 4 samples med paketets första byte."""
+
+    def __init__(self, sample_rate, channels):
+        assert (sample_rate, channels) == (16000, 1)
+
+    def decode(self, packet, frame_size):
+        return np.full(4, packet[0], dtype="<i2").tobytes()
+
+fake_opuslib = SimpleNamespace(Decoder=FakeOpusDecoder)
+
+def _element(element_id: bytes, payload: bytes) -> bytes:
+    assert len(payload) < 127
+    return element_id + bytes([0x80 | len(payload)]) + payload
+
+def _webm_stream() -> bytes:
+    """WebM som MediaRecorder skriver: Segment/Cluster med okänd storlek, SimpleBlock och BlockGroup."""
+    return b"".join([
+        _element(b"\x1a\x45\xdf\xa3", b"\x42\x82\x84webm"),        # EBML-header
+        b"\x18\x53\x80\x67\x01\xff\xff\xff\xff\xff\xff\xff",        # Segment, okänd storlek
+        _element(b"\x16\x54\xae\x6b", b"\xae\x83\xd7\x81\x01"),     # Tracks (hoppas över)
+        b"\x1f\x43\xb6\x75\xff",                                    # Cluster, okänd storlek
+        _element(b"\xe7", b"\x00"),                                 # Timecode
+        _element(b"\xa3", b"\x81\x00\x00\x80\x01opus"),             # SimpleBlock
+        _element(b"\xa3", b"\x81\x00\x14\x80\x02opus"),
+        _element(b"\xa0", _element(b"\xa1", b"\x81\x00\x28\x00\x03opus")),  # BlockGroup/Block
+        _element(b"\xa3", b"\x81\x00\x3c\x82\x01\x04\x05"),         # Xiph-lacing, hoppas över
+    ])
+
+def test_mulaw_decodes_and_upsamples():
+    """Testar μ-law → PCM16 och uppsampling 8 → 16 kHz över chunk-gränser."""
+    pcm_8k = (np.sin(np.arange(800) / 8) * 12000).astype("<i2")
+    encoded = MulawDecoder.encode(pcm_8k.tobytes())
+    assert len(encoded) == 800
+
+    decoder = MulawDecoder()
+    out = np.frombuffer(decoder.decode(encoded[:333]) + decoder.decode(encoded[333:]), dtype="<i2")
+    assert out.size == 1600
+    # Udda samples är de avkodade originalen (μ-law-fel < ~3 %)
+    assert np.max(np.abs(out[1::2].astype(int) - pcm_8k)) < 400
+    # Jämna samples interpoleras, även över chunk-gränsen
+    assert abs(int(out[666]) * 2 - int(out[665]) - int(out[667])) <= 2
+
+def test_webm_demuxer_extracts_packets_across_chunks():
+    """Testar att demuxern hittar Opus-paketen oavsett hur strömmen delas upp."""
+    stream = _webm_stream()
+    expected = [b"\x01opus", b"\x02opus", b"\x03opus"]
+
+    whole = WebMDemuxer()
+    assert whole.feed(stream) == expected
+    assert whole.laced_blocks_skipped == 1
+
+    bytewise = WebMDemuxer()
+    packets = []
+    for i in range(len(stream)):
+        packets += bytewise.feed(stream[i:i + 1])
+    assert packets == expected
+
+def test_create_decoder_rejects_unknown_and_unavailable_codecs():
+    """Testar att saknat codec ger PCM16 men att okända codecs och otillgänglig Opus avvisas."""
+    assert isinstance(create_decoder(None), Pcm16Decoder)
+    assert isinstance(create_decoder("PCM16"), Pcm16Decoder)
+    for codec in ("flac", "aac", "webm_opus"):
+        with pytest.raises(UnsupportedCodec):
+            create_decoder(codec)
+    with patch.object(decoders, "opuslib", None):
+        assert "opus" not in available_codecs()
+        with pytest.raises(UnsupportedCodec):
+            create_decoder("webm-opus")
+    with patch.object(decoders, "opuslib", fake_opuslib):
+        assert available_codecs() == ["pcm16", "mulaw", "opus", "webm-opus"]
+        decoder = create_decoder("webm-opus")
+        assert decoder.describe()["container"] == "webm"
+        assert decoder.decode(_webm_stream()) == np.repeat(np.array([1, 2, 3], dtype="<i2"), 4).tobytes()
+
+@pytest.mark.asyncio
+async def test_decode_runs_off_event_loop_in_order():
+    """Testar att avkodningen körs i trådpoolen och att chunkarna kommer i ordning."""
+    threads = []
+
+    class RecordingDecoder(MulawDecoder):
+        def decode(self, data):
+            threads.append(threading.current_thread().name)
+            return super().decode(data)
+
+    stage = DecodeStage(RecordingDecoder())
+    chunks = [MulawDecoder.encode(np.full(160, i * 100, dtype="<i2").tobytes()) for i in range(5)]
+    results = [await stage.decode(chunk) for chunk in chunks]
+
+    assert all(name.startswith("stt-decode") for name in threads)
+    assert [np.frombuffer(r, dtype="<i2")[-1] for r in results] == [
+        np.frombuffer(MulawDecoder().decode(c), dtype="<i2")[-1] for c in chunks
+    ]
+    assert stage.stats()["compression_ratio"] == 4.0
+
+@pytest.mark.asyncio
+async def test_decode_errors_drop_chunk():
+    """Testar att trasiga chunkar räknas och släpps utan att sessionen avbryts."""
+    class BrokenDecoder(MulawDecoder):
+        def decode(self, data):
+            raise ValueError("trasig frame")
+
+    stage = DecodeStage(BrokenDecoder())
+    assert await stage.decode(b"\x00" * 10) == b""
+    assert stage.errors == 1
+
+def test_transcribe_decodes_mulaw_ingest():
+    """Testar att /ws/transcribe?codec=mulaw avkodar till PCM16 innan ljudet skickas till Realtime."""
+    client = RecordedRealtimeClient([])
+    with patch("app.endpoints.stt_ws.realtime_client_factory", lambda: client):
+        with TestClient(app).websocket_connect("/ws/transcribe?codec=mulaw") as ws:
+            ready = ws.receive_json()
+            ws.send_bytes(b"\xff" * 160)
+            ws.send_bytes(b"\x80" * 160)
+            ws.send_text("ping")
+            while ws.receive_text() != "pong":
+                pass
+
+    assert ready["audio_in"]["encoding"] == "mulaw"
+    assert ready["audio_in"]["sample_rate_hz"] == 8000
+    assert "mulaw" in ready["audio_in"]["codecs_available"]
+    assert client.chunks_received == 2
+    assert client.bytes_received == 2 * 160 * 2 * 2  # 2x uppsampling, 2 bytes/sample
+
+def test_transcribe_rejects_unavailable_codec():
+    """Testar att /ws/transcribe?codec=opus utan libopus ger fel och stängs (inget ljud som PCM16)."""
+    client = RecordedRealtimeClient([])
+    with patch.object(decoders, "opuslib", None), \
+         patch("app.endpoints.stt_ws.realtime_client_factory", lambda: client):
+        with TestClient(app).websocket_connect("/ws/transcribe?codec=opus") as ws:
+            error = ws.receive_json()
+            assert ws.receive()["type"] == "websocket.close"
+
+    assert error["reason"] == "unsupported_codec" and error["codec"] == "opus"
+    assert "opus" not in error["codecs_available"]
+    assert client.chunks_received == 0
+
+def test_transcribe_rejects_unknown_codec():
+    """Testar att /ws/transcribe?codec=aac stängs med 1003 i stället för att ljudet skickas som PCM16."""
+    client = RecordedRealtimeClient([])
+    with patch("app.endpoints.stt_ws.realtime_client_factory", lambda: client):
+        with TestClient(app).websocket_connect("/ws/transcribe?codec=aac") as ws:
+            error = ws.receive_json()
+            closed = ws.receive()
+
+    assert error["reason"] == "unsupported_codec" and error["codec"] == "aac"
+    assert closed == {"type": "websocket.close", "code": 1003, "reason": ""}
+    assert client.chunks_received == 0
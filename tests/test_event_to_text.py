@@ -0,0 +1,72 @@
+from app.debug_store import SessionBuffers
+from app.stt.event_to_text import TranscriptState, process_realtime_event, _HANDLERS
+
+def test_handlers_are_registered_per_event_type():
+    """Testar att dispatch-tabellen har handlers för de kända eventtyperna."""
+    for event_type in (
+        "error",
+        "session.updated",
+        "conversation.item.input_audio_transcription.delta",
+        "conversation.item.input_audio_transcription.completed",
+        "response.audio_transcript.delta",
+        "response.audio_transcript.completed",
+        "response.output_text.delta",
+    ):
+        assert event_type in _HANDLERS
+
+def test_unknown_events_are_counted_and_ignored():
+    """Testar att okända events räknas och loggas men inte ger något resultat."""
+    state = TranscriptState()
+    buffers = SessionBuffers()
+    assert state.process({"type": "rate_limits.updated"}, buffers) is None
+    assert state.process({"type": "rate_limits.updated"}, buffers) is None
+    assert state.process({}, buffers) is None
+    assert state.counters == {"rate_limits.updated": 2, None: 1}
+    assert list(buffers.rt_events) == ["rate_limits.updated", "rate_limits.updated", "None"]
+
+def test_overlapping_items_keep_separate_text():
+    """Testar att deltas för olika item_id inte blandas ihop."""
+    state = TranscriptState()
+    delta = "conversation.item.input_audio_transcription.delta"
+    state.process({"type": delta, "item_id": "a", "delta": "Hej"})
+    state.process({"type": delta, "item_id": "b", "delta": "Nästa"})
+    result = state.process({"type": delta, "item_id": "a", "delta": " där"})
+
+    assert result["text"] == "Hej där" and result["delta"] == " där"
+    assert result["item_id"] == "a" and result["is_final"] is False
+    assert state.items == {"a": "Hej där", "b": "Nästa"}
+
+def test_completed_item_is_final_and_released():
+    """Testar att completed ger final (även om texten redan kommit som partials) och släpper itemet."""
+    state = TranscriptState()
+    state.process({"type": "conversation.item.input_audio_transcription.delta", "item_id": "a", "delta": "Hej där"})
+    result = state.process({
+        "type": "conversation.item.input_audio_transcription.completed", "item_id": "a", "transcript": "Hej där",
+    })
+    assert result["is_final"] is True
+    assert result["text"] == "Hej där" and result["delta"] == ""
+    assert state.items == {}
+
+    # Transkript i item.content (äldre format)
+    result = state.process({
+        "type": "conversation.item.input_audio_transcription.completed",
+        "item": {"content": [{"transcript": "Från item"}]},
+    })
+    assert result["text"] == result["delta"] == "Från item"
+
+def test_error_and_info_events():
+    """Testar error- och session.updated-events."""
+    state = TranscriptState()
+    assert state.process({"type": "error", "error": {"code": "x"}}) == {"type": "error", "detail": {"code": "x"}}
+    assert state.process({"type": "session.updated"})["type"] == "info"
+
+def test_process_realtime_event_keeps_stateless_api():
+    """Testar att den gamla funktionen fungerar med last_text som tidigare."""
+    buffers = SessionBuffers()
+    result = process_realtime_event({"type": "response.output_text.delta", "delta": " där"}, "Hej", buffers)
+    assert result["text"] == "Hej där" and result["delta"] == " där"
+
+    result = process_realtime_event(
+        {"type": "conversation.item.input_audio_transcription.completed", "transcript": "Annat"}, "Hej", buffers
+    )
+    assert result["text"] == result["delta"] == "Annat" and result["is_final"] is True
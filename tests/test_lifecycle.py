@@ -0,0 +1,93 @@
+import pytest
+import asyncio
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from app.lifecycle import LifecycleManager
+from app.main import app
+
+@pytest.mark.asyncio
+async def test_drain_waits_for_sessions_to_finish():
+    """Testar att drain varnar sessioner och väntar tills de avslutats."""
+    manager = LifecycleManager()
+    notified = []
+
+    async def on_drain(deadline_ms):
+        notified.append(deadline_ms)
+
+    handle = manager.register("tts", "s1", on_drain=on_drain)
+    handle.upstream_opened("elevenlabs")
+    assert manager.status()["upstream_connections"] == {"elevenlabs": 1}
+
+    drain = manager.start_draining(timeout_sec=1.0)
+    await asyncio.sleep(0.05)
+    assert manager.draining and not manager.accepting
+    assert notified and 0 < notified[0] <= 1000
+
+    handle.upstream_closed("elevenlabs")
+    manager.unregister(handle)
+    assert await drain is True
+    assert manager.status()["active_sessions"] == 0
+
+@pytest.mark.asyncio
+async def test_drain_closes_sessions_at_deadline():
+    """Testar att kvarvarande sessioner stängs när deadline passerats."""
+    manager = LifecycleManager()
+    closed = []
+
+    async def on_close():
+        closed.append(True)
+        manager.unregister(handle)
+
+    handle = manager.register("transcribe", "s1", on_close=on_close)
+    assert await manager.drain(timeout_sec=0.05) is False
+    assert closed == [True]
+    assert manager.active_sessions == 0
+
+@pytest.mark.asyncio
+async def test_drain_without_sessions_is_immediate():
+    """Testar att drain utan sessioner blir klar direkt och är idempotent."""
+    manager = LifecycleManager()
+    first = manager.start_draining(timeout_sec=5.0)
+    assert manager.start_draining() is first
+    assert await asyncio.wait_for(first, 1.0) is True
+
+def test_new_sessions_rejected_and_healthz_reports_draining():
+    """Testar att nya WebSocket-sessioner avvisas och att /healthz ger 503 under drain."""
+    manager = LifecycleManager()
+    manager.draining = True
+
+    with patch("app.endpoints.tts_ws.lifecycle", manager), patch("app.endpoints.health.lifecycle", manager):
+        client = TestClient(app)
+
+        response = client.get("/healthz")
+        assert response.status_code == 503
+        assert response.json()["draining"] is True
+
+        with client.websocket_connect("/ws/tts") as ws:
+            message = ws.receive_json()
+            assert message["type"] == "error"
+            assert message["reason"] == "draining"
+            with pytest.raises(WebSocketDisconnect) as exc:
+                ws.receive_json()
+            assert exc.value.code == 1012
+
+def test_tts_session_gets_draining_message():
+    """Testar att en pågående TTS-session får server.draining och sedan stängs."""
+    manager = LifecycleManager()
+
+    with patch("app.endpoints.tts_ws.lifecycle", manager):
+        client = TestClient(app)
+        with client.websocket_connect("/ws/tts") as ws:
+            assert ws.receive_json()["stage"] == "ready"
+            assert manager.active_sessions == 1
+
+            ws.portal.call(manager.drain, 0.2)
+            message = ws.receive_json()
+            assert message["type"] == "server.draining"
+            assert message["deadline_ms"] <= 200
+            with pytest.raises(WebSocketDisconnect) as exc:
+                ws.receive_json()
+            assert exc.value.code == 1012
+        assert manager.active_sessions == 0
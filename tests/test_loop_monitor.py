@@ -0,0 +1,78 @@
+import pytest
+import asyncio
+import time
+from fastapi.testclient import TestClient
+
+from app.loop_monitor import (
+    CpuAccounting, LoopLagSampler, LoopMonitor, SlowCallbackWatchdog, endpoint_label,
+)
+from app.main import app
+
+def _monitor():
+    return LoopMonitor(LoopLagSampler(interval_sec=0.02), SlowCallbackWatchdog(threshold_ms=50), CpuAccounting())
+
+async def blocking_handler():
+    endpoint_label.set("websocket:/ws/test")
+    await asyncio.sleep(0.1)
+    time.sleep(0.3)  # Blockerar hela loopen
+
+@pytest.mark.asyncio
+async def test_slow_callback_records_coroutine_and_stack():
+    """Testar att en blockerande coroutine fångas med namn, endpoint och stack."""
+    monitor = _monitor()
+    monitor.start()
+    try:
+        await asyncio.create_task(blocking_handler())
+        await asyncio.sleep(0.1)  # Låt hjärtslaget registrera att blockeringen är över
+    finally:
+        await monitor.stop()
+
+    stalls = monitor.watchdog.snapshot()["recent"]
+    assert len(stalls) == 1
+    stall = stalls[0]
+    assert stall["coroutine"] == "blocking_handler"
+    assert stall["endpoint"] == "websocket:/ws/test"
+    assert stall["duration_ms"] >= 150
+    assert any("time.sleep(0.3)" in line for line in stall["stack"])
+    assert monitor.lag.max_lag_ms >= 150
+
+@pytest.mark.asyncio
+async def test_cpu_accounting_per_endpoint():
+    """Testar att CPU-tid bokförs på endpoint-etiketten och ärvs av barn-tasks."""
+    monitor = _monitor()
+    monitor.start()
+
+    async def busy(label):
+        endpoint_label.set(label)
+
+        async def child():
+            sum(i * i for i in range(200_000))
+
+        await asyncio.create_task(child())
+
+    try:
+        await asyncio.gather(asyncio.create_task(busy("websocket:/ws/tts")), asyncio.create_task(busy("http:/api/test")))
+    finally:
+        await monitor.stop()
+
+    cpu = monitor.snapshot()["cpu_by_endpoint"]
+    assert cpu["websocket:/ws/tts"]["cpu_ms"] > 1
+    assert cpu["http:/api/test"]["cpu_ms"] > 1
+    assert cpu["websocket:/ws/tts"]["steps"] >= 2
+
+@pytest.mark.asyncio
+async def test_task_factory_is_restored():
+    """Testar att task-factory återställs när monitorn stoppas."""
+    loop = asyncio.get_running_loop()
+    before = loop.get_task_factory()
+    monitor = _monitor()
+    monitor.start()
+    assert loop.get_task_factory() is not before
+    await monitor.stop()
+    assert loop.get_task_factory() is before
+
+def test_debug_loop_endpoint():
+    """Testar att /debug/loop exponerar lag, långsamma anrop och CPU per endpoint."""
+    response = TestClient(app).get("/debug/loop")
+    assert response.status_code == 200
+    assert set(response.json()) == {"lag", "slow_callbacks", "cpu_by_endpoint"}
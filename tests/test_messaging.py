@@ -0,0 +1,100 @@
+import pytest
+import asyncio
+import json
+import orjson
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+
+from app.messaging import (
+    FrontendChannel, MessageSchema, STT_PARTIAL, PONG, packb, send_message, send_schema,
+)
+from app.replay import RecordedRealtimeClient
+from app.tts.paced_sender import PacedAudioSender
+from app.main import app
+
+def test_schema_matches_generic_encoding():
+    """Testar att förkompilerade scheman ger samma JSON som generisk kodning."""
+    for text in ["Hej", "åäö \"citat\" \n ny rad", ""]:
+        assert STT_PARTIAL.encode(text) == orjson.dumps({"type": "stt.partial", "text": text})
+    schema = MessageSchema("turn.done", "turn", "latency_ms")
+    assert json.loads(schema.encode(2, {"total_ms": 1.5})) == {"type": "turn.done", "turn": 2, "latency_ms": {"total_ms": 1.5}}
+    assert PONG.encode() == b'{"type":"pong"}'
+
+def test_msgpack_encoding():
+    """Testar MessagePack-kodningen mot kända byte-sekvenser."""
+    assert packb({"a": 1}) == b"\x81\xa1a\x01"
+    assert packb([None, True, False, -1]) == b"\x94\xc0\xc3\xc2\xff"
+    assert packb(300) == b"\xcd\x01\x2c"
+    assert packb(-200) == b"\xd1\xff\x38"
+    assert packb(1.5) == b"\xcb\x3f\xf8\x00\x00\x00\x00\x00\x00"
+    assert packb("x" * 40) == b"\xd9\x28" + b"x" * 40
+    assert packb(b"\x00\x01") == b"\xc4\x02\x00\x01"
+    assert STT_PARTIAL.encode_msgpack("åä") == packb({"type": "stt.partial", "text": "åä"})
+
+@pytest.mark.asyncio
+async def test_channel_frames_json_and_msgpack(mock_websocket):
+    """Testar att kanalen skickar text-frames för JSON och binära för MessagePack."""
+    await FrontendChannel(mock_websocket).send_schema(STT_PARTIAL, "Hej")
+    mock_websocket.send_text.assert_called_once_with('{"type":"stt.partial","text":"Hej"}')
+
+    await FrontendChannel(mock_websocket, "msgpack").send({"type": "info"})
+    mock_websocket.send_bytes.assert_called_once_with(packb({"type": "info"}))
+
+    with pytest.raises(ValueError):
+        FrontendChannel(mock_websocket, "xml")
+
+@pytest.mark.asyncio
+async def test_batchable_messages_are_batched(mock_websocket):
+    """Testar att debug-meddelanden samlas i en batch som skickas efter batch_ms."""
+    channel = FrontendChannel(mock_websocket, batch_ms=10)
+    for i in range(3):
+        await channel.send({"type": "debug", "n": i}, batchable=True)
+    mock_websocket.send_text.assert_not_called()
+
+    await asyncio.sleep(0.05)
+    mock_websocket.send_text.assert_called_once()
+    batch = json.loads(mock_websocket.send_text.call_args[0][0])
+    assert batch == {"type": "batch", "messages": [{"type": "debug", "n": 0}, {"type": "debug", "n": 1}, {"type": "debug", "n": 2}]}
+    assert channel.messages_sent == 3 and channel.frames_sent == 1
+
+@pytest.mark.asyncio
+async def test_non_batchable_message_flushes_in_order(mock_websocket):
+    """Testar att vanliga meddelanden skickas efter redan batchade (ordningen behålls)."""
+    channel = FrontendChannel(mock_websocket, batch_ms=1000)
+    await channel.send({"type": "debug"}, batchable=True)
+    await channel.send_schema(STT_PARTIAL, "Hej")
+    sent = [json.loads(call.args[0])["type"] for call in mock_websocket.send_text.call_args_list]
+    assert sent == ["debug", "stt.partial"]
+
+@pytest.mark.asyncio
+async def test_send_helpers_work_with_plain_and_wrapped_sockets(mock_websocket):
+    """Testar att hjälpfunktionerna fungerar med vanlig WebSocket och via wrappers."""
+    await send_message(mock_websocket, {"type": "error", "message": "åäö"})
+    await send_schema(mock_websocket, STT_PARTIAL, "Hej")
+    texts = [call.args[0] for call in mock_websocket.send_text.call_args_list]
+    assert json.loads(texts[0]) == {"type": "error", "message": "åäö"}
+    assert texts[1] == '{"type":"stt.partial","text":"Hej"}'
+
+    mock_websocket.send_text.reset_mock()
+    channel = FrontendChannel(mock_websocket, batch_ms=1000)
+    paced = PacedAudioSender(channel)
+    await send_message(paced, {"type": "debug"}, batchable=True)
+    mock_websocket.send_text.assert_not_called()
+    await channel.close()
+    mock_websocket.send_text.assert_called_once_with('{"type":"debug"}')
+    mock_websocket.close.assert_called_once()
+
+def test_transcribe_negotiates_msgpack_framing():
+    """Testar att /ws/transcribe?framing=msgpack svarar med binära MessagePack-frames."""
+    with patch("app.endpoints.stt_ws.realtime_client_factory", lambda: RecordedRealtimeClient([])):
+        with TestClient(app).websocket_connect("/ws/transcribe?framing=msgpack") as ws:
+            ready = ws.receive_bytes()
+    assert ready.startswith(b"\x85\xa4type\xa5ready")
+    assert b"\xa7framing\xa7msgpack" in ready
+
+def test_tts_keeps_json_framing():
+    """Testar att /ws/tts alltid använder JSON (binära frames är ljud)."""
+    with TestClient(app).websocket_connect("/ws/tts?framing=msgpack&batch_ms=5") as ws:
+        ready = ws.receive_json()
+    assert ready["stage"] == "ready"
+    assert ready["framing"] == "json" and ready["batch_ms"] == 5.0
@@ -0,0 +1,72 @@
+import pytest
+import asyncio
+import time
+from app.tts.paced_sender import PacedAudioSender
+
+BYTES_PER_SEC = 16000 * 2
+
+@pytest.mark.asyncio
+async def test_audio_released_in_realtime(mock_websocket):
+    """Testar att audio släpps i realtidstakt och inte i en skur."""
+    sender = PacedAudioSender(mock_websocket, lead_ms=50, jitter_ms=0, frame_ms=20)
+
+    started = time.monotonic()
+    # 300 ms ljud levererat på en gång
+    await sender.send_bytes(b"\x00" * (BYTES_PER_SEC * 3 // 10))
+    stats = await sender.finish()
+    elapsed = time.monotonic() - started
+
+    # Ljudlängd minus lead: minst ~250 ms
+    assert elapsed >= 0.22
+    assert stats["frames_sent"] == 15
+    assert stats["bytes_sent"] == BYTES_PER_SEC * 3 // 10
+    assert mock_websocket.send_bytes.call_count == 15
+
+@pytest.mark.asyncio
+async def test_frames_preserve_audio_order(mock_websocket):
+    """Testar att frames skickas i ordning och utan att data går förlorad."""
+    sender = PacedAudioSender(mock_websocket, lead_ms=1000, jitter_ms=0, frame_ms=20)
+    audio = bytes(range(256)) * 10
+
+    await sender.send_bytes(audio[:1000])
+    await sender.send_bytes(audio[1000:])
+    await sender.finish()
+
+    sent = b"".join(call.args[0] for call in mock_websocket.send_bytes.call_args_list)
+    assert sent == audio
+
+@pytest.mark.asyncio
+async def test_underrun_counted_when_producer_is_slow(mock_websocket):
+    """Testar att underrun räknas när klientens buffert tar slut."""
+    sender = PacedAudioSender(mock_websocket, lead_ms=0, jitter_ms=0, frame_ms=20)
+
+    # 20 ms ljud, sedan paus längre än ljudet → klienten svälter
+    await sender.send_bytes(b"\x00" * (BYTES_PER_SEC // 50))
+    await asyncio.sleep(0.08)
+    await sender.send_bytes(b"\x00" * (BYTES_PER_SEC // 50))
+    stats = await sender.finish()
+
+    assert stats["underruns"] == 1
+    assert stats["first_playout_delay_ms"] is not None
+
+@pytest.mark.asyncio
+async def test_overrun_applies_backpressure(mock_websocket):
+    """Testar att full server-buffert räknas som overrun och att producenten får vänta."""
+    sender = PacedAudioSender(mock_websocket, lead_ms=0, jitter_ms=0, max_buffer_ms=40, frame_ms=20)
+
+    for _ in range(4):
+        await sender.send_bytes(b"\x00" * (BYTES_PER_SEC // 25))  # 40 ms per chunk
+    stats = await sender.finish()
+
+    assert stats["overruns"] >= 1
+    assert stats["bytes_sent"] == 4 * BYTES_PER_SEC // 25
+
+@pytest.mark.asyncio
+async def test_text_passes_through_immediately(mock_websocket):
+    """Testar att text-meddelanden inte paceas."""
+    sender = PacedAudioSender(mock_websocket)
+
+    await sender.send_text('{"type": "debug"}')
+
+    mock_websocket.send_text.assert_called_once_with('{"type": "debug"}')
+    await sender.finish()
@@ -0,0 +1,94 @@
+import pytest
+import asyncio
+import json
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+
+from app.stt.partial_emitter import PartialEmitter
+from app.replay import RecordedRealtimeClient
+from app.main import app
+
+def _sent(mock_websocket):
+    return [json.loads(call.args[0]) for call in mock_websocket.send_text.call_args_list]
+
+@pytest.mark.asyncio
+async def test_partials_within_window_are_coalesced(mock_websocket):
+    """Testar att partials inom fönstret slås ihop till ett meddelande med senaste texten."""
+    emitter = PartialEmitter(mock_websocket, mode="full", window_ms=20)
+    for text in ("H", "He", "Hej"):
+        emitter.push(text)
+    await asyncio.sleep(0.06)
+
+    assert _sent(mock_websocket) == [{"type": "stt.partial", "text": "Hej", "seq": 1}]
+    assert emitter.superseded == 2 and emitter.sent == 1
+
+@pytest.mark.asyncio
+async def test_delta_mode_sends_increments_and_snapshots(mock_websocket):
+    """Testar inkrementella deltas med seq, snapshot vid omskrivning och periodiskt."""
+    emitter = PartialEmitter(mock_websocket, mode="delta", window_ms=0, snapshot_every=3)
+    for text in ("Hej", "Hej då", "Hej då du", "Hej då du där", "Hallå"):
+        emitter.push(text)
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+
+    assert _sent(mock_websocket) == [
+        {"type": "stt.partial", "text": "Hej", "seq": 1},
+        {"type": "stt.partial.delta", "delta": " då", "seq": 2},
+        {"type": "stt.partial.delta", "delta": " du", "seq": 3},
+        {"type": "stt.partial", "text": "Hej då du där", "seq": 4},  # var 3:e → snapshot
+        {"type": "stt.partial", "text": "Hallå", "seq": 5},  # omskriven text → snapshot
+    ]
+
+@pytest.mark.asyncio
+async def test_slow_client_only_gets_latest_partial(mock_websocket):
+    """Testar att partials som hinner ersättas medan klienten är långsam släpps."""
+    release = asyncio.Event()
+
+    async def slow_send(data):
+        await release.wait()
+
+    mock_websocket.send_text.side_effect = slow_send
+    emitter = PartialEmitter(mock_websocket, mode="full", window_ms=0)
+    emitter.push("Ett")
+    await asyncio.sleep(0.01)  # första sändningen hänger
+    for text in ("Ett två", "Ett två tre", "Ett två tre fyra"):
+        emitter.push(text)
+    release.set()
+    await asyncio.sleep(0.01)
+
+    texts = [m["text"] for m in _sent(mock_websocket)]
+    assert texts == ["Ett", "Ett två tre fyra"]
+    assert emitter.superseded == 2
+
+@pytest.mark.asyncio
+async def test_end_utterance_drops_pending_and_resets(mock_websocket):
+    """Testar att final släpper ej skickade partials och att nästa yttrande börjar med snapshot."""
+    emitter = PartialEmitter(mock_websocket, mode="delta", window_ms=1000)
+    emitter.push("Hej")
+    await emitter.end_utterance()
+    mock_websocket.send_text.assert_not_called()
+
+    emitter.window_sec = 0
+    emitter.push("Nytt")
+    await asyncio.sleep(0.01)
+    assert _sent(mock_websocket) == [{"type": "stt.partial", "text": "Nytt", "seq": 1}]
+    await emitter.close()
+
+def test_transcribe_sends_delta_partials():
+    """Testar att /ws/transcribe?partials=delta skickar snapshot följt av deltas."""
+    events = [
+        (0, {"type": "response.output_text.delta", "delta": "Hej"}),
+        (30, {"type": "response.output_text.delta", "delta": " där"}),
+    ]
+    with patch("app.endpoints.stt_ws.realtime_client_factory", lambda: RecordedRealtimeClient(events)):
+        with TestClient(app).websocket_connect("/ws/transcribe?partials=delta&partial_window_ms=0") as ws:
+            messages = []
+            while len(messages) < 2:
+                message = ws.receive_json()
+                if message["type"].startswith("stt.partial"):
+                    messages.append(message)
+
+    assert messages == [
+        {"type": "stt.partial", "text": "Hej", "seq": 1},
+        {"type": "stt.partial.delta", "delta": " där", "seq": 2},
+    ]
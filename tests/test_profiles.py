@@ -0,0 +1,109 @@
+import pytest
+import json
+import time
+from unittest.mock import AsyncMock, patch
+from fastapi.testclient import TestClient
+
+from app.llm.receive_text_from_stt import get_or_create_conversation
+from app.main import app
+from app.profiles import Profile, ProfileRegistry, activate_profile
+from app.stt.audio_to_event import AudioToEventClient
+from app.tts.engine_router import TTSRouter
+from app.tts.engines import LocalTTSEngine
+from app.tts.paced_sender import PacedAudioSender
+from app.tts.text_to_audio import process_text_to_audio
+
+ACME = {
+    "voice_id": "acme-voice",
+    "tts_model_id": "eleven_turbo_v2_5",
+    "chunk_length_schedule": [120, 160],
+    "system_prompt": "Du är Acmes bokningsassistent.",
+    "llm_model": "gpt-4o-mini",
+    "input_language": "en",
+}
+
+@pytest.fixture
+def registry():
+    registry = ProfileRegistry.from_mapping({"acme": ACME})
+    with patch("app.profiles.profiles", registry):
+        yield registry
+
+def test_payloads_are_precomputed_per_profile():
+    """Testar att init-meddelande, URL och session.update serialiseras en gång per profil."""
+    profile = Profile(name="acme", **ACME)
+
+    init = json.loads(profile.tts_init_message("xi-nyckel"))
+    assert init["generation_config"] == {"chunk_length_schedule": [120, 160]}
+    assert init["xi_api_key"] == "xi-nyckel"
+    assert "/acme-voice/stream-input?model_id=eleven_turbo_v2_5&output_format=pcm_16000" in profile.tts_url
+    assert profile.session_update("en") is profile.session_update("en")
+    assert json.loads(profile.session_update("en"))["session"]["input_audio_transcription"]["language"] == "en"
+    assert profile.with_voice("annan").with_voice("annan") is profile.with_voice("annan")
+
+def test_unknown_profile_falls_back_to_default(registry):
+    """Testar att okänt profilnamn ger standardprofilen och räknas."""
+    assert registry.get("acme").voice_id == "acme-voice"
+    assert registry.get("okänd") is registry.default
+    assert registry.get(None) is registry.default
+    assert registry.snapshot()["unknown_requests"] == 1
+
+@pytest.mark.asyncio
+async def test_active_profile_drives_tts_stt_and_llm(registry):
+    """Testar att vald profil används för ElevenLabs, session.update och system-prompt."""
+    activate_profile("acme")
+
+    with patch("app.tts.text_to_audio.ws_connect") as mock_connect:
+        eleven = AsyncMock()
+        mock_connect.return_value.__aenter__.return_value = eleven
+        eleven.recv = AsyncMock(side_effect=[b"ljud", '{"isFinal": true}'])
+        async for _ in process_text_to_audio(AsyncMock(), "Hej", time.time()):
+            pass
+
+    assert "/acme-voice/" in mock_connect.call_args.args[0]
+    assert json.loads(eleven.send.call_args_list[0].args[0])["generation_config"]["chunk_length_schedule"] == [120, 160]
+    assert AudioToEventClient().language == "en"
+    conversation = get_or_create_conversation("profil-session")
+    assert conversation.messages[0].content == ACME["system_prompt"]
+
+def test_tts_connection_records_latency_per_profile(registry):
+    """Testar /ws/tts?profile= och att TTFB mäts per profil."""
+    with patch("app.endpoints.tts_ws.tts_router", TTSRouter([LocalTTSEngine()])):
+        with TestClient(app).websocket_connect("/ws/tts?profile=acme") as ws:
+            ws.send_json({"type": "tts_request", "text": "Hej"})
+            while True:
+                frame = ws.receive()
+                if frame.get("text") and (message := json.loads(frame["text"])).get("stage") == "done":
+                    break
+
+    assert message["profile"] == "acme"
+    metrics = registry.snapshot()["profiles"]["acme"]["metrics"]
+    assert metrics["sessions"] == 1
+    assert metrics["tts_ttfb_ms"]["count"] == 1
+    assert registry.snapshot()["profiles"]["default"]["metrics"]["sessions"] == 0
+
+def test_output_format_drives_pacing_rate():
+    """Testar att pacingen följer profilens PCM-takt och stängs av för komprimerat format."""
+    registry = ProfileRegistry.from_mapping({
+        "wide": {"output_format": "pcm_24000"},
+        "mp3": {"output_format": "mp3_44100_128"},
+    })
+    assert registry.get("wide").audio_out == {"encoding": "pcm16", "sample_rate_hz": 24000, "channels": 1}
+    assert registry.get("mp3").audio_out == {"encoding": "mp3", "sample_rate_hz": 44100, "channels": 1}
+
+    done = {}
+    with patch("app.profiles.profiles", registry), \
+         patch("app.endpoints.tts_ws.tts_router", TTSRouter([LocalTTSEngine()])), \
+         patch("app.endpoints.tts_ws.PacedAudioSender", wraps=PacedAudioSender) as paced:
+        for name in ("wide", "mp3"):
+            with TestClient(app).websocket_connect(f"/ws/tts?profile={name}&pacing=true") as ws:
+                ws.send_json({"type": "tts_request", "text": "Hej"})
+                while True:
+                    frame = ws.receive()
+                    if frame.get("text") and (message := json.loads(frame["text"])).get("stage") == "done":
+                        done[name] = message
+                        break
+
+    paced.assert_called_once()
+    assert paced.call_args.kwargs["bytes_per_sec"] == 24000 * 2
+    assert done["wide"]["pacing"]["frames_sent"] > 0
+    assert "pacing" not in done["mp3"]
@@ -0,0 +1,113 @@
+import pytest
+import asyncio
+import httpx
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+
+from app.config import Settings
+from app.lifecycle import LifecycleManager
+from app.loop_monitor import LoopLagSampler
+from app.readiness import HttpProbe, TcpProbe, Readiness, ProbeResult, _probes_from_settings
+from app.main import app
+
+def _stand_in(status_code):
+    """httpx-klient mot en lokal ersättare som svarar med given status."""
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(status_code, json={"data": []})
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler)), calls
+
+@pytest.mark.asyncio
+async def test_http_probe_statuses():
+    """Testar att HTTP-proben klassar 2xx/4xx/5xx som ok/degraded/down."""
+    for status_code, expected in ((200, "ok"), (401, "degraded"), (503, "down")):
+        client, calls = _stand_in(status_code)
+        probe = HttpProbe("elevenlabs", "https://stand-in/v1/models", {"xi-api-key": "k"}, client=client)
+        result = await probe.check()
+        assert result.status == expected
+        assert calls[0].headers["xi-api-key"] == "k"
+        await client.aclose()
+
+@pytest.mark.asyncio
+async def test_tcp_probe_against_local_server():
+    """Testar TCP-proben mot en lokal server och mot en stängd port."""
+    server = await asyncio.start_server(lambda r, w: w.close(), "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        ok = await TcpProbe.from_url("openai_realtime", f"ws://127.0.0.1:{port}/v1/realtime").check()
+        assert ok.status == "ok"
+        assert ok.latency_ms is not None
+    finally:
+        server.close()
+        await server.wait_closed()
+
+    down = await TcpProbe("openai_realtime", "127.0.0.1", port, tls=False).check()
+    assert down.status == "down"
+
+@pytest.mark.asyncio
+async def test_probe_results_are_cached_between_runs():
+    """Testar att snapshot använder cachade proberesultat utan nya anrop."""
+    client, calls = _stand_in(200)
+    readiness = Readiness([HttpProbe("openai_llm", "https://stand-in/v1/models", client=client)])
+    assert readiness.snapshot()["probes"]["openai_llm"]["status"] == "unknown"
+
+    await readiness.run_probes()
+    for _ in range(5):
+        snapshot = readiness.snapshot()
+    assert len(calls) == 1
+    assert snapshot["probes"]["openai_llm"]["status"] == "ok"
+    await client.aclose()
+
+def test_not_ready_reasons():
+    """Testar att lag, kapacitet, drain och nere-leverantörer gör workern ej redo."""
+    manager = LifecycleManager()
+    lag = LoopLagSampler()
+    readiness = Readiness([], max_loop_lag_ms=100, max_sessions=1)
+
+    with patch("app.readiness.lifecycle", manager), patch("app.readiness.loop_lag", lag):
+        assert readiness.snapshot()["ready"] is True
+
+        lag.record(500)
+        manager.register("tts")
+        readiness.results["elevenlabs"] = ProbeResult("down", detail="timeout")
+        manager.draining = True
+
+        snapshot = readiness.snapshot()
+        assert snapshot["ready"] is False
+        assert set(snapshot["reasons"]) >= {"draining", "event_loop_lag", "at_capacity", "elevenlabs_down"}
+        assert snapshot["sessions"] == {"active": 1, "capacity": 1}
+
+def test_readyz_endpoint():
+    """Testar att /readyz ger 200 när redo och 503 annars."""
+    readiness = Readiness([])
+    with patch("app.endpoints.health.readiness", readiness):
+        client = TestClient(app)
+        response = client.get("/readyz")
+        assert response.status_code == 200
+        assert "pools" in response.json()
+
+        readiness.results["openai_llm"] = ProbeResult("down")
+        response = client.get("/readyz")
+        assert response.status_code == 503
+        assert "openai_llm_down" in response.json()["reasons"]
+
+@pytest.mark.asyncio
+async def test_probes_read_api_key_and_limits_from_settings_on_each_check():
+    """Testar att nyckel och gränser läses från settings vid varje kontroll (omläsning når proberna)."""
+    current = Settings.from_env({"ELEVENLABS_API_KEY": "gammal", "MAX_SESSIONS": "3"})
+    with patch("app.readiness.settings", current):
+        probe = _probes_from_settings()[1]
+        probe._client, calls = _stand_in(200)
+        await probe.check()
+        current.elevenlabs_api_key = "ny"
+        await probe.check()
+        assert [c.headers["xi-api-key"] for c in calls] == ["gammal", "ny"]
+        await probe._client.aclose()
+
+        readiness = Readiness([])
+        assert readiness.max_sessions == 3
+        current.max_sessions = 5
+        assert readiness.max_sessions == 5
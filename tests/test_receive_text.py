@@ -1,7 +1,11 @@
 import pytest
 import json
-from unittest.mock import AsyncMock
-from app.tts.receive_text_from_frontend import receive_and_validate_text
+from unittest.mock import AsyncMock, patch
+from fastapi.testclient import TestClient
+from app.main import app
+from app.tts.engine_router import TTSRouter
+from app.tts.engines import LocalTTSEngine
+from app.tts.receive_text_from_frontend import receive_and_validate_text, MAX_TEXT_CHARS
 
 @pytest.mark.asyncio
 async def test_valid_text_received(mock_websocket):
@@ -41,7 +45,7 @@ async def test_whitespace_only_text_rejected(mock_websocket):
 @pytest.mark.asyncio
 async def test_text_too_long_rejected(mock_websocket):
     """Testar att för lång text avvisas."""
-    long_text = "a" * 1001  # Över 1000 tecken
+    long_text = "a" * (MAX_TEXT_CHARS + 1)  # Över maxgränsen
     mock_websocket.receive_text = AsyncMock(return_value=json.dumps({"text": long_text}))
     
     result = await receive_and_validate_text(mock_websocket)
@@ -50,6 +54,17 @@ async def test_text_too_long_rejected(mock_websocket):
     mock_websocket.send_text.assert_called_once()
     mock_websocket.close.assert_called_once_with(code=1009)
 
+@pytest.mark.asyncio
+async def test_long_text_over_old_limit_accepted(mock_websocket):
+    """Testar att text över den gamla 1000-teckensgränsen accepteras (delas i segment)."""
+    long_text = "Det här är en mening. " * 60  # ~1300 tecken
+    mock_websocket.receive_text = AsyncMock(return_value=json.dumps({"text": long_text}))
+    
+    result = await receive_and_validate_text(mock_websocket)
+    
+    assert result is not None
+    assert result["text"] == long_text.strip()
+
 @pytest.mark.asyncio
 async def test_invalid_json_rejected(mock_websocket):
     """Testar att ogiltig JSON avvisas."""
@@ -71,3 +86,19 @@ async def test_missing_text_field_rejected(mock_websocket):
     assert result is None
     mock_websocket.send_text.assert_called_once()
     mock_websocket.close.assert_called_once_with(code=1003)
+
+def test_ws_tts_rejects_too_long_tts_request():
+    """Testar att /ws/tts avvisar tts_request över gränsen och att anslutningen fortsätter fungera."""
+    router = TTSRouter([LocalTTSEngine(ms_per_char=1)])
+    audio = 0
+    with patch("app.endpoints.tts_ws.tts_router", router):
+        with TestClient(app).websocket_connect("/ws/tts") as ws:
+            ws.receive_json()  # ready
+            ws.send_json({"type": "tts_request", "text": "a" * (MAX_TEXT_CHARS + 1)})
+            error = ws.receive_json()
+            ws.send_json({"type": "tts_request", "text": "a" * MAX_TEXT_CHARS})
+            while '"done"' not in ((frame := ws.receive()).get("text") or ""):
+                audio += len(frame.get("bytes") or b"")
+
+    assert error == {"type": "error", "message": f"Max {MAX_TEXT_CHARS} tecken"}
+    assert audio > 0
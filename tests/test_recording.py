@@ -0,0 +1,132 @@
+import pytest
+import os
+import wave
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+
+from app.recording import RecordingWriter, Recording, RecordingSink, INDEX_RECORD, TRACK_IN, TRACK_OUT
+from app.tts.engine_router import TTSRouter
+from app.tts.engines import LocalTTSEngine
+from app.main import app
+from app.profiles import ProfileRegistry
+
+def test_index_record_is_compact():
+    """Testar att varje indexpost är 16 bytes."""
+    assert INDEX_RECORD.size == 16
+
+def test_records_audio_and_events_across_segments(tmp_path):
+    """Testar inspelning av båda spåren, segmentbyte och läsning tillbaka."""
+    writer = RecordingWriter(tmp_path, segment_bytes=1000)
+    rec = writer.start_session("transcribe", "abc", meta={"session_id": "s1"})
+
+    chunks = [bytes([i]) * 300 for i in range(1, 8)]  # 2100 bytes → 3 segment
+    for chunk in chunks:
+        rec.audio(TRACK_IN, chunk)
+    rec.event("transcript", text="Hej", is_final=True)
+    rec.audio(TRACK_OUT, b"\x01\x02" * 50)
+    rec.close()
+    assert writer.flush()
+    assert writer.errors == 0
+
+    recording = Recording.find("abc", tmp_path)
+    manifest = recording.manifest
+    assert manifest["meta"] == {"session_id": "s1"}
+    assert manifest["tracks"]["in"]["bytes"] == 2100
+    assert manifest["tracks"]["in"]["segments"] == ["rec-abc-in-000.pcm", "rec-abc-in-001.pcm", "rec-abc-in-002.pcm"]
+    # Sista segmentet kortas till använd längd
+    assert os.path.getsize(tmp_path / "rec-abc-in-002.pcm") == 100
+
+    assert recording.audio(TRACK_IN) == b"".join(chunks)
+    assert recording.audio(TRACK_OUT) == b"\x01\x02" * 50
+    events = recording.events()
+    assert events[0]["type"] == "transcript" and events[0]["text"] == "Hej"
+    times = [t_ms for t_ms, *_ in recording.index()]
+    assert times == sorted(times)
+
+def test_calls_after_close_are_ignored(tmp_path):
+    """Testar att inget skrivs efter close."""
+    writer = RecordingWriter(tmp_path, segment_bytes=1000)
+    rec = writer.start_session("tts", "x")
+    rec.close()
+    rec.audio(TRACK_OUT, b"\x00" * 10)
+    rec.event("late")
+    assert writer.flush()
+    recording = Recording.find("x", tmp_path)
+    assert recording.manifest["tracks"]["out"]["bytes"] == 0
+    assert recording.events() == []
+
+@pytest.mark.asyncio
+async def test_recording_sink_forwards_and_records(tmp_path, mock_websocket):
+    """Testar att RecordingSink skickar vidare och spelar in utgående ljud."""
+    writer = RecordingWriter(tmp_path, segment_bytes=1000)
+    rec = writer.start_session("tts", "sink")
+    sink = RecordingSink(mock_websocket, rec)
+    await sink.send_bytes(b"\x05" * 20)
+    await sink.send_text("meta")
+    rec.close()
+    assert writer.flush()
+
+    mock_websocket.send_bytes.assert_called_once_with(b"\x05" * 20)
+    mock_websocket.send_text.assert_called_once_with("meta")
+    assert Recording.find("sink", tmp_path).audio(TRACK_OUT) == b"\x05" * 20
+
+def test_tts_websocket_records_when_requested(tmp_path):
+    """Testar att /ws/tts?record=true spelar in förfrågan och utgående ljud."""
+    writer = RecordingWriter(tmp_path)
+    router = TTSRouter([LocalTTSEngine()])
+    with patch("app.endpoints.tts_ws.recorder", writer), patch("app.endpoints.tts_ws.tts_router", router):
+        client = TestClient(app)
+        received = 0
+        with client.websocket_connect("/ws/tts?record=true") as ws:
+            ws.receive_json()
+            ws.send_json({"type": "tts_request", "text": "Hej"})
+            while True:
+                message = ws.receive()
+                if message.get("bytes"):
+                    received += len(message["bytes"])
+                elif '"done"' in (message.get("text") or ""):
+                    break
+    assert writer.flush()
+
+    manifests = list(tmp_path.glob("rec-*.json"))
+    assert len(manifests) == 1
+    recording = Recording(manifests[0])
+    assert recording.manifest["kind"] == "tts"
+    assert len(recording.audio(TRACK_OUT)) == received > 0
+    assert recording.events()[0]["text"] == "Hej"
+
+def test_track_format_follows_session_output(tmp_path):
+    """Testar att manifestet har format per spår från sessionen och att WAV-exporten använder det."""
+    writer = RecordingWriter(tmp_path)
+    registry = ProfileRegistry.from_mapping({"wide": {"output_format": "pcm_24000"}})
+    with patch("app.profiles.profiles", registry), patch("app.endpoints.tts_ws.recorder", writer), \
+         patch("app.endpoints.tts_ws.tts_router", TTSRouter([LocalTTSEngine()])):
+        with TestClient(app).websocket_connect("/ws/tts?record=true&profile=wide") as ws:
+            ws.receive_json()
+            ws.send_json({"type": "tts_request", "text": "Hej"})
+            while '"done"' not in (ws.receive().get("text") or ""):
+                pass
+    assert writer.flush()
+
+    recording = Recording(next(tmp_path.glob("rec-*.json")))
+    assert recording.manifest["meta"] == {"profile": "wide"}
+    assert recording.track_format(TRACK_OUT) == {"encoding": "pcm16", "sample_rate_hz": 24000, "channels": 1}
+    assert recording.track_format(TRACK_IN)["sample_rate_hz"] == 16000
+    with wave.open(str(recording.export_wav(TRACK_OUT)), "rb") as wav:
+        assert wav.getframerate() == 24000
+        assert wav.getnframes() * 2 == recording.manifest["tracks"]["out"]["bytes"]
+
+    # Äldre manifest: gemensamt format på toppnivå
+    recording.manifest.update({"sample_rate_hz": 8000})
+    for track in ("in", "out"):
+        for key in ("encoding", "sample_rate_hz", "channels"):
+            recording.manifest["tracks"][track].pop(key)
+    assert recording.track_format(TRACK_OUT)["sample_rate_hz"] == 8000
+
+    rec = writer.start_session("tts", "mp3")
+    rec.set_format(TRACK_OUT, "mp3", 44100)
+    rec.audio(TRACK_OUT, b"\xff\xfb" * 10)
+    rec.close()
+    assert writer.flush()
+    with pytest.raises(ValueError):
+        Recording.find("mp3", tmp_path).export_wav(TRACK_OUT)
@@ -0,0 +1,103 @@
+import pytest
+import time
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+
+from app.recording import RecordingWriter, Recording, TRACK_IN, TRACK_OUT
+from app.replay import replay, replay_passed, replay_transcribe, RecordedRealtimeClient, _tts_responses
+from app.tts.engine_router import TTSRouter
+from app.tts.engines import LocalTTSEngine
+from app.main import app
+
+def _at(rec, t_ms):
+    """Flytta inspelarens klocka så att nästa anrop får tidsstämpeln t_ms."""
+    rec._t0 = time.monotonic() - t_ms / 1000
+
+def _transcribe_recording(tmp_path):
+    writer = RecordingWriter(tmp_path)
+    rec = writer.start_session("transcribe", "stt1")
+    for i in range(4):
+        _at(rec, i * 40)
+        rec.audio(TRACK_IN, bytes([i]) * 640)
+    _at(rec, 150)
+    completed = {"type": "conversation.item.input_audio_transcription.completed", "transcript": "Hej världen"}
+    rec.event("realtime", event=completed)
+    rec.event("transcript", text="Hej världen", is_final=True)
+    rec.close()
+    assert writer.flush()
+    return Recording.find("stt1", tmp_path)
+
+@pytest.mark.asyncio
+async def test_recorded_realtime_client_keeps_timing():
+    """Testar att inspelade Realtime-events spelas upp med skalad timing."""
+    client = RecordedRealtimeClient([(0, {"type": "a"}), (100, {"type": "b"})], speed=2.0)
+    received = []
+
+    async def on_event(evt):
+        received.append((time.monotonic(), evt["type"]))
+        if len(received) == 2:
+            raise StopAsyncIteration
+
+    await client.connect()
+    with pytest.raises(StopAsyncIteration):
+        await client.recv_loop(on_event)
+    assert [t for _, t in received] == ["a", "b"]
+    assert 0.04 <= received[1][0] - received[0][0] < 0.2
+
+@pytest.mark.asyncio
+async def test_replay_transcribe_matches_recorded_final(tmp_path):
+    """Testar replay av /ws/transcribe: samma final-transkript och allt ljud skickat."""
+    recording = _transcribe_recording(tmp_path)
+    report = await replay_transcribe(recording, app, speed=4.0)
+
+    assert report["transcripts"]["expected"] == ["Hej världen"]
+    assert report["transcripts"]["match"] is True
+    assert report["audio_bytes_sent"] == report["audio_bytes_recorded"] == 4 * 640
+    assert len(report["latency_deltas_ms"]) == 1
+    assert replay_passed(report)
+
+def test_tts_responses_split_per_request(tmp_path):
+    """Testar att utgående ljud delas upp per inspelad tts_request."""
+    writer = RecordingWriter(tmp_path)
+    rec = writer.start_session("tts", "split")
+    _at(rec, 0)
+    rec.event("tts_request", text="Ett")
+    _at(rec, 30)
+    rec.audio(TRACK_OUT, b"\x01" * 10)
+    _at(rec, 500)
+    rec.event("tts_request", text="Två")
+    _at(rec, 520)
+    rec.audio(TRACK_OUT, b"\x02" * 20)
+    rec.close()
+    assert writer.flush()
+
+    requests, responses = _tts_responses(Recording.find("split", tmp_path))
+    assert [r["text"] for r in requests] == ["Ett", "Två"]
+    assert responses == [[(30, b"\x01" * 10)], [(20, b"\x02" * 20)]]
+
+@pytest.mark.asyncio
+async def test_replay_tts_round_trip(tmp_path):
+    """Testar inspelning via /ws/tts och replay mot inspelat ljud."""
+    writer = RecordingWriter(tmp_path)
+    router = TTSRouter([LocalTTSEngine()])
+    with patch("app.endpoints.tts_ws.recorder", writer), patch("app.endpoints.tts_ws.tts_router", router):
+        with TestClient(app).websocket_connect("/ws/tts?record=true") as ws:
+            ws.receive_json()
+            ws.send_json({"type": "tts_request", "text": "Hej"})
+            while '"done"' not in (ws.receive().get("text") or ""):
+                pass
+    assert writer.flush()
+
+    recording = Recording(next(tmp_path.glob("rec-*.json")))
+    report = await replay(recording, app, speed=8.0)
+
+    assert report["kind"] == "tts"
+    assert report["audio_match"] is True
+    assert report["requests"][0]["audio_bytes_actual"] == len(recording.audio(TRACK_OUT)) > 0
+    assert replay_passed(report)
+
+def test_replay_passed_respects_max_delta():
+    """Testar att latensgränsen får replay att fallera."""
+    report = {"kind": "tts", "audio_match": True, "max_delta_ms": -250.0}
+    assert replay_passed(report)
+    assert not replay_passed(report, max_delta_ms=100)
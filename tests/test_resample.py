@@ -0,0 +1,65 @@
+import pytest
+import numpy as np
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+
+from app.stt.resample import Resampler, create_resampler, parse_audio_format
+from app.replay import RecordedRealtimeClient
+from app.main import app
+
+def _tone(freq: float, sample_rate: int, seconds: float, channels: int = 1) -> bytes:
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    return np.repeat(np.sin(2 * np.pi * freq * t) * 10000, channels).astype("<i2").tobytes()
+
+def _rms(pcm: bytes) -> float:
+    x = np.frombuffer(pcm, dtype="<i2").astype(float)[400:-400]
+    return float(np.sqrt(np.mean(x ** 2)))
+
+@pytest.mark.parametrize("sample_rate,channels", [(48000, 2), (44100, 1), (8000, 1)])
+def test_resample_length_and_chunk_independence(sample_rate, channels):
+    """Testar att utdata är 16 kHz och identisk oavsett chunkgränser (även mitt i en frame)."""
+    audio = _tone(440, sample_rate, 1.0, channels)
+    whole = Resampler(sample_rate, channels).process(audio)
+    assert len(whole) == 16000 * 2
+
+    chunked = Resampler(sample_rate, channels)
+    parts = b"".join(chunked.process(audio[i:i + 1001]) for i in range(0, len(audio), 1001))
+    assert parts == whole
+
+def test_passband_kept_and_aliasing_removed():
+    """Testar att tal-bandet passerar och att frekvenser över 8 kHz filtreras bort."""
+    assert _rms(Resampler(48000, 1).process(_tone(1000, 48000, 0.5))) == pytest.approx(7071, rel=0.02)
+    assert _rms(Resampler(44100, 1).process(_tone(15000, 44100, 0.5))) < 10
+
+def test_stereo_is_downmixed():
+    """Testar nedmixning: motfas-kanaler tar ut varandra, lika kanaler behålls."""
+    left = np.sin(np.arange(48000) / 10) * 8000
+    opposite = np.column_stack([left, -left]).astype("<i2").tobytes()
+    assert _rms(Resampler(48000, 2).process(opposite)) < 1
+    assert _rms(Resampler(48000, 2).process(_tone(500, 48000, 0.5, 2))) == pytest.approx(7071, rel=0.02)
+
+def test_parse_audio_format():
+    """Testar validering av audio.format och att 16 kHz mono inte resamplas."""
+    assert parse_audio_format({"type": "audio.format", "sample_rate_hz": 48000, "channels": 2}) == (48000, 2)
+    assert create_resampler(16000, 1) is None
+    for bad in ({"sample_rate_hz": 4000}, {"channels": 0}, {"encoding": "f32le"}, {"sample_rate_hz": "snabb"}):
+        with pytest.raises(ValueError):
+            parse_audio_format(bad)
+
+def test_transcribe_resamples_negotiated_format():
+    """Testar att /ws/transcribe resamplar efter audio.format innan ljudet skickas till Realtime."""
+    client = RecordedRealtimeClient([])
+    with patch("app.endpoints.stt_ws.realtime_client_factory", lambda: client):
+        with TestClient(app).websocket_connect("/ws/transcribe") as ws:
+            ws.send_json({"type": "audio.format", "sample_rate_hz": 48000, "channels": 2})
+            while (ack := ws.receive_json())["type"] != "audio.format":
+                pass
+            ws.send_bytes(_tone(440, 48000, 0.1, 2))
+            ws.send_json({"type": "audio.format", "sample_rate_hz": 44100})
+            while (error := ws.receive_json())["type"] != "error":
+                pass
+
+    assert ack["accepted"] is True
+    assert ack["resampled_to"] == {"sample_rate_hz": 16000, "channels": 1}
+    assert client.bytes_received == 1600 * 2
+    assert error["reason"] == "unsupported_audio_format"
@@ -0,0 +1,98 @@
+import pytest
+import json
+import time
+from unittest.mock import AsyncMock, patch
+from fastapi.testclient import TestClient
+
+from app.config import Settings
+from app.main import app
+from app.tts.schedule_tuner import ScheduleTuner, length_bucket, tuning_enabled
+from app.tts.text_to_audio import process_text_to_audio
+
+BASE = [50, 90, 140]
+
+def _feed(tuner, n, ttfb_ms, gaps_ms=(), text_length=20):
+    for _ in range(n):
+        tuner.record("voice", "model", text_length, BASE, ttfb_ms, list(gaps_ms))
+
+def test_slow_first_byte_shrinks_first_step_within_bounds():
+    """Testar att hög TTFB minskar första steget, men aldrig under ElevenLabs minimum."""
+    tuner = ScheduleTuner(target_ttfb_ms=500, adjust_every=5, path=None)
+    base = [80, 120, 160]
+    for _ in range(5):
+        tuner.record("voice", "model", 20, base, 900, [])
+    assert tuner.schedule_for("voice", "model", 20, base) == [70, 120, 160]
+
+    _feed(tuner, 50, 900)
+    assert tuner.schedule_for("voice", "model", 20, base)[0] == 50
+
+def test_fast_first_byte_grows_schedule_and_gaps_grow_tail():
+    """Testar att marginal till målet ökar första steget och att stora glapp ökar resten."""
+    tuner = ScheduleTuner(target_ttfb_ms=500, gap_limit_ms=250, adjust_every=5, path=None)
+    _feed(tuner, 5, 200, gaps_ms=[50, 60])
+    assert tuner.schedule_for("voice", "model", 20, BASE) == [60, 90, 140]
+
+    _feed(tuner, 5, 200, gaps_ms=[400])
+    assert tuner.schedule_for("voice", "model", 20, BASE) == [60, 100, 150]
+
+    # Inom toleransen och utan glapp → oförändrat
+    _feed(tuner, 5, 500)
+    assert tuner.schedule_for("voice", "model", 20, BASE) == [60, 100, 150]
+
+def test_schedules_are_learned_per_length_bucket():
+    """Testar att korta och långa texter lärs in var för sig."""
+    tuner = ScheduleTuner(adjust_every=1, path=None)
+    tuner.record("voice", "model", 20, BASE, 2000, [])
+    assert length_bucket(20) == "short" and length_bucket(1000) == "long"
+    assert tuner.schedule_for("voice", "model", 20, BASE) == [50, 90, 140]  # redan på minimum
+    tuner.record("voice", "model", 1000, [100, 150, 200], 2000, [])
+    assert tuner.schedule_for("voice", "model", 1000, BASE) == [90, 150, 200]
+    assert tuner.schedule_for("annan", "model", 1000, BASE) == BASE
+
+def test_learned_schedule_is_persisted_and_reloaded(tmp_path):
+    """Testar att inlärda scheman sparas till fil och läses in vid start."""
+    path = tmp_path / "schedules.json"
+    tuner = ScheduleTuner(adjust_every=1, path=str(path))
+    tuner.record("voice", "model", 20, [100, 150, 200], 2000, [])
+    assert path.exists()
+
+    reloaded = ScheduleTuner(path=str(path))
+    assert reloaded.schedule_for("voice", "model", 20, BASE) == [90, 150, 200]
+    assert reloaded.snapshot()["schedules"]["voice|model|short"]["adjustments"] == 1
+
+@pytest.mark.asyncio
+async def test_stream_uses_tuned_schedule_and_reports_ttfb(mock_websocket):
+    """Testar att init-meddelandet får det inlärda schemat och att strömmen mäts."""
+    tuner = ScheduleTuner(adjust_every=100, path=None)
+    tuner.record("Vo4adEN1y46b0ufuysRe", "eleven_flash_v2_5", 3, BASE, None, [])
+    tuner.states[("Vo4adEN1y46b0ufuysRe", "eleven_flash_v2_5", "short")].schedule = [120, 160, 200]
+
+    with patch("app.tts.text_to_audio.schedule_tuner", tuner), \
+         patch("app.tts.text_to_audio.ws_connect") as mock_connect:
+        eleven = AsyncMock()
+        mock_connect.return_value.__aenter__.return_value = eleven
+        eleven.recv = AsyncMock(side_effect=[b"ljud1", b"ljud2", '{"isFinal": true}'])
+        stats = {}
+        async for _ in process_text_to_audio(mock_websocket, "Hej", time.time(), stats):
+            pass
+
+    init = json.loads(eleven.send.call_args_list[0].args[0])
+    assert init["generation_config"]["chunk_length_schedule"] == [120, 160, 200]
+    assert stats["chunk_length_schedule"] == [120, 160, 200]
+    state = tuner.states[("Vo4adEN1y46b0ufuysRe", "eleven_flash_v2_5", "short")]
+    assert state.requests == 2 and len(state.ttfb_ms) == 1 and len(state.gap_ms) == 1
+
+def test_schedules_endpoint():
+    """Testar att /debug/tts-schedules visar mål och inlärda scheman."""
+    body = TestClient(app).get("/debug/tts-schedules").json()
+    assert body["target_ttfb_ms"] > 0
+    assert "schedules" in body
+
+def test_targets_and_tuning_switch_come_from_settings():
+    """Testar att mål, glappgräns och av/på läses från settings (ingen env-läsning per förfrågan)."""
+    env = {"TTS_SCHEDULE_TUNING": "false", "TTS_TARGET_TTFB_MS": "800", "TTS_GAP_LIMIT_MS": "300"}
+    with patch("app.tts.schedule_tuner.settings", Settings.from_env(env)):
+        tuner = ScheduleTuner(path=None)
+        assert not tuning_enabled()
+        assert (tuner.target_ttfb_ms, tuner.gap_limit_ms) == (800, 300)
+        assert ScheduleTuner(target_ttfb_ms=400, path=None).snapshot()["target_ttfb_ms"] == 400
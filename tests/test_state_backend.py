@@ -0,0 +1,219 @@
+import pytest
+import asyncio
+import time
+import hashlib
+import hmac
+import orjson
+from app.state_backend import InProcessBackend, SharedMemoryBackend, RedisBackend, create_backend
+from app import affinity
+from app.affinity import make_token, parse_token, resume_session_id
+from app.debug_store import DebugStore
+from app.llm.conversation_manager import ConversationManager
+
+
+class FakeRedisServer:
+    """Lokal RESP2-ersättare för Redis (GET/SET PX/DEL/SCAN/AUTH/SELECT)."""
+
+    def __init__(self, password=None):
+        self.password = password
+        self.data = {}
+        self.commands = []
+        self.server = None
+        self.port = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _read_command(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        count = int(line[1:-2])
+        args = []
+        for _ in range(count):
+            length = int((await reader.readline())[1:-2])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    @staticmethod
+    def _bulk(value):
+        if value is None:
+            return b"$-1\r\n"
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def _alive(self, key):
+        item = self.data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and time.monotonic() >= expires_at:
+            del self.data[key]
+            return None
+        return value
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                args = await self._read_command(reader)
+                if args is None:
+                    break
+                name = args[0].decode().upper()
+                self.commands.append(name)
+                if name == "AUTH":
+                    reply = b"+OK\r\n" if args[1].decode() == self.password else b"-WRONGPASS invalid password\r\n"
+                elif name == "SELECT":
+                    reply = b"+OK\r\n"
+                elif name == "GET":
+                    reply = self._bulk(self._alive(args[1]))
+                elif name == "SET":
+                    expires_at = None
+                    if len(args) == 5 and args[3].upper() == b"PX":
+                        expires_at = time.monotonic() + int(args[4]) / 1000
+                    self.data[args[1]] = (args[2], expires_at)
+                    reply = b"+OK\r\n"
+                elif name == "DEL":
+                    reply = b":%d\r\n" % (1 if self.data.pop(args[1], None) is not None else 0)
+                elif name == "SCAN":
+                    prefix = args[3][:-1]
+                    keys = [k for k in list(self.data) if k.startswith(prefix) and self._alive(k) is not None]
+                    reply = b"*2\r\n$1\r\n0\r\n*%d\r\n" % len(keys) + b"".join(self._bulk(k) for k in keys)
+                else:
+                    reply = b"-ERR unknown command\r\n"
+                writer.write(reply)
+                await writer.drain()
+        finally:
+            writer.close()
+
+
+async def _exercise_backend(backend):
+    await backend.set("conversation:a", b"one")
+    await backend.set("conversation:b", b"two", ttl_sec=0.05)
+    await backend.set("debug:a", b"three")
+
+    assert await backend.get("conversation:a") == b"one"
+    assert await backend.get("missing") is None
+    assert sorted(await backend.keys("conversation:")) == ["conversation:a", "conversation:b"]
+
+    await asyncio.sleep(0.1)
+    assert await backend.get("conversation:b") is None
+    assert await backend.keys("conversation:") == ["conversation:a"]
+
+    await backend.delete("conversation:a")
+    assert await backend.get("conversation:a") is None
+
+
+@pytest.mark.asyncio
+async def test_in_process_backend():
+    """Testar get/set/ttl/keys/delete i processens minne."""
+    backend = InProcessBackend()
+    assert backend.shared is False
+    await _exercise_backend(backend)
+
+
+@pytest.mark.asyncio
+async def test_shared_memory_backend_is_shared_between_instances(tmp_path):
+    """Testar att två instanser (som två workers) ser samma data."""
+    first = SharedMemoryBackend(str(tmp_path))
+    second = SharedMemoryBackend(str(tmp_path))
+    await _exercise_backend(first)
+
+    await first.set("session/with:odd chars", b"x")
+    assert await second.get("session/with:odd chars") == b"x"
+
+
+@pytest.mark.asyncio
+async def test_redis_backend_against_local_stand_in():
+    """Testar Redis-protokollet mot en lokal RESP-server, inklusive AUTH och återanslutning."""
+    server = await FakeRedisServer(password="hemligt").start()
+    backend = RedisBackend(f"redis://:hemligt@127.0.0.1:{server.port}/2")
+    try:
+        await _exercise_backend(backend)
+        assert server.commands[:2] == ["AUTH", "SELECT"]
+
+        # Tappad anslutning → återansluter automatiskt
+        await backend._drop()
+        await backend.set("k", b"v")
+        assert await backend.get("k") == b"v"
+    finally:
+        await backend.close()
+        await server.stop()
+
+
+def test_create_backend_from_name(tmp_path, monkeypatch):
+    """Testar att backend väljs från namn och att okända namn avvisas."""
+    monkeypatch.setenv("STATE_SHM_DIR", str(tmp_path))
+    assert isinstance(create_backend("memory"), InProcessBackend)
+    assert isinstance(create_backend("shm"), SharedMemoryBackend)
+    assert isinstance(create_backend("redis"), RedisBackend)
+    with pytest.raises(ValueError):
+        create_backend("okänd")
+
+
+def test_affinity_token_roundtrip_and_tampering():
+    """Testar att affinity-token kan läsas tillbaka och att manipulerade tokens avvisas."""
+    token = make_token("session-1", instance_id="node-a")
+    assert parse_token(token) == ("session-1", "node-a")
+    assert resume_session_id(token) == "session-1"
+
+    forged = make_token("session-2", instance_id="node-a").split(".")
+    tampered = ".".join([forged[0], forged[1], token.split(".")[2]])
+    assert parse_token(tampered) is None
+    assert parse_token("skräp") is None
+    assert resume_session_id(None) is None
+
+
+def test_affinity_token_signed_with_empty_key_is_rejected():
+    """Testar att ett token signerat med tom nyckel (AFFINITY_SECRET saknas) avvisas."""
+    assert affinity._SECRET
+    payload = b"offer-session|node-a"
+    signature = hmac.new(b"", payload, hashlib.sha256).digest()[:12]
+    forged = f"v1.{affinity._b64(payload)}.{affinity._b64(signature)}"
+    assert parse_token(forged) is None
+    assert resume_session_id(forged) is None
+
+
+@pytest.mark.asyncio
+async def test_debug_store_publishes_to_shared_backend(tmp_path):
+    """Testar att debug-buffertar från en worker kan läsas av en annan."""
+    backend = SharedMemoryBackend(str(tmp_path))
+    worker_a = DebugStore(backend)
+    worker_b = DebugStore(backend)
+
+    session_id = worker_a.new_session()
+    worker_a.get_or_create(session_id).openai_text.append("hej")
+    await worker_a.publish(session_id)
+
+    buffers = await worker_b.load(session_id)
+    assert list(buffers.openai_text) == ["hej"]
+
+    # Återupptagen session fortsätter med samma buffertar
+    assert await worker_b.open_session(session_id) == session_id
+    assert list(worker_b.get_or_create(session_id).openai_text) == ["hej"]
+
+
+@pytest.mark.asyncio
+async def test_debug_store_in_process_does_not_publish():
+    """Testar att in-process-backend inte publicerar något."""
+    backend = InProcessBackend()
+    debug_store = DebugStore(backend)
+    session_id = debug_store.new_session()
+    await debug_store.publish(session_id)
+    assert debug_store.start_publisher(session_id) is None
+    assert await backend.keys() == []
+
+
+def test_conversation_roundtrip():
+    """Testar att konversationshistorik kan serialiseras för delad backend."""
+    manager = ConversationManager("session-1")
+    manager.add_user_message("Hej")
+    manager.add_assistant_message("Hej själv")
+
+    restored = ConversationManager.from_dict(orjson.loads(orjson.dumps(manager.to_dict())))
+    assert restored.session_id == "session-1"
+    assert [(m.role, m.content) for m in restored.messages] == [(m.role, m.content) for m in manager.messages]
@@ -0,0 +1,136 @@
+import pytest
+import asyncio
+import io
+import wave
+import httpx
+import numpy as np
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+
+from app.stt.engines import BatchHTTPSTTEngine, LocalSTTEngine
+from app.stt.engine_router import STTRouter
+from app.stt.event_to_text import TranscriptState
+from app.main import app
+
+async def _events(client, count, timeout=1.0):
+    received = []
+    done = asyncio.Event()
+
+    async def on_event(evt):
+        received.append(evt)
+        if len(received) >= count:
+            done.set()
+
+    task = asyncio.create_task(client.recv_loop(on_event))
+    try:
+        await asyncio.wait_for(done.wait(), timeout)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    return received
+
+@pytest.mark.asyncio
+async def test_local_engine_emits_scripted_partials_and_final():
+    """Testar att den lokala engine:n ger ett ord i taget och final per yttrande."""
+    client = LocalSTTEngine(script=["hej där", "hej då"], utterance_audio_ms=100).create_client()
+    await client.connect()
+    await client.send_audio_chunk(b"\x00" * 3200 * 2)  # 200 ms → två yttranden
+
+    events = await _events(client, 7)
+    await client.close()
+
+    state = TranscriptState()
+    finals = [r["text"] for r in map(state.process, events) if r and r.get("is_final")]
+    assert events[0]["type"] == "session.updated"
+    assert [e.get("delta") for e in events[1:3]] == ["hej", " där"]
+    assert finals == ["hej där", "hej då"]
+    assert events[-1]["item_id"] == "local_2"
+
+@pytest.mark.asyncio
+async def test_local_engine_latency_is_configurable():
+    """Testar att final kommer efter konfigurerad latens."""
+    client = LocalSTTEngine(utterance_audio_ms=20, first_partial_ms=30, final_ms=30).create_client()
+    await client.connect()
+    await client.send_audio_chunk(b"\x00" * 640)
+    started = asyncio.get_running_loop().time()
+    events = await _events(client, 8)  # session.updated, 6 ord, final
+    await client.close()
+
+    assert events[-1]["type"] == "conversation.item.input_audio_transcription.completed"
+    assert asyncio.get_running_loop().time() - started >= 0.055
+
+@pytest.mark.asyncio
+async def test_batch_engine_transcribes_utterance_after_silence():
+    """Testar att batch-engine:n skickar yttrandet som WAV efter tystnad."""
+    requests = []
+
+    def handler(request: httpx.Request):
+        requests.append(request)
+        return httpx.Response(200, json={"text": "hej världen"})
+
+    engine = BatchHTTPSTTEngine(base_url="https://stand-in", api_key="k", silence_ms=100,
+                                transport=httpx.MockTransport(handler))
+    client = engine.create_client()
+    await client.connect()
+    speech = (np.sin(np.arange(3200) / 5) * 8000).astype("<i2").tobytes()
+    await client.send_audio_chunk(speech)
+    await client.commit()  # tal utan tystnad → inget skickas än
+    assert not requests
+    await client.send_audio_chunk(b"\x00" * 3200)
+    await client.commit()
+
+    events = await _events(client, 2)
+    await client.close()
+
+    assert events[1] == {"type": "conversation.item.input_audio_transcription.completed",
+                         "item_id": "batch_1", "transcript": "hej världen"}
+    assert requests[0].url.path == "/v1/audio/transcriptions"
+    body = requests[0].read()
+    wav_start = body.index(b"RIFF")
+    with wave.open(io.BytesIO(body[wav_start:]), "rb") as wav:
+        assert (wav.getframerate(), wav.getnchannels()) == (16000, 1)
+
+@pytest.mark.asyncio
+async def test_router_fails_over_from_slow_and_broken_engines():
+    """Testar failover när en engine inte ansluter i tid eller fallerar."""
+    slow = LocalSTTEngine(name="slow", connect_delay_ms=200)
+    broken = LocalSTTEngine(name="broken", fail=True)
+    backup = LocalSTTEngine(name="backup")
+    router = STTRouter([slow, broken, backup], connect_timeout_ms=20)
+
+    connection = await router.connect()
+    await connection.client.close()
+    connection.release()
+
+    assert connection.engine_name == "backup"
+    assert connection.failovers == 2 and router.failovers == 1
+    assert router.snapshot()["engines"]["slow"]["errors"] == 1
+
+@pytest.mark.asyncio
+async def test_router_honours_preferred_engine():
+    """Testar att klientens önskade engine provas först och att okända namn ignoreras."""
+    router = STTRouter([LocalSTTEngine(name="a"), LocalSTTEngine(name="b")])
+    assert [e.name for e in router.ranked("b")] == ["b", "a"]
+    assert [e.name for e in router.ranked("okänd")] == ["a", "b"]
+
+    router = STTRouter([LocalSTTEngine(name="a", fail=True)])
+    with pytest.raises(RuntimeError):
+        await router.connect()
+
+def test_transcribe_runs_offline_with_local_engine():
+    """Testar /ws/transcribe?stt_engine=local från ljud till stt.final utan nätverk."""
+    async def _fake_llm(session_id, text):
+        return "svar"
+
+    router = STTRouter([LocalSTTEngine(name="realtime", fail=True), LocalSTTEngine(script=["boka en tid"], utterance_audio_ms=100)])
+    with patch("app.endpoints.stt_ws.stt_router", router), \
+         patch("app.llm.receive_text_from_stt.process_final_transcription", _fake_llm):
+        with TestClient(app).websocket_connect("/ws/transcribe?stt_engine=local") as ws:
+            while (info := ws.receive_json())["type"] != "info":
+                pass
+            ws.send_bytes(b"\x00" * 3200)
+            while (message := ws.receive_json())["type"] != "stt.final":
+                pass
+
+    assert info == {"type": "info", "msg": "realtime_connected", "engine": "local"}
+    assert message["text"] == "boka en tid"
@@ -0,0 +1,138 @@
+import pytest
+import asyncio
+import os
+import time
+from fastapi.testclient import TestClient
+
+from app.endpoints.test import TestJobQueue, TestRunner, code_fingerprint
+
+def _project(tmp_path):
+    """Litet projekt med en lyckad, en misslyckad och en långsam testsvit."""
+    (tmp_path / "app").mkdir()
+    (tmp_path / "app" / "mod.py").write_text("VALUE = 1\n")
+    tests = tmp_path / "tests"
+    tests.mkdir()
+    (tests / "test_ok.py").write_text(
+        "import os\n"
+        "def test_ok():\n"
+        "    print('TEXT=' + os.environ.get('TEXT', ''))\n"
+    )
+    (tests / "test_bad.py").write_text("def test_bad():\n    assert False\n")
+    (tests / "test_slow.py").write_text("import time\ndef test_slow():\n    time.sleep(0.5)\n")
+    configs = {
+        name: {"name": name, "path": f"tests/test_{name}.py", "description": name}
+        for name in ("ok", "bad", "slow")
+    }
+    return TestJobQueue(configs=configs, max_parallel=2, max_pending=5, timeout_sec=60, root=tmp_path)
+
+@pytest.mark.asyncio
+async def test_job_runs_without_blocking_loop(tmp_path):
+    """Testar att ett jobb kör som subprocess medan event-loopen är fri."""
+    queue = _project(tmp_path)
+    job = await queue.submit("slow")
+    assert job.status in ("queued", "running")
+
+    # Loopen ska kunna ticka under tiden testet kör
+    ticks = 0
+    while not job.done:
+        await asyncio.sleep(0.01)
+        ticks += 1
+    assert ticks > 10
+    assert job.status == "passed"
+    assert "passed" in "".join(job.output)
+
+@pytest.mark.asyncio
+async def test_text_is_passed_per_job_and_failures_reported(tmp_path):
+    """Testar att TEXT bara skickas till subprocessen och att fel rapporteras."""
+    queue = _project(tmp_path)
+    ok, bad = await queue.submit("ok", "hej"), await queue.submit("bad")
+    await asyncio.gather(ok.wait(), bad.wait())
+
+    assert ok.status == "passed"
+    assert "TEXT=hej" in "".join(ok.output)
+    assert "TEXT" not in os.environ or os.environ["TEXT"] != "hej"
+    assert bad.status == "failed"
+    assert bad.return_code != 0
+
+@pytest.mark.asyncio
+async def test_results_cached_until_code_changes(tmp_path):
+    """Testar att resultat cachas och invalideras när en .py-fil ändras."""
+    queue = _project(tmp_path)
+    first = await (await queue.submit("ok")).wait()
+    second = await queue.submit("ok")
+    assert second.done and second.cached
+    assert second.output == first.output
+
+    before = code_fingerprint(tmp_path)
+    time.sleep(0.01)
+    (tmp_path / "app" / "mod.py").write_text("VALUE = 2\n")
+    assert code_fingerprint(tmp_path) != before
+
+    third = await queue.submit("ok")
+    assert not third.cached
+    await third.wait()
+
+@pytest.mark.asyncio
+async def test_cache_keeps_current_fingerprint_and_skips_external_suites(tmp_path):
+    """Testar att bara aktuellt fingeravtryck cachas och att sviter mot externa tjänster inte cachas."""
+    queue = _project(tmp_path)
+    queue.configs["external"] = {**queue.configs["ok"], "name": "external", "external": True}
+    await (await queue.submit("external")).wait()
+    again = await queue.submit("external")
+    assert not again.cached
+    await again.wait()
+
+    await (await queue.submit("ok")).wait()
+    assert len(queue._cache) == 1
+    time.sleep(0.01)
+    (tmp_path / "app" / "mod.py").write_text("VALUE = 2\n")
+    job = await queue.submit("bad")
+    assert queue._cache == {}
+    await job.wait()
+    assert [key[2] for key in queue._cache] == [code_fingerprint(tmp_path)]
+
+@pytest.mark.asyncio
+async def test_job_cancelled_in_queue_gets_final_status(tmp_path):
+    """Testar att ett jobb som avbryts medan det väntar på en plats avslutas med fel."""
+    queue = _project(tmp_path)
+    queue._semaphore = asyncio.Semaphore(0)  # ingen ledig plats
+    job = await queue.submit("ok")
+    await asyncio.sleep(0.01)
+    for task in list(queue._tasks):
+        task.cancel()
+    await asyncio.wait_for(job.wait(), 1.0)
+
+    assert job.status == "error" and job.error == "Avbrutet"
+    assert queue.pending == 0
+
+@pytest.mark.asyncio
+async def test_run_all_tests_in_parallel_and_bounded_queue(tmp_path):
+    """Testar att sviter körs parallellt och att kön är begränsad."""
+    queue = _project(tmp_path)
+    result = await TestRunner(queue).run_all_tests()
+    assert result["summary"] == {"total": 3, "passed": 2, "failed": 1}
+
+    queue.max_pending = 1
+    queue._cache.clear()
+    (tmp_path / "app" / "mod.py").write_text("VALUE = 3\n")
+    running = await queue.submit("slow")
+    with pytest.raises(OverflowError):
+        await queue.submit("slow")
+    await running.wait()
+
+@pytest.mark.asyncio
+async def test_follow_streams_output(tmp_path):
+    """Testar att output kan strömmas medan jobbet kör."""
+    queue = _project(tmp_path)
+    job = await queue.submit("ok")
+    lines = [line async for line in job.follow()]
+    assert "".join(lines) == "".join(job.output)
+    assert job.done
+
+def test_job_endpoints_validate_input():
+    """Testar att okända test-typer och jobb ger 400/404."""
+    from app.main import app
+    client = TestClient(app)
+    assert client.post("/api/test/jobs?test_type=finns-inte").status_code == 400
+    assert client.get("/api/test/jobs/job-0-finns-inte").status_code == 404
+    assert client.get("/api/test/jobs").status_code == 200
@@ -0,0 +1,55 @@
+from app.tts.text_segmenter import split_sentences, split_text
+
+def test_split_sentences_basic():
+    """Testar att text delas vid meningsslut."""
+    result = split_sentences("Hej! Hur mår du? Jag mår bra.")
+    
+    assert result == ["Hej!", "Hur mår du?", "Jag mår bra."]
+
+def test_abbreviations_do_not_split():
+    """Testar att svenska förkortningar inte tolkas som meningsslut."""
+    text = "Vi ses kl. 10 t.ex. på kontoret, dvs. Kungsgatan. Ta med bl.a. papper."
+    
+    result = split_sentences(text)
+    
+    assert result == [
+        "Vi ses kl. 10 t.ex. på kontoret, dvs. Kungsgatan.",
+        "Ta med bl.a. papper.",
+    ]
+
+def test_numbers_and_initials_do_not_split():
+    """Testar att decimaltal, klockslag och initialer inte delar meningen."""
+    text = "Priset är 3.5 kr och 4,25 euro. Mötet börjar 12.30 med S. Andersson."
+    
+    result = split_sentences(text)
+    
+    assert result == ["Priset är 3.5 kr och 4,25 euro.", "Mötet börjar 12.30 med S. Andersson."]
+
+def test_lowercase_continuation_is_not_boundary():
+    """Testar att punkt följd av gemen inte ger nytt segment."""
+    result = split_sentences("Det kostar 100 kr. per styck.")
+    
+    assert result == ["Det kostar 100 kr. per styck."]
+
+def test_first_segment_is_first_sentence():
+    """Testar att första segmentet är kort och att resten slås ihop."""
+    text = "Hej. " + "Det här är en mening. " * 30
+    
+    segments = split_text(text, max_chars=200)
+    
+    assert segments[0] == "Hej."
+    assert all(len(s) <= 200 for s in segments)
+    assert " ".join(segments) == text.strip()
+
+def test_long_sentence_split_at_clause():
+    """Testar att en mening över maxgränsen delas vid satsgräns."""
+    text = "Först kommer en ganska lång inledning, sedan en fortsättning; till sist ett slut."
+    
+    segments = split_text(text, max_chars=45, first_max_chars=45)
+    
+    assert segments[0] == "Först kommer en ganska lång inledning,"
+    assert all(len(s) <= 45 for s in segments)
+
+def test_empty_text():
+    """Testar att tom text ger inga segment."""
+    assert split_text("   ") == []
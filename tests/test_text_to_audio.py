@@ -1,6 +1,7 @@
 import pytest
 import asyncio
 import time
+import json
 from unittest.mock import AsyncMock, patch
 from app.tts.text_to_audio import process_text_to_audio
 
@@ -116,3 +117,69 @@ def test_text_to_audio_error_handling(mock_websocket):
             assert any("error" in str(chunk[0]) for chunk in audio_chunks)
     
     asyncio.run(_run_test())
+
+def test_text_to_audio_sends_segments(mock_websocket):
+    """Testar att lång text skickas som flera segment och att TTFB mäts per segment."""
+    
+    async def _run_test():
+        test_text = "Hej och välkommen. Det här är den andra meningen som är lite längre. " * 8
+        started_at = time.time()
+        
+        with patch('app.tts.text_to_audio.ws_connect') as mock_connect:
+            mock_eleven_ws = AsyncMock()
+            mock_connect.return_value.__aenter__.return_value = mock_eleven_ws
+            
+            # Första chunken täcker första segmentet ("Hej och välkommen. ")
+            mock_eleven_ws.recv = AsyncMock(side_effect=[
+                '{"audio": "dGVzdA==", "alignment": {"chars": ' + json.dumps(list("Hej och välkommen. ")) + '}}',
+                '{"audio": "dGVzdA==", "alignment": {"chars": ["D"]}}',
+                '{"isFinal": true}'
+            ])
+            
+            stats = {}
+            async for _ in process_text_to_audio(mock_websocket, test_text, started_at, stats):
+                pass
+            
+            sent = [json.loads(call.args[0]) for call in mock_eleven_ws.send.call_args_list]
+            text_messages = [m for m in sent if m.get("flush") and m.get("text", "").strip()]
+            
+            # Init + flera segment + avslutande tomt meddelande
+            assert len(text_messages) == stats["segments"] > 1
+            assert text_messages[0]["text"] == "Hej och välkommen. "
+            assert sent[-1] == {"text": "", "flush": True}
+            assert stats["segment_ttfb_ms"][0] is not None
+            assert stats["segment_ttfb_ms"][1] is not None
+    
+    asyncio.run(_run_test())
+
+def test_segment_ttfb_excludes_time_queued_behind_previous_audio(mock_websocket):
+    """Testar att TTFB för senare segment räknas från föregående segments sista ljud, inte kötid."""
+    
+    async def _run_test():
+        first = "Hej och välkommen. "
+        frames = [
+            (0.0, '{"audio": "dGVzdA==", "alignment": {"chars": ' + json.dumps(list(first[:8])) + '}}'),
+            (0.2, '{"audio": "dGVzdA==", "alignment": {"chars": ' + json.dumps(list(first[8:])) + '}}'),
+            (0.01, '{"audio": "dGVzdA==", "alignment": {"chars": ["D"]}}'),
+            (0.0, '{"isFinal": true}'),
+        ]
+        
+        async def _recv():
+            delay, frame = frames.pop(0)
+            await asyncio.sleep(delay)
+            return frame
+        
+        with patch('app.tts.text_to_audio.ws_connect') as mock_connect:
+            mock_eleven_ws = AsyncMock()
+            mock_connect.return_value.__aenter__.return_value = mock_eleven_ws
+            mock_eleven_ws.recv = _recv
+            
+            stats = {}
+            async for _ in process_text_to_audio(mock_websocket, first + "Det här är den andra meningen.", time.time(), stats):
+                pass
+        
+        # Andra segmentet skickades direkt men köade ~200 ms bakom första segmentets ljud
+        assert stats["segments"] == 2
+        assert stats["segment_ttfb_ms"][1] < 100
+    
+    asyncio.run(_run_test())
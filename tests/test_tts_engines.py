@@ -0,0 +1,172 @@
+import pytest
+import json
+import time
+from app.messaging import send_message
+from app.tts.engines import LocalTTSEngine, message_has_audio
+from app.tts.engine_router import TTSRouter
+
+async def _collect(router, text="Hej världen", hedge=False):
+    stats = {}
+    messages = []
+    async for server_msg, _ in router.stream(None, text, time.time(), stats, hedge=hedge):
+        messages.append(server_msg)
+    return messages, stats
+
+@pytest.mark.asyncio
+async def test_local_engine_produces_audio_and_final():
+    """Testar att den lokala engine:n ger ElevenLabs-liknande audio och final-meddelande."""
+    engine = LocalTTSEngine(ms_per_char=10)
+    
+    messages = [msg async for msg, _ in engine.stream(None, "Hej", time.time())]
+    
+    assert message_has_audio(messages[0])
+    assert json.loads(messages[-1]) == {"isFinal": True}
+
+@pytest.mark.asyncio
+async def test_router_prefers_fastest_engine():
+    """Testar att routern väljer engine med lägst uppmätt TTFB."""
+    slow = LocalTTSEngine(name="slow", first_byte_delay_ms=40, ms_per_char=5)
+    fast = LocalTTSEngine(name="fast", first_byte_delay_ms=0, ms_per_char=5)
+    router = TTSRouter([slow, fast])
+    
+    # Mät båda en gång
+    router.stats["slow"].record_latency(40)
+    router.stats["fast"].record_latency(1)
+    
+    _, stats = await _collect(router)
+    
+    assert stats["engine"] == "fast"
+    assert router.stats["fast"].requests == 1
+
+@pytest.mark.asyncio
+async def test_router_fails_over_and_skips_unhealthy_engine():
+    """Testar failover till nästa engine och att en felande engine väljs bort."""
+    broken = LocalTTSEngine(name="broken", fail=True)
+    backup = LocalTTSEngine(name="backup", ms_per_char=5)
+    router = TTSRouter([broken, backup])
+    
+    _, stats = await _collect(router)
+    
+    assert stats["engine"] == "backup"
+    assert not router.stats["broken"].healthy()
+    assert router.ranked()[0].name == "backup"
+
+@pytest.mark.asyncio
+async def test_router_raises_when_all_engines_fail():
+    """Testar att felet propageras när ingen engine fungerar."""
+    router = TTSRouter([LocalTTSEngine(name="a", fail=True), LocalTTSEngine(name="b", fail=True)])
+    
+    with pytest.raises(RuntimeError):
+        await _collect(router)
+
+@pytest.mark.asyncio
+async def test_hedge_wins_when_primary_stalls():
+    """Testar att backup startas och vinner när primary inte ger ljud i tid."""
+    stalled = LocalTTSEngine(name="stalled", first_byte_delay_ms=2000, ms_per_char=5)
+    quick = LocalTTSEngine(name="quick", ms_per_char=5)
+    router = TTSRouter([stalled, quick], hedge_after_ms=30)
+    router.stats["stalled"].record_latency(1)  # ser snabbast ut
+    
+    started = time.monotonic()
+    messages, stats = await _collect(router, hedge=True)
+    
+    assert time.monotonic() - started < 1.0
+    assert stats["engine"] == "quick"
+    assert stats["hedged"] is True
+    assert any(message_has_audio(m) for m in messages)
+    assert json.loads(messages[-1]) == {"isFinal": True}
+
+@pytest.mark.asyncio
+async def test_no_hedge_when_primary_is_fast():
+    """Testar att ingen backup startas om primary ger ljud före tröskeln."""
+    primary = LocalTTSEngine(name="primary", ms_per_char=5)
+    backup = LocalTTSEngine(name="backup", ms_per_char=5)
+    router = TTSRouter([primary, backup], hedge_after_ms=500)
+    
+    _, stats = await _collect(router, hedge=True)
+    
+    assert stats["engine"] == "primary"
+    assert stats["hedged"] is False
+    assert router.stats["backup"].requests == 0
+
+class _StallOnceEngine(LocalTTSEngine):
+    """Första sessionen fastnar innan första byte, efterföljande är snabba."""
+    
+    def __init__(self, stall_ms: float):
+        super().__init__(name="stall-once", ms_per_char=5)
+        self.stall_ms = stall_ms
+        self.calls = 0
+    
+    async def stream(self, ws, text, started_at, stats=None):
+        self.calls += 1
+        self.first_byte_delay_ms = self.stall_ms if self.calls == 1 else 0
+        async for item in super().stream(ws, text, started_at, stats):
+            yield item
+
+def test_hedge_threshold_follows_recent_p95():
+    """Testar att hedge-tröskeln följer p95 och hålls inom gränserna."""
+    engine = LocalTTSEngine(name="e")
+    router = TTSRouter([engine], hedge_after_ms=800)
+    
+    # För lite data → statisk tröskel
+    assert router.hedge_threshold_ms(engine) == 800
+    
+    for _ in range(20):
+        router.stats["e"].record_latency(1200)
+    assert router.hedge_threshold_ms(engine) == 1200
+    
+    for _ in range(50):
+        router.stats["e"].record_latency(10)
+    assert router.hedge_threshold_ms(engine) == 300  # nedre gräns
+
+@pytest.mark.asyncio
+async def test_hedge_same_engine_second_session_wins():
+    """Testar att en ensam engine hedgas med en andra session och att räknarna uppdateras."""
+    engine = _StallOnceEngine(stall_ms=2000)
+    router = TTSRouter([engine], hedge_after_ms=30)
+    
+    started = time.monotonic()
+    messages, stats = await _collect(router, hedge=True)
+    
+    assert time.monotonic() - started < 1.0
+    assert engine.calls == 2
+    assert stats["hedged"] is True
+    assert stats["hedge_won"] is True
+    assert router.hedges_fired == 1
+    assert router.hedges_won == 1
+    assert json.loads(messages[-1]) == {"isFinal": True}
+    
+    snapshot = router.snapshot()
+    assert snapshot["hedges_fired"] == 1
+    assert snapshot["hedges_won"] == 1
+
+class _DebugStallOnceEngine(_StallOnceEngine):
+    """Som _StallOnceEngine men skickar ett debug-meddelande till klienten per session."""
+    
+    async def stream(self, ws, text, started_at, stats=None):
+        await send_message(ws, {"type": "debug", "session": self.calls + 1})
+        async for item in super().stream(ws, text, started_at, stats):
+            yield item
+
+class _Client:
+    def __init__(self):
+        self.messages = []
+    
+    async def send_text(self, text):
+        self.messages.append(json.loads(text))
+
+@pytest.mark.asyncio
+async def test_hedge_loser_is_not_a_ttfb_sample_and_its_messages_are_dropped():
+    """Testar att förloraren räknas som hedge-förlust (inte TTFB) och att bara vinnarens meddelanden når klienten."""
+    engine = _DebugStallOnceEngine(stall_ms=2000)
+    router = TTSRouter([engine], hedge_after_ms=30)
+    client = _Client()
+    
+    stats = {}
+    async for _ in router.stream(client, "Hej världen", time.time(), stats, hedge=True):
+        pass
+    
+    assert stats["hedge_won"] is True
+    assert client.messages == [{"type": "debug", "session": 2}]
+    assert len(router.stats["stall-once"].latency_ms) == 1  # bara vinnarens första ljud
+    assert router.snapshot()["hedge_losses"] == {"stall-once": 1}
@@ -2,17 +2,18 @@
 """
 Verktyg för att konvertera PCM-filer till WAV-format.
 ElevenLabs skickar PCM 16kHz 16-bit, vilket vi konverterar till WAV.
+Konverteringen görs strömmande av app/audio (filen läses aldrig in i minnet).
 """
 
-import wave
-import os
 import sys
-from pathlib import Path
+
+from app.audio import PcmFormat, open_audio
+from app.audio import pcm_to_wav as _pcm_to_wav
 
 def pcm_to_wav(pcm_file_path, wav_file_path=None, sample_rate=16000, channels=1, sample_width=2):
     """
     Konverterar PCM-fil till WAV-format.
-    
+
     Args:
         pcm_file_path: Sökväg till PCM-filen
         wav_file_path: Sökväg för WAV-filen (om None, skapas automatiskt)
@@ -20,39 +21,7 @@ def pcm_to_wav(pcm_file_path, wav_file_path=None, sample_rate=16000, channels=1,
         channels: Antal kanaler (default: 1 för mono)
         sample_width: Bredd per sample i bytes (default: 2 för 16-bit)
     """
-    
-    if not os.path.exists(pcm_file_path):
-        raise FileNotFoundError(f"PCM-fil hittades inte: {pcm_file_path}")
-    
-    # Skapa WAV-filnamn om inte angivet
-    if wav_file_path is None:
-        pcm_path = Path(pcm_file_path)
-        wav_file_path = pcm_path.with_suffix('.wav')
-    
-    print(f"🔄 Konverterar {pcm_file_path} → {wav_file_path}")
-    
-    # Läs PCM-data
-    with open(pcm_file_path, 'rb') as pcm_file:
-        pcm_data = pcm_file.read()
-    
-    print(f"📊 PCM-data: {len(pcm_data)} bytes")
-    
-    # Skapa WAV-fil
-    with wave.open(wav_file_path, 'wb') as wav_file:
-        wav_file.setnchannels(channels)
-        wav_file.setsampwidth(sample_width)
-        wav_file.setframerate(sample_rate)
-        wav_file.writeframes(pcm_data)
-    
-    # Verifiera WAV-filen
-    with wave.open(wav_file_path, 'rb') as wav_file:
-        frames = wav_file.getnframes()
-        duration = frames / sample_rate
-    
-    print(f"✅ WAV skapad: {wav_file_path}")
-    print(f"📊 WAV-info: {frames} frames, {duration:.2f}s, {sample_rate}Hz")
-    
-    return wav_file_path
+    return _pcm_to_wav(pcm_file_path, wav_file_path, PcmFormat(sample_rate, channels, sample_width))
 
 def main():
     """Huvudfunktion för kommandoradsanvändning."""
@@ -60,13 +29,14 @@ def main():
         print("Användning: python pcm_to_wav.py <pcm-fil> [wav-fil]")
         print("Exempel: python pcm_to_wav.py test_output/audio.pcm")
         sys.exit(1)
-    
+
     pcm_file = sys.argv[1]
     wav_file = sys.argv[2] if len(sys.argv) > 2 else None
-    
+
     try:
         wav_path = pcm_to_wav(pcm_file, wav_file)
-        print(f"🎵 Konvertering klar: {wav_path}")
+        with open_audio(wav_path) as wav:
+            print(f"🎵 Konvertering klar: {wav_path} ({wav.frame_count} frames, {wav.duration_sec:.2f}s)")
     except Exception as e:
         print(f"❌ Fel vid konvertering: {e}")
         sys.exit(1)